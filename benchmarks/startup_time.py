@@ -0,0 +1,121 @@
+# Copyright (C) 2024 twyleg
+"""
+Measures the cold-start time of the track_generator CLI per subcommand and checks it against a time budget.
+
+Every measurement spawns a fresh interpreter, so the numbers include interpreter start and all imports. Additionally the
+heavy dependencies that were imported by the command are reported, commands that only print help or the version are
+expected to not import any of them. The SVG-only generate_track run measures the time to the first rendered track.
+
+Usage:
+    python benchmarks/startup_time.py [--runs N] [--budget SECONDS]
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List
+
+FILE_DIR = Path(__file__).parent
+REPO_DIR = FILE_DIR.parent
+
+HEAVY_MODULES = ["drawsvg", "cairosvg", "imageio", "pytransform3d", "xmlschema", "jinja2", "numpy"]
+
+SMALL_TRACK_FILEPATH = REPO_DIR / "examples/track_files/small_track_example.xml"
+
+# "{tmp}" is replaced by a temporary directory of the run that contains an empty application config (config.json)
+COMMANDS: Dict[str, List[str]] = {
+    "--help": ["--help"],
+    "--version": ["--version"],
+    "generate_track --help": ["generate_track", "--help"],
+    "generate_trajectory --help": ["generate_trajectory", "--help"],
+    "serve --help": ["serve", "--help"],
+    "read_artifact --help": ["read_artifact", "--help"],
+    "generate_track (svg)": ["-c", "{tmp}/config.json", "generate_track", "-o", "{tmp}/output", str(SMALL_TRACK_FILEPATH)],
+}
+
+# Files (relative to "{tmp}") that commands which do real work must have written
+EXPECTED_OUTPUTS: Dict[str, str] = {
+    "generate_track (svg)": "output/small_track_example/small_track_example.svg",
+}
+
+RUNNER = """
+import runpy, sys, json
+heavy_modules = json.loads(sys.argv[2])
+sys.argv = ["track_generator"] + json.loads(sys.argv[1])
+try:
+    runpy.run_module("track_generator", run_name="__main__")
+except SystemExit:
+    pass
+sys.stderr.write("\\n" + json.dumps([m for m in heavy_modules if m in sys.modules]) + "\\n")
+"""
+
+
+def is_help_command(arguments: List[str]) -> bool:
+    return "--help" in arguments or "--version" in arguments
+
+
+def measure_command(name: str, arguments: List[str], runs: int) -> Dict:
+    durations: List[float] = []
+    imported_heavy_modules: List[str] = []
+    succeeded = True
+    for _ in range(runs):
+        with tempfile.TemporaryDirectory() as tmp_dirpath:
+            (Path(tmp_dirpath) / "config.json").write_text("{}")
+            arguments_of_run = [argument.replace("{tmp}", tmp_dirpath) for argument in arguments]
+            start = time.perf_counter()
+            result = subprocess.run(
+                [sys.executable, "-c", RUNNER, json.dumps(arguments_of_run), json.dumps(HEAVY_MODULES)],
+                cwd=REPO_DIR,
+                capture_output=True,
+                text=True,
+            )
+            durations.append(time.perf_counter() - start)
+            # The CLI exits with 0 on errors as well, so runs are checked by their output
+            if name in EXPECTED_OUTPUTS:
+                succeeded = succeeded and (Path(tmp_dirpath) / EXPECTED_OUTPUTS[name]).is_file()
+        imported_heavy_modules = json.loads(result.stderr.strip().splitlines()[-1])
+    return {
+        "min": min(durations),
+        "median": statistics.median(durations),
+        "max": max(durations),
+        "heavy_modules": imported_heavy_modules,
+        "succeeded": succeeded,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Measure cold-start time of the track_generator CLI.")
+    parser.add_argument("--runs", type=int, default=5, help="Number of runs per command. Default=5")
+    parser.add_argument("--budget", type=float, default=None, help="Fail if the median startup time of a command exceeds the budget (seconds).")
+    parser.add_argument("--json", dest="json_output", action="store_true", help="Print results as JSON.")
+    args = parser.parse_args()
+
+    results = {name: measure_command(name, arguments, args.runs) for name, arguments in COMMANDS.items()}
+
+    if args.json_output:
+        print(json.dumps(results, indent=4))
+    else:
+        for name, result in results.items():
+            heavy_modules = ", ".join(result["heavy_modules"]) or "-"
+            print(f"{name:<30} min={result['min']:.3f}s median={result['median']:.3f}s max={result['max']:.3f}s heavy_modules={heavy_modules}")
+
+    exit_code = 0
+    for name, result in results.items():
+        if not result["succeeded"]:
+            print(f"FAIL: '{name}' did not write its output ({EXPECTED_OUTPUTS[name]})")
+            exit_code = 1
+        if is_help_command(COMMANDS[name]) and result["heavy_modules"]:
+            print(f"FAIL: '{name}' imports heavy modules: {', '.join(result['heavy_modules'])}")
+            exit_code = 1
+        if args.budget is not None and result["median"] > args.budget:
+            print(f"FAIL: '{name}' exceeds startup budget: {result['median']:.3f}s > {args.budget:.3f}s")
+            exit_code = 1
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
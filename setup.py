@@ -28,6 +28,7 @@ setup(
         "watchdog~=3.0.0",
         "xmlschema~=3.4.3",
         "jinja2~=3.1.2",
+        "scipy>=1.10",
         "simple-python-app-qt~=0.1.0"
     ],
     entry_points={
@@ -0,0 +1,116 @@
+# Copyright (C) 2024 twyleg
+import collections
+import os
+import tarfile
+import zipfile
+from pathlib import Path
+
+import pytest
+
+from track_generator.archive import ArchiveReader, ArchiveSink
+from track_generator.artifacts import TrackArtifacts
+from track_generator.generator import generate_track, generate_track_artifacts
+from track_generator.sinks import WriteBehindSink
+
+
+#
+# General naming convention for unit tests:
+#               test_INITIALSTATE_ACTION_EXPECTATION
+#
+
+
+FILE_DIR = Path(__file__).parent
+TRACK_FILES_DIR = FILE_DIR / "../examples/track_files"
+TRACK_FILEPATHS = [
+    TRACK_FILES_DIR / "small_track_example.xml",
+    TRACK_FILES_DIR / "doc_track_example.xml",
+    TRACK_FILES_DIR / "clothoid_track_example.xml",
+]
+
+
+class TestArchiveSink:
+    @pytest.mark.parametrize("archive_format", ["tar", "zip"])
+    def test_ArchiveSink_GenerateTrack_ReaderReturnsEveryArtifact(self, tmp_path, archive_format):
+        all_artifacts = generate_track_artifacts(TRACK_FILEPATHS, generate_ground_truth=True)
+        with ArchiveSink(tmp_path, archive_format) as sink:
+            generate_track(TRACK_FILEPATHS, tmp_path, generate_ground_truth=True, sink=sink)
+
+        with ArchiveReader(tmp_path) as archive_reader:
+            assert archive_reader.track_names() == [artifacts.track_name for artifacts in all_artifacts]
+            for artifacts in all_artifacts:
+                files = artifacts.files()
+                assert archive_reader.list_artifacts(artifacts.track_name) == list(files)
+                for relative_path, content in files.items():
+                    assert archive_reader.read(artifacts.track_name, relative_path) == content.encode("utf-8")
+
+    def test_SmallShardSize_GenerateTrack_TracksAreNotSplitAcrossShards(self, tmp_path):
+        with ArchiveSink(tmp_path, "tar", shard_size=1) as sink:
+            generate_track(TRACK_FILEPATHS, tmp_path, generate_ground_truth=True, sink=sink)
+
+        assert sink.shard_filenames == ["shard-00000.tar", "shard-00001.tar", "shard-00002.tar"]
+        for shard_filename, track_filepath in zip(sink.shard_filenames, TRACK_FILEPATHS):
+            with tarfile.open(tmp_path / shard_filename) as tar_file:
+                assert {Path(name).parts[0] for name in tar_file.getnames()} == {track_filepath.stem}
+
+    def test_OutputDirectoryWithEarlierArchive_GenerateTrack_OnlyIndexedShardsRemain(self, tmp_path):
+        with ArchiveSink(tmp_path, "tar", shard_size=1) as sink:
+            generate_track(TRACK_FILEPATHS, tmp_path, generate_ground_truth=True, sink=sink)
+        (tmp_path / "unrelated.tar").write_bytes(b"")
+
+        with ArchiveSink(tmp_path, "zip") as sink:
+            generate_track(TRACK_FILEPATHS[:1], tmp_path, generate_ground_truth=True, sink=sink)
+
+        assert sorted(path.name for path in tmp_path.glob("*.*") if path.suffix in (".tar", ".zip")) == ["shard-00000.zip", "unrelated.tar"]
+
+    @pytest.mark.parametrize("archive_format", ["tar", "zip"])
+    def test_WriteBehindSinkWithSmallShardSize_WriteArtifacts_EveryTrackInExactlyOneShard(self, tmp_path, archive_format):
+        archive_sink = ArchiveSink(tmp_path, archive_format, shard_size=4096)
+        with WriteBehindSink(archive_sink, max_workers=4) as sink:
+            for i in range(50):
+                artifacts = TrackArtifacts(f"track_{i}")
+                artifacts.extra_files = {f"file_{j}.bin": bytes([i]) * 700 for j in range(4)}
+                sink.write_artifacts(artifacts)
+
+        with ArchiveReader(tmp_path) as archive_reader:
+            shards_per_track = collections.defaultdict(set)
+            for (track_name, _), entry in archive_reader.index.items():
+                shards_per_track[track_name].add(entry["shard"])
+            assert len(shards_per_track) == 50
+            assert all(len(shards) == 1 for shards in shards_per_track.values())
+            assert len(archive_sink.shard_filenames) > 1
+            for i in range(50):
+                assert archive_reader.read(f"track_{i}", "file_3.bin") == bytes([i]) * 700
+
+    def test_ArchiveSinkWithFsync_WriteAndClose_ShardsIndexAndDirectorySynced(self, tmp_path, monkeypatch):
+        synced_fds = []
+        monkeypatch.setattr(os, "fsync", synced_fds.append)
+        with ArchiveSink(tmp_path, "tar", shard_size=1, fsync=True) as sink:
+            sink.write("track_0", "ground_truth.xml", "<GroundTruth/>")
+            sink.write("track_1", "ground_truth.xml", "<GroundTruth/>")
+
+        # Two shards, the index and the output directory
+        assert len(synced_fds) == 4
+        with ArchiveReader(tmp_path) as archive_reader:
+            assert archive_reader.read("track_1", "ground_truth.xml") == b"<GroundTruth/>"
+
+    @pytest.mark.parametrize("archive_format", ["tar", "zip"])
+    def test_ArchiveSink_Close_ShardsReadableWithStandardTools(self, tmp_path, archive_format):
+        with ArchiveSink(tmp_path, archive_format) as sink:
+            sink.write("track", "ground_truth.xml", "<GroundTruth/>")
+            sink.write("track", "gazebo_models/setup.bash", b"#!/bin/bash\n")
+
+        shard_filepath = tmp_path / f"shard-00000.{archive_format}"
+        if archive_format == "tar":
+            with tarfile.open(shard_filepath) as tar_file:
+                extracted_file = tar_file.extractfile("track/gazebo_models/setup.bash")
+                assert extracted_file and extracted_file.read() == b"#!/bin/bash\n"
+        else:
+            with zipfile.ZipFile(shard_filepath) as zip_file:
+                assert zip_file.read("track/gazebo_models/setup.bash") == b"#!/bin/bash\n"
+
+    def test_ArchiveReader_ReadUnknownArtifact_RaisesArtifactNotFoundError(self, tmp_path):
+        with ArchiveSink(tmp_path) as sink:
+            sink.write("track", "ground_truth.xml", "<GroundTruth/>")
+
+        with ArchiveReader(tmp_path) as archive_reader, pytest.raises(ArchiveReader.ArtifactNotFoundError):
+            archive_reader.read("track", "track.svg")
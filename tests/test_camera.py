@@ -0,0 +1,145 @@
+# Copyright (C) 2024 twyleg
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from track_generator import xml_reader
+from track_generator.camera import FrameRenderer, PerspectiveCamera, TiledTexture
+from track_generator.coordinate_system import world_to_pixel
+from track_generator.label_raster import LabelClass, encode_label_png
+
+
+#
+# General naming convention for unit tests:
+#               test_INITIALSTATE_ACTION_EXPECTATION
+#
+
+
+FILE_DIR = Path(__file__).parent
+TRACK_FILES_DIR = FILE_DIR / "../examples/track_files"
+
+
+def read_track(filename: str):
+    track = xml_reader.read_track(TRACK_FILES_DIR / filename)
+    track.calc()
+    return track
+
+
+def direct_frames(texture: TiledTexture, camera: PerspectiveCamera, poses: np.ndarray) -> np.ndarray:
+    """
+    Frames looked up pixel by pixel in the source of the texture
+    """
+    frames = np.full((len(poses), camera.height * camera.width) + texture.channel_shape, texture.fill_value, dtype=texture.source.dtype)
+    for i, (x, y, heading) in enumerate(poses):
+        ground = camera.ground[camera.is_ground]
+        ground_x = x + ground[:, 0] * np.cos(heading) - ground[:, 1] * np.sin(heading)
+        ground_y = y + ground[:, 0] * np.sin(heading) + ground[:, 1] * np.cos(heading)
+        cols, rows = world_to_pixel(ground_x, ground_y, texture.height, texture.origin, texture.pixels_per_meter)
+        rows, cols = np.floor(rows).astype(np.int64), np.floor(cols).astype(np.int64)
+        is_inside = (rows >= 0) & (rows < texture.source.shape[0]) & (cols >= 0) & (cols < texture.source.shape[1])
+        values = np.full((len(rows),) + texture.channel_shape, texture.fill_value, dtype=texture.source.dtype)
+        values[is_inside] = texture.source[rows[is_inside], cols[is_inside]]
+        frames[i, camera.is_ground] = values
+    return frames.reshape((len(poses), camera.height, camera.width) + texture.channel_shape)
+
+
+def random_poses(track, count: int, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    return np.stack([rng.uniform(0.0, track.width, count), rng.uniform(0.0, track.height, count), rng.uniform(-np.pi, np.pi, count)], axis=-1)
+
+
+class TestFrameRenderer:
+    @pytest.mark.parametrize("filename", ["reference_track_example.xml", "doc_track_example.xml"])
+    def test_RandomPoses_Render_SameAsDirectLookup(self, filename):
+        track = read_track(filename)
+        texture = TiledTexture.from_track(track, pixels_per_meter=200.0, tile_size=32, max_tiles=256)
+        camera = PerspectiveCamera(64, 48, 50.0, position=(0.1, 0.02, 0.3), pitch=0.5, yaw=0.1, roll=0.05, max_distance=2.0)
+        poses = random_poses(track, 40, 4)
+
+        frames = FrameRenderer(texture, camera, batch_size=8).render(poses)
+
+        # Ground points in float32 can end up in the neighbouring texel of texel boundaries
+        assert np.mean(frames != direct_frames(texture, camera, poses)) < 1e-4
+        assert np.any(frames == LabelClass.LANE_LINE)
+
+    def test_SmallTileAtlas_Render_SameFramesFromLazilyLoadedTiles(self):
+        track = read_track("reference_track_example.xml")
+        camera = PerspectiveCamera(64, 48, 50.0, max_distance=2.0)
+        poses = random_poses(track, 20, 5)
+        texture = TiledTexture.from_track(track, pixels_per_meter=200.0, tile_size=32, max_tiles=4096)
+        small_texture = TiledTexture(texture.source, track.height, track.origin, 200.0, tile_size=32, max_tiles=160)
+
+        frames = FrameRenderer(texture, camera).render(poses)
+        small_frames = FrameRenderer(small_texture, camera).render(poses)
+
+        np.testing.assert_array_equal(small_frames, frames)
+        assert texture.num_loaded_tiles < texture.num_tiles
+        assert small_texture.num_loaded_tiles > texture.num_loaded_tiles
+
+    def test_TooSmallTileAtlas_Render_ValueError(self):
+        track = read_track("doc_track_example.xml")
+        texture = TiledTexture.from_track(track, pixels_per_meter=200.0, tile_size=32, max_tiles=2)
+        camera = PerspectiveCamera(64, 48, 50.0, max_distance=2.0)
+
+        with pytest.raises(ValueError):
+            FrameRenderer(texture, camera).render(np.array([[0.5, 1.5, np.pi / 2]]))
+
+    def test_CameraLookingDown_RenderAtStart_CenterLineBelowCamera(self):
+        track = read_track("doc_track_example.xml")
+        texture = TiledTexture.from_track(track, pixels_per_meter=500.0)
+        # 1cm per pixel on the ground, image top is in front of the vehicle
+        camera = PerspectiveCamera(41, 21, 50.0, position=(0.0, 0.0, 0.5), pitch=np.pi / 2)
+
+        frame = FrameRenderer(texture, camera).render(np.array([[0.5, 1.42, np.pi / 2]]))[0]
+
+        # Start of the track at (0.5m, 1.3m) heading upwards, lines at x=0.12m, 0.5m and 0.88m with a width of 0.02m
+        assert frame[10, 20] == LabelClass.CENTER_LINE
+        assert np.all(frame[:, 5] == LabelClass.ROAD) and np.all(frame[:, 35] == LabelClass.ROAD)
+
+    def test_RgbTexture_Render_FramesWithChannels(self):
+        track = read_track("doc_track_example.xml")
+        labels = TiledTexture.from_track(track, pixels_per_meter=200.0).source
+        texture = TiledTexture(np.stack([labels, labels * 2, labels * 3], axis=-1), track.height, track.origin, 200.0)
+        camera = PerspectiveCamera(32, 24, 25.0)
+
+        frames = FrameRenderer(texture, camera).render(random_poses(track, 3, 6))
+
+        assert frames.shape == (3, 24, 32, 3)
+        np.testing.assert_array_equal(frames[..., 2], frames[..., 0] * 3)
+
+    def test_NoPoses_Render_EmptyResult(self):
+        track = read_track("small_track_example.xml")
+        texture = TiledTexture.from_track(track, pixels_per_meter=100.0)
+
+        frames = FrameRenderer(texture, PerspectiveCamera(32, 24, 25.0)).render(np.empty((0, 3)))
+
+        assert frames.shape == (0, 24, 32)
+
+
+class TestPerspectiveCamera:
+    def test_GroundPoints_Project_PixelCenters(self):
+        camera = PerspectiveCamera(64, 48, 50.0, principal_point=(30.0, 20.0), position=(0.1, -0.05, 0.3), pitch=0.4, yaw=-0.2, roll=0.1)
+
+        projected = camera.project(camera.ground[camera.is_ground])
+
+        rows, cols = np.divmod(np.flatnonzero(camera.is_ground), camera.width)
+        np.testing.assert_allclose(projected, np.stack([cols, rows], axis=-1), atol=1e-6)
+        # Pixels above the horizon do not see the ground
+        assert not np.any(camera.is_ground[: camera.width]) and np.all(camera.is_ground[-camera.width :])
+
+    def test_CameraBelowGround_Create_ValueError(self):
+        with pytest.raises(ValueError):
+            PerspectiveCamera(64, 48, 50.0, position=(0.0, 0.0, -0.1))
+
+
+class TestTiledTexture:
+    def test_LabelPng_FromPng_SameAsLabelRaster(self):
+        track = read_track("doc_track_example.xml")
+        texture = TiledTexture.from_track(track, pixels_per_meter=100.0)
+
+        png_texture = TiledTexture.from_png(encode_label_png(texture.source), track, pixels_per_meter=100.0)
+
+        np.testing.assert_array_equal(png_texture.source, texture.source)
+        rows, cols = np.array([-1, 0, 150, 10**6], dtype=np.int32), np.array([0, -5, 100, 0], dtype=np.int32)
+        np.testing.assert_array_equal(png_texture.sample(rows, cols), [0, 0, texture.source[150, 100], 0])
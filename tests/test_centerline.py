@@ -0,0 +1,176 @@
+# Copyright (C) 2024 twyleg
+from pathlib import Path
+from xml.etree import ElementTree as ET
+
+import numpy as np
+import pytest
+
+from track_generator import xml_reader
+from track_generator.centerline import CenterlinePrimitive, sample_track
+from track_generator.ground_truth_generator import GroundTruthGenerator
+from track_generator.track import LINE_OFFSET, Clothoid, ClothoidType, Turn
+
+
+#
+# General naming convention for unit tests:
+#               test_INITIALSTATE_ACTION_EXPECTATION
+#
+
+
+FILE_DIR = Path(__file__).parent
+TRACK_FILES_DIR = FILE_DIR / "../examples/track_files"
+
+ALL_SEGMENTS_TRACK = """
+<TrackDefinition version="0.0.1">
+    <Size width="20.0" height="20.0"/>
+    <Origin x="0" y="0"/>
+    <Background color="#545454" opacity="1.0"/>
+    <Segments>
+        <Start x="5.0" y="5.0" direction_angle="30.0"/>
+        <Straight length="1.0"/>
+        <Turn direction="left" radius="1.0" radian="60.0"/>
+        <Clothoid a="2.0" angle="45" angle_offset="10.0" direction="left" type="opend"/>
+        <Clothoid a="1.5" angle="30" angle_offset="20.0" direction="left" type="closing"/>
+        <Clothoid a="1.0" angle="40" angle_offset="0.0" direction="right" type="closing"/>
+        <Turn direction="right" radius="0.8" radian="45.0"/>
+        <Crosswalk length="0.4"/>
+        <Intersection length="2.0" direction="right"/>
+        <Gap length="2.0" direction="left"/>
+        <TrafficIsland island_width="0.3" crosswalk_length="0.4" curve_segment_length="0.5" curvature="0.2"/>
+    </Segments>
+</TrackDefinition>
+"""
+
+
+def read_all_segments_track():
+    track = xml_reader.read_track_from_string(ALL_SEGMENTS_TRACK)
+    track.calc()
+    return track
+
+
+def end_pose(segment):
+    local_to_world = segment.end_coordinate_system.local_to_world
+    return local_to_world[:2, 3], np.arctan2(local_to_world[1, 0], local_to_world[0, 0])
+
+
+class TestCenterline:
+    def test_AllSegmentTypes_SampleTrack_ContinuousAndEndingAtSegmentEnds(self):
+        track = read_all_segments_track()
+        samples = sample_track(track, 0.01)
+
+        steps = np.linalg.norm(np.diff(samples.center, axis=0), axis=1)
+        assert np.all(np.diff(samples.s) <= 0.01 + 1e-12)
+        np.testing.assert_allclose(steps, np.diff(samples.s), atol=1e-5)
+        for i, segment in enumerate(track.segments[1:-1], start=1):
+            end_position, _ = end_pose(segment)
+            first_sample_of_next_segment = np.argmax(samples.segment_index == i + 1)
+            np.testing.assert_allclose(samples.center[first_sample_of_next_segment], end_position, atol=1e-9)
+
+    def test_Turn_SampleTrack_SamplesOnCircleAroundCenterPoint(self):
+        track = read_all_segments_track()
+        samples = sample_track(track, 0.01)
+
+        for i, segment in enumerate(track.segments):
+            if isinstance(segment, Turn):
+                center_point = np.array([segment.center_point.x_w, segment.center_point.y_w])
+                distances = np.linalg.norm(samples.center[samples.segment_index == i] - center_point, axis=1)
+                np.testing.assert_allclose(distances, segment.radius)
+                np.testing.assert_allclose(np.abs(samples.curvature[samples.segment_index == i]), 1 / segment.radius)
+
+    def test_Track_SampleTrack_BoundariesAtLineOffsetLeftOfDrivingDirection(self):
+        samples = sample_track(read_all_segments_track(), 0.05)
+        tangent = np.stack([np.cos(samples.heading), np.sin(samples.heading)], axis=1)
+        to_left = samples.left - samples.center
+
+        assert np.all(np.linalg.norm(to_left, axis=1) >= LINE_OFFSET - 1e-9)
+        assert np.all(tangent[:, 0] * to_left[:, 1] - tangent[:, 1] * to_left[:, 0] > 0)
+        np.testing.assert_allclose(samples.left + samples.right, 2 * samples.center, atol=1e-12)
+
+    def test_ClosingClothoid_SampleTrack_MatchesClothoidLines(self):
+        track = read_all_segments_track()
+        samples = sample_track(track, 0.001)
+
+        for i, segment in enumerate(track.segments):
+            if isinstance(segment, Clothoid) and segment.type == ClothoidType.CLOSING:
+                # The end point of the segment is the first sample of the next segment
+                segment_samples = samples.samples[(samples.segment_index == i) | (samples.segment_index == i + 1)]
+                for line, columns in ((segment.lines[0], slice(1, 3)), (segment.lines[1], slice(5, 7)), (segment.lines[2], slice(7, 9))):
+                    points = np.array([[point.x_w, point.y_w] for point in line])
+                    # The last point but one of the clothoid lines overshoots the end of the clothoid
+                    points = np.delete(points, -2, axis=0)
+                    distances = np.linalg.norm(segment_samples[:, np.newaxis, columns] - points[np.newaxis], axis=2).min(axis=0)
+                    assert distances.max() < 0.001
+
+    def test_InvalidSpacing_SampleTrack_RaisesValueError(self):
+        with pytest.raises(ValueError):
+            sample_track(read_all_segments_track(), 0.0)
+
+    def test_PrimitiveWithoutEvaluate_Create_RaisesTypeError(self):
+        class IncompletePrimitive(CenterlinePrimitive):
+            length = 1.0
+
+        with pytest.raises(TypeError):
+            IncompletePrimitive()  # type: ignore
+
+
+class TestCenterlineEvaluation:
+    def test_AllSegmentTypes_EvaluateCenterline_SameAsSamples(self):
+        track = read_all_segments_track()
+        samples = sample_track(track, 0.01)
+
+        positions, headings, curvatures = track.evaluate_centerline(samples.s)
+
+        np.testing.assert_allclose(positions, samples.center, atol=1e-12)
+        np.testing.assert_allclose(headings, samples.heading, atol=1e-12)
+        np.testing.assert_allclose(curvatures, samples.curvature, atol=1e-12)
+
+    @pytest.mark.parametrize("filename", ["doc_track_example.xml", "reference_track_example.xml"])
+    def test_TrackFile_EvaluateCenterline_HeadingAndCurvatureAreDerivatives(self, filename):
+        track = xml_reader.read_track(TRACK_FILES_DIR / filename)
+        track.calc()
+        path = track.get_centerline_path()
+        # Unsorted arc lengths within the pieces, away from the joints where heading and curvature are not differentiable
+        s = np.concatenate([np.linspace(start + 0.01, end - 0.01, 100) for start, end in zip(path.s_starts[:-1], path.s_starts[1:])])
+        order = np.random.default_rng(0).permutation(len(s))
+
+        _, headings, curvatures = track.evaluate_centerline(s[order])
+        next_positions, next_headings, _ = track.evaluate_centerline(s[order] + 1e-6)
+        previous_positions, previous_headings, _ = track.evaluate_centerline(s[order] - 1e-6)
+
+        direction = next_positions - previous_positions
+        np.testing.assert_allclose(np.hypot(direction[:, 0], direction[:, 1]), 2e-6, rtol=1e-6)
+        heading_errors = np.arctan2(direction[:, 1], direction[:, 0]) - headings
+        np.testing.assert_allclose(np.arctan2(np.sin(heading_errors), np.cos(heading_errors)), 0.0, atol=1e-6)
+        np.testing.assert_allclose((next_headings - previous_headings) / 2e-6, curvatures, atol=1e-3)
+
+    def test_ArcLengthsOutsideOfTrack_EvaluateCenterline_ClippedToEnds(self):
+        track = read_all_segments_track()
+        length = track.get_centerline_path().length
+
+        positions, _, _ = track.evaluate_centerline(np.array([-1.0, 0.0, length, length + 1.0]))
+
+        np.testing.assert_array_equal(positions[0], positions[1])
+        np.testing.assert_array_equal(positions[2], positions[3])
+        np.testing.assert_allclose(positions[0], [5.0, 5.0])
+
+    def test_CalculatedTrack_GetCenterlinePath_CachedUntilRecalculated(self):
+        track = read_all_segments_track()
+
+        path = track.get_centerline_path()
+
+        assert track.get_centerline_path() is path
+        track.calc()
+        assert track.get_centerline_path() is not path
+
+
+class TestDenseGroundTruth:
+    def test_TrackFile_RenderDenseGroundTruth_PointsAtSpacing(self):
+        track = xml_reader.read_track(TRACK_FILES_DIR / "small_track_example.xml")
+        track.calc()
+        samples = sample_track(track, 0.02)
+
+        root = ET.fromstring(GroundTruthGenerator("small_track_example", spacing=0.02).render_ground_truth(track).split("?>", 1)[1])
+        points = np.array([[float(point.attrib[name]) for name in ("x_1", "y_1", "x_2", "y_2", "x_c", "y_c")] for point in root.findall("Points/Point")])
+
+        assert root.attrib == {"version": "0.0.1", "spacing": "0.02"}
+        np.testing.assert_array_equal(points, np.column_stack([samples.right, samples.left, samples.center]))
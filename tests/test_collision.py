@@ -0,0 +1,117 @@
+# Copyright (C) 2024 twyleg
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from track_generator import xml_reader
+from track_generator.collision import CollisionChecker, CollisionClass
+from track_generator.label_raster import polygon_to_array
+from track_generator.track import ParkingArea, TrafficIsland
+
+
+#
+# General naming convention for unit tests:
+#               test_INITIALSTATE_ACTION_EXPECTATION
+#
+
+
+FILE_DIR = Path(__file__).parent
+TRACK_FILES_DIR = FILE_DIR / "../examples/track_files"
+
+
+def read_track(filename: str):
+    track = xml_reader.read_track(TRACK_FILES_DIR / filename)
+    track.calc()
+    return track
+
+
+def brute_force_collisions(checker: CollisionChecker, poses: np.ndarray, length: float, width: float) -> np.ndarray:
+    """
+    Collisions of dense point samples of the footprints with the obstacle segments
+    """
+    u, v = (grid.ravel() for grid in np.meshgrid(np.linspace(-0.5, 0.5, 41), np.linspace(-0.5, 0.5, 41)))
+    direction = checker.p1 - checker.p0
+    squared_length = np.maximum(np.sum(direction**2, axis=1), 1e-24)
+    collisions = np.zeros((len(poses), len(CollisionClass)), dtype=bool)
+    for i, (x, y, heading) in enumerate(poses):
+        # Segments within the circumcircle of the footprint
+        t = np.clip(((x - checker.p0[:, 0]) * direction[:, 0] + (y - checker.p0[:, 1]) * direction[:, 1]) / squared_length, 0.0, 1.0)
+        near = (
+            np.hypot(x - checker.p0[:, 0] - t * direction[:, 0], y - checker.p0[:, 1] - t * direction[:, 1]) <= np.hypot(length, width) / 2 + checker.clearance
+        )
+        p0, segment_direction = checker.p0[near], direction[near]
+        points_x = x + length * u * np.cos(heading) - width * v * np.sin(heading)
+        points_y = y + length * u * np.sin(heading) + width * v * np.cos(heading)
+        relative_x, relative_y = points_x[:, np.newaxis] - p0[:, 0], points_y[:, np.newaxis] - p0[:, 1]
+        t = np.clip((relative_x * segment_direction[:, 0] + relative_y * segment_direction[:, 1]) / squared_length[near], 0.0, 1.0)
+        distances = np.hypot(relative_x - t * segment_direction[:, 0], relative_y - t * segment_direction[:, 1])
+        is_hit = np.any(distances <= checker.clearance[near], axis=0)
+        for collision_class in CollisionClass:
+            collisions[i, collision_class] = np.any(is_hit[checker.classes[near] == collision_class])
+    return collisions
+
+
+class TestCollisionChecker:
+    @pytest.mark.parametrize("filename", ["reference_track_example.xml", "doc_track_example.xml"])
+    def test_RandomPoses_Check_SameAsBruteForce(self, filename):
+        track = read_track(filename)
+        checker = CollisionChecker.from_track(track)
+        rng = np.random.default_rng(2)
+        poses = np.stack([rng.uniform(0.0, track.width, 500), rng.uniform(0.0, track.height, 500), rng.uniform(-np.pi, np.pi, 500)], axis=-1)
+
+        collisions = checker.check(poses, 0.4, 0.2)
+
+        expected = brute_force_collisions(checker, poses, 0.4, 0.2)
+        # Footprints entirely within traffic islands do not touch segments
+        np.testing.assert_array_equal(np.delete(collisions, CollisionClass.TRAFFIC_ISLAND, axis=1), np.delete(expected, CollisionClass.TRAFFIC_ISLAND, axis=1))
+        assert np.all(collisions[:, CollisionClass.TRAFFIC_ISLAND] >= expected[:, CollisionClass.TRAFFIC_ISLAND])
+        assert np.any(collisions[:, CollisionClass.LANE_LINE]) and not np.all(collisions[:, CollisionClass.LANE_LINE])
+
+    def test_VehicleInLane_CheckAlongAndAcrossTrack_CollidesAcrossOnly(self):
+        track = read_track("doc_track_example.xml")
+        checker = CollisionChecker.from_track(track)
+        # Start of the track at (0.5m, 1.3m) heading upwards, right lane center at x=0.69m
+        poses = np.array([[0.69, 1.6, np.pi / 2], [0.69, 1.6, 0.0]])
+
+        collisions = checker.check(poses, 0.4, 0.2)
+
+        np.testing.assert_array_equal(collisions.any(axis=1), [False, True])
+        assert collisions[1, CollisionClass.LANE_LINE]
+
+    def test_BlockedParkingSpot_CheckFootprintOnCross_CollidesWithBlocker(self):
+        track = read_track("reference_track_example.xml")
+        checker = CollisionChecker.from_track(track)
+        parking_area = next(segment for segment in track.segments if isinstance(segment, ParkingArea))
+        cross_center = polygon_to_array(parking_area.blocker_polygons[0]).mean(axis=0)
+
+        collisions = checker.check(np.array([[*cross_center, 0.0]]), 0.1, 0.1)
+
+        assert collisions[0, CollisionClass.BLOCKER]
+        assert not collisions[0, CollisionClass.LANE_LINE]
+
+    def test_TrafficIsland_CheckFootprintWithinIsland_CollidesWithIsland(self):
+        track = read_track("reference_track_example.xml")
+        checker = CollisionChecker.from_track(track)
+        island = next(segment for segment in track.segments if isinstance(segment, TrafficIsland))
+        island_center = (polygon_to_array(island.line_polygons[0])[1:3].mean(axis=0) + polygon_to_array(island.line_polygons[2])[1:3].mean(axis=0)) / 2
+
+        collisions = checker.check(np.array([[*island_center, 0.0]]), 0.05, 0.05)
+
+        np.testing.assert_array_equal(collisions[0], [False, False, False, True])
+
+    def test_Poses_CheckWithFootprintPerPose_SizesApplied(self):
+        track = read_track("doc_track_example.xml")
+        checker = CollisionChecker.from_track(track)
+        poses = np.array([[0.69, 1.6, np.pi / 2], [0.69, 1.6, np.pi / 2]])
+
+        is_colliding = checker.collides(poses, 0.4, np.array([0.2, 0.5]))
+
+        np.testing.assert_array_equal(is_colliding, [False, True])
+
+    def test_NoPoses_Check_EmptyResult(self):
+        track = read_track("small_track_example.xml")
+
+        collisions = CollisionChecker.from_track(track).check(np.empty((0, 3)))
+
+        assert collisions.shape == (0, len(CollisionClass))
@@ -0,0 +1,141 @@
+# Copyright (C) 2024 twyleg
+import os
+import shutil
+from pathlib import Path
+
+import pytest
+
+from track_generator import generator
+from track_generator.content_store import ContentAddressedSink, ContentStore
+from track_generator.generator import generate_track
+from track_generator.sinks import DirectorySink
+
+
+#
+# General naming convention for unit tests:
+#               test_INITIALSTATE_ACTION_EXPECTATION
+#
+
+
+FILE_DIR = Path(__file__).parent
+TRACK_FILES_DIR = FILE_DIR / "../examples/track_files"
+
+
+def read_files(root_dirpath: Path):
+    return {filepath.relative_to(root_dirpath): filepath.read_bytes() for filepath in root_dirpath.rglob("*") if filepath.is_file()}
+
+
+class TestContentAddressedSink:
+    def test_IdenticalArtifactsOfTwoTracks_Write_StoredOnceAndHardlinked(self, tmp_path):
+        content_store = ContentStore(tmp_path / "store")
+        with ContentAddressedSink(tmp_path / "output", content_store) as sink:
+            sink.write("track_a", "gazebo_models/setup.bash", "#!/bin/bash\n")
+            sink.write("track_b", "gazebo_models/setup.bash", "#!/bin/bash\n")
+
+        filepath_a = tmp_path / "output/track_a/gazebo_models/setup.bash"
+        filepath_b = tmp_path / "output/track_b/gazebo_models/setup.bash"
+        assert filepath_a.read_text() == "#!/bin/bash\n"
+        assert filepath_a.stat().st_ino == filepath_b.stat().st_ino
+        assert content_store.statistics() == {"objects_written": 1, "objects_reused": 1, "bytes_written": 12, "bytes_reused": 12}
+
+    @pytest.mark.parametrize("link_mode", ["hardlink", "symlink"])
+    def test_MaterializedTree_RegenerateWithDirectorySink_StoredObjectUnchanged(self, tmp_path, link_mode):
+        content_store = ContentStore(tmp_path / "store")
+        with ContentAddressedSink(tmp_path / "output", content_store, link_mode) as sink:
+            sink.write("track", "a.txt", b"old")
+            sink.write("other_track", "a.txt", b"old")
+
+        with DirectorySink(tmp_path / "output") as directory_sink:
+            directory_sink.write("track", "a.txt", b"new")
+
+        assert (tmp_path / "output/track/a.txt").read_bytes() == b"new"
+        assert not (tmp_path / "output/track/a.txt").is_symlink()
+        assert (tmp_path / "output/other_track/a.txt").read_bytes() == b"old"
+        assert [filepath.read_bytes() for filepath in (tmp_path / "store").rglob("*") if filepath.is_file() and "manifests" not in filepath.parts] == [b"old"]
+
+    def test_SymlinkMode_GenerateTrack_SameFilesAsDirectorySink(self, tmp_path):
+        track_filepath = TRACK_FILES_DIR / "small_track_example.xml"
+        generate_track([track_filepath], tmp_path / "reference", generate_ground_truth=True)
+        with ContentAddressedSink(tmp_path / "output", ContentStore(tmp_path / "store"), link_mode="symlink") as sink:
+            generate_track([track_filepath], tmp_path / "output", generate_ground_truth=True, sink=sink)
+
+        assert read_files(tmp_path / "output") == read_files(tmp_path / "reference")
+        assert (tmp_path / "output/small_track_example/ground_truth.xml").is_symlink()
+
+    def test_ContentStoreWithFsync_WriteAndFlush_ObjectsAndDirectoriesSynced(self, tmp_path, monkeypatch):
+        synced_fds = []
+        monkeypatch.setattr(os, "fsync", synced_fds.append)
+        with ContentAddressedSink(tmp_path / "output", ContentStore(tmp_path / "store", fsync=True)) as sink:
+            sink.write("track", "ground_truth.xml", "<GroundTruth/>")
+            sink.write("track", "track.svg", "<svg/>")
+
+        # Two objects, their directories in the store and the track directory
+        assert len(synced_fds) == 5
+
+
+class TestRenderCache:
+    def test_RenderedTrack_GenerateTrackAgain_ReusedWithoutRendering(self, tmp_path, monkeypatch):
+        track_filepaths = [TRACK_FILES_DIR / "small_track_example.xml", TRACK_FILES_DIR / "background_image_example.xml"]
+        content_store = ContentStore(tmp_path / "store")
+        with ContentAddressedSink(tmp_path / "first", content_store) as sink:
+            generate_track(track_filepaths, tmp_path / "first", generate_ground_truth=True, sink=sink, render_cache=content_store)
+
+        def render_track_artifacts(*args, **kwargs):
+            raise AssertionError("Track rendered again")
+
+        monkeypatch.setattr(generator, "render_track_artifacts", render_track_artifacts)
+        with ContentAddressedSink(tmp_path / "second", content_store) as sink:
+            track_output_directories = generate_track(track_filepaths, tmp_path / "second", generate_ground_truth=True, sink=sink, render_cache=content_store)
+
+        assert track_output_directories == [tmp_path / "second/small_track_example", tmp_path / "second/background_image_example"]
+        assert read_files(tmp_path / "second") == read_files(tmp_path / "first")
+
+    def test_ContentAddressedSink_GenerateTrackWithRenderCache_ObjectsStoredOnce(self, tmp_path):
+        track_filepaths = [TRACK_FILES_DIR / "small_track_example.xml", TRACK_FILES_DIR / "doc_track_example.xml"]
+        content_store = ContentStore(tmp_path / "store")
+        with ContentAddressedSink(tmp_path / "output", content_store) as sink:
+            generate_track(track_filepaths, tmp_path / "output", generate_ground_truth=True, sink=sink, render_cache=content_store)
+
+        assert content_store.statistics()["objects_written"] == len(read_files(tmp_path / "output"))
+        assert content_store.statistics()["objects_reused"] == 0
+
+    def test_TrackFilesWithSameName_GenerateTrack_BothRendersStored(self, tmp_path):
+        track_filepaths = [tmp_path / "a/track.xml", tmp_path / "b/track.xml"]
+        for track_filepath, example_filename in zip(track_filepaths, ["small_track_example.xml", "doc_track_example.xml"]):
+            track_filepath.parent.mkdir()
+            shutil.copyfile(TRACK_FILES_DIR / example_filename, track_filepath)
+        content_store = ContentStore(tmp_path / "store")
+
+        generate_track(track_filepaths, tmp_path / "output", prefetch=2, render_cache=content_store)
+
+        assert len(list((tmp_path / "store/manifests").iterdir())) == 2
+
+    def test_ChangedTrackFile_GenerateTrackAgain_TrackRenderedAgain(self, tmp_path):
+        track_filepath = tmp_path / "track.xml"
+        shutil.copyfile(TRACK_FILES_DIR / "small_track_example.xml", track_filepath)
+        content_store = ContentStore(tmp_path / "store")
+        generate_track([track_filepath], tmp_path / "output", render_cache=content_store)
+
+        track_filepath.write_text(track_filepath.read_text().replace('length="1.800"', 'length="1.900"'))
+        generate_track([track_filepath], tmp_path / "output", render_cache=content_store)
+
+        assert len(list((tmp_path / "store/manifests").iterdir())) == 2
+
+    def test_ManifestWithMissingObject_GetManifest_ReturnsNone(self, tmp_path):
+        content_store = ContentStore(tmp_path / "store")
+        digest = content_store.put("<GroundTruth/>")
+        content_store.put_manifest("key", {"ground_truth.xml": digest})
+        assert content_store.get_manifest("key") == {"ground_truth.xml": digest}
+
+        content_store.get_object_path(digest).unlink()
+        assert content_store.get_manifest("key") is None
+
+
+class TestContentStore:
+    @pytest.mark.parametrize("content", ["text", b"\x89PNG"])
+    def test_Content_PutAndRead_ContentUnchangedAndObjectReadOnly(self, tmp_path, content):
+        content_store = ContentStore(tmp_path)
+        digest = content_store.put(content)
+
+        assert content_store.read(digest) == (content.encode("utf-8") if isinstance(content, str) else content)
+        assert content_store.get_object_path(digest).stat().st_mode & 0o222 == 0
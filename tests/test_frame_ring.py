@@ -0,0 +1,115 @@
+# Copyright (C) 2024 twyleg
+import multiprocessing
+from pathlib import Path
+
+import imageio.v3 as iio
+import numpy as np
+import pytest
+
+from track_generator.frame_ring import FrameRingBuffer, FrameRingReader, RingBufferSink
+from track_generator.generator import generate_track
+
+
+#
+# General naming convention for unit tests:
+#               test_INITIALSTATE_ACTION_EXPECTATION
+#
+
+
+FILE_DIR = Path(__file__).parent
+TRACK_FILES_DIR = FILE_DIR / "../examples/track_files"
+
+
+def consume_frames(name: str, count: int, queue) -> None:
+    with FrameRingReader(name) as reader:
+        sums = []
+        for sequence in range(1, count + 1):
+            frame = reader.wait(sequence, timeout=10.0)
+            assert frame is not None
+            sums.append((int(frame.array.sum()), frame.metadata["index"], frame.is_valid()))
+            del frame
+    queue.put(sums)
+
+
+class TestFrameRingBuffer:
+    def test_Frames_WriteAndRead_SameFramesWithoutCopies(self):
+        with FrameRingBuffer.for_frames((4, 5, 3), num_slots=4) as ring, FrameRingReader(ring.name) as reader:
+            frames = np.arange(3 * 60, dtype=np.uint8).reshape(3, 4, 5, 3)
+            sequence = ring.write_batch(frames, [{"index": i} for i in range(3)])
+
+            frame = reader.read(2)
+
+            assert sequence == reader.sequence == 3
+            assert frame is not None and frame.sequence == 2 and frame.metadata == {"index": 1}
+            np.testing.assert_array_equal(frame.array, frames[1])
+            assert not frame.array.flags.owndata and not frame.array.flags.writeable
+            assert frame.is_valid()
+            np.testing.assert_array_equal(reader.read_latest().array, frames[2])
+            del frame
+
+    def test_FullRing_WriteMoreFrames_OldestFramesReplaced(self):
+        with FrameRingBuffer(8, num_slots=2) as ring, FrameRingReader(ring.name) as reader:
+            ring.write(np.array([1.0]))
+            first = reader.read(1)
+            assert first is not None
+
+            ring.write(np.array([2.0]))
+            ring.write(np.array([3.0]))
+
+            assert not first.is_valid()
+            assert reader.read(1) is None and reader.read(4) is None
+            assert reader.read(3).array.tolist() == [3.0]
+            del first
+
+    def test_FrameOrMetadataTooLarge_Write_ValueError(self):
+        with FrameRingBuffer(16, metadata_size=16) as ring:
+            with pytest.raises(ValueError):
+                ring.write(np.zeros(3, dtype=np.float64))
+            with pytest.raises(ValueError):
+                ring.write(np.zeros(2), {"name": "a long name of the frame"})
+            assert ring.sequence == 0
+
+    def test_ConsumerProcess_WriteFrames_ConsumerReadsEveryFrame(self):
+        context = multiprocessing.get_context("spawn")
+        with FrameRingBuffer.for_frames((48, 64), dtype=np.uint16, num_slots=64) as ring:
+            queue = context.Queue()
+            process = context.Process(target=consume_frames, args=(ring.name, 50, queue))
+            process.start()
+            for i in range(50):
+                ring.write(np.full((48, 64), i, dtype=np.uint16), {"index": i})
+            sums = queue.get(timeout=60.0)
+            process.join(timeout=60.0)
+
+        assert process.exitcode == 0
+        assert sums == [(i * 48 * 64, i, True) for i in range(50)]
+
+
+class TestRingBufferSink:
+    def test_TrackWithLabelsAndMap_GenerateTrack_RastersPublished(self, tmp_path):
+        with FrameRingBuffer(1 << 24, num_slots=4) as ring, FrameRingReader(ring.name) as reader:
+            generate_track([TRACK_FILES_DIR / "small_track_example.xml"], tmp_path, generate_labels=True, map_resolution=0.05, sink=RingBufferSink(ring))
+
+            frames = [reader.read(sequence) for sequence in range(1, reader.sequence + 1)]
+
+            paths = {frame.metadata["relative_path"]: frame for frame in frames}
+            assert set(paths) == {"small_track_example_labels.png", "map.pgm", "map_distance.npy", "map_heading.npy"}
+            assert all(frame.metadata["track_name"] == "small_track_example" for frame in frames)
+            labels = paths["small_track_example_labels.png"].array
+            assert labels.dtype == np.uint8 and labels.ndim == 2 and labels.max() > 0
+            occupancy = paths["map.pgm"].array
+            assert occupancy.dtype == np.uint8 and occupancy.shape == paths["map_distance.npy"].array.shape
+            distance = paths["map_distance.npy"].array
+            assert distance.dtype == np.float32 and distance.ndim == 2
+            del frames, paths, labels, occupancy, distance
+
+    def test_TrackPng_Write_PublishedAsDecodedImage(self):
+        image = np.random.default_rng(0).integers(0, 256, size=(12, 20, 4), dtype=np.uint8)
+        png = iio.imwrite("<bytes>", image, extension=".png")
+
+        with FrameRingBuffer(1 << 16, num_slots=2) as ring, FrameRingReader(ring.name) as reader:
+            RingBufferSink(ring).write("track", "track.png", png)
+
+            frame = reader.read_latest()
+            assert frame is not None
+            np.testing.assert_array_equal(frame.array, image)
+            del frame
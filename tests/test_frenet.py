@@ -0,0 +1,142 @@
+# Copyright (C) 2024 twyleg
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from track_generator import xml_reader
+from track_generator.centerline import CenterlinePath, sample_track
+from track_generator.frenet import FrenetFrame
+
+
+#
+# General naming convention for unit tests:
+#               test_INITIALSTATE_ACTION_EXPECTATION
+#
+
+
+FILE_DIR = Path(__file__).parent
+TRACK_FILES_DIR = FILE_DIR / "../examples/track_files"
+
+MIXED_SEGMENTS_TRACK = """
+<TrackDefinition version="0.0.1">
+    <Size width="20.0" height="20.0"/>
+    <Origin x="0" y="0"/>
+    <Background color="#545454" opacity="1.0"/>
+    <Segments>
+        <Start x="5.0" y="5.0" direction_angle="30.0"/>
+        <Straight length="1.0"/>
+        <Turn direction="left" radius="1.0" radian="60.0"/>
+        <Clothoid a="2.0" angle="45" angle_offset="10.0" direction="left" type="opend"/>
+        <Clothoid a="1.0" angle="40" angle_offset="0.0" direction="right" type="closing"/>
+        <Crosswalk length="0.4"/>
+        <Intersection length="2.0" direction="right"/>
+        <Gap length="2.0" direction="left"/>
+        <TrafficIsland island_width="0.3" crosswalk_length="0.4" curve_segment_length="0.5" curvature="0.2"/>
+    </Segments>
+</TrackDefinition>
+"""
+
+
+def read_mixed_segments_track():
+    track = xml_reader.read_track_from_string(MIXED_SEGMENTS_TRACK)
+    track.calc()
+    return track
+
+
+def read_track(filename: str):
+    track = xml_reader.read_track(TRACK_FILES_DIR / filename)
+    track.calc()
+    return track
+
+
+class TestFrenetFrame:
+    def test_AllSegmentTypes_ToFrenet_ArcLengthAndOffsetOfSamples(self):
+        track = read_mixed_segments_track()
+        samples = sample_track(track, 0.01)
+        offsets = np.random.default_rng(0).uniform(-0.3, 0.3, len(samples))
+        normals = np.stack([-np.sin(samples.heading), np.cos(samples.heading)], axis=-1)
+
+        s, d, relative_headings = track.get_frenet_frame().to_frenet(samples.center + offsets[:, np.newaxis] * normals, samples.heading + 0.2)
+
+        # The clothoids join their neighbours with small kinks, so offset points at the joints differ slightly in s
+        np.testing.assert_allclose(s, samples.s, atol=1e-3)
+        np.testing.assert_allclose(d, offsets, atol=1e-6)
+        np.testing.assert_allclose(relative_headings, 0.2, atol=1e-6)
+
+    @pytest.mark.parametrize("filename", ["doc_track_example.xml", "clothoid_track_example.xml"])
+    def test_RandomPoints_ToFrenet_NearestPointOfCenterLine(self, filename):
+        track = read_track(filename)
+        samples = sample_track(track, 0.001)
+        points = np.random.default_rng(0).uniform(samples.center.min(axis=0) - 1.5, samples.center.max(axis=0) + 1.5, size=(1000, 2))
+
+        frenet_frame = track.get_frenet_frame()
+        s, d, relative_headings = frenet_frame.to_frenet(points)
+        nearest_points, _ = frenet_frame.to_cartesian(s, np.zeros_like(s))
+
+        brute_force = np.hypot(points[:, np.newaxis, 0] - samples.x, points[:, np.newaxis, 1] - samples.y).min(axis=1)
+        np.testing.assert_allclose(np.hypot(*(points - nearest_points).T), brute_force, atol=1e-3)
+        assert relative_headings is None
+        assert np.all((s >= 0.0) & (s <= frenet_frame.length))
+
+    def test_FrenetCoordinates_ToCartesianAndBack_SameCoordinates(self):
+        frenet_frame = read_track("doc_track_example.xml").get_frenet_frame()
+        rng = np.random.default_rng(0)
+        s = rng.uniform(0.0, frenet_frame.length, 1000)
+        d = rng.uniform(-0.3, 0.3, 1000)
+        relative_headings = rng.uniform(-1.0, 1.0, 1000)
+
+        points, headings = frenet_frame.to_cartesian(s, d, relative_headings)
+        # Points on the crossing of the intersection can be closer to the other driving direction
+        same_s, same_d, same_relative_headings = frenet_frame.to_frenet(points, headings)
+        is_unique = np.abs(same_s - s) < 1e-6
+
+        assert np.count_nonzero(is_unique) > 0.9 * len(s)
+        np.testing.assert_allclose(same_d[is_unique], d[is_unique], atol=1e-9)
+        np.testing.assert_allclose(same_relative_headings[is_unique], relative_headings[is_unique], atol=1e-9)
+
+    def test_PointBehindStart_ToFrenet_ProjectedToStart(self):
+        # Start at (5m, 5m) heading 30 degrees, the point is 0.5m behind and 0.1m left of the start
+        frenet_frame = read_mixed_segments_track().get_frenet_frame()
+        heading = np.radians(30.0)
+
+        s, d, _ = frenet_frame.to_frenet(np.array([[5.0 - 0.5 * np.cos(heading) - 0.1 * np.sin(heading), 5.0 - 0.5 * np.sin(heading) + 0.1 * np.cos(heading)]]))
+
+        assert s[0] == pytest.approx(0.0)
+        assert d[0] == pytest.approx(0.1)
+
+    def test_LaneAtCrossingOfTrack_ProjectNear_StaysOnOwnBranch(self):
+        track = read_track("reference_track_example.xml")
+        frenet_frame = track.get_frenet_frame()
+        s = np.linspace(4.0, 5.0, 201)
+        points, _ = frenet_frame.to_cartesian(s, np.full_like(s, -0.19))
+
+        nearest_s, _, _ = frenet_frame.project(points)
+        near_s, near_d, _ = frenet_frame.project_near(points, s + 0.1, 0.5)
+
+        assert np.any(np.abs(nearest_s - s) > 1.0)
+        np.testing.assert_allclose(near_s, s, atol=1e-6)
+        np.testing.assert_allclose(near_d, -0.19, atol=1e-6)
+
+    def test_ClosedTrack_ProjectNearAcrossEnd_WrapsAround(self):
+        track = read_track("reference_track_example.xml")
+        frenet_frame = track.get_frenet_frame()
+        s = np.array([0.05, frenet_frame.length - 0.05])
+        points, _ = frenet_frame.to_cartesian(s, np.zeros_like(s))
+
+        near_s, _, _ = frenet_frame.project_near(points, s[::-1], 0.2, closed=True)
+
+        np.testing.assert_allclose(near_s, s, atol=1e-6)
+
+    def test_InvalidCellSize_FromTrack_RaisesValueError(self):
+        with pytest.raises(ValueError):
+            FrenetFrame(CenterlinePath(read_track("small_track_example.xml")), cell_size=0.0)
+
+    def test_CalculatedTrack_GetFrenetFrame_CachedUntilRecalculated(self):
+        track = read_track("small_track_example.xml")
+
+        frenet_frame = track.get_frenet_frame()
+
+        assert track.get_frenet_frame() is frenet_frame
+        track.calc()
+        assert track.get_frenet_frame() is not frenet_frame
@@ -0,0 +1,37 @@
+# Copyright (C) 2024 twyleg
+import glob
+from pathlib import Path
+
+from track_generator.generator import iter_generate_track
+
+
+#
+# General naming convention for unit tests:
+#               test_INITIALSTATE_ACTION_EXPECTATION
+#
+
+
+FILE_DIR = Path(__file__).parent
+TRACK_FILES_DIR = FILE_DIR / "../examples/track_files"
+
+
+def get_track_files():
+    return sorted(Path(filepath) for filepath in glob.glob(str(TRACK_FILES_DIR / "*.xml")))
+
+
+class TestIterGenerateTrack:
+    def test_LazyTrackFiles_IterateWithPrefetch_YieldsArtifactsInInputOrder(self):
+        track_filepaths = get_track_files()
+
+        artifacts = list(iter_generate_track((filepath for filepath in track_filepaths), generate_ground_truth=True, prefetch=2))
+
+        assert [a.track_name for a in artifacts] == [filepath.stem for filepath in track_filepaths]
+        assert all(a.svg and a.ground_truth for a in artifacts)
+
+    def test_TrackFiles_IterateWithAndWithoutPrefetch_ProduceEqualArtifacts(self):
+        track_filepaths = get_track_files()[:2]
+
+        sequential = [a.files() for a in iter_generate_track(track_filepaths)]
+        prefetched = [a.files() for a in iter_generate_track(track_filepaths, prefetch=1)]
+
+        assert sequential == prefetched
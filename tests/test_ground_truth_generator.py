@@ -0,0 +1,115 @@
+# Copyright (C) 2024 twyleg
+import io
+from pathlib import Path
+from xml.dom import minidom
+from xml.etree import ElementTree as ET
+
+import numpy as np
+import pytest
+
+from track_generator import xml_reader
+from track_generator.generator import generate_track
+from track_generator.ground_truth_generator import SEGMENT_TYPES, GroundTruthGenerator, GroundTruthWriter, calc_ground_truth_columns, load_ground_truth
+
+
+#
+# General naming convention for unit tests:
+#               test_INITIALSTATE_ACTION_EXPECTATION
+#
+
+
+FILE_DIR = Path(__file__).parent
+TRACK_FILES_DIR = FILE_DIR / "../examples/track_files"
+
+
+def render_with_minidom(points: np.ndarray) -> str:
+    root = ET.Element("GroundTruth", {"version": "0.0.1"})
+    points_element = ET.SubElement(root, "Points")
+    for x_1, y_1, x_2, y_2 in points:
+        ET.SubElement(points_element, "Point", {"x_1": str(x_1), "y_1": str(y_1), "x_2": str(x_2), "y_2": str(y_2)})
+    return minidom.parseString(ET.tostring(root, "utf-8")).toprettyxml(indent="\t")
+
+
+def render_with_writer(points: np.ndarray, indent="\t") -> str:
+    f = io.StringIO()
+    writer = GroundTruthWriter(f, indent)
+    writer.write_points(points[:1])
+    writer.write_points(points[1:])
+    writer.close()
+    return f.getvalue()
+
+
+class TestGroundTruthWriter:
+    def test_PointsWithEdgeCaseValues_Write_SameOutputAsMinidom(self):
+        points = np.array([[0.78, 1.05, 0.020000000000000018, -0.0], [1e-05, 1e16, 123456789.123, -2.5e-300], [0.1, 0.2, 0.30000000000000004, 4.0]])
+        assert render_with_writer(points) == render_with_minidom(points)
+
+    def test_NoPoints_Write_SameOutputAsMinidom(self):
+        assert render_with_writer(np.empty((0, 4))) == render_with_minidom(np.empty((0, 4)))
+
+    def test_NoIndentation_Write_SamePointsWithoutWhitespace(self):
+        points = np.array([[0.78, 1.05, 0.02, 1.05], [0.78, 2.85, 0.02, 2.85]])
+        output = render_with_writer(points, indent=None)
+
+        assert "\n" not in output and "\t" not in output
+        parsed_points = ET.fromstring(output.split("?>", 1)[1]).findall("Points/Point")
+        assert [[float(point.attrib[key]) for key in ("x_1", "y_1", "x_2", "y_2")] for point in parsed_points] == points.tolist()
+
+
+class TestGroundTruthGenerator:
+    def test_TrackFile_GenerateGroundTruth_FileMatchesRenderedGroundTruth(self, tmp_path):
+        track = xml_reader.read_track(TRACK_FILES_DIR / "clothoid_track_example.xml")
+        track.calc()
+        GroundTruthGenerator("clothoid_track_example", tmp_path).generate_ground_truth(track)
+
+        ground_truth = (tmp_path / "ground_truth.xml").read_text()
+        assert ground_truth == GroundTruthGenerator("clothoid_track_example").render_ground_truth(track)
+        assert len(ET.fromstring(ground_truth.split("?>", 1)[1]).findall("Points/Point")) > 0
+
+    def test_TrackFile_GenerateXmlAndBinaryGroundTruth_FilesMatchRenderedFiles(self, tmp_path):
+        track = xml_reader.read_track(TRACK_FILES_DIR / "small_track_example.xml")
+        track.calc()
+        GroundTruthGenerator("small_track_example", tmp_path, formats=("xml", "npz", "raw")).generate_ground_truth(track)
+
+        rendered_files = GroundTruthGenerator("small_track_example", formats=("xml", "npz", "raw")).render_ground_truth_files(track)
+        assert sorted(path.name for path in tmp_path.iterdir()) == sorted(rendered_files)
+        assert (tmp_path / "ground_truth.xml").read_text() == rendered_files["ground_truth.xml"]
+        assert (tmp_path / "ground_truth.bin").read_bytes() == rendered_files["ground_truth.bin"]
+
+
+class TestBinaryGroundTruth:
+    @pytest.mark.parametrize("ground_truth_format,filename", [("npz", "ground_truth.npz"), ("raw", "ground_truth.json")])
+    def test_TrackFile_GenerateBinaryGroundTruth_LoadedColumnsMatchCalculatedColumns(self, tmp_path, ground_truth_format, filename):
+        generate_track([TRACK_FILES_DIR / "small_track_example.xml"], tmp_path, generate_ground_truth=True, ground_truth_formats=[ground_truth_format])
+        track = xml_reader.read_track(TRACK_FILES_DIR / "small_track_example.xml")
+        track.calc()
+
+        ground_truth = load_ground_truth(tmp_path / "small_track_example" / filename)
+        expected_columns = calc_ground_truth_columns(track, 0.01)
+
+        assert not (tmp_path / "small_track_example/ground_truth.xml").exists()
+        for name, column in expected_columns.items():
+            np.testing.assert_array_equal(ground_truth[name], column)
+            assert ground_truth[name].dtype == column.dtype
+
+    def test_RawGroundTruth_Load_ColumnsAreReadOnlyViewsOfMappedFile(self, tmp_path):
+        track = xml_reader.read_track(TRACK_FILES_DIR / "clothoid_track_example.xml")
+        track.calc()
+        GroundTruthGenerator("clothoid_track_example", tmp_path, formats=["raw"]).generate_ground_truth(track)
+
+        ground_truth = load_ground_truth(tmp_path / "ground_truth.json")
+
+        assert isinstance(ground_truth["x"].base, np.memmap)
+        assert not ground_truth["x"].flags.writeable
+
+    def test_TrackFile_CalcColumns_PixelCoordinatesAndSegmentTypesMatchTrack(self):
+        track = xml_reader.read_track(TRACK_FILES_DIR / "small_track_example.xml")
+        track.calc()
+
+        columns = calc_ground_truth_columns(track, 0.05)
+
+        # Start at x=0.4m, y=1.05m on a 4m high track
+        assert (columns["px"][0], columns["py"][0]) == pytest.approx((400.0, 2950.0))
+        np.testing.assert_allclose(columns["left_px"] - columns["px"], (columns["left_x"] - columns["x"]) * 1000, atol=1e-9)
+        assert [SEGMENT_TYPES[code] for code in columns["segment_type"][:2]] == [type(track.segments[1]).__name__] * 2
+        assert np.all(np.diff(columns["s"]) > 0)
@@ -0,0 +1,56 @@
+# Copyright (C) 2024 twyleg
+import json
+from pathlib import Path
+
+from track_generator import instrumentation
+from track_generator.generator import generate_track
+
+
+#
+# General naming convention for unit tests:
+#               test_INITIALSTATE_ACTION_EXPECTATION
+#
+
+
+FILE_DIR = Path(__file__).parent
+TRACK_FILES_DIR = FILE_DIR / "../examples/track_files"
+
+
+class RecordingHook(instrumentation.InstrumentationHook):
+    def __init__(self):
+        self.events = []
+
+    def on_start(self, event):
+        self.events.append(("start", event.name, dict(event.attributes)))
+
+    def on_end(self, event):
+        self.events.append(("end", event.name, dict(event.attributes)))
+
+
+class TestInstrumentation:
+    def test_NoHooks_Span_ReturnsSharedNullContext(self):
+        assert not instrumentation.is_enabled()
+        assert instrumentation.span("a") is instrumentation.span("b")
+
+    def test_RecordingHook_GenerateTrack_SpansCarryTrackAndSegmentIdentifiers(self, tmp_path):
+        with instrumentation.hook_registered(RecordingHook()) as hook:
+            generate_track([TRACK_FILES_DIR / "small_track_example.xml"], tmp_path, generate_ground_truth=True)
+
+        names = {name for _, name, _ in hook.events}
+        assert {"read_track", "Track.calc", "Segment.calc", "Painter.draw_track", "Painter.draw_straight", "Painter.as_svg"} <= names
+        assert {"GroundTruthGenerator.render_ground_truth", "OutputSink.write_artifacts"} <= names
+        assert all(attributes["track"] == "small_track_example" for _, _, attributes in hook.events)
+
+        segment_calc_starts = [attributes for phase, name, attributes in hook.events if phase == "start" and name == "Segment.calc"]
+        assert [attributes["segment_index"] for attributes in segment_calc_starts] == list(range(len(segment_calc_starts)))
+        assert segment_calc_starts[0]["segment_type"] == "Start"
+
+    def test_ChromeTraceExporter_GenerateTrack_WritesBalancedTraceEvents(self, tmp_path):
+        with instrumentation.hook_registered(instrumentation.ChromeTraceExporter()) as exporter:
+            generate_track([TRACK_FILES_DIR / "small_track_example.xml"], tmp_path)
+        exporter.write(tmp_path / "trace.json")
+
+        trace_events = json.loads((tmp_path / "trace.json").read_text())["traceEvents"]
+        assert len(trace_events) > 0
+        assert sum(1 for e in trace_events if e["ph"] == "B") == sum(1 for e in trace_events if e["ph"] == "E")
+        assert trace_events[0]["name"] == "generate_track"
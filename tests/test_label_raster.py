@@ -0,0 +1,120 @@
+# Copyright (C) 2024 twyleg
+import json
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from track_generator import xml_reader
+from track_generator.generator import render_track_artifacts
+from track_generator.label_raster import LabelClass, LabelRaster, LabelTarget, decode_label_png, decode_rle, encode_label_png, encode_rle
+
+
+#
+# General naming convention for unit tests:
+#               test_INITIALSTATE_ACTION_EXPECTATION
+#
+
+
+FILE_DIR = Path(__file__).parent
+TRACK_FILES_DIR = FILE_DIR / "../examples/track_files"
+
+
+class TestLabelRaster:
+    def test_HorizontalLine_StrokePolyline_PixelsOfStrokeLabeled(self):
+        label_raster = LabelRaster(1.0, 1.0, (0.0, 0.0), pixels_per_meter=100)
+
+        label_raster.stroke_polyline(np.array([[0.2, 0.5], [0.8, 0.5]]), 0.1, LabelClass.LANE_LINE)
+
+        rows, cols = np.nonzero(label_raster.labels == LabelClass.LANE_LINE)
+        assert (rows.min(), rows.max(), cols.min(), cols.max()) == (45, 54, 20, 79)
+        assert len(rows) == 10 * 60
+
+    def test_DashedLine_StrokePolyline_DashesAlternate(self):
+        label_raster = LabelRaster(1.0, 1.0, (0.0, 0.0), pixels_per_meter=100)
+
+        label_raster.stroke_polyline(np.array([[0.0, 0.5], [1.0, 0.5]]), 0.02, LabelClass.CENTER_LINE, dash=(0.16, 0.16))
+
+        row = label_raster.labels[50]
+        assert np.all(row[0:16] == LabelClass.CENTER_LINE) and np.all(row[16:32] == LabelClass.BACKGROUND)
+        assert np.all(row[32:48] == LabelClass.CENTER_LINE)
+
+    def test_QuarterArc_StrokeArc_PixelsWithinRadiusAndSweepLabeled(self):
+        label_raster = LabelRaster(2.0, 2.0, (0.0, 0.0), pixels_per_meter=100)
+
+        label_raster.stroke_arc((1.0, 1.0), 0.5, 0.0, -np.pi / 2, 0.1, LabelClass.ROAD)
+
+        rows, cols = np.nonzero(label_raster.labels == LabelClass.ROAD)
+        x, y = (cols + 0.5) / 100, 2.0 - (rows + 0.5) / 100
+        assert np.all(np.abs(np.hypot(x - 1.0, y - 1.0) - 0.5) <= 0.05)
+        # Clockwise from the positive x axis, so the quarter below the center
+        assert np.all(x >= 1.0) and np.all(y <= 1.0)
+        assert len(rows) == pytest.approx(np.pi / 4 * (0.55**2 - 0.45**2) * 100**2, rel=0.02)
+
+    def test_Square_FillPolygon_InteriorLabeled(self):
+        label_raster = LabelRaster(1.0, 1.0, (0.0, 0.0), pixels_per_meter=100)
+
+        label_raster.fill_polygon(np.array([[0.1, 0.1], [0.4, 0.1], [0.4, 0.3], [0.1, 0.3]]), LabelClass.BLOCKED_AREA)
+
+        rows, cols = np.nonzero(label_raster.labels == LabelClass.BLOCKED_AREA)
+        assert (rows.min(), rows.max(), cols.min(), cols.max()) == (70, 89, 10, 39)
+        assert len(rows) == 20 * 30
+
+    def test_TargetWithoutFillPolygon_Create_RaisesTypeError(self):
+        class IncompleteTarget(LabelTarget):
+            def stroke_polyline(self, points, width, label, dash=None):
+                pass
+
+            def stroke_arc(self, center, radius, start_angle, sweep, width, label, dash=None):
+                pass
+
+        with pytest.raises(TypeError):
+            IncompleteTarget()  # type: ignore
+
+
+class TestLabelEncoding:
+    def test_Mask_EncodeRle_CocoCountsAndRoundTrip(self):
+        mask = np.array([[1, 0, 0], [1, 1, 0]], dtype=bool)
+
+        rle = encode_rle(mask)
+
+        assert rle == {"size": [2, 3], "counts": [0, 2, 1, 1, 2]}
+        np.testing.assert_array_equal(decode_rle(rle), mask)
+
+    def test_Labels_EncodePng_DecodedPngEqualsLabels(self):
+        labels = np.random.default_rng(0).integers(0, len(LabelClass), size=(7, 11), dtype=np.uint8)
+
+        np.testing.assert_array_equal(decode_label_png(encode_label_png(labels)), labels)
+
+    def test_NotAPng_DecodePng_RaisesValueError(self):
+        with pytest.raises(ValueError):
+            decode_label_png(b"P5\n1 1\n255\n\0")
+
+
+class TestTrackLabels:
+    def test_TrackFile_RenderWithLabels_ClassMapAlignedWithTrack(self):
+        track = xml_reader.read_track(TRACK_FILES_DIR / "doc_track_example.xml")
+        artifacts = render_track_artifacts(track, "doc_track_example", generate_labels=True, label_rle=True)
+
+        labels = decode_label_png(artifacts.extra_files["doc_track_example_labels.png"])
+        label_rle = json.loads(artifacts.extra_files["doc_track_example_labels_rle.json"])
+
+        assert labels.shape == (round(track.height * 1000), round(track.width * 1000))
+        assert set(np.unique(labels)) == set(LabelClass)
+        for label_class in LabelClass:
+            np.testing.assert_array_equal(decode_rle(label_rle["masks"][label_class.name.lower()]), labels == label_class)
+
+        # Start of the track at (0.5m, 1.3m) heading upwards: road on the center line, lane lines at +-0.38m
+        start_row = round((track.height - 1.3 - 0.05) * 1000)
+        assert labels[start_row, 500] == LabelClass.CENTER_LINE
+        assert labels[start_row, 300] == LabelClass.ROAD
+        assert labels[start_row, 500 - 380] == LabelClass.LANE_LINE
+        assert labels[start_row, 500 + 380] == LabelClass.LANE_LINE
+        assert labels[start_row, 500 + 420] == LabelClass.BACKGROUND
+
+    def test_TrackFile_RenderWithoutLabels_NoLabelFiles(self):
+        track = xml_reader.read_track(TRACK_FILES_DIR / "small_track_example.xml")
+
+        artifacts = render_track_artifacts(track, "small_track_example")
+
+        assert not any("labels" in relative_path for relative_path in artifacts.files())
@@ -0,0 +1,43 @@
+# Copyright (C) 2024 twyleg
+import json
+from pathlib import Path
+
+from track_generator.generator import generate_track
+from track_generator.profiler import Profiler
+
+
+#
+# General naming convention for unit tests:
+#               test_INITIALSTATE_ACTION_EXPECTATION
+#
+
+
+FILE_DIR = Path(__file__).parent
+TRACK_FILES_DIR = FILE_DIR / "../examples/track_files"
+
+
+class TestProfiler:
+    def test_TrackFiles_GenerateWithProfiler_ReportContainsStagesPerTrack(self, tmp_path):
+        track_filepaths = [TRACK_FILES_DIR / "small_track_example.xml", TRACK_FILES_DIR / "doc_track_example.xml"]
+
+        with Profiler(trace_memory=False) as profiler:
+            generate_track(track_filepaths, tmp_path, generate_ground_truth=True, profiler=profiler)
+        profiler.write_report(tmp_path / "profile.json")
+
+        report = json.loads((tmp_path / "profile.json").read_text())
+        assert [track["track_name"] for track in report["tracks"]] == ["small_track_example", "doc_track_example"]
+        for track in report["tracks"]:
+            assert {"schema_load", "parse", "calc.Straight", "calc.Turn", "svg_paint", "svg_save", "ground_truth"} <= set(track["stages"])
+        assert report["summary"]["num_tracks"] == 2
+        assert report["summary"]["stages"]["svg_save"]["calls"] == 4
+
+    def test_Profiler_StageWithMemoryTracing_RecordsPeakMemory(self):
+        with Profiler() as profiler:
+            profiler.start_track("track")
+            with profiler.stage("allocate"):
+                data = bytearray(1024 * 1024)
+            del data
+
+        stage = profiler.track_profiles[0].stages["allocate"]
+        assert stage.calls == 1
+        assert stage.peak_memory >= 1024 * 1024
@@ -0,0 +1,112 @@
+# Copyright (C) 2024 twyleg
+import io
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from track_generator import xml_reader
+from track_generator.generator import render_track_artifacts
+from track_generator.racing_line import RacingLine, calc_racing_line
+from track_generator.track import LINE_OFFSET, LINE_WIDTH, Straight
+
+
+#
+# General naming convention for unit tests:
+#               test_INITIALSTATE_ACTION_EXPECTATION
+#
+
+
+FILE_DIR = Path(__file__).parent
+TRACK_FILES_DIR = FILE_DIR / "../examples/track_files"
+
+
+def read_track(filename: str):
+    track = xml_reader.read_track(TRACK_FILES_DIR / filename)
+    track.calc()
+    return track
+
+
+def squared_curvature_integral(line: RacingLine) -> float:
+    _, curvatures = line.headings_and_curvatures()
+    lengths = np.hypot(*np.gradient(line.positions, axis=0).T)
+    if not line.closed:
+        curvatures, lengths = curvatures[1:-1], lengths[1:-1]
+    return float(np.sum(curvatures**2 * lengths))
+
+
+class TestRacingLine:
+    @pytest.mark.parametrize("bounds", ["lane", "road"])
+    def test_Track_CalcRacingLine_WithinBoundsAndLessCurvatureThanCenterLine(self, bounds):
+        track = read_track("doc_track_example.xml")
+
+        line = calc_racing_line(track, bounds)
+
+        assert np.all(line.offsets >= line.lower_bounds - 1e-9)
+        assert np.all(line.offsets <= line.upper_bounds + 1e-9)
+        positions, _, _ = track.evaluate_centerline(line.s)
+        np.testing.assert_allclose(np.linalg.norm(line.positions - positions, axis=1), np.abs(line.offsets), atol=1e-9)
+        center_line = RacingLine(line.s, np.zeros_like(line.s), positions, line.lower_bounds, line.upper_bounds, line.active, False, 0)
+        assert squared_curvature_integral(line) < 0.95 * squared_curvature_integral(center_line)
+
+    def test_Track_CalcRacingLineOnRoad_LessCurvatureThanInLane(self):
+        track = read_track("small_track_example.xml")
+
+        lane_line = calc_racing_line(track, "lane")
+        road_line = calc_racing_line(track, "road")
+
+        assert np.all(road_line.lower_bounds <= lane_line.lower_bounds)
+        assert squared_curvature_integral(road_line) < squared_curvature_integral(lane_line)
+
+    def test_TrackWithoutTrafficIslands_CalcRacingLine_VehicleClearOfLaneLines(self):
+        track = read_track("small_track_example.xml")
+
+        lane_line = calc_racing_line(track, "lane", vehicle_width=0.2)
+        road_line = calc_racing_line(track, "road", vehicle_width=0.2)
+
+        # The inner edges of the outer lines are LINE_OFFSET - LINE_WIDTH / 2 away from the center line
+        np.testing.assert_allclose(lane_line.lower_bounds, -(LINE_OFFSET - LINE_WIDTH / 2 - 0.1))
+        np.testing.assert_allclose(lane_line.upper_bounds, -(LINE_WIDTH / 2 + 0.1))
+        np.testing.assert_allclose(road_line.upper_bounds, LINE_OFFSET - LINE_WIDTH / 2 - 0.1)
+
+    def test_ClosedTrack_CalcRacingLine_ClosedLoop(self):
+        track = read_track("reference_track_example.xml")
+
+        line = calc_racing_line(track, "lane")
+
+        assert line.closed
+        assert line.s[-1] < track.get_centerline_path().length
+        assert np.hypot(*(line.positions[-1] - line.positions[0])) < 0.2
+
+    def test_EditedTrack_CalcRacingLineWithWarmStart_FewerIterationsSameLine(self):
+        track = read_track("doc_track_example.xml")
+        previous_line = calc_racing_line(track, "road")
+        next(segment for segment in track.segments if isinstance(segment, Straight)).length *= 1.02
+        track.calc()
+
+        cold_line = calc_racing_line(track, "road")
+        warm_line = calc_racing_line(track, "road", warm_start=previous_line)
+
+        assert warm_line.iterations < cold_line.iterations
+        np.testing.assert_allclose(warm_line.offsets, cold_line.offsets, atol=1e-9)
+
+    def test_Track_CalcRacingLineWithTooWideVehicle_ValueError(self):
+        track = read_track("small_track_example.xml")
+
+        with pytest.raises(ValueError):
+            calc_racing_line(track, "lane", vehicle_width=1.0)
+
+    def test_Track_CalcRacingLineWithInvalidBounds_ValueError(self):
+        track = read_track("small_track_example.xml")
+
+        with pytest.raises(ValueError):
+            calc_racing_line(track, "track")
+
+    def test_TrackFile_RenderWithRacingLine_RacingLineNpz(self):
+        track = xml_reader.read_track(TRACK_FILES_DIR / "small_track_example.xml")
+
+        artifacts = render_track_artifacts(track, "small_track_example", racing_line="lane")
+
+        with np.load(io.BytesIO(artifacts.extra_files["racing_line.npz"])) as npz:
+            assert {"s", "offset", "x", "y", "heading", "curvature"} <= set(npz.files)
+            assert len(npz["x"]) == len(npz["s"]) > 0
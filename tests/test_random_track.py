@@ -0,0 +1,96 @@
+# Copyright (C) 2024 twyleg
+from pathlib import Path
+
+import numpy as np
+import pytest
+from scipy.spatial import cKDTree
+
+from track_generator import xml_reader
+from track_generator.random_track import RandomTrackGenerator, SegmentGrammar
+from track_generator.track import TRACK_WIDTH, Intersection, ParkingArea, Start, Straight, TrafficIsland
+from track_generator.xml_writer import write_track_to_string
+
+
+#
+# General naming convention for unit tests:
+#               test_INITIALSTATE_ACTION_EXPECTATION
+#
+
+
+def overlapping_samples(track, closed: bool) -> int:
+    """
+    Number of pairs of center line samples that are closer than the track width without being neighbours on the track.
+    The roads end at the ends of open tracks, so samples there are left out.
+    """
+    path = track.get_centerline_path()
+    s = np.arange(0.0, path.length, 0.02) if closed else np.arange(TRACK_WIDTH / 2, path.length - TRACK_WIDTH / 2, 0.02)
+    positions, _, _ = track.evaluate_centerline(s)
+    pairs = cKDTree(positions).query_pairs(TRACK_WIDTH, output_type="ndarray")
+    distances = np.abs(s[pairs[:, 0]] - s[pairs[:, 1]])
+    if closed:
+        distances = np.minimum(distances, path.length - distances)
+    # Samples on turns with a radius of at least 0.5m that are 2m apart are further apart than the track width
+    return int(np.sum(distances > 2.0))
+
+
+class TestRandomTrackGenerator:
+    def test_SameSeed_Generate_SameTrack(self):
+        generator = RandomTrackGenerator(8.0, 6.0)
+
+        assert write_track_to_string(generator.generate(5)) == write_track_to_string(RandomTrackGenerator(8.0, 6.0).generate(5))
+
+    def test_DifferentSeeds_Generate_DistinctTracks(self):
+        generator = RandomTrackGenerator(8.0, 6.0, closed=False)
+
+        tracks = {write_track_to_string(generator.generate(seed)) for seed in range(20)}
+
+        assert len(tracks) == 20
+
+    @pytest.mark.parametrize("closed", [True, False])
+    def test_Seeds_Generate_TracksInsideAreaWithoutOverlaps(self, closed):
+        generator = RandomTrackGenerator(10.0, 8.0, closed=closed)
+
+        for seed in range(10):
+            track = generator.generate(seed)
+            track.calc()
+
+            assert isinstance(track.segments[0], Start)
+            assert track.get_centerline_path().is_closed() == closed
+            positions, _, _ = track.evaluate_centerline(np.linspace(0.0, track.get_centerline_path().length, 1000))
+            assert np.all(positions >= TRACK_WIDTH / 2) and np.all(positions <= [10.0 - TRACK_WIDTH / 2, 8.0 - TRACK_WIDTH / 2])
+            assert overlapping_samples(track, closed) == 0
+
+    def test_OpenTracks_Generate_NumberOfSegmentsInRange(self):
+        generator = RandomTrackGenerator(10.0, 8.0, num_segments=(3, 5), closed=False)
+
+        lengths = [len(generator.generate(seed).segments) - 1 for seed in range(10)]
+
+        assert min(lengths) >= 3 and max(lengths) <= 5
+
+    def test_CustomWeights_Generate_OnlyWeightedSegmentTypes(self):
+        grammar = SegmentGrammar({"Straight": 1.0, "Intersection": 1.0, "ParkingArea": 1.0, "TrafficIsland": 1.0})
+        generator = RandomTrackGenerator(12.0, 12.0, grammar=grammar, num_segments=(8, 8), closed=False)
+
+        segments = [segment for seed in range(5) for segment in generator.generate(seed).segments[1:]]
+
+        assert {type(segment) for segment in segments} == {Straight, Intersection, ParkingArea, TrafficIsland}
+
+    def test_GeneratedTrack_WriteAndRead_SameCenterline(self):
+        track = RandomTrackGenerator(8.0, 6.0).generate(3)
+        track.calc()
+
+        read_track = xml_reader.read_track_from_string(write_track_to_string(track), Path("."))
+        read_track.calc()
+
+        s = np.linspace(0.0, track.get_centerline_path().length, 200)
+        np.testing.assert_allclose(read_track.evaluate_centerline(s)[0], track.evaluate_centerline(s)[0], atol=1e-9)
+
+    def test_InvalidParameters_Create_ValueError(self):
+        with pytest.raises(ValueError):
+            RandomTrackGenerator(1.0, 6.0)
+        with pytest.raises(ValueError):
+            RandomTrackGenerator(8.0, 6.0, num_segments=(5, 3))
+        with pytest.raises(ValueError):
+            SegmentGrammar({"Roundabout": 1.0})
+        with pytest.raises(ValueError):
+            SegmentGrammar({"Straight": 0.0})
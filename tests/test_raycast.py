@@ -0,0 +1,111 @@
+# Copyright (C) 2024 twyleg
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from track_generator import xml_reader
+from track_generator.label_raster import LabelClass
+from track_generator.raycast import Raycaster
+
+
+#
+# General naming convention for unit tests:
+#               test_INITIALSTATE_ACTION_EXPECTATION
+#
+
+
+FILE_DIR = Path(__file__).parent
+TRACK_FILES_DIR = FILE_DIR / "../examples/track_files"
+
+
+def read_track(filename: str):
+    track = xml_reader.read_track(TRACK_FILES_DIR / filename)
+    track.calc()
+    return track
+
+
+def brute_force_distances(raycaster: Raycaster, origins: np.ndarray, angles: np.ndarray, max_range: float, step: float) -> np.ndarray:
+    """
+    Distance to the first sample along the rays that hits a marking stroke
+    """
+    index = raycaster.spatial_index
+    steps = np.arange(0.0, max_range, step)
+    distances = np.full(len(origins), np.inf)
+    for i, (origin, angle) in enumerate(zip(origins, angles)):
+        points = origin + steps[:, np.newaxis] * np.array([np.cos(angle), np.sin(angle)])
+        points_min, points_max = points.min(axis=0), points.max(axis=0)
+        strokes = raycaster.strokes[np.all((index.stroke_max[raycaster.strokes] >= points_min) & (index.stroke_min[raycaster.strokes] <= points_max), axis=1)]
+        hits = index._hits_strokes(np.repeat(points, len(strokes), axis=0), np.tile(strokes, len(points))).reshape(len(points), len(strokes))
+        hit_steps = np.flatnonzero(hits.any(axis=1))
+        if len(hit_steps):
+            distances[i] = steps[hit_steps[0]]
+    return distances
+
+
+class TestRaycaster:
+    @pytest.mark.parametrize("filename", ["reference_track_example.xml", "doc_track_example.xml"])
+    def test_RandomRays_Cast_SameAsBruteForce(self, filename):
+        track = read_track(filename)
+        raycaster = Raycaster.from_track(track)
+        rng = np.random.default_rng(3)
+        origins = np.stack([rng.uniform(0.0, track.width, 100), rng.uniform(0.0, track.height, 100)], axis=-1)
+        angles = rng.uniform(-np.pi, np.pi, 100)
+
+        distances, labels, shapes = raycaster.cast(origins, angles, 1.0)
+
+        expected = brute_force_distances(raycaster, origins, angles, 1.0, 0.001)
+        # Samples can step over slivers of strokes, but never find a marking before the ray does
+        assert np.all(expected >= distances)
+        is_same = np.isclose(distances, expected, rtol=0.0, atol=0.001) | (np.isinf(distances) & np.isinf(expected))
+        assert np.mean(is_same) >= 0.98
+        assert np.all(np.isfinite(distances) == (labels != LabelClass.BACKGROUND))
+        assert np.all(np.isfinite(distances) == (shapes >= 0))
+        assert np.any(np.isfinite(distances)) and not np.all(np.isfinite(distances))
+
+    def test_VehicleInLane_CastAcrossTrack_LaneLineAndDashedCenterLine(self):
+        track = read_track("doc_track_example.xml")
+        raycaster = Raycaster.from_track(track)
+        # Start of the track at (0.5m, 1.3m) heading upwards, lines at x=0.12m, 0.5m and 0.88m with a width of 0.02m
+        # Center line dashes of 0.16m from the start, followed by gaps of 0.16m
+        origins = np.array([[0.69, 1.4], [0.69, 1.4], [0.69, 1.55]])
+
+        distances, labels, _ = raycaster.cast(origins, np.array([0.0, np.pi, np.pi]))
+
+        np.testing.assert_allclose(distances, [0.18, 0.18, 0.56], atol=1e-9)
+        np.testing.assert_array_equal(labels, [LabelClass.LANE_LINE, LabelClass.CENTER_LINE, LabelClass.LANE_LINE])
+
+    def test_MarkingBeyondMaxRange_Scan_NoHit(self):
+        track = read_track("doc_track_example.xml")
+        raycaster = Raycaster.from_track(track)
+        poses = np.array([[0.69, 1.6, np.pi / 2], [0.69, 1.6, np.pi / 2]])
+
+        distances, labels = raycaster.scan(poses, np.array([-np.pi / 2, np.pi / 2]), 0.1)
+
+        assert distances.shape == labels.shape == (2, 2)
+        assert np.all(np.isinf(distances))
+        assert np.all(labels == LabelClass.BACKGROUND)
+
+    def test_PoseOnCenterLine_DownwardCamera_SameAsLabelQuery(self):
+        track = read_track("doc_track_example.xml")
+        raycaster = Raycaster.from_track(track)
+        poses = np.array([[0.5, 1.33, np.pi / 2], [0.69, 1.6, 0.3]])
+
+        images = raycaster.downward_camera(poses, (0.2, 0.1), 0.01, offset=(0.1, 0.0))
+
+        assert images.shape == (2, 20, 10)
+        # First dash of the center line up to y=1.46m
+        assert np.all(images[0, -12:, 4:6] == LabelClass.CENTER_LINE)
+        assert np.all(images[0, :6, 4:6] == LabelClass.ROAD)
+        # Bottom right pixel of the second image: 0.005m ahead of and 0.045m right of the vehicle
+        x = 0.69 + 0.005 * np.cos(0.3) + 0.045 * np.sin(0.3)
+        y = 1.6 + 0.005 * np.sin(0.3) - 0.045 * np.cos(0.3)
+        _, labels = raycaster.spatial_index.query_labels(np.array([[x, y]]))
+        assert images[1, -1, -1] == labels[0]
+
+    def test_NoRays_Cast_EmptyResult(self):
+        track = read_track("small_track_example.xml")
+
+        distances, labels, shapes = Raycaster.from_track(track).cast(np.empty((0, 2)), np.empty(0))
+
+        assert distances.shape == labels.shape == shapes.shape == (0,)
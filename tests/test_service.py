@@ -0,0 +1,85 @@
+# Copyright (C) 2024 twyleg
+import threading
+from pathlib import Path
+
+import pytest
+
+from track_generator import service
+
+
+#
+# General naming convention for unit tests:
+#               test_INITIALSTATE_ACTION_EXPECTATION
+#
+
+
+FILE_DIR = Path(__file__).parent
+TRACK_FILES_DIR = FILE_DIR / "../examples/track_files"
+
+
+@pytest.fixture
+def http_server(tmp_path):
+    render_service = service.RenderService(tmp_path, num_workers=1, max_queue_size=1)
+    server = service.RenderHttpServer(("127.0.0.1", 0), render_service)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    render_service.shutdown()
+
+
+@pytest.fixture
+def unix_socket_server(tmp_path):
+    render_service = service.RenderService(tmp_path, num_workers=1, max_queue_size=1)
+    server = service.RenderUnixSocketServer(tmp_path / "service.sock", render_service)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    render_service.shutdown()
+
+
+class TestService:
+    def test_RunningHttpService_RequestTrackXmlWithBytes_ReturnsArtifacts(self, http_server, tmp_path):
+        job = {
+            "track_xml": (TRACK_FILES_DIR / "small_track_example.xml").read_text(),
+            "track_name": "small",
+            "ground_truth": True,
+            "return_bytes": True,
+        }
+        result = service.request_http(job, port=http_server.server_address[1])
+
+        assert result["status"] == "ok"
+        assert result["output_directory"] == str(tmp_path / "small")
+        assert set(result["artifact_data"]) == {"small.svg", "small_verbose.svg", "ground_truth.xml"}
+        assert (tmp_path / "small" / "small.svg").exists()
+
+    def test_RunningHttpService_RequestWithoutWritingFiles_ReturnsOnlyBytes(self, http_server, tmp_path):
+        job = {"track_file": str(TRACK_FILES_DIR / "small_track_example.xml"), "return_bytes": True, "write_files": False}
+        result = service.request_http(job, port=http_server.server_address[1])
+
+        assert result["status"] == "ok"
+        assert "small_track_example.svg" in result["artifact_data"]
+        assert not (tmp_path / "small_track_example").exists()
+
+    def test_RunningHttpService_RequestInvalidJob_ReturnsError(self, http_server):
+        result = service.request_http({"track_name": "missing_source"}, port=http_server.server_address[1])
+        assert result["status"] == "error"
+
+    @pytest.mark.skipif(not service.UNIX_SOCKETS_SUPPORTED, reason="Unix sockets are not supported on this platform")
+    def test_RunningUnixSocketService_RequestMultipleJobs_ReturnsResultPerJob(self, unix_socket_server, tmp_path):
+        jobs = [
+            {"track_file": str(TRACK_FILES_DIR / "small_track_example.xml")},
+            {"track_name": "missing_source"},
+        ]
+        results = service.request_unix_socket(jobs, tmp_path / "service.sock", timeout=60.0)
+
+        assert [result["status"] for result in results] == ["ok", "error"]
+        assert (tmp_path / "small_track_example" / "small_track_example.svg").exists()
+
+    @pytest.mark.skipif(service.UNIX_SOCKETS_SUPPORTED, reason="Unix sockets are supported on this platform")
+    def test_PlatformWithoutUnixSockets_ServeOnUnixSocket_RaisesError(self, tmp_path):
+        with pytest.raises(OSError):
+            service.serve(tmp_path, unix_socket_path=tmp_path / "service.sock")
@@ -0,0 +1,133 @@
+# Copyright (C) 2024 twyleg
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from track_generator import xml_reader
+from track_generator.simulator import SIMULATION_COLUMNS, LaneKeepingController, VehicleSimulator
+from track_generator.trajectory import VehicleLimits
+
+
+#
+# General naming convention for unit tests:
+#               test_INITIALSTATE_ACTION_EXPECTATION
+#
+
+
+FILE_DIR = Path(__file__).parent
+TRACK_FILES_DIR = FILE_DIR / "../examples/track_files"
+
+
+def read_track(filename: str):
+    track = xml_reader.read_track(TRACK_FILES_DIR / filename)
+    track.calc()
+    return track
+
+
+class TestVehicleSimulator:
+    def test_VehiclesOnStraight_Accelerate_ProgressOfConstantAcceleration(self):
+        track = read_track("doc_track_example.xml")
+        simulator = VehicleSimulator(track, 3, VehicleLimits(max_speed=5.0, max_acceleration=2.0))
+
+        for _ in range(25):
+            observation = simulator.step(np.array([0.5, 1.0, 2.0]), 0.0)
+
+        np.testing.assert_allclose(observation["progress"], np.array([0.5, 1.0, 2.0]) * 0.5**2 / 2, atol=1e-9)
+        np.testing.assert_allclose(observation["speed"], np.array([0.5, 1.0, 2.0]) * 0.5, atol=1e-9)
+        np.testing.assert_allclose(observation["d"], -0.19, atol=1e-9)
+        assert set(observation) == set(SIMULATION_COLUMNS)
+
+    def test_ConstantSteeringAngle_DriveFullCircle_BackAtStart(self):
+        track = read_track("doc_track_example.xml")
+        simulator = VehicleSimulator(track, 1, time_step=0.01)
+        simulator.reset(speed=1.0)
+        start = np.array([simulator.x[0], simulator.y[0]])
+        circumference = 2 * np.pi * simulator.wheelbase / np.tan(0.3)
+
+        for _ in range(round(circumference / 0.01)):
+            simulator.step(0.0, 0.3)
+
+        assert np.hypot(simulator.x[0] - start[0], simulator.y[0] - start[1]) < 0.01
+
+    @pytest.mark.parametrize("filename", ["doc_track_example.xml", "small_track_example.xml", "clothoid_track_example.xml"])
+    def test_LaneKeepingController_DriveTrack_StaysInLaneUntilFinished(self, filename):
+        track = read_track(filename)
+        simulator = VehicleSimulator(track, 8)
+        controller = LaneKeepingController(target_speed=np.linspace(0.5, 1.2, 8))
+
+        previous_progress = simulator.progress.copy()
+        for _ in range(2000):
+            observation = simulator.step(*controller(simulator))
+            assert np.all(observation["progress"] >= previous_progress - 1e-9)
+            assert not np.any(observation["lane_departure"] & ~observation["finished"])
+            previous_progress = observation["progress"]
+
+        assert np.all(observation["finished"])
+
+    def test_LaneThroughIntersection_DriveWithController_ArcLengthContinuous(self):
+        track = read_track("reference_track_example.xml")
+        simulator = VehicleSimulator(track, 4)
+        simulator.reset(s=np.array([3.5, 3.6, 3.7, 3.8]), speed=1.0)
+        controller = LaneKeepingController(target_speed=1.0)
+
+        for _ in range(150):
+            previous_s = simulator.s.copy()
+            observation = simulator.step(*controller(simulator))
+            assert np.all(np.abs(observation["s"] - previous_s) < 0.05)
+
+        np.testing.assert_allclose(observation["progress"], observation["s"] - np.array([3.5, 3.6, 3.7, 3.8]), atol=1e-9)
+
+    def test_ClosedTrack_DriveAcrossEnd_ProgressContinues(self):
+        track = read_track("reference_track_example.xml")
+        simulator = VehicleSimulator(track, 1)
+        length = simulator.path.length
+        simulator.reset(s=length - 0.1, speed=1.0)
+
+        for _ in range(10):
+            observation = simulator.step(0.0, 0.0)
+
+        assert simulator.closed
+        np.testing.assert_allclose(observation["progress"], 0.2, atol=1e-3)
+        np.testing.assert_allclose(observation["s"], 0.1, atol=1e-3)
+
+    def test_Vehicles_ResetSubset_OtherVehiclesUnchanged(self):
+        track = read_track("doc_track_example.xml")
+        simulator = VehicleSimulator(track, 4)
+        for _ in range(10):
+            simulator.step(1.0, 0.1)
+        previous = simulator.observation()
+
+        observation = simulator.reset(np.array([1, 3]), s=2.0, d=-0.1)
+
+        np.testing.assert_allclose(observation["s"][[1, 3]], 2.0, atol=1e-9)
+        np.testing.assert_allclose(observation["d"][[1, 3]], -0.1, atol=1e-9)
+        assert np.all(observation["progress"][[1, 3]] == 0.0)
+        for name in SIMULATION_COLUMNS:
+            np.testing.assert_array_equal(observation[name][[0, 2]], previous[name][[0, 2]])
+
+    def test_VehicleLeavingRoad_Step_OffRoadAndLaneDeparture(self):
+        track = read_track("doc_track_example.xml")
+        simulator = VehicleSimulator(track, 2)
+        simulator.reset(d=np.array([-0.19, -0.45]))
+
+        observation = simulator.step(0.0, 0.0)
+
+        np.testing.assert_array_equal(observation["lane_departure"], [False, True])
+        np.testing.assert_array_equal(observation["off_road"], [False, True])
+
+    def test_VehicleTouchingCenterLine_Step_LaneDeparture(self):
+        track = read_track("doc_track_example.xml")
+        simulator = VehicleSimulator(track, 2, vehicle_width=0.2)
+        simulator.reset(d=np.array([-0.115, -0.105]))
+
+        observation = simulator.step(0.0, 0.0)
+
+        np.testing.assert_array_equal(observation["lane_departure"], [False, True])
+        np.testing.assert_array_equal(observation["off_road"], [False, False])
+
+    def test_NoVehicles_Create_ValueError(self):
+        track = read_track("doc_track_example.xml")
+
+        with pytest.raises(ValueError):
+            VehicleSimulator(track, 0)
@@ -0,0 +1,110 @@
+# Copyright (C) 2024 twyleg
+import threading
+import zipfile
+from pathlib import Path
+
+import pytest
+
+from track_generator.generator import generate_track, generate_track_artifacts
+from track_generator.sinks import CallbackSink, DirectorySink, OutputSink, WriteBehindSink, ZipSink
+
+
+#
+# General naming convention for unit tests:
+#               test_INITIALSTATE_ACTION_EXPECTATION
+#
+
+
+FILE_DIR = Path(__file__).parent
+TRACK_FILES_DIR = FILE_DIR / "../examples/track_files"
+
+
+class TestSinks:
+    def test_TrackFile_GenerateArtifacts_ArtifactsMatchFilesWrittenByGenerateTrack(self, tmp_path):
+        track_filepath = TRACK_FILES_DIR / "small_track_example.xml"
+        (artifacts,) = generate_track_artifacts([track_filepath], generate_ground_truth=True)
+        generate_track([track_filepath], tmp_path, generate_ground_truth=True)
+
+        files = artifacts.files()
+        assert set(files) == {"small_track_example.svg", "small_track_example_verbose.svg", "ground_truth.xml"}
+        for relative_path, content in files.items():
+            assert (tmp_path / "small_track_example" / relative_path).read_text() == content
+
+    def test_SinkWithoutWrite_Create_RaisesTypeError(self):
+        class IncompleteSink(OutputSink):
+            pass
+
+        with pytest.raises(TypeError):
+            IncompleteSink()  # type: ignore
+
+    def test_ZipSink_GenerateTrack_ArchiveContainsArtifactsPerTrack(self, tmp_path):
+        track_filepaths = [TRACK_FILES_DIR / "small_track_example.xml", TRACK_FILES_DIR / "doc_track_example.xml"]
+        with ZipSink(tmp_path / "tracks.zip") as sink:
+            generate_track(track_filepaths, tmp_path, sink=sink)
+
+        with zipfile.ZipFile(tmp_path / "tracks.zip") as zip_file:
+            assert "small_track_example/small_track_example.svg" in zip_file.namelist()
+            assert "doc_track_example/doc_track_example_verbose.svg" in zip_file.namelist()
+        assert not (tmp_path / "small_track_example").exists()
+
+    def test_CallbackSink_GenerateTrack_CallbackReceivesEveryArtifact(self, tmp_path):
+        received = []
+        generate_track([TRACK_FILES_DIR / "small_track_example.xml"], tmp_path, sink=CallbackSink(lambda *args: received.append(args)))
+
+        assert [(track_name, relative_path) for track_name, relative_path, _ in received] == [
+            ("small_track_example", "small_track_example.svg"),
+            ("small_track_example", "small_track_example_verbose.svg"),
+        ]
+
+
+class BlockingSink(OutputSink):
+    def __init__(self):
+        self.release = threading.Event()
+        self.written = []
+
+    def write(self, track_name, relative_path, content):
+        self.release.wait()
+        if relative_path == "fail":
+            raise IOError("disk full")
+        self.written.append(relative_path)
+
+
+class TestWriteBehindSink:
+    def test_DirectorySinkWithFsync_GenerateTrackWriteBehind_SameFilesAsSynchronousWrite(self, tmp_path):
+        track_filepaths = [TRACK_FILES_DIR / "small_track_example.xml", TRACK_FILES_DIR / "doc_track_example.xml"]
+        generate_track(track_filepaths, tmp_path / "sync", generate_ground_truth=True)
+        with WriteBehindSink(DirectorySink(tmp_path / "async", fsync=True), max_inflight_bytes=1024) as sink:
+            generate_track(track_filepaths, tmp_path / "async", generate_ground_truth=True, sink=sink)
+
+        sync_files = sorted(p.relative_to(tmp_path / "sync") for p in (tmp_path / "sync").rglob("*") if p.is_file())
+        async_files = sorted(p.relative_to(tmp_path / "async") for p in (tmp_path / "async").rglob("*") if p.is_file())
+        assert sync_files == async_files
+        for relative_path in sync_files:
+            assert (tmp_path / "sync" / relative_path).read_bytes() == (tmp_path / "async" / relative_path).read_bytes()
+
+    def test_SlowSink_WriteBeyondBudget_BlocksUntilInflightBytesWereWritten(self):
+        blocking_sink = BlockingSink()
+        sink = WriteBehindSink(blocking_sink, max_workers=2, max_inflight_bytes=10)
+        sink.write("track", "a", b"12345678")
+
+        writer = threading.Thread(target=sink.write, args=("track", "b", b"12345678"))
+        writer.start()
+        writer.join(timeout=0.2)
+        assert writer.is_alive()
+        assert sink.inflight_bytes == 8
+
+        blocking_sink.release.set()
+        writer.join()
+        sink.close()
+        assert sorted(blocking_sink.written) == ["a", "b"]
+        assert sink.inflight_bytes == 0
+
+    def test_FailingSink_Flush_RaisesBackgroundError(self):
+        blocking_sink = BlockingSink()
+        blocking_sink.release.set()
+        sink = WriteBehindSink(blocking_sink)
+        sink.write("track", "fail", b"data")
+
+        with pytest.raises(IOError):
+            sink.flush()
+        sink.close()
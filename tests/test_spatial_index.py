@@ -0,0 +1,83 @@
+# Copyright (C) 2024 twyleg
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from track_generator import xml_reader
+from track_generator.label_raster import LabelClass
+from track_generator.painter import Painter
+from track_generator.spatial_index import SpatialIndex
+
+
+#
+# General naming convention for unit tests:
+#               test_INITIALSTATE_ACTION_EXPECTATION
+#
+
+
+FILE_DIR = Path(__file__).parent
+TRACK_FILES_DIR = FILE_DIR / "../examples/track_files"
+
+
+def read_track(filename: str):
+    track = xml_reader.read_track(TRACK_FILES_DIR / filename)
+    track.calc()
+    return track
+
+
+class TestSpatialIndex:
+    @pytest.mark.parametrize("filename", ["doc_track_example.xml", "small_track_example.xml"])
+    def test_TrackFile_QueryLabels_SameAsLabelRaster(self, filename):
+        track = read_track(filename)
+        painter = Painter(labels=True, label_pixels_per_meter=47)
+        painter.draw_track(track)
+        assert painter.label_raster
+        labels = painter.label_raster.labels
+
+        rows, cols = np.indices(labels.shape)
+        points = np.stack([(cols.ravel() + 0.5) / 47 + track.origin[0], track.height - (rows.ravel() + 0.5) / 47 - track.origin[1]], axis=-1)
+        segment_indices, query_labels = track.get_spatial_index().query_labels(points)
+
+        # Only pixels centered within floating point noise of a shape edge may differ
+        assert np.count_nonzero(query_labels != labels.ravel()) <= 0.005 * labels.size
+        assert np.all((segment_indices >= 0) == (query_labels != LabelClass.BACKGROUND))
+        assert set(segment_indices) <= set(range(-1, len(track.segments)))
+
+    def test_RandomPoints_NearestBoundary_SameAsBruteForce(self):
+        spatial_index = read_track("doc_track_example.xml").get_spatial_index()
+        points = np.random.default_rng(0).uniform([-1.0, -1.0], [8.0, 7.0], size=(500, 2))
+
+        distances, nearest_points, shapes = spatial_index.nearest_boundary(points)
+
+        strokes = spatial_index.boundary_strokes
+        p0, p1 = spatial_index.stroke_p0[strokes], spatial_index.stroke_p1[strokes]
+        direction = p1 - p0
+        t = np.clip(np.einsum("pnk,nk->pn", points[:, np.newaxis] - p0, direction) / np.einsum("nk,nk->n", direction, direction), 0.0, 1.0)
+        brute_force = np.hypot(*(points[:, np.newaxis] - (p0 + t[..., np.newaxis] * direction)).transpose(2, 0, 1)).min(axis=1)
+        np.testing.assert_allclose(distances, brute_force, atol=1e-12)
+        np.testing.assert_allclose(np.hypot(*(points - nearest_points).T), distances, atol=1e-12)
+        assert np.all(spatial_index.shape_label[shapes] == LabelClass.LANE_LINE)
+
+    def test_StartOfTrack_QueryBox_ContainsShapesOfFirstSegment(self):
+        spatial_index = read_track("doc_track_example.xml").get_spatial_index()
+
+        # Straight after the start of the track at (0.5m, 1.3m) heading upwards
+        shapes = spatial_index.query_box((0.1, 1.35), (0.9, 1.45))
+
+        assert np.all(np.diff(shapes) > 0)
+        assert set(spatial_index.shape_segment_index[shapes]) == {1}
+        assert {LabelClass.ROAD, LabelClass.LANE_LINE, LabelClass.CENTER_LINE} <= set(spatial_index.shape_label[shapes])
+
+    def test_InvalidCellSize_FromTrack_RaisesValueError(self):
+        with pytest.raises(ValueError):
+            SpatialIndex.from_track(read_track("small_track_example.xml"), cell_size=0.0)
+
+    def test_CalculatedTrack_GetSpatialIndex_CachedUntilRecalculated(self):
+        track = read_track("small_track_example.xml")
+
+        spatial_index = track.get_spatial_index()
+
+        assert track.get_spatial_index() is spatial_index
+        track.calc()
+        assert track.get_spatial_index() is not spatial_index
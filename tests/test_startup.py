@@ -0,0 +1,42 @@
+# Copyright (C) 2024 twyleg
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+
+#
+# General naming convention for unit tests:
+#               test_INITIALSTATE_ACTION_EXPECTATION
+#
+
+
+FILE_DIR = Path(__file__).parent
+
+HEAVY_MODULES = ["drawsvg", "pytransform3d", "xmlschema", "jinja2", "numpy"]
+
+RUN_CLI = """
+import json, runpy, sys
+sys.argv = ["track_generator"] + sys.argv[1:]
+try:
+    runpy.run_module("track_generator", run_name="__main__")
+except SystemExit:
+    pass
+print(json.dumps([m for m in {heavy_modules!r} if m in sys.modules]))
+"""
+
+
+class TestStartup:
+    def test_FreshInterpreter_ImportCliStarter_NoHeavyDependenciesImported(self):
+        code = f"import sys, json, track_generator.starter; print(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))"
+        result = subprocess.run([sys.executable, "-c", code], cwd=FILE_DIR.parent, capture_output=True, text=True, check=True)
+        assert json.loads(result.stdout.strip().splitlines()[-1]) == []
+
+    @pytest.mark.parametrize("command", ["generate_track", "generate_trajectory", "serve", "read_artifact"])
+    def test_FreshInterpreter_SubcommandHelp_NoHeavyDependenciesImported(self, command):
+        code = RUN_CLI.format(heavy_modules=HEAVY_MODULES)
+        result = subprocess.run([sys.executable, "-c", code, command, "--help"], cwd=FILE_DIR.parent, capture_output=True, text=True, check=True)
+        assert "usage:" in result.stdout
+        assert json.loads(result.stdout.strip().splitlines()[-1]) == []
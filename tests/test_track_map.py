@@ -0,0 +1,95 @@
+# Copyright (C) 2024 twyleg
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from track_generator import xml_reader
+from track_generator.coordinate_system import world_to_pixel
+from track_generator.generator import generate_track
+from track_generator.track_map import FREE, OCCUPIED, TrackMap, decode_pgm, distance_transform, load_track_map
+
+
+#
+# General naming convention for unit tests:
+#               test_INITIALSTATE_ACTION_EXPECTATION
+#
+
+
+FILE_DIR = Path(__file__).parent
+TRACK_FILES_DIR = FILE_DIR / "../examples/track_files"
+
+
+def read_small_track():
+    track = xml_reader.read_track(TRACK_FILES_DIR / "small_track_example.xml")
+    track.calc()
+    return track
+
+
+class TestDistanceTransform:
+    @pytest.mark.parametrize("shape,density", [((23, 31), 0.05), ((40, 7), 0.5), ((9, 9), 0.0)])
+    def test_RandomFeatures_DistanceTransform_SameAsBruteForce(self, shape, density):
+        features = np.random.default_rng(0).random(shape) < density
+        features[4, 2] = True
+
+        distances, nearest_rows, nearest_cols = distance_transform(features)
+
+        rows, cols = np.indices(shape)
+        feature_rows, feature_cols = np.nonzero(features)
+        brute_force = np.hypot(rows[..., np.newaxis] - feature_rows, cols[..., np.newaxis] - feature_cols).min(axis=-1)
+        np.testing.assert_allclose(distances, brute_force)
+        assert np.all(features[nearest_rows, nearest_cols])
+        np.testing.assert_allclose(np.hypot(rows - nearest_rows, cols - nearest_cols), distances)
+
+
+class TestTrackMap:
+    def test_SmallTrack_FromTrack_FieldsAtStartOfTrack(self):
+        track_map = TrackMap.from_track(read_small_track(), 0.02)
+
+        # Start at x=0.4m, y=1.05m heading upwards on a 3m x 4m track, 0.2m after the start
+        row, col = int((4.0 - 1.05 - 0.2) / 0.02), int(0.4 / 0.02)
+        assert track_map.occupancy.shape == (200, 150)
+        assert track_map.occupancy[row, col] == FREE
+        assert track_map.occupancy[row, col + 25] == OCCUPIED
+        assert track_map.distance[row, col] == pytest.approx(0.39, abs=0.02)
+        assert track_map.distance[row, col + 25] < 0.0
+        assert track_map.heading[row, col] == pytest.approx(np.pi / 2)
+        assert np.isnan(track_map.heading[row, col + 25])
+
+    def test_HeightNotMultipleOfResolution_FromTrack_OriginAtLowerLeftCornerOfGrid(self):
+        track = read_small_track()
+        track_map = TrackMap.from_track(track, 0.03)
+
+        # map_server convention: row 0 is the top row, the origin is the lower left corner of the last row
+        num_rows = track_map.occupancy.shape[0]
+        rows, cols = np.array([0, 50, num_rows - 1]), np.array([0, 70, 99])
+        x = track_map.origin[0] + (cols + 0.5) * track_map.resolution
+        y = track_map.origin[1] + (num_rows - rows - 0.5) * track_map.resolution
+        pixel_cols, pixel_rows = world_to_pixel(x, y, track.height, track.origin, 1.0 / track_map.resolution)
+        np.testing.assert_allclose(pixel_cols, cols + 0.5)
+        np.testing.assert_allclose(pixel_rows, rows + 0.5)
+
+    def test_InvalidResolution_FromTrack_RaisesValueError(self):
+        with pytest.raises(ValueError):
+            TrackMap.from_track(read_small_track(), 0.0)
+
+    def test_TrackFile_GenerateWithMap_MemoryMappedMapMatchesCalculatedMap(self, tmp_path):
+        generate_track([TRACK_FILES_DIR / "small_track_example.xml"], tmp_path, map_resolution=0.05)
+
+        track_map = load_track_map(tmp_path / "small_track_example/map.yaml")
+        expected_track_map = TrackMap.from_track(read_small_track(), 0.05)
+
+        descriptor = (tmp_path / "small_track_example/map.yaml").read_text()
+        assert "image: map.pgm\n" in descriptor and "resolution: 0.05\n" in descriptor and "origin: [0.0, 0.0, 0.0]\n" in descriptor
+        assert isinstance(track_map.occupancy, np.memmap)
+        np.testing.assert_array_equal(track_map.occupancy, expected_track_map.occupancy)
+        np.testing.assert_array_equal(track_map.distance, expected_track_map.distance)
+        np.testing.assert_array_equal(track_map.heading, expected_track_map.heading)
+        assert (track_map.resolution, track_map.origin) == (0.05, (0.0, 0.0))
+
+    def test_SmallTrack_DecodeRenderedPgm_EqualsOccupancyGrid(self):
+        track_map = TrackMap.from_track(read_small_track(), 0.05)
+
+        occupancy = decode_pgm(track_map.render_map_files()["map.pgm"])  # type: ignore
+
+        np.testing.assert_array_equal(occupancy, track_map.occupancy)
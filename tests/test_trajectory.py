@@ -0,0 +1,117 @@
+# Copyright (C) 2024 twyleg
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from track_generator import xml_reader
+from track_generator.generator import generate_trajectory
+from track_generator.trajectory import (
+    DEFAULT_TIME_STEP,
+    TRAJECTORY_COLUMNS,
+    VehicleLimits,
+    _resample_in_time,
+    calc_trajectories,
+    calc_trajectory,
+    speed_profile,
+)
+
+
+#
+# General naming convention for unit tests:
+#               test_INITIALSTATE_ACTION_EXPECTATION
+#
+
+
+FILE_DIR = Path(__file__).parent
+TRACK_FILES_DIR = FILE_DIR / "../examples/track_files"
+
+
+def read_track(filename: str):
+    track = xml_reader.read_track(TRACK_FILES_DIR / filename)
+    track.calc()
+    return track
+
+
+class TestSpeedProfile:
+    def test_Straight_SpeedProfile_AccelerateCruiseDecelerate(self):
+        s = np.linspace(0.0, 10.0, 1001)
+
+        speed = speed_profile(np.zeros_like(s), 0.01, max_speed=2.0, max_lateral_acceleration=1.0, max_acceleration=1.0, max_deceleration=2.0, end_speed=0.0)
+
+        np.testing.assert_allclose(speed, np.minimum.reduce([np.sqrt(2 * 1.0 * s), np.full_like(s, 2.0), np.sqrt(2 * 2.0 * (10.0 - s))]), atol=1e-9)
+
+    def test_RandomCurvature_SpeedProfile_SameAsSequentialPasses(self):
+        rng = np.random.default_rng(0)
+        curvature = rng.uniform(-2.0, 2.0, (3, 500)) * (rng.random((3, 500)) < 0.2)
+        max_speed, max_acceleration, max_deceleration = np.array([1.0, 2.0, 3.0]), np.array([0.5, 1.0, 2.0]), np.array([1.0, 0.5, 3.0])
+
+        speeds = speed_profile(curvature, 0.02, max_speed, 1.5, max_acceleration, max_deceleration, start_speed=0.5)
+
+        for i in range(3):
+            limits = np.minimum(max_speed[i] ** 2, 1.5 / np.maximum(np.abs(curvature[i]), 1e-300))
+            squared_speeds = limits.copy()
+            squared_speeds[0] = min(squared_speeds[0], 0.5**2)
+            for j in range(1, 500):
+                squared_speeds[j] = min(squared_speeds[j], squared_speeds[j - 1] + 2 * max_acceleration[i] * 0.02)
+            for j in range(498, -1, -1):
+                squared_speeds[j] = min(squared_speeds[j], squared_speeds[j + 1] + 2 * max_deceleration[i] * 0.02)
+            np.testing.assert_allclose(speeds[i], np.sqrt(squared_speeds), atol=1e-9)
+
+
+class TestTrajectory:
+    def test_TrackFile_CalcTrajectory_WithinVehicleLimits(self):
+        track = read_track("reference_track_example.xml")
+        vehicle_limits = VehicleLimits(max_speed=3.0, max_lateral_acceleration=2.0, max_acceleration=1.0, max_deceleration=1.5)
+
+        trajectory = calc_trajectory(track, vehicle_limits, time_step=0.05)
+
+        assert list(trajectory) == TRAJECTORY_COLUMNS
+        np.testing.assert_allclose(np.diff(trajectory["t"]), 0.05)
+        assert np.all(np.diff(trajectory["s"]) >= 0.0)
+        assert trajectory["s"][-1] == pytest.approx(track.get_centerline_path().length, abs=0.01)
+        assert trajectory["speed"][0] == 0.0 and trajectory["speed"].max() <= 3.0 + 1e-9
+        assert np.all(np.abs(trajectory["lateral_acceleration"]) <= 2.0 + 1e-9)
+        assert np.all((trajectory["acceleration"] >= -1.5 - 1e-9) & (trajectory["acceleration"] <= 1.0 + 1e-9))
+        # Positions along the center line move with the speed
+        steps = np.hypot(np.diff(trajectory["x"]), np.diff(trajectory["y"]))
+        np.testing.assert_allclose(steps, np.diff(trajectory["s"]), atol=1e-3)
+
+    def test_SetsOfVehicleLimits_CalcTrajectories_SameAsSingleTrajectories(self):
+        track = read_track("small_track_example.xml")
+        all_vehicle_limits = [VehicleLimits(max_speed=1.0), VehicleLimits(max_lateral_acceleration=4.0, end_speed=None)]
+
+        trajectories = calc_trajectories(track, all_vehicle_limits)
+
+        for trajectory, vehicle_limits in zip(trajectories, all_vehicle_limits):
+            for name, column in calc_trajectory(track, vehicle_limits).items():
+                np.testing.assert_array_equal(trajectory[name], column)
+        assert trajectories[1]["speed"][-1] > 0.0
+
+    def test_SpacingLongerThanTrack_CalcTrajectory_StopsAtEndOfTrack(self):
+        track = read_track("small_track_example.xml")
+        length = track.get_centerline_path().length
+
+        trajectory = calc_trajectory(track, spacing=2 * length)
+
+        assert np.all(np.isfinite(trajectory["t"]))
+        assert trajectory["s"][-1] == pytest.approx(length, abs=0.1)
+        assert np.all(trajectory["speed"] >= 0.0)
+
+    def test_ZeroSpeedsOfAnInterval_ResampleInTime_RaisesValueError(self):
+        with pytest.raises(ValueError):
+            _resample_in_time(np.array([0.0, 0.05]), np.array([0.0, 0.0]), DEFAULT_TIME_STEP)
+
+    def test_InvalidVehicleLimits_Create_RaisesValueError(self):
+        with pytest.raises(ValueError):
+            VehicleLimits(max_acceleration=0.0)
+
+    def test_TrackFile_GenerateTrajectory_NpzWithColumnsAndMetadata(self, tmp_path):
+        output_directories = generate_trajectory([TRACK_FILES_DIR / "small_track_example.xml"], tmp_path, VehicleLimits(max_speed=1.5), time_step=0.1)
+
+        assert output_directories == [tmp_path / "small_track_example"]
+        with np.load(tmp_path / "small_track_example/trajectory.npz") as npz:
+            expected_trajectory = calc_trajectory(read_track("small_track_example.xml"), VehicleLimits(max_speed=1.5), time_step=0.1)
+            for name in TRAJECTORY_COLUMNS:
+                np.testing.assert_array_equal(npz[name], expected_trajectory[name])
+            assert npz["time_step"] == 0.1 and npz["max_speed"] == 1.5
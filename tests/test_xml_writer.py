@@ -0,0 +1,59 @@
+# Copyright (C) 2024 twyleg
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from track_generator import xml_reader
+from track_generator.track import ParkingArea
+from track_generator.xml_writer import write_track, write_track_to_string
+
+
+#
+# General naming convention for unit tests:
+#               test_INITIALSTATE_ACTION_EXPECTATION
+#
+
+
+FILE_DIR = Path(__file__).parent
+TRACK_FILES_DIR = FILE_DIR / "../examples/track_files"
+
+
+def read_track(filename: str):
+    track = xml_reader.read_track(TRACK_FILES_DIR / filename)
+    track.calc()
+    return track
+
+
+class TestXmlWriter:
+    @pytest.mark.parametrize(
+        "filename",
+        ["background_image_example.xml", "clothoid_track_example.xml", "doc_track_example.xml", "reference_track_example.xml", "small_track_example.xml"],
+    )
+    def test_ExampleTrack_WriteAndRead_SameTrack(self, filename):
+        track = read_track(filename)
+
+        written_track = xml_reader.read_track_from_string(write_track_to_string(track))
+        written_track.calc()
+
+        assert [type(segment) for segment in written_track.segments] == [type(segment) for segment in track.segments]
+        assert (written_track.width, written_track.height, written_track.origin) == (track.width, track.height, track.origin)
+        assert vars(written_track.background) == vars(track.background)
+        s = np.linspace(0.0, track.get_centerline_path().length, 500)
+        np.testing.assert_allclose(written_track.evaluate_centerline(s)[0], track.evaluate_centerline(s)[0], atol=1e-9)
+
+    def test_ParkingArea_WriteToFile_SameLots(self, tmp_path):
+        track = read_track("reference_track_example.xml")
+
+        write_track(track, tmp_path / "track.xml")
+        written_track = xml_reader.read_track(tmp_path / "track.xml")
+
+        parking_area = next(segment for segment in track.segments if isinstance(segment, ParkingArea))
+        written_parking_area = next(segment for segment in written_track.segments if isinstance(segment, ParkingArea))
+        for lots, written_lots in [(parking_area.right_lots, written_parking_area.right_lots), (parking_area.left_lots, written_parking_area.left_lots)]:
+            assert [(lot.start, lot.depth, lot.opening_ending_angle) for lot in written_lots] == [
+                (lot.start, lot.depth, lot.opening_ending_angle) for lot in lots
+            ]
+            assert [[(spot.type, spot.length) for spot in lot.spots] for lot in written_lots] == [
+                [(spot.type, spot.length) for spot in lot.spots] for lot in lots
+            ]
@@ -0,0 +1,205 @@
+# Copyright (C) 2024 twyleg
+import io
+import json
+import os
+import tarfile
+import threading
+import time
+import zipfile
+from pathlib import Path
+from typing import Dict, IO, List, Optional, Tuple, Union
+
+from track_generator import instrumentation
+from track_generator.artifacts import Content, TrackArtifacts, to_bytes
+from track_generator.sinks import OutputSink, sync_directories
+
+INDEX_FILENAME = "index.jsonl"
+ARCHIVE_FORMATS = ["tar", "zip"]
+
+
+class ArchiveSink(OutputSink):
+    """
+    Streams the artifacts of a batch into sharded, uncompressed archives (tar or zip) instead of a directory tree per
+    track. A new shard is started with the first track that doesn't fit into the current shard anymore, so the
+    artifacts of a track are never split across shards (write_artifacts() commits a track at once, single write() calls
+    of different tracks must not be interleaved). Every artifact is recorded in an index (JSON lines) with its
+    shard, data offset and size, which allows reading single artifacts with one seek (see ArchiveReader). With fsync
+    enabled, finished shards are synced when the next one is started and flush() syncs the current shard, the index and
+    the output directory. Shards of an earlier archive with the same prefix are removed when the sink is opened, so the
+    output directory only contains shards that are listed in the index.
+    """
+
+    def __init__(self, output_dirpath: Path, format: str = "tar", shard_size: int = 1024 * 1024 * 1024, shard_prefix: str = "shard", fsync: bool = False):
+        if format not in ARCHIVE_FORMATS:
+            raise ValueError(f"Unsupported archive format: {format}")
+        self.output_dirpath = output_dirpath
+        self.format = format
+        self.shard_size = shard_size
+        self.shard_prefix = shard_prefix
+        self.fsync = fsync
+        self.shard_filenames: List[str] = []
+
+        self.output_dirpath.mkdir(parents=True, exist_ok=True)
+        self._remove_stale_shards()
+        self._index_file = open(self.output_dirpath / INDEX_FILENAME, "w")
+        self._lock = threading.Lock()
+        self._shard_file: Optional[IO[bytes]] = None
+        self._tar_file: Optional[tarfile.TarFile] = None
+        self._zip_file: Optional[zipfile.ZipFile] = None
+        self._current_track_name: Optional[str] = None
+
+    def _remove_stale_shards(self) -> None:
+        for archive_format in ARCHIVE_FORMATS:
+            for shard_filepath in self.output_dirpath.glob(f"{self.shard_prefix}-[0-9][0-9][0-9][0-9][0-9].{archive_format}"):
+                shard_filepath.unlink()
+
+    @property
+    def _current_shard_size(self) -> int:
+        if self._tar_file:
+            return self._tar_file.offset
+        if self._zip_file:
+            assert self._zip_file.fp
+            return self._zip_file.fp.tell()
+        return 0
+
+    def _close_shard(self) -> None:
+        if self._tar_file:
+            self._tar_file.close()
+            self._tar_file = None
+        if self._zip_file:
+            self._zip_file.close()
+            self._zip_file = None
+        if self._shard_file:
+            self._sync_file(self._shard_file)
+            self._shard_file.close()
+            self._shard_file = None
+
+    def _sync_file(self, f: IO) -> None:
+        f.flush()
+        if self.fsync:
+            os.fsync(f.fileno())
+
+    def _open_next_shard(self) -> None:
+        self._close_shard()
+        shard_filename = f"{self.shard_prefix}-{len(self.shard_filenames):05d}.{self.format}"
+        shard_filepath = self.output_dirpath / shard_filename
+        # The archives don't close a file object that was passed to them, so it can be synced after the archive end
+        self._shard_file = open(shard_filepath, "wb")
+        if self.format == "tar":
+            self._tar_file = tarfile.open(fileobj=self._shard_file, mode="w", format=tarfile.PAX_FORMAT)
+        else:
+            self._zip_file = zipfile.ZipFile(self._shard_file, "w", compression=zipfile.ZIP_STORED)
+        self.shard_filenames.append(shard_filename)
+
+    def _add_to_tar(self, name: str, data: bytes) -> int:
+        assert self._tar_file
+        tar_info = tarfile.TarInfo(name)
+        tar_info.size = len(data)
+        tar_info.mtime = int(time.time())
+        self._tar_file.addfile(tar_info, io.BytesIO(data))
+        padded_size = -(-len(data) // tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE
+        return self._tar_file.offset - padded_size
+
+    def _add_to_zip(self, name: str, data: bytes) -> int:
+        assert self._zip_file
+        zip_info = zipfile.ZipInfo(name, date_time=time.localtime(time.time())[:6])
+        zip_info.compress_type = zipfile.ZIP_STORED
+        self._zip_file.writestr(zip_info, data)
+        return zip_info.header_offset + len(zip_info.FileHeader())
+
+    def _add_track_files(self, track_name: str, files: Dict[str, bytes]) -> None:
+        # The caller holds the lock. The whole track is committed at once, so concurrent writers (e.g. WriteBehindSink)
+        # can't interleave the files of different tracks and split a track across a shard rollover.
+        if track_name != self._current_track_name:
+            track_size = sum(len(data) for data in files.values())
+            if not self.shard_filenames or (self._current_shard_size > 0 and self._current_shard_size + track_size > self.shard_size):
+                self._open_next_shard()
+            self._current_track_name = track_name
+
+        for relative_path, data in files.items():
+            name = f"{track_name}/{relative_path}"
+            offset = self._add_to_tar(name, data) if self.format == "tar" else self._add_to_zip(name, data)
+            entry = {"track": track_name, "path": relative_path, "shard": self.shard_filenames[-1], "offset": offset, "size": len(data)}
+            self._index_file.write(json.dumps(entry) + "\n")
+
+    def write(self, track_name: str, relative_path: str, content: Content) -> None:
+        data = to_bytes(content)
+        with self._lock:
+            self._add_track_files(track_name, {relative_path: data})
+
+    def write_artifacts(self, artifacts: TrackArtifacts) -> None:
+        files = {relative_path: to_bytes(content) for relative_path, content in artifacts.files().items()}
+        with instrumentation.span("ArchiveSink.write_artifacts", track=artifacts.track_name):
+            with self._lock:
+                self._add_track_files(artifacts.track_name, files)
+
+    def flush(self) -> None:
+        with self._lock:
+            if self._shard_file:
+                self._sync_file(self._shard_file)
+            self._sync_file(self._index_file)
+        if self.fsync:
+            sync_directories([self.output_dirpath])
+
+    def close(self) -> None:
+        with self._lock:
+            self._close_shard()
+            self._sync_file(self._index_file)
+            self._index_file.close()
+        if self.fsync:
+            sync_directories([self.output_dirpath])
+
+
+class ArchiveReader:
+    """
+    Reads single artifacts from archives written by ArchiveSink without extracting them, using the index to seek
+    directly to the data of the artifact.
+    """
+
+    class ArtifactNotFoundError(KeyError):
+        pass
+
+    def __init__(self, archive_dirpath: Path):
+        self.archive_dirpath = archive_dirpath
+        self._index: Optional[Dict[Tuple[str, str], Dict[str, Union[str, int]]]] = None
+        self._shard_files: Dict[str, IO[bytes]] = {}
+
+    @property
+    def index(self) -> Dict[Tuple[str, str], Dict[str, Union[str, int]]]:
+        if self._index is None:
+            self._index = {}
+            with open(self.archive_dirpath / INDEX_FILENAME) as f:
+                for line in f:
+                    entry = json.loads(line)
+                    self._index[(entry["track"], entry["path"])] = entry
+        return self._index
+
+    def track_names(self) -> List[str]:
+        return list(dict.fromkeys(track_name for track_name, _ in self.index))
+
+    def list_artifacts(self, track_name: str) -> List[str]:
+        return [relative_path for name, relative_path in self.index if name == track_name]
+
+    def read(self, track_name: str, relative_path: str) -> bytes:
+        try:
+            entry = self.index[(track_name, relative_path)]
+        except KeyError:
+            raise ArchiveReader.ArtifactNotFoundError(f"{track_name}/{relative_path}")
+
+        shard_filename = str(entry["shard"])
+        if shard_filename not in self._shard_files:
+            self._shard_files[shard_filename] = open(self.archive_dirpath / shard_filename, "rb")
+        shard_file = self._shard_files[shard_filename]
+        shard_file.seek(int(entry["offset"]))
+        return shard_file.read(int(entry["size"]))
+
+    def close(self) -> None:
+        for shard_file in self._shard_files.values():
+            shard_file.close()
+        self._shard_files.clear()
+
+    def __enter__(self) -> "ArchiveReader":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
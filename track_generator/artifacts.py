@@ -0,0 +1,49 @@
+# Copyright (C) 2024 twyleg
+from pathlib import PurePosixPath
+from typing import Dict, Optional, Union
+
+
+Content = Union[str, bytes]
+
+
+def to_bytes(content: Content) -> bytes:
+    return content.encode("utf-8") if isinstance(content, str) else content
+
+
+class TrackArtifacts:
+    """
+    In-memory results of a generated track. files() maps them to the same relative paths that generate_track writes
+    into the output directory of the track.
+    """
+
+    def __init__(self, track_name: str):
+        self.track_name = track_name
+        self.svg: Optional[str] = None
+        self.svg_verbose: Optional[str] = None
+        self.png: Optional[bytes] = None
+        self.ground_truth: Optional[str] = None
+        self.gazebo_files: Dict[str, Content] = {}
+        self.extra_files: Dict[str, Content] = {}
+
+    def files(self) -> Dict[str, Content]:
+        files: Dict[str, Content] = {}
+        if self.svg is not None:
+            files[f"{self.track_name}.svg"] = self.svg
+        if self.png is not None:
+            files[f"{self.track_name}.png"] = self.png
+        files.update(self.gazebo_files)
+        if self.svg_verbose is not None:
+            files[f"{self.track_name}_verbose.svg"] = self.svg_verbose
+        if self.ground_truth is not None:
+            files["ground_truth.xml"] = self.ground_truth
+        files.update(self.extra_files)
+        return files
+
+    @property
+    def size(self) -> int:
+        return sum(len(to_bytes(content)) for content in self.files().values())
+
+    def set_gazebo_files(self, gazebo_files: Dict, texture: Optional[bytes]) -> None:
+        self.gazebo_files = {PurePosixPath(*filepath.parts).as_posix(): content for filepath, content in gazebo_files.items()}
+        if texture is not None:
+            self.gazebo_files[f"gazebo_models/{self.track_name}/materials/textures/{self.track_name}.png"] = texture
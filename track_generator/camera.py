@@ -0,0 +1,313 @@
+# Copyright (C) 2024 twyleg
+from pathlib import Path
+from typing import Iterator, Optional, Tuple, Union
+
+import numpy as np
+
+from track_generator.coordinate_system import PIXELS_PER_METER
+from track_generator.label_raster import LabelRaster
+from track_generator.track import Track
+
+DEFAULT_TILE_SIZE = 128
+DEFAULT_MAX_TILES = 1024
+DEFAULT_BATCH_SIZE = 16
+DEFAULT_MAX_DISTANCE = 3.0
+
+
+class TiledTexture:
+    """
+    Rendered image of a track (RGB(A) PNG or label raster) in world coordinates, split into square tiles that are copied
+    from the source raster on first use. Sampled tiles are kept in a fixed size atlas and the least recently used tiles
+    are replaced, so the source can be a memory mapped or otherwise lazily loaded array that is larger than the memory
+    spent on the atlas.
+    """
+
+    def __init__(
+        self,
+        source: np.ndarray,
+        height: float,
+        origin: Tuple[float, float],
+        pixels_per_meter: float = PIXELS_PER_METER,
+        tile_size: int = DEFAULT_TILE_SIZE,
+        max_tiles: int = DEFAULT_MAX_TILES,
+        fill_value: Union[int, float] = 0,
+    ):
+        """
+        :param source: Array (rows, columns) or (rows, columns, channels) with the pixel mapping of the track images
+        :param height: Height of the track in m
+        :param origin: Origin of the track
+        :param tile_size: Size of the tiles in pixels, a power of two
+        :param max_tiles: Number of tiles kept in memory
+        :param fill_value: Value of samples outside of the source
+        """
+        if tile_size <= 0 or tile_size & (tile_size - 1):
+            raise ValueError(f"Invalid tile size: {tile_size}")
+        if max_tiles <= 0:
+            raise ValueError(f"Invalid number of tiles: {max_tiles}")
+        self.source = source
+        self.height = height
+        self.origin = origin
+        self.pixels_per_meter = pixels_per_meter
+        self.tile_size = tile_size
+        self.fill_value = fill_value
+
+        self.tile_shift = tile_size.bit_length() - 1
+        self.tile_rows = -(-source.shape[0] // tile_size)
+        self.tile_cols = -(-source.shape[1] // tile_size)
+        self.num_tiles = self.tile_rows * self.tile_cols
+        self.channel_shape = source.shape[2:]
+        # The last slot of the atlas is filled with fill_value, it is the slot of the samples outside of the source
+        self.atlas = np.zeros((max_tiles + 1, tile_size, tile_size) + self.channel_shape, dtype=source.dtype)
+        self.atlas[max_tiles] = fill_value
+        # Atlas slot of every tile (-1 for tiles that are not loaded), tile and last use of every slot
+        self.tile_slots = np.full(self.num_tiles + 1, -1, dtype=np.int64)
+        self.tile_slots[self.num_tiles] = max_tiles
+        self.slot_tiles = np.full(max_tiles, -1, dtype=np.int64)
+        self.slot_last_use = np.full(max_tiles, -1, dtype=np.int64)
+        self.num_uses = 0
+        self.num_loaded_tiles = 0
+
+    @classmethod
+    def from_label_raster(cls, label_raster: LabelRaster, **kwargs) -> "TiledTexture":
+        return cls(label_raster.labels, label_raster.height, label_raster.origin, label_raster.pixels_per_meter, **kwargs)
+
+    @classmethod
+    def from_track(cls, track: Track, pixels_per_meter: float = PIXELS_PER_METER, **kwargs) -> "TiledTexture":
+        """
+        Texture of the LabelClass of every pixel, rasterized with the same shapes as the track images.
+        :param track: The calculated track
+        """
+        from track_generator.painter import Painter
+
+        painter = Painter(labels=True, label_pixels_per_meter=pixels_per_meter)
+        painter.draw_track(track)
+        assert painter.label_raster
+        return cls.from_label_raster(painter.label_raster, **kwargs)
+
+    @classmethod
+    def from_png(cls, png: Union[Path, str, bytes], track: Track, pixels_per_meter: float = PIXELS_PER_METER, **kwargs) -> "TiledTexture":
+        """
+        :param png: File path or content of a PNG rendered from the track by the Painter
+        :param track: The calculated track
+        """
+        import imageio.v3 as iio
+
+        return cls(iio.imread(png, extension=".png"), track.height, track.origin, pixels_per_meter, **kwargs)
+
+    def to_pixel(self, x: np.ndarray, y: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        :return: Row and column of the pixels containing the world coordinates
+        """
+        cols = np.floor((x - self.origin[0]) * self.pixels_per_meter).astype(np.int32)
+        rows = np.floor((self.height - y - self.origin[1]) * self.pixels_per_meter).astype(np.int32)
+        return rows, cols
+
+    def tiles(self, rows: np.ndarray, cols: np.ndarray) -> np.ndarray:
+        """
+        :param rows: Array of pixel rows (int32)
+        :param cols: Array of pixel columns (int32)
+        :return: Index of the tile containing every pixel, num_tiles for pixels outside of the source
+        """
+        # Negative rows and columns are outside as large unsigned integers
+        is_inside = (rows.view(np.uint32) < self.source.shape[0]) & (cols.view(np.uint32) < self.source.shape[1])
+        return np.where(is_inside, (rows >> self.tile_shift) * self.tile_cols + (cols >> self.tile_shift), self.num_tiles)
+
+    def required_tiles(self, tiles: np.ndarray) -> np.ndarray:
+        """
+        :return: Unique indices of the given tiles within the source
+        """
+        is_required = np.zeros(self.num_tiles + 1, dtype=bool)
+        is_required[tiles] = True
+        return np.flatnonzero(is_required[: self.num_tiles])
+
+    def load(self, tiles: np.ndarray) -> None:
+        """
+        Make sure that the tiles are in the atlas, the other tiles that are used least recently are replaced.
+        :param tiles: Unique indices of the tiles to sample
+        """
+        self.num_uses += 1
+        slots = self.tile_slots[tiles]
+        self.slot_last_use[slots[slots >= 0]] = self.num_uses
+        missing = tiles[slots < 0]
+        if len(missing):
+            # Replace the least recently used tiles, the slots of the tiles in use are the most recently used
+            free_slots = np.argsort(self.slot_last_use, kind="stable")[: len(missing)]
+            if len(free_slots) < len(missing) or np.any(self.slot_last_use[free_slots] == self.num_uses):
+                raise ValueError(f"Samples need {len(tiles)} tiles, more than the {len(self.slot_tiles)} tiles of the texture")
+            replaced = self.slot_tiles[free_slots]
+            self.tile_slots[replaced[replaced >= 0]] = -1
+            size = self.tile_size
+            for tile, slot in zip(missing, free_slots):
+                row, col = divmod(int(tile), self.tile_cols)
+                data = np.asarray(self.source[row * size : (row + 1) * size, col * size : (col + 1) * size])
+                self.atlas[slot, : data.shape[0], : data.shape[1]] = data
+            self.tile_slots[missing] = free_slots
+            self.slot_tiles[free_slots] = missing
+            self.slot_last_use[free_slots] = self.num_uses
+            self.num_loaded_tiles += len(missing)
+
+    def gather(self, rows: np.ndarray, cols: np.ndarray, tiles: np.ndarray) -> np.ndarray:
+        """
+        :param rows: Array of pixel rows (int32)
+        :param cols: Array of pixel columns (int32)
+        :param tiles: Tiles of the pixels, the tiles within the source must be loaded
+        :return: Array (n, channels...) of the pixel values, fill_value for pixels outside of the source
+        """
+        mask = self.tile_size - 1
+        texels = (self.tile_slots[np.ravel(tiles)] << (2 * self.tile_shift)) + ((np.ravel(rows) & mask) << self.tile_shift) + (np.ravel(cols) & mask)
+        return self.atlas.reshape((-1,) + self.channel_shape)[texels]
+
+    def sample(self, rows: np.ndarray, cols: np.ndarray) -> np.ndarray:
+        """
+        :param rows: Array of pixel rows (int32)
+        :param cols: Array of pixel columns (int32)
+        :return: Array (n, channels...) of the pixel values, fill_value for pixels outside of the source
+        """
+        tiles = self.tiles(rows, cols)
+        self.load(self.required_tiles(tiles))
+        return self.gather(rows, cols, tiles)
+
+
+class PerspectiveCamera:
+    """
+    Pinhole camera mounted on a vehicle that looks at the flat ground. Image rows point down and columns to the right,
+    pixel centers have integer coordinates. The vehicle coordinate system has x forward, y to the left and z upwards.
+    Every pixel sees a fixed point of the ground in the vehicle coordinate system (the homography of the ground plane),
+    so the ground points are calculated once and only moved with the poses of the vehicle for every frame.
+    """
+
+    def __init__(
+        self,
+        width: int,
+        height: int,
+        focal_length: float,
+        principal_point: Optional[Tuple[float, float]] = None,
+        position: Tuple[float, float, float] = (0.0, 0.0, 0.25),
+        pitch: float = 0.4,
+        yaw: float = 0.0,
+        roll: float = 0.0,
+        max_distance: float = DEFAULT_MAX_DISTANCE,
+    ):
+        """
+        :param width: Width of the images in pixels
+        :param height: Height of the images in pixels
+        :param focal_length: Focal length in pixels
+        :param principal_point: Column and row of the principal point, the center of the image by default
+        :param position: Position of the camera in the vehicle coordinate system in m
+        :param pitch: Downward tilt of the camera (rad)
+        :param yaw: Direction of the camera (rad) relative to the heading of the vehicle, counterclockwise
+        :param roll: Rotation of the camera (rad) around its optical axis
+        :param max_distance: Maximum distance in m of the ground points from the camera, farther pixels are not filled
+        """
+        if width <= 0 or height <= 0 or focal_length <= 0.0:
+            raise ValueError(f"Invalid camera intrinsics: {width}x{height} pixels, focal length {focal_length}")
+        if position[2] <= 0.0:
+            raise ValueError(f"Camera must be above the ground: {position}")
+        self.width = width
+        self.height = height
+        self.max_distance = max_distance
+        cx, cy = principal_point if principal_point is not None else ((width - 1) / 2, (height - 1) / 2)
+        self.intrinsics = np.array([[focal_length, 0.0, cx], [0.0, focal_length, cy], [0.0, 0.0, 1.0]])
+
+        # Rotation from the camera coordinate system (x right, y down, z along the optical axis) to the vehicle
+        def rotation(axis: int, angle: float) -> np.ndarray:
+            i, j = (axis + 1) % 3, (axis + 2) % 3
+            matrix = np.eye(3)
+            matrix[i, i], matrix[i, j], matrix[j, i], matrix[j, j] = np.cos(angle), -np.sin(angle), np.sin(angle), np.cos(angle)
+            return matrix
+
+        camera_axes = np.array([[0.0, 0.0, 1.0], [-1.0, 0.0, 0.0], [0.0, -1.0, 0.0]])
+        self.rotation = rotation(2, yaw) @ rotation(1, pitch) @ camera_axes @ rotation(2, roll)
+        self.position = np.array(position, dtype=float)
+
+        # Homography from the ground plane (x, y, 1) in the vehicle coordinate system to the image
+        to_camera = self.rotation.T
+        self.homography = self.intrinsics @ np.column_stack([to_camera[:, 0], to_camera[:, 1], -to_camera @ self.position])
+
+        # Ground point of every pixel: intersection of its ray with the ground in front of the camera
+        rows, cols = np.meshgrid(np.arange(height, dtype=float), np.arange(width, dtype=float), indexing="ij")
+        rays = np.stack([cols.ravel(), rows.ravel(), np.ones(width * height)], axis=-1) @ np.linalg.inv(self.intrinsics).T @ self.rotation.T
+        with np.errstate(divide="ignore", invalid="ignore"):
+            scale = np.where(rays[:, 2] < 0.0, -self.position[2] / rays[:, 2], np.inf)
+        self.is_ground = scale * np.linalg.norm(rays, axis=1) <= max_distance
+        self.ground = np.where(self.is_ground[:, np.newaxis], self.position[:2] + scale[:, np.newaxis] * rays[:, :2], 0.0)
+
+    def project(self, points: np.ndarray) -> np.ndarray:
+        """
+        :param points: Array (n, 2) of ground points in the vehicle coordinate system
+        :return: Array (n, 2) of their image coordinates (column, row), points behind the camera have no valid image coordinates
+        """
+        projected = np.column_stack([points, np.ones(len(points))]) @ self.homography.T
+        return projected[:, :2] / projected[:, 2:3]
+
+
+class FrameRenderer:
+    """
+    Perspective camera frames along a sequence of vehicle poses, sampled from a tiled texture of the track. Frames are
+    rendered in batches: the ground points of all pixels of a batch are moved to world coordinates at once and the
+    tiles they need are loaded before they are sampled (nearest pixel).
+    """
+
+    def __init__(self, texture: TiledTexture, camera: PerspectiveCamera, batch_size: int = DEFAULT_BATCH_SIZE):
+        """
+        :param batch_size: Number of frames rendered at once
+        """
+        if batch_size <= 0:
+            raise ValueError(f"Invalid batch size: {batch_size}")
+        self.texture = texture
+        self.camera = camera
+        self.batch_size = batch_size
+
+        # Ground points in pixels of the texture, float32 is exact to fractions of a pixel for textures of tracks
+        pixels_per_meter = texture.pixels_per_meter
+        self.ground_x = (camera.ground[camera.is_ground, 0] * pixels_per_meter).astype(np.float32)
+        self.ground_y = (camera.ground[camera.is_ground, 1] * pixels_per_meter).astype(np.float32)
+
+    def _pixels(self, poses: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        :return: Arrays (n, ground pixels) of the texture rows and columns seen by the ground pixels of the camera
+        """
+        # Offsets within the texture pixels containing the poses, the rest of the calculations is local in float32
+        rows, cols = self.texture.to_pixel(poses[:, 0:1], poses[:, 1:2])
+        pixels_per_meter = self.texture.pixels_per_meter
+        fraction_col = ((poses[:, 0:1] - self.texture.origin[0]) * pixels_per_meter - cols).astype(np.float32)
+        fraction_row = ((self.texture.height - poses[:, 1:2] - self.texture.origin[1]) * pixels_per_meter - rows).astype(np.float32)
+        cos, sin = np.cos(poses[:, 2:3]).astype(np.float32), np.sin(poses[:, 2:3]).astype(np.float32)
+        cols = np.floor(fraction_col + cos * self.ground_x - sin * self.ground_y).astype(np.int32) + cols
+        rows = np.floor(fraction_row - sin * self.ground_x - cos * self.ground_y).astype(np.int32) + rows
+        return rows, cols
+
+    def _render_batches(self, poses: np.ndarray) -> Iterator[np.ndarray]:
+        rows, cols = self._pixels(poses)
+        tiles = self.texture.tiles(rows, cols)
+        required_tiles = self.texture.required_tiles(tiles)
+        if len(poses) > 1 and len(required_tiles) > len(self.texture.slot_tiles):
+            # Batches that need more tiles than the texture keeps are split
+            yield from self._render_batches(poses[: len(poses) // 2])
+            yield from self._render_batches(poses[len(poses) // 2 :])
+            return
+
+        channel_shape = self.texture.channel_shape
+        frames = np.full((len(poses), self.camera.height * self.camera.width) + channel_shape, self.texture.fill_value, dtype=self.texture.atlas.dtype)
+        self.texture.load(required_tiles)
+        frames[:, self.camera.is_ground] = self.texture.gather(rows, cols, tiles).reshape((len(poses), -1) + channel_shape)
+        yield frames.reshape((len(poses), self.camera.height, self.camera.width) + channel_shape)
+
+    def iter_batches(self, poses: np.ndarray) -> Iterator[np.ndarray]:
+        """
+        :param poses: Array (n, 3) of vehicle poses: x, y and heading (rad) in world coordinates
+        :return: Arrays (batch, rows, columns, channels...) of consecutive frames
+        """
+        poses = np.asarray(poses, dtype=float).reshape(-1, 3)
+        for start in range(0, len(poses), self.batch_size):
+            yield from self._render_batches(poses[start : start + self.batch_size])
+
+    def render(self, poses: np.ndarray) -> np.ndarray:
+        """
+        :param poses: Array (n, 3) of vehicle poses: x, y and heading (rad) in world coordinates
+        :return: Array (n, rows, columns, channels...) of the frames, pixels that do not see the texture get its fill value
+        """
+        frames = list(self.iter_batches(poses))
+        if not frames:
+            return np.empty((0, self.camera.height, self.camera.width) + self.texture.channel_shape, dtype=self.texture.atlas.dtype)
+        return np.concatenate(frames)
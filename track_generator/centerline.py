@@ -0,0 +1,373 @@
+# Copyright (C) 2024 twyleg
+import abc
+from math import ceil, factorial, radians, sqrt
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from track_generator.coordinate_system import CartesianSystem2d
+from track_generator.track import (
+    LINE_OFFSET,
+    Clothoid,
+    ClothoidType,
+    Gap,
+    Intersection,
+    IntersectionDirection,
+    Straight,
+    Start,
+    Track,
+    TrafficIsland,
+    Turn,
+)
+
+CLOTHOID_SERIES_TERMS = 20
+CLOTHOID_SAMPLE_DISTANCE = 0.04
+# Distance in m (and heading difference in rad) between start and end of the center line up to which a track is closed
+CLOSED_TOLERANCE = 1e-3
+
+
+class CenterlinePrimitive(abc.ABC):
+    """
+    Center line of a segment as function of the arc length s in [0, length], given in the start coordinate system of
+    the segment (x forward, y to the left).
+    """
+
+    length: float
+
+    @abc.abstractmethod
+    def evaluate(self, s: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        :param s: Arc lengths to evaluate the center line at
+        :return: Arrays x, y, heading (rad) and curvature (1/m, positive to the left) for every arc length
+        """
+        pass
+
+    def lateral_offset(self, s: np.ndarray) -> np.ndarray:
+        """
+        :return: Distance of the lane boundaries from the center line for every arc length
+        """
+        return np.full_like(s, LINE_OFFSET)
+
+
+class Line(CenterlinePrimitive):
+    def __init__(self, length: float):
+        self.length = length
+
+    def evaluate(self, s: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        zeros = np.zeros_like(s)
+        return s.copy(), zeros, zeros, zeros.copy()
+
+
+class Arc(CenterlinePrimitive):
+    def __init__(self, radius: float, angle: float, clockwise: bool):
+        """
+        :param radius: Radius of the arc
+        :param angle: Angle of the arc in rad
+        :param clockwise: Flag whether the arc turns clockwise (to the right)
+        """
+        self.radius = radius
+        self.angle = angle
+        self.sign = -1.0 if clockwise else 1.0
+        self.length = radius * angle
+
+    def evaluate(self, s: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        theta = s / self.radius
+        x = self.radius * np.sin(theta)
+        y = self.sign * self.radius * (1.0 - np.cos(theta))
+        return x, y, self.sign * theta, np.full_like(s, self.sign / self.radius)
+
+
+class TrafficIslandLine(Line):
+    """
+    Straight center line through a traffic island. The lane boundaries are moved outwards by half the island width
+    along the island, with linear transitions over the curve segments.
+    """
+
+    def __init__(self, segment: TrafficIsland):
+        super().__init__(2 * segment.curve_segment_length + segment.crosswalk_length)
+        self.segment = segment
+
+    def lateral_offset(self, s: np.ndarray) -> np.ndarray:
+        curve_segment_length = self.segment.curve_segment_length
+        ramp = np.interp(s, [0.0, curve_segment_length, self.length - curve_segment_length, self.length], [0.0, 1.0, 1.0, 0.0])
+        return LINE_OFFSET + ramp * self.segment.island_width / 2
+
+
+class ClothoidCurve(CenterlinePrimitive):
+    """
+    Evaluates the clothoid of a Clothoid segment at arbitrary arc lengths with the same series expansion and
+    transformations (offset angle, direction, opening type) as Clothoid.calc().
+    """
+
+    def __init__(self, segment: Clothoid):
+        self.a = segment.a
+        self.direction = int(segment.direction) * -1
+        self.opening = segment.type == ClothoidType.OPEND
+        self.offset_rotation = radians(segment.angle_offset) * self.direction
+        self.inversion_rotation = radians(segment.angle) * int(segment.direction)
+
+        arc_length_start = segment.a * sqrt(2 * radians(segment.angle_offset))
+        self.arc_length_end = segment.a * sqrt(2 * radians(segment.angle_offset + segment.angle))
+        self.arc_length_first = segment.get_int(arc_length_start / CLOTHOID_SAMPLE_DISTANCE) * CLOTHOID_SAMPLE_DISTANCE
+        self.length = self.arc_length_end - self.arc_length_first
+
+        self.first_point = self._raw_points(np.array([self.arc_length_first]))
+        self.end_point = self._closing_points(np.array([self.arc_length_end]))
+
+    def _raw_points(self, arc_length: np.ndarray) -> np.ndarray:
+        x = np.zeros_like(arc_length)
+        y = np.zeros_like(arc_length)
+        toggle = 1.0
+        # Powers of the arc length are updated by multiplication, which is much cheaper than a power per term
+        power = np.asarray(arc_length, dtype=float).copy()
+        arc_length_pow4 = power**4
+        arc_length_pow2 = power**2
+        for loops in range(CLOTHOID_SERIES_TERMS):
+            x += toggle * power / (self.a ** (4 * loops) * factorial(2 * loops) * (1 + 4 * loops) * 2 ** (2 * loops))
+            y += toggle * power * arc_length_pow2 / (self.a ** (2 + 4 * loops) * factorial(1 + 2 * loops) * (3 + 4 * loops) * 2 ** (1 + 2 * loops))
+            power *= arc_length_pow4
+            toggle *= -1.0
+        return np.stack([x, y * self.direction], axis=-1)
+
+    @staticmethod
+    def _rotate(vectors: np.ndarray, radian: float) -> np.ndarray:
+        c, s = np.cos(radian), np.sin(radian)
+        return np.stack([vectors[..., 0] * c + vectors[..., 1] * s, -vectors[..., 0] * s + vectors[..., 1] * c], axis=-1)
+
+    def _closing_points(self, arc_length: np.ndarray) -> np.ndarray:
+        return self._rotate(self._raw_points(arc_length) - self.first_point, self.offset_rotation)
+
+    def _closing_tangents(self, arc_length: np.ndarray) -> np.ndarray:
+        phi = arc_length**2 / (2 * self.a**2)
+        return self._rotate(np.stack([np.cos(phi), self.direction * np.sin(phi)], axis=-1), self.offset_rotation)
+
+    def evaluate(self, s: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        if self.opening:
+            arc_length = self.arc_length_end - s
+            points = self._closing_points(arc_length)
+            points = self._rotate(np.stack([self.end_point[0, 0] - points[:, 0], points[:, 1] - self.end_point[0, 1]], axis=-1), self.inversion_rotation)
+            tangents = self._closing_tangents(arc_length)
+            tangents = self._rotate(np.stack([tangents[:, 0], -tangents[:, 1]], axis=-1), self.inversion_rotation)
+        else:
+            arc_length = self.arc_length_first + s
+            points = self._closing_points(arc_length)
+            tangents = self._closing_tangents(arc_length)
+
+        curvature = self.direction * arc_length / self.a**2
+        return points[:, 0], points[:, 1], np.arctan2(tangents[:, 1], tangents[:, 0]), curvature
+
+
+def _turning_primitive(length: float, direction: IntersectionDirection) -> CenterlinePrimitive:
+    if direction == IntersectionDirection.STRAIGHT:
+        return Line(length)
+    return Arc(length / 2, np.pi / 2, clockwise=direction == IntersectionDirection.RIGHT)
+
+
+def get_centerline_primitive(segment) -> Optional[CenterlinePrimitive]:
+    """
+    :return: The center line primitive of a calculated segment or None for segments without extent (Start)
+    """
+    if isinstance(segment, Start):
+        return None
+    elif isinstance(segment, Gap):
+        return _turning_primitive(segment.length, segment.direction)
+    elif isinstance(segment, Straight):
+        return Line(segment.length)
+    elif isinstance(segment, Turn):
+        return Arc(segment.radius, radians(segment.radian_angle), segment.direction_clockwise)
+    elif isinstance(segment, Intersection):
+        return _turning_primitive(segment.length, segment.direction)
+    elif isinstance(segment, TrafficIsland):
+        return TrafficIslandLine(segment)
+    elif isinstance(segment, Clothoid):
+        return ClothoidCurve(segment)
+    raise RuntimeError(f"Error in centerline: {segment} not supported")
+
+
+COLUMNS = ["s", "x", "y", "heading", "curvature", "left_x", "left_y", "right_x", "right_y"]
+
+
+class CenterlineSamples:
+    """
+    Samples of the center line and the lane boundaries of a track in world coordinates. The boundaries are sampled at
+    the same stations as the center line, offset along its normal: left is to the left of the driving direction
+    (+LINE_OFFSET in the segment coordinate systems), right to the right (-LINE_OFFSET).
+    """
+
+    def __init__(self, samples: np.ndarray, segment_index: np.ndarray):
+        """
+        :param samples: Array with one row per sample and the columns COLUMNS
+        :param segment_index: Index of the segment in Track.segments for every sample
+        """
+        self.samples = samples
+        self.segment_index = segment_index
+
+    @property
+    def s(self) -> np.ndarray:
+        return self.samples[:, 0]
+
+    @property
+    def x(self) -> np.ndarray:
+        return self.samples[:, 1]
+
+    @property
+    def y(self) -> np.ndarray:
+        return self.samples[:, 2]
+
+    @property
+    def heading(self) -> np.ndarray:
+        return self.samples[:, 3]
+
+    @property
+    def curvature(self) -> np.ndarray:
+        return self.samples[:, 4]
+
+    @property
+    def left(self) -> np.ndarray:
+        return self.samples[:, 5:7]
+
+    @property
+    def right(self) -> np.ndarray:
+        return self.samples[:, 7:9]
+
+    @property
+    def center(self) -> np.ndarray:
+        return self.samples[:, 1:3]
+
+    def __len__(self) -> int:
+        return len(self.samples)
+
+
+class CenterlinePath:
+    """
+    Center line of a calculated track as function of the arc length s in [0, length] from the start of the track, in
+    world coordinates. The segments with extent are numbered as pieces, arc lengths are assigned to pieces with a table
+    of the cumulative piece lengths (binary search).
+    """
+
+    def __init__(self, track: Track):
+        self.segment_indices: List[int] = []
+        self.primitives: List[CenterlinePrimitive] = []
+        rotations: List[np.ndarray] = []
+        translations: List[np.ndarray] = []
+        for i, segment in enumerate(track.segments):
+            primitive = get_centerline_primitive(segment)
+            if primitive is None or primitive.length <= 0.0:
+                continue
+            assert isinstance(segment.start_coordinate_system, CartesianSystem2d)
+            local_to_world = segment.start_coordinate_system.local_to_world
+            self.segment_indices.append(i)
+            self.primitives.append(primitive)
+            rotations.append(local_to_world[:2, :2])
+            translations.append(local_to_world[:2, 3])
+
+        self.rotations = np.array(rotations).reshape(-1, 2, 2)
+        self.translations = np.array(translations).reshape(-1, 2)
+        self.yaws = np.arctan2(self.rotations[:, 1, 0], self.rotations[:, 0, 0])
+        self.s_starts = np.concatenate([[0.0], np.cumsum([primitive.length for primitive in self.primitives])])
+        self.length = float(self.s_starts[-1])
+
+    def __len__(self) -> int:
+        return len(self.primitives)
+
+    def is_closed(self) -> bool:
+        """
+        :return: Flag whether the center line is a closed loop: it ends at its start with the same heading
+        """
+        if not self.primitives:
+            return False
+        x, y, heading, _ = self.evaluate(np.array([0.0, self.length]))
+        heading_difference = np.angle(np.exp(1j * (heading[1] - heading[0])))
+        return bool(np.hypot(x[1] - x[0], y[1] - y[0]) < CLOSED_TOLERANCE and abs(heading_difference) < CLOSED_TOLERANCE)
+
+    def locate(self, s: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        :param s: Arc lengths, clipped to the track
+        :return: Piece index and arc length within the piece for every arc length, joints belong to the following piece
+        """
+        if not self.primitives:
+            raise ValueError("Track without center line")
+        s = np.clip(np.asarray(s, dtype=float), 0.0, self.length)
+        pieces = np.clip(np.searchsorted(self.s_starts, s, side="right") - 1, 0, len(self.primitives) - 1)
+        return pieces, s - self.s_starts[pieces]
+
+    def group_by_piece(self, pieces: np.ndarray) -> List[Tuple[int, np.ndarray]]:
+        """
+        :return: Pairs of a piece and the indices into pieces that refer to it, for every piece that is referred to
+        """
+        order = np.argsort(pieces, kind="stable")
+        bounds = np.searchsorted(pieces[order], np.arange(len(self.primitives) + 1))
+        return [(piece, order[bounds[piece] : bounds[piece + 1]]) for piece in range(len(self.primitives)) if bounds[piece + 1] > bounds[piece]]
+
+    def evaluate_piece(self, piece: int, s: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        :param s: Arc lengths within the piece
+        :return: Arrays x, y, heading (rad) and curvature (1/m, positive to the left) in world coordinates
+        """
+        x, y, heading, curvature = self.primitives[piece].evaluate(s)
+        rotation, translation = self.rotations[piece], self.translations[piece]
+        world_x = rotation[0, 0] * x + rotation[0, 1] * y + translation[0]
+        world_y = rotation[1, 0] * x + rotation[1, 1] * y + translation[1]
+        return world_x, world_y, heading + self.yaws[piece], curvature
+
+    def evaluate(self, s: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Evaluate the center line in one vectorized pass per piece.
+        :param s: Arc lengths from the start of the track, clipped to the track
+        :return: Arrays x, y, heading (rad) and curvature (1/m, positive to the left) in world coordinates
+        """
+        pieces, local_s = self.locate(np.ravel(s))
+        x, y, heading, curvature = (np.empty_like(local_s) for _ in range(4))
+        for piece, indices in self.group_by_piece(pieces):
+            x[indices], y[indices], heading[indices], curvature[indices] = self.evaluate_piece(piece, local_s[indices])
+        return x, y, heading, curvature
+
+    def lateral_offset(self, s: np.ndarray) -> np.ndarray:
+        """
+        :param s: Arc lengths from the start of the track, clipped to the track
+        :return: Distance of the lane boundaries from the center line for every arc length
+        """
+        pieces, local_s = self.locate(np.ravel(s))
+        offsets = np.empty_like(local_s)
+        for piece, indices in self.group_by_piece(pieces):
+            offsets[indices] = self.primitives[piece].lateral_offset(local_s[indices])
+        return offsets
+
+
+def sample_track(track: Track, spacing: float) -> CenterlineSamples:
+    """
+    Sample the center line and the lane boundaries of a calculated track at equidistant arc lengths. Every segment is
+    divided into the smallest number of equal steps that are not longer than the given spacing, so segment boundaries
+    are always sampled. Joints between segments are sampled once.
+    :param track: The calculated track
+    :param spacing: Maximum arc length between two samples in m
+    :return: The samples
+    """
+    if spacing <= 0.0:
+        raise ValueError(f"Invalid spacing: {spacing}")
+
+    path = track.get_centerline_path()
+    all_samples: List[np.ndarray] = []
+    all_segment_indices: List[np.ndarray] = []
+    for piece, primitive in enumerate(path.primitives):
+        num_steps = max(1, ceil(primitive.length / spacing - 1e-9))
+        s = np.linspace(0.0, primitive.length, num_steps + 1)
+        if piece < len(path) - 1:
+            s = s[:-1]
+
+        samples = np.empty((len(s), len(COLUMNS)))
+        samples[:, 0] = path.s_starts[piece] + s
+        x, y, heading, samples[:, 4] = path.evaluate_piece(piece, s)
+        center = np.stack([x, y], axis=-1)
+        normal = np.stack([-np.sin(heading), np.cos(heading)], axis=-1)
+        offset = primitive.lateral_offset(s)[:, np.newaxis]
+        samples[:, 1:3] = center
+        samples[:, 3] = heading
+        samples[:, 5:7] = center + offset * normal
+        samples[:, 7:9] = center - offset * normal
+        all_samples.append(samples)
+        all_segment_indices.append(np.full(len(s), path.segment_indices[piece], dtype=np.int32))
+
+    if not all_samples:
+        return CenterlineSamples(np.empty((0, len(COLUMNS))), np.empty(0, dtype=np.int32))
+    return CenterlineSamples(np.concatenate(all_samples), np.concatenate(all_segment_indices))
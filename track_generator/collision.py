@@ -0,0 +1,239 @@
+# Copyright (C) 2024 twyleg
+from enum import IntEnum
+from typing import List, Tuple, Union
+
+import numpy as np
+
+from track_generator.label_raster import LabelClass, polygon_to_array
+from track_generator.spatial_index import UniformGrid
+from track_generator.track import TrafficIsland, Track
+
+DEFAULT_CELL_SIZE = 0.25
+DEFAULT_VEHICLE_LENGTH = 0.4
+DEFAULT_VEHICLE_WIDTH = 0.2
+# Number of poses checked at once, limits the memory of the candidate pairs
+CHUNK_SIZE = 65536
+
+
+class CollisionClass(IntEnum):
+    LANE_LINE = 0
+    PARKING_OUTLINE = 1
+    BLOCKER = 2
+    TRAFFIC_ISLAND = 3
+
+
+# Classes of the strokes of the track shapes that are obstacles
+STROKE_COLLISION_CLASSES = {
+    LabelClass.LANE_LINE: CollisionClass.LANE_LINE,
+    LabelClass.PARKING_OUTLINE: CollisionClass.PARKING_OUTLINE,
+    LabelClass.BLOCKED_AREA: CollisionClass.BLOCKER,
+}
+
+ArrayLike = Union[float, np.ndarray]
+
+
+def _point_box_distance(x: np.ndarray, y: np.ndarray, half_length: np.ndarray, half_width: np.ndarray) -> np.ndarray:
+    return np.hypot(np.maximum(np.abs(x) - half_length, 0.0), np.maximum(np.abs(y) - half_width, 0.0))
+
+
+def _point_segment_distance(x: np.ndarray, y: np.ndarray, p0: np.ndarray, p1: np.ndarray) -> np.ndarray:
+    direction = p1 - p0
+    squared_length = np.maximum(np.sum(direction**2, axis=-1), 1e-24)
+    t = np.clip(((x - p0[:, 0]) * direction[:, 0] + (y - p0[:, 1]) * direction[:, 1]) / squared_length, 0.0, 1.0)
+    return np.hypot(x - p0[:, 0] - t * direction[:, 0], y - p0[:, 1] - t * direction[:, 1])
+
+
+def _segment_intersects_box(p0: np.ndarray, p1: np.ndarray, half_length: np.ndarray, half_width: np.ndarray) -> np.ndarray:
+    """
+    Clip the segments against the boxes centered at the origin (slab method).
+    """
+    half_extents = np.stack([half_length, half_width], axis=-1)
+    direction = p1 - p0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t0 = (-half_extents - p0) / direction
+        t1 = (half_extents - p0) / direction
+    is_parallel = direction == 0.0
+    # Segments parallel to an axis are within the slab completely or not at all
+    t_enter = np.where(is_parallel, np.where(np.abs(p0) <= half_extents, -np.inf, np.inf), np.minimum(t0, t1)).max(axis=1)
+    t_exit = np.where(is_parallel, np.where(np.abs(p0) <= half_extents, np.inf, -np.inf), np.maximum(t0, t1)).min(axis=1)
+    return (t_enter <= t_exit) & (t_exit >= 0.0) & (t_enter <= 1.0)
+
+
+def _segment_box_collision(p0: np.ndarray, p1: np.ndarray, clearance: np.ndarray, half_length: np.ndarray, half_width: np.ndarray) -> np.ndarray:
+    """
+    :param p0: Start points (n, 2) of the segments in the coordinate systems of the boxes (centered, axis aligned)
+    :param clearance: Distances from the segments within which the boxes collide (half width of the lines)
+    :return: Flags whether the boxes are within the clearance of the segments
+    """
+    # Without intersection, the closest points of a segment and a box are an end point of the segment or a corner of
+    # the box
+    distances = np.minimum(_point_box_distance(p0[:, 0], p0[:, 1], half_length, half_width), _point_box_distance(p1[:, 0], p1[:, 1], half_length, half_width))
+    for sign_x, sign_y in ((-1, -1), (-1, 1), (1, -1), (1, 1)):
+        distances = np.minimum(distances, _point_segment_distance(sign_x * half_length, sign_y * half_width, p0, p1))
+    return (distances <= clearance) | _segment_intersects_box(p0, p1, half_length, half_width)
+
+
+def _inside_polygon(points: np.ndarray, vertices: np.ndarray) -> np.ndarray:
+    """
+    :param vertices: Closed polygon (m + 1, 2)
+    :return: Flags whether the points are inside the polygon (even-odd rule)
+    """
+    x0, y0, x1, y1 = vertices[:-1, 0], vertices[:-1, 1], vertices[1:, 0], vertices[1:, 1]
+    x, y = points[:, 0:1], points[:, 1:2]
+    crosses = (y0 <= y) != (y1 <= y)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        x_crossing = x0 + (y - y0) * (x1 - x0) / (y1 - y0)
+    return np.logical_xor.reduce(crosses & (x < x_crossing), axis=1)
+
+
+class CollisionChecker:
+    """
+    Checks rectangular vehicle footprints at arrays of poses for collisions with the obstacles of a calculated track:
+    lane boundary lines, parking area outlines and spot separators, the crosses of blocked parking spots and traffic
+    islands. Lines are segments with the half line width as clearance, traffic islands are polygons between their inner
+    lane lines. A uniform grid over the segments limits every footprint to the segments of the cells it covers.
+    """
+
+    def __init__(self, p0: np.ndarray, p1: np.ndarray, clearance: np.ndarray, classes: np.ndarray, island_polygons: List[np.ndarray], cell_size: float):
+        """
+        :param p0: Start points (n, 2) of the obstacle segments in world coordinates
+        :param p1: End points (n, 2) of the obstacle segments
+        :param clearance: Half widths of the obstacle segments
+        :param classes: CollisionClass of every obstacle segment
+        :param island_polygons: Polygons (m, 2) of the traffic islands, their edges are expected among the segments
+        :param cell_size: Size of the grid cells in m
+        """
+        if cell_size <= 0.0:
+            raise ValueError(f"Invalid cell size: {cell_size}")
+        self.p0 = np.asarray(p0, dtype=float).reshape(-1, 2)
+        self.p1 = np.asarray(p1, dtype=float).reshape(-1, 2)
+        self.clearance = np.asarray(clearance, dtype=float)
+        self.classes = np.asarray(classes, dtype=np.int64)
+        self.island_polygons = [np.concatenate([polygon, polygon[:1]]) for polygon in island_polygons]
+
+        self.segment_min = np.minimum(self.p0, self.p1) - self.clearance[:, np.newaxis]
+        self.segment_max = np.maximum(self.p0, self.p1) + self.clearance[:, np.newaxis]
+        origin = self.segment_min.min(axis=0) if len(self.p0) else np.zeros(2)
+        extent = self.segment_max.max(axis=0) - origin if len(self.p0) else np.zeros(2)
+        shape = (int(extent[0] // cell_size) + 1, int(extent[1] // cell_size) + 1)
+        self.grid = UniformGrid(self.segment_min, self.segment_max, origin, cell_size, shape)
+        self.island_min = np.array([polygon.min(axis=0) for polygon in self.island_polygons]).reshape(-1, 2)
+        self.island_max = np.array([polygon.max(axis=0) for polygon in self.island_polygons]).reshape(-1, 2)
+
+    @classmethod
+    def from_track(cls, track: Track, cell_size: float = DEFAULT_CELL_SIZE) -> "CollisionChecker":
+        """
+        :param track: The calculated track, the obstacle lines are taken from its spatial index
+        :param cell_size: Size of the grid cells in m
+        """
+        spatial_index = track.get_spatial_index()
+        stroke_labels = spatial_index.shape_label[spatial_index.stroke_shape]
+        # Round joins are covered by the clearance around the ends of the adjoining segments
+        strokes = np.flatnonzero(~spatial_index.stroke_round & np.isin(stroke_labels, list(STROKE_COLLISION_CLASSES)))
+        classes = [STROKE_COLLISION_CLASSES[LabelClass(label)] for label in stroke_labels[strokes]]
+
+        island_polygons: List[np.ndarray] = []
+        for segment in track.segments:
+            if isinstance(segment, TrafficIsland):
+                # The inner lane lines of both sides start and end on the center line
+                left_inner, right_inner = polygon_to_array(segment.line_polygons[0]), polygon_to_array(segment.line_polygons[2])
+                island_polygons.append(np.concatenate([left_inner, right_inner[::-1]]))
+        num_island_edges = sum(len(polygon) for polygon in island_polygons)
+
+        return cls(
+            np.concatenate([spatial_index.stroke_p0[strokes], *island_polygons]),
+            np.concatenate([spatial_index.stroke_p1[strokes], *[np.roll(polygon, -1, axis=0) for polygon in island_polygons]]),
+            np.concatenate([spatial_index.stroke_half_width[strokes], np.zeros(num_island_edges)]),
+            np.concatenate([np.array(classes, dtype=np.int64), np.full(num_island_edges, CollisionClass.TRAFFIC_ISLAND)]),
+            island_polygons,
+            cell_size,
+        )
+
+    def _footprint_candidates(self, centers: np.ndarray, half_extents: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        :return: Pairs of footprint index and segment, the segments of all grid cells the footprints' bounding boxes cover
+        """
+        first_x, first_y = self.grid.cell_of(centers - half_extents)
+        last_x, last_y = self.grid.cell_of(centers + half_extents)
+        first_x, first_y = np.maximum(first_x, 0), np.maximum(first_y, 0)
+        last_x, last_y = np.minimum(last_x, self.grid.shape[0] - 1), np.minimum(last_y, self.grid.shape[1] - 1)
+        extent_x, extent_y = np.maximum(last_x - first_x + 1, 0), np.maximum(last_y - first_y + 1, 0)
+        counts = extent_x * extent_y
+        owners = np.repeat(np.arange(len(centers)), counts)
+        local_indices = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        cells_x = first_x[owners] + local_indices % extent_x[owners]
+        cells_y = first_y[owners] + local_indices // extent_x[owners]
+        queries, segments = self.grid.candidates(self.grid.flat_cells(cells_x, cells_y))
+        return owners[queries], segments
+
+    def _check_chunk(self, poses: np.ndarray, half_length: np.ndarray, half_width: np.ndarray, center_offset: np.ndarray) -> np.ndarray:
+        cos, sin = np.cos(poses[:, 2]), np.sin(poses[:, 2])
+        centers = poses[:, :2] + center_offset[:, np.newaxis] * np.stack([cos, sin], axis=-1)
+        # Half extents of the bounding boxes of the rotated footprints
+        half_extents = np.stack([np.abs(cos) * half_length + np.abs(sin) * half_width, np.abs(sin) * half_length + np.abs(cos) * half_width], axis=-1)
+        collisions = np.zeros((len(poses), len(CollisionClass)), dtype=bool)
+
+        queries, segments = self._footprint_candidates(centers, half_extents)
+        # World to footprint coordinate system
+        query_cos, query_sin = cos[queries], sin[queries]
+        relative_0, relative_1 = self.p0[segments] - centers[queries], self.p1[segments] - centers[queries]
+        p0 = np.stack([relative_0[:, 0] * query_cos + relative_0[:, 1] * query_sin, relative_0[:, 1] * query_cos - relative_0[:, 0] * query_sin], axis=-1)
+        p1 = np.stack([relative_1[:, 0] * query_cos + relative_1[:, 1] * query_sin, relative_1[:, 1] * query_cos - relative_1[:, 0] * query_sin], axis=-1)
+
+        # Separating axes of the footprints and the normals of the segments rule out most pairs, the exact test is left
+        # for the others
+        clearance, query_half_length, query_half_width = self.clearance[segments], half_length[queries], half_width[queries]
+        direction = p1 - p0
+        normal_length = np.maximum(np.hypot(direction[:, 0], direction[:, 1]), 1e-12)
+        is_candidate = (
+            (np.minimum(p0[:, 0], p1[:, 0]) <= query_half_length + clearance)
+            & (np.maximum(p0[:, 0], p1[:, 0]) >= -query_half_length - clearance)
+            & (np.minimum(p0[:, 1], p1[:, 1]) <= query_half_width + clearance)
+            & (np.maximum(p0[:, 1], p1[:, 1]) >= -query_half_width - clearance)
+            & (
+                np.abs(p0[:, 0] * direction[:, 1] - p0[:, 1] * direction[:, 0])
+                <= query_half_length * np.abs(direction[:, 1]) + query_half_width * np.abs(direction[:, 0]) + clearance * normal_length
+            )
+        )
+        # Segments with an end point within the footprint collide
+        is_inside = (np.abs(p0[:, 0]) <= query_half_length) & (np.abs(p0[:, 1]) <= query_half_width)
+        candidates = np.flatnonzero(is_candidate & ~is_inside)
+        is_hit = _segment_box_collision(p0[candidates], p1[candidates], clearance[candidates], query_half_length[candidates], query_half_width[candidates])
+        hits = np.concatenate([np.flatnonzero(is_inside), candidates[is_hit]])
+        collisions[queries[hits], self.classes[segments[hits]]] = True
+
+        # Footprints that do not touch the edges of an island are either outside of it or entirely inside
+        for polygon, island_min, island_max in zip(self.island_polygons, self.island_min, self.island_max):
+            is_near = (centers[:, 0] >= island_min[0]) & (centers[:, 0] <= island_max[0]) & (centers[:, 1] >= island_min[1]) & (centers[:, 1] <= island_max[1])
+            near = np.flatnonzero(is_near)
+            collisions[near[_inside_polygon(centers[near], polygon)], CollisionClass.TRAFFIC_ISLAND] = True
+        return collisions
+
+    def check(
+        self, poses: np.ndarray, length: ArrayLike = DEFAULT_VEHICLE_LENGTH, width: ArrayLike = DEFAULT_VEHICLE_WIDTH, center_offset: ArrayLike = 0.0
+    ) -> np.ndarray:
+        """
+        :param poses: Array (n, 3) of vehicle poses: x, y and heading (rad) in world coordinates
+        :param length: Length of the footprints in m, a scalar or one per pose
+        :param width: Width of the footprints in m
+        :param center_offset: Distance in m from the pose to the center of the footprint along the heading, e.g. from
+        the rear axle
+        :return: Array (n, len(CollisionClass)) of flags whether a footprint collides with obstacles of a class
+        """
+        poses = np.asarray(poses, dtype=float).reshape(-1, 3)
+        half_length = np.broadcast_to(np.asarray(length, dtype=float) / 2, len(poses))
+        half_width = np.broadcast_to(np.asarray(width, dtype=float) / 2, len(poses))
+        center_offset = np.broadcast_to(np.asarray(center_offset, dtype=float), len(poses))
+        collisions = np.empty((len(poses), len(CollisionClass)), dtype=bool)
+        for start in range(0, len(poses), CHUNK_SIZE):
+            chunk = slice(start, start + CHUNK_SIZE)
+            collisions[chunk] = self._check_chunk(poses[chunk], half_length[chunk], half_width[chunk], center_offset[chunk])
+        return collisions
+
+    def collides(
+        self, poses: np.ndarray, length: ArrayLike = DEFAULT_VEHICLE_LENGTH, width: ArrayLike = DEFAULT_VEHICLE_WIDTH, center_offset: ArrayLike = 0.0
+    ) -> np.ndarray:
+        """
+        :return: Flags whether the footprints collide with any obstacle, see check()
+        """
+        return self.check(poses, length, width, center_offset).any(axis=1)
@@ -0,0 +1,228 @@
+# Copyright (C) 2024 twyleg
+import hashlib
+import json
+import logging
+import os
+import shutil
+import stat
+import tempfile
+import threading
+import xml.etree.ElementTree as ET
+from pathlib import Path
+from typing import Dict, Optional, Sequence, Set
+
+from track_generator import __version__
+from track_generator.artifacts import Content, to_bytes
+from track_generator.sinks import OutputSink, sync_directories
+
+
+logm = logging.getLogger(__name__)
+
+LINK_MODES = ["hardlink", "symlink", "copy"]
+
+
+def content_digest(content: Content) -> str:
+    """
+    Hash an artifact the way ContentStore addresses its objects.
+    """
+    return hashlib.sha256(to_bytes(content)).hexdigest()
+
+
+class ContentStore:
+    """
+    Stores artifacts by the SHA-256 hash of their content (objects/<2 hex digits>/<remaining hex digits>), so identical
+    artifacts of different tracks are stored once. Objects are written atomically and made read-only, because they
+    are shared by all hardlinks to them. Additionally, render manifests (artifact path -> hash) can be stored by a
+    key of the render inputs (see render_key()) to skip rendering of tracks that were already rendered. With fsync
+    enabled, objects and manifests are synced before they are moved into place and flush() syncs their directories.
+    """
+
+    def __init__(self, store_dirpath: Path, fsync: bool = False):
+        self.store_dirpath = store_dirpath
+        self.fsync = fsync
+        self.objects_dirpath = store_dirpath / "objects"
+        self.manifests_dirpath = store_dirpath / "manifests"
+        self.objects_written = 0
+        self.objects_reused = 0
+        self.bytes_written = 0
+        self.bytes_reused = 0
+        self._lock = threading.Lock()
+        self._unsynced_dirpaths: Set[Path] = set()
+
+    def get_object_path(self, digest: str) -> Path:
+        return self.objects_dirpath / digest[:2] / digest[2:]
+
+    def contains(self, digest: str) -> bool:
+        return self.get_object_path(digest).exists()
+
+    def put(self, content: Content) -> str:
+        data = to_bytes(content)
+        digest = content_digest(data)
+        object_path = self.get_object_path(digest)
+        if object_path.exists():
+            with self._lock:
+                self.objects_reused += 1
+                self.bytes_reused += len(data)
+            return digest
+
+        object_path.parent.mkdir(parents=True, exist_ok=True)
+        self._write_atomically(object_path, data, read_only=True)
+        with self._lock:
+            self.objects_written += 1
+            self.bytes_written += len(data)
+        return digest
+
+    def read(self, digest: str) -> bytes:
+        return self.get_object_path(digest).read_bytes()
+
+    def get_manifest(self, key: str) -> Optional[Dict[str, str]]:
+        """
+        Return the manifest stored for the given render key, if it exists and all of its objects are still stored.
+        """
+        try:
+            with open(self.manifests_dirpath / f"{key}.json") as f:
+                manifest: Dict[str, str] = json.load(f)
+        except FileNotFoundError:
+            return None
+        if not all(self.contains(digest) for digest in manifest.values()):
+            return None
+        return manifest
+
+    def put_manifest(self, key: str, manifest: Dict[str, str]) -> None:
+        self.manifests_dirpath.mkdir(parents=True, exist_ok=True)
+        self._write_atomically(self.manifests_dirpath / f"{key}.json", json.dumps(manifest).encode("utf-8"))
+
+    def flush(self) -> None:
+        with self._lock:
+            dirpaths, self._unsynced_dirpaths = self._unsynced_dirpaths, set()
+        sync_directories(dirpaths)
+
+    def statistics(self) -> Dict[str, int]:
+        return {
+            "objects_written": self.objects_written,
+            "objects_reused": self.objects_reused,
+            "bytes_written": self.bytes_written,
+            "bytes_reused": self.bytes_reused,
+        }
+
+    def _write_atomically(self, filepath: Path, data: bytes, read_only: bool = False) -> None:
+        fd, tmp_filepath = tempfile.mkstemp(dir=filepath.parent, prefix=".tmp_")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+                if self.fsync:
+                    f.flush()
+                    os.fsync(f.fileno())
+            if read_only:
+                os.chmod(tmp_filepath, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+            os.replace(tmp_filepath, filepath)
+        except BaseException:
+            os.unlink(tmp_filepath)
+            raise
+        if self.fsync:
+            with self._lock:
+                self._unsynced_dirpaths.add(filepath.parent)
+
+
+class ContentAddressedSink(OutputSink):
+    """
+    Writes the artifacts into a content store and materializes <root_dirpath>/<track_name>/<relative_path> (or
+    <root_dirpath>/<relative_path> with per_track_subdirectory disabled) as hardlink, symlink or copy of the stored
+    object. Hardlinks fall back to symlinks if the store is on another file system. Materialized files share the
+    object, so they must not be modified in place. flush() flushes the content store and, if it syncs to disk, the
+    directories of the materialized files.
+    """
+
+    def __init__(self, root_dirpath: Path, content_store: ContentStore, link_mode: str = "hardlink", per_track_subdirectory: bool = True):
+        if link_mode not in LINK_MODES:
+            raise ValueError(f"Unsupported link mode: {link_mode}")
+        self.root_dirpath = root_dirpath
+        self.content_store = content_store
+        self.link_mode = link_mode
+        self.per_track_subdirectory = per_track_subdirectory
+        self._unsynced_dirpaths: Set[Path] = set()
+        self._lock = threading.Lock()
+
+    def get_filepath(self, track_name: str, relative_path: str) -> Path:
+        if self.per_track_subdirectory:
+            return self.root_dirpath / track_name / relative_path
+        return self.root_dirpath / relative_path
+
+    def write(self, track_name: str, relative_path: str, content: Content) -> None:
+        digest = self.content_store.put(content)
+        filepath = self.get_filepath(track_name, relative_path)
+        filepath.parent.mkdir(parents=True, exist_ok=True)
+        self._materialize(self.content_store.get_object_path(digest), filepath)
+        if self.content_store.fsync:
+            with self._lock:
+                self._unsynced_dirpaths.add(filepath.parent)
+
+    def flush(self) -> None:
+        self.content_store.flush()
+        with self._lock:
+            dirpaths, self._unsynced_dirpaths = self._unsynced_dirpaths, set()
+        sync_directories(dirpaths)
+
+    def _materialize(self, object_path: Path, filepath: Path) -> None:
+        if filepath.is_symlink() or filepath.exists():
+            filepath.unlink()
+
+        if self.link_mode == "hardlink":
+            try:
+                os.link(object_path, filepath)
+                return
+            except OSError as e:
+                logm.warning("Unable to hardlink %s (%s), falling back to symlinks", filepath, e)
+                self.link_mode = "symlink"
+
+        if self.link_mode == "symlink":
+            os.symlink(object_path.resolve(), filepath)
+        else:
+            shutil.copyfile(object_path, filepath)
+
+
+def render_key(
+    track_filepath: Path,
+    track_name: str,
+    generate_png: bool,
+    generate_gazebo_project: bool,
+    generate_ground_truth: bool,
+    ground_truth_spacing: Optional[float] = None,
+    ground_truth_formats: Optional[Sequence[str]] = None,
+    generate_labels: bool = False,
+    label_rle: bool = False,
+    map_resolution: Optional[float] = None,
+    racing_line: Optional[str] = None,
+) -> str:
+    """
+    Calculate the key of a render from everything its artifacts depend on: the version of the generator, the track
+    name, the flags, the track file and the referenced background image.
+    """
+    track_file_data = Path(track_filepath).read_bytes()
+
+    key_hash = hashlib.sha256()
+    key_hash.update(
+        json.dumps(
+            [
+                __version__,
+                track_name,
+                generate_png,
+                generate_gazebo_project,
+                generate_ground_truth,
+                ground_truth_spacing,
+                list(ground_truth_formats or []),
+                generate_labels,
+                label_rle,
+                map_resolution,
+                racing_line,
+            ]
+        ).encode("utf-8")
+    )
+    key_hash.update(hashlib.sha256(track_file_data).digest())
+
+    background_image_element = ET.fromstring(track_file_data).find("BackgroundImage")
+    if background_image_element is not None:
+        background_image_filepath = Path(track_filepath).parent / background_image_element.attrib["file"]
+        key_hash.update(hashlib.sha256(background_image_filepath.read_bytes()).digest())
+
+    return key_hash.hexdigest()
@@ -2,7 +2,9 @@
 import numpy as np
 import pytransform3d.rotations as pyrot
 import pytransform3d.transformations as pytr
-from typing import List, Union
+from typing import List, Tuple, Union
+
+PIXELS_PER_METER = 1000
 
 
 class WorldCoordinateSystem:
@@ -40,3 +42,13 @@ class Point2d:
 
 
 Polygon = List[Point2d]
+
+
+def world_to_pixel(
+    x_w: np.ndarray, y_w: np.ndarray, image_height: float, origin: Tuple[float, float], pixels_per_meter: float = PIXELS_PER_METER
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Convert world coordinates to pixel coordinates (column, row) of the images rendered from a track with the given
+    height and origin.
+    """
+    return (np.asarray(x_w) - origin[0]) * pixels_per_meter, (image_height - np.asarray(y_w) - origin[1]) * pixels_per_meter
@@ -0,0 +1,312 @@
+# Copyright (C) 2024 twyleg
+import io
+import json
+import struct
+import sys
+import threading
+import time
+from multiprocessing import resource_tracker, shared_memory
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from track_generator.artifacts import Content, to_bytes
+from track_generator.sinks import OutputSink
+
+# Layout of the shared memory, all integers are little endian:
+#   header (HEADER_SIZE bytes):
+#       0   8s  magic b"TGFRING1"
+#       8   u32 number of slots
+#       12  u32 size of the metadata region of every slot in bytes
+#       16  u64 payload capacity of every slot in bytes
+#       24  u64 stride of the slots in bytes
+#       32  u64 sequence of the last published frame (0 for none)
+#   slots (number of slots * stride bytes), frame with sequence n (1, 2, ...) in slot (n - 1) % number of slots:
+#       0   u64 sequence of the frame being written (set before the slot is written)
+#       8   u64 sequence of the frame in the slot (set after the slot is written)
+#       16  f64 time of writing (seconds since the epoch)
+#       24  8s  numpy dtype string of the payload (e.g. "|u1", "<f4"), padded with zeros
+#       32  u32 number of dimensions (up to MAX_DIMENSIONS)
+#       36  u32 length of the metadata in bytes
+#       40  u64 * MAX_DIMENSIONS shape of the payload
+#       SLOT_HEADER_SIZE: metadata region, UTF-8 JSON object
+#       SLOT_HEADER_SIZE + metadata size, aligned to ALIGNMENT: payload, C contiguous
+# A slot is valid while both sequences equal the sequence of the frame (seqlock), so readers check the first sequence
+# again after using a frame to detect that the writer replaced it in the meantime.
+MAGIC = b"TGFRING1"
+HEADER_FORMAT = "<8sIIQQQ"
+HEADER_SIZE = 64
+SLOT_HEADER_FORMAT = "<QQd8sII"
+SLOT_INFO_FORMAT = "<d8sII"
+MAX_DIMENSIONS = 4
+SLOT_HEADER_SIZE = 80
+ALIGNMENT = 64
+SEQUENCE_OFFSET = 32
+
+DEFAULT_NUM_SLOTS = 16
+DEFAULT_METADATA_SIZE = 512
+# Artifacts passed on by the RingBufferSink by default: images, class maps, occupancy grids and arrays, all decoded
+DEFAULT_SINK_SUFFIXES = (".png", ".pgm", ".npy")
+
+_attach_lock = threading.Lock()
+
+
+def _align(size: int) -> int:
+    return -(-size // ALIGNMENT) * ALIGNMENT
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    """
+    Attach to existing shared memory without registering it with the resource tracker, which would remove it when the
+    process exits (or remove the registration of the writer, if the resource tracker is shared with it).
+    """
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    with _attach_lock:
+        register = resource_tracker.register
+        resource_tracker.register = lambda *args: None
+        try:
+            return shared_memory.SharedMemory(name=name)
+        finally:
+            resource_tracker.register = register
+
+
+class RingFrame:
+    """
+    Frame read from a ring buffer. The array is a view of the shared memory, it stays valid until the writer replaces
+    the slot, which is_valid() detects.
+    """
+
+    def __init__(self, sequence: int, timestamp: float, metadata: Dict[str, Any], array: np.ndarray, slot: np.ndarray):
+        self.sequence = sequence
+        self.timestamp = timestamp
+        self.metadata = metadata
+        self.array = array
+        self._slot = slot
+
+    def is_valid(self) -> bool:
+        """
+        :return: Whether the slot still holds the frame, check after using the array
+        """
+        return int(self._slot[0]) == self.sequence
+
+
+class _FrameRing:
+    def __init__(self, memory: shared_memory.SharedMemory):
+        self.memory = memory
+        magic, self.num_slots, self.metadata_size, self.slot_size, self.stride, _ = struct.unpack_from(HEADER_FORMAT, memory.buf, 0)
+        if magic != MAGIC:
+            raise ValueError(f"Shared memory {memory.name} is not a frame ring buffer")
+        self._sequence: np.ndarray = np.ndarray((1,), dtype="<u8", buffer=memory.buf, offset=SEQUENCE_OFFSET)
+        self._slot_sequences: List[np.ndarray] = [np.ndarray((2,), dtype="<u8", buffer=memory.buf, offset=self._slot_offset(i)) for i in range(self.num_slots)]
+
+    @property
+    def name(self) -> str:
+        return self.memory.name
+
+    @property
+    def sequence(self) -> int:
+        """
+        :return: Sequence of the last published frame, 0 if no frame was published yet
+        """
+        return int(self._sequence[0])
+
+    def _slot_offset(self, slot: int) -> int:
+        return HEADER_SIZE + slot * self.stride
+
+    def close(self) -> None:
+        """
+        Unmap the shared memory. The frames read before are views of it and must be released first.
+        """
+        self._sequence = np.empty(1, dtype="<u8")
+        self._slot_sequences = []
+        self.memory.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+class FrameRingBuffer(_FrameRing):
+    """
+    Writer of a ring buffer of frames (arrays with up to MAX_DIMENSIONS dimensions) and their metadata in shared
+    memory, with the layout documented at the top of this module. The writer never waits for readers: the oldest
+    frame is replaced when all slots are used, readers detect missed frames by their sequences.
+    """
+
+    def __init__(
+        self,
+        slot_size: int,
+        num_slots: int = DEFAULT_NUM_SLOTS,
+        metadata_size: int = DEFAULT_METADATA_SIZE,
+        name: Optional[str] = None,
+    ):
+        """
+        :param slot_size: Maximum size of the frames in bytes
+        :param num_slots: Number of frames kept in the buffer
+        :param metadata_size: Maximum size of the JSON metadata of every frame in bytes
+        :param name: Name of the shared memory, a unique name is generated by default
+        """
+        if slot_size <= 0 or num_slots <= 0 or metadata_size < 0:
+            raise ValueError(f"Invalid ring buffer size: {num_slots} slots of {slot_size} bytes, {metadata_size} bytes of metadata")
+        stride = _align(SLOT_HEADER_SIZE + metadata_size) + _align(slot_size)
+        memory = shared_memory.SharedMemory(name=name, create=True, size=HEADER_SIZE + num_slots * stride)
+        struct.pack_into(HEADER_FORMAT, memory.buf, 0, MAGIC, num_slots, metadata_size, slot_size, stride, 0)
+        super().__init__(memory)
+
+    @classmethod
+    def for_frames(cls, shape: Tuple[int, ...], dtype: Any = np.uint8, **kwargs) -> "FrameRingBuffer":
+        """
+        Ring buffer with slots for frames of the given shape and dtype, e.g. the frames of a FrameRenderer.
+        """
+        return cls(int(np.prod(shape)) * np.dtype(dtype).itemsize, **kwargs)
+
+    def write(self, frame: np.ndarray, metadata: Optional[Dict[str, Any]] = None) -> int:
+        """
+        Copy a frame into the next slot and publish it.
+        :param frame: Array of the frame
+        :param metadata: JSON serializable metadata of the frame
+        :return: Sequence of the frame
+        """
+        frame = np.asarray(frame)
+        if frame.ndim > MAX_DIMENSIONS or frame.nbytes > self.slot_size or frame.dtype.hasobject:
+            raise ValueError(f"Frame with shape {frame.shape} and dtype {frame.dtype} does not fit into slots of {self.slot_size} bytes")
+        metadata_bytes = json.dumps(metadata or {}).encode("utf-8")
+        if len(metadata_bytes) > self.metadata_size:
+            raise ValueError(f"Metadata of {len(metadata_bytes)} bytes does not fit into {self.metadata_size} bytes")
+
+        sequence = self.sequence + 1
+        slot = (sequence - 1) % self.num_slots
+        offset = self._slot_offset(slot)
+        slot_sequences = self._slot_sequences[slot]
+        slot_sequences[0] = sequence
+        struct.pack_into(SLOT_INFO_FORMAT, self.memory.buf, offset + 16, time.time(), frame.dtype.str.encode("ascii"), frame.ndim, len(metadata_bytes))
+        struct.pack_into(f"<{MAX_DIMENSIONS}Q", self.memory.buf, offset + 40, *frame.shape, *([0] * (MAX_DIMENSIONS - frame.ndim)))
+        metadata_offset = offset + SLOT_HEADER_SIZE
+        self.memory.buf[metadata_offset : metadata_offset + len(metadata_bytes)] = metadata_bytes
+        payload_offset = offset + _align(SLOT_HEADER_SIZE + self.metadata_size)
+        np.ndarray(frame.shape, dtype=frame.dtype, buffer=self.memory.buf, offset=payload_offset)[...] = frame
+        slot_sequences[1] = sequence
+        self._sequence[0] = sequence
+        return sequence
+
+    def write_batch(self, frames: np.ndarray, metadata: Optional[Sequence[Dict[str, Any]]] = None) -> int:
+        """
+        Write the frames along the first axis of a batch, e.g. of FrameRenderer.iter_batches().
+        :param metadata: Metadata of every frame
+        :return: Sequence of the last frame
+        """
+        if metadata is not None and len(metadata) != len(frames):
+            raise ValueError(f"Metadata of {len(metadata)} frames for a batch of {len(frames)} frames")
+        for i, frame in enumerate(frames):
+            self.write(frame, metadata[i] if metadata is not None else None)
+        return self.sequence
+
+    def unlink(self) -> None:
+        """
+        Remove the shared memory, readers that are attached keep their mapping.
+        """
+        self.memory.unlink()
+
+    def __exit__(self, *args) -> None:
+        self.close()
+        self.unlink()
+
+
+class FrameRingReader(_FrameRing):
+    """
+    Reader of a ring buffer of frames created by a FrameRingBuffer, possibly in another process. Frames are read
+    without copying: their arrays are views of the shared memory.
+    """
+
+    def __init__(self, name: str):
+        """
+        :param name: Name of the shared memory of the FrameRingBuffer
+        """
+        super().__init__(_attach(name))
+
+    def read(self, sequence: int) -> Optional[RingFrame]:
+        """
+        :param sequence: Sequence of the frame
+        :return: The frame, None if it is not published yet or was already replaced
+        """
+        if sequence <= 0 or sequence > self.sequence:
+            return None
+        slot = (sequence - 1) % self.num_slots
+        offset = self._slot_offset(slot)
+        slot_sequences = self._slot_sequences[slot]
+        if int(slot_sequences[1]) != sequence or int(slot_sequences[0]) != sequence:
+            return None
+
+        _, _, timestamp, dtype, ndim, metadata_length = struct.unpack_from(SLOT_HEADER_FORMAT, self.memory.buf, offset)
+        shape = struct.unpack_from(f"<{ndim}Q", self.memory.buf, offset + 40)
+        metadata_offset = offset + SLOT_HEADER_SIZE
+        metadata = json.loads(bytes(self.memory.buf[metadata_offset : metadata_offset + metadata_length]))
+        payload_offset = offset + _align(SLOT_HEADER_SIZE + self.metadata_size)
+        array: np.ndarray = np.ndarray(shape, dtype=np.dtype(dtype.rstrip(b"\0").decode("ascii")), buffer=self.memory.buf, offset=payload_offset)
+        array.flags.writeable = False
+        frame = RingFrame(sequence, timestamp, metadata, array, slot_sequences)
+        # The writer may have started to replace the slot while the header was read
+        return frame if frame.is_valid() else None
+
+    def read_latest(self) -> Optional[RingFrame]:
+        """
+        :return: The last published frame, None if there is none
+        """
+        return self.read(self.sequence)
+
+    def wait(self, sequence: int, timeout: Optional[float] = None, poll_interval: float = 0.0005) -> Optional[RingFrame]:
+        """
+        Wait until the frame is published.
+        :return: The frame, None if it was already replaced or the timeout expired
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.sequence < sequence:
+            if deadline is not None and time.monotonic() > deadline:
+                return None
+            time.sleep(poll_interval)
+        return self.read(sequence)
+
+
+class RingBufferSink(OutputSink):
+    """
+    Publishes raster artifacts of generated tracks (images, label rasters and maps) to a frame ring buffer, with the
+    track name and relative path as metadata. Rasters are decoded before they are published, so consumers map frames
+    without decoding them: images (.png, e.g. the track PNG and Gazebo textures) as (rows, cols, channels) uint8 arrays,
+    class maps (*_labels.png) and occupancy grids (.pgm) as (rows, cols) uint8 arrays and .npy files as their arrays.
+    Other selected artifacts are published as their bytes (uint8).
+    """
+
+    def __init__(self, ring: FrameRingBuffer, suffixes: Optional[Sequence[str]] = DEFAULT_SINK_SUFFIXES):
+        """
+        :param suffixes: Suffixes of the relative paths of the published artifacts, None for all artifacts
+        """
+        self.ring = ring
+        self.suffixes = tuple(suffixes) if suffixes is not None else None
+
+    def write(self, track_name: str, relative_path: str, content: Content) -> None:
+        if self.suffixes is not None and not relative_path.endswith(self.suffixes):
+            return
+        data = to_bytes(content)
+        frame: np.ndarray
+        if relative_path.endswith(".npy"):
+            frame = np.load(io.BytesIO(data), allow_pickle=False)
+        elif relative_path.endswith("_labels.png"):
+            from track_generator.label_raster import decode_label_png
+
+            frame = decode_label_png(data)
+        elif relative_path.endswith(".pgm"):
+            from track_generator.track_map import decode_pgm
+
+            frame = decode_pgm(data)
+        elif relative_path.endswith(".png"):
+            import imageio.v3 as iio
+
+            frame = iio.imread(data, extension=".png")
+            if frame.ndim == 2:
+                frame = frame[:, :, np.newaxis]
+        else:
+            frame = np.frombuffer(data, dtype=np.uint8)
+        self.ring.write(frame, {"track_name": track_name, "relative_path": relative_path})
@@ -0,0 +1,235 @@
+# Copyright (C) 2024 twyleg
+from math import ceil
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from track_generator.centerline import Arc, CenterlinePath, CenterlinePrimitive, Line
+from track_generator.track import Track
+
+DEFAULT_CELL_SIZE = 0.25
+# Distance in m that the lookup grid reaches beyond the center line, points outside of it test all pieces
+DEFAULT_GRID_MARGIN = 1.0
+# Arc length in m between the samples that start the Newton iterations on curves without closed form projection
+NEWTON_SAMPLE_DISTANCE = 0.2
+NEWTON_ITERATIONS = 8
+NEWTON_TOLERANCE = 1e-12
+
+
+def _wrap_angle(angle: np.ndarray) -> np.ndarray:
+    return (angle + np.pi) % (2 * np.pi) - np.pi
+
+
+class FrenetFrame:
+    """
+    Conversion between world coordinates and Frenet coordinates along the center line of a calculated track:
+        s: arc length from the start of the track to the nearest point of the center line in m
+        d: signed distance from the center line in m, positive to the left of the driving direction
+        relative heading: heading relative to the center line at s in rad
+    Points are projected onto the primitives of the segments (lines, arcs and clothoids). A grid over the track lists
+    for every cell the pieces that can contain the nearest center line point of a point in the cell, so a query tests
+    a few pieces only. Points beyond the ends of the track are projected to the ends.
+    """
+
+    def __init__(self, path: CenterlinePath, cell_size: float = DEFAULT_CELL_SIZE, grid_margin: float = DEFAULT_GRID_MARGIN):
+        """
+        :param cell_size: Size of the lookup grid cells in m
+        :param grid_margin: Distance in m that the lookup grid reaches beyond the center line
+        """
+        if cell_size <= 0.0:
+            raise ValueError(f"Invalid cell size: {cell_size}")
+        if not len(path):
+            raise ValueError("Track without center line")
+        self.path = path
+        self.cell_size = cell_size
+
+        # Every point of a piece is within half the sample spacing of a sample of that piece
+        spacing = cell_size / 2
+        sample_s: List[np.ndarray] = []
+        for piece, primitive in enumerate(path.primitives):
+            sample_s.append(path.s_starts[piece] + np.linspace(0.0, primitive.length, ceil(primitive.length / spacing) + 1))
+        sample_counts = [len(s) for s in sample_s]
+        sample_pieces = np.repeat(np.arange(len(path)), sample_counts)
+        sample_x, sample_y, _, _ = path.evaluate(np.concatenate(sample_s))
+        samples = np.stack([sample_x, sample_y], axis=-1)
+
+        piece_min = np.array([samples[sample_pieces == piece].min(axis=0) for piece in range(len(path))]) - spacing / 2
+        piece_max = np.array([samples[sample_pieces == piece].max(axis=0) for piece in range(len(path))]) + spacing / 2
+        self.origin = samples.min(axis=0) - grid_margin
+        self.shape = tuple(int(n) for n in np.ceil((samples.max(axis=0) + grid_margin - self.origin) / cell_size))
+
+        cells_x, cells_y = np.meshgrid(np.arange(self.shape[0]), np.arange(self.shape[1]))
+        cell_min = self.origin + np.stack([cells_x.ravel(), cells_y.ravel()], axis=-1) * cell_size
+        cell_centers = cell_min + cell_size / 2
+        half_diagonal = cell_size * np.sqrt(0.5)
+
+        # Lower bound of the distance from a cell to every piece (bounding boxes) and upper bound from the nearest sample
+        # of every piece, pieces whose lower bound exceeds the smallest upper bound can not contain the nearest point
+        candidates = np.empty((len(cell_centers), len(path)), dtype=bool)
+        for start in range(0, len(cell_centers), 1024):
+            centers = cell_centers[start : start + 1024]
+            gaps = np.maximum(0.0, np.maximum(piece_min - (centers[:, np.newaxis] + cell_size / 2), (centers[:, np.newaxis] - cell_size / 2) - piece_max))
+            lower_bounds = np.hypot(gaps[..., 0], gaps[..., 1])
+            sample_distances = np.hypot(centers[:, np.newaxis, 0] - samples[:, 0], centers[:, np.newaxis, 1] - samples[:, 1])
+            upper_bounds = np.minimum.reduceat(sample_distances, np.cumsum(sample_counts) - sample_counts, axis=1)
+            candidates[start : start + 1024] = lower_bounds <= upper_bounds.min(axis=1, keepdims=True) + half_diagonal
+
+        # Candidate pieces of every cell stored contiguously (CSR layout)
+        self.cell_starts = np.concatenate([[0], np.cumsum(candidates.sum(axis=1))])
+        self.cell_pieces = np.nonzero(candidates)[1]
+
+        self.newton_samples: List[Optional[np.ndarray]] = [
+            None if isinstance(primitive, (Line, Arc)) else np.linspace(0.0, primitive.length, ceil(primitive.length / NEWTON_SAMPLE_DISTANCE) + 1)
+            for primitive in path.primitives
+        ]
+
+    @classmethod
+    def from_track(cls, track: Track, cell_size: float = DEFAULT_CELL_SIZE) -> "FrenetFrame":
+        """
+        :param track: The calculated track
+        :param cell_size: Size of the lookup grid cells in m
+        """
+        return cls(track.get_centerline_path(), cell_size)
+
+    @property
+    def length(self) -> float:
+        return self.path.length
+
+    def _candidates(self, points: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        :return: Pairs of point index and piece, all pieces for points outside of the grid
+        """
+        cells = np.floor((points - self.origin) / self.cell_size).astype(np.int64)
+        is_inside = np.all((cells >= 0) & (cells < self.shape), axis=1)
+        flat_cells = np.where(is_inside, cells[:, 1] * self.shape[0] + cells[:, 0], 0)
+        starts = self.cell_starts[flat_cells]
+        counts = np.where(is_inside, self.cell_starts[flat_cells + 1] - starts, 0)
+        queries = np.repeat(np.arange(len(points)), counts)
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        pieces = self.cell_pieces[np.repeat(starts, counts) + offsets]
+
+        outside = np.flatnonzero(~is_inside)
+        queries = np.concatenate([queries, np.repeat(outside, len(self.path))])
+        pieces = np.concatenate([pieces, np.tile(np.arange(len(self.path)), len(outside))])
+        return queries, pieces
+
+    def _project_newton(self, piece: int, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        primitive = self.path.primitives[piece]
+        samples_s = self.newton_samples[piece]
+        assert samples_s is not None
+        samples_x, samples_y, _, _ = primitive.evaluate(samples_s)
+        s = samples_s[np.argmin(np.hypot(x[:, np.newaxis] - samples_x, y[:, np.newaxis] - samples_y), axis=1)]
+        active = np.arange(len(s))
+        for _ in range(NEWTON_ITERATIONS):
+            center_x, center_y, heading, curvature = primitive.evaluate(s[active])
+            dx, dy = x[active] - center_x, y[active] - center_y
+            along = dx * np.cos(heading) + dy * np.sin(heading)
+            across = dy * np.cos(heading) - dx * np.sin(heading)
+            # Derivative of the distance along the tangent, limited to keep the steps short near centers of curvature
+            next_s = np.clip(s[active] + along / np.maximum(1.0 - curvature * across, 0.5), 0.0, primitive.length)
+            is_converged = np.abs(next_s - s[active]) <= NEWTON_TOLERANCE
+            s[active] = next_s
+            active = active[~is_converged]
+            if not len(active):
+                break
+        return s
+
+    def _project(self, piece: int, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        """
+        :param x: Point coordinates in the start coordinate system of the piece
+        :return: Arc length within the piece of the nearest point
+        """
+        primitive: CenterlinePrimitive = self.path.primitives[piece]
+        if isinstance(primitive, Line):
+            return np.clip(x, 0.0, primitive.length)
+        if isinstance(primitive, Arc):
+            theta = np.mod(np.arctan2(x, primitive.sign * (primitive.sign * primitive.radius - y)), 2 * np.pi)
+            # Points off the arc are closest to the end that is angularly closer
+            is_off = theta > primitive.angle
+            theta = np.where(is_off, np.where(theta - primitive.angle < 2 * np.pi - theta, primitive.angle, 0.0), theta)
+            return theta * primitive.radius
+        return self._project_newton(piece, x, y)
+
+    def _window_candidates(self, s: np.ndarray, max_distance: float, closed: bool) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        :return: Pairs of point index and piece, the pieces within max_distance in arc length of every s
+        """
+        num_pieces = len(self.path)
+        first, _ = self.path.locate(s - max_distance)
+        last, _ = self.path.locate(s + max_distance)
+        if closed:
+            # Windows across the start or the end of a closed track continue at the other end, piece indices wrap around
+            first = np.where(s - max_distance < 0.0, self.path.locate(s - max_distance + self.length)[0] - num_pieces, first)
+            last = np.where(s + max_distance > self.length, self.path.locate(s + max_distance - self.length)[0] + num_pieces, last)
+        counts = np.minimum(last - first + 1, num_pieces)
+        queries = np.repeat(np.arange(len(s)), counts)
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        return queries, (np.repeat(first, counts) + offsets) % num_pieces
+
+    def _project_candidates(self, points: np.ndarray, queries: np.ndarray, pieces: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        s, d, heading = (np.zeros(len(points)) for _ in range(3))
+        distances = np.full(len(points), np.inf)
+        # Pieces are tested in order and a point has every piece once at most, so the nearest candidate of a point is
+        # found by updates without sorting, the one with the smaller arc length on ties
+        for piece, indices in self.path.group_by_piece(pieces):
+            piece_queries = queries[indices]
+            # World to start coordinate system of the piece
+            local = (points[piece_queries] - self.path.translations[piece]) @ self.path.rotations[piece]
+            local_s = self._project(piece, local[:, 0], local[:, 1])
+            center_x, center_y, piece_heading, _ = self.path.primitives[piece].evaluate(local_s)
+            dx, dy = local[:, 0] - center_x, local[:, 1] - center_y
+            piece_distances = np.hypot(dx, dy)
+
+            is_closer = piece_distances < distances[piece_queries]
+            closer_queries = piece_queries[is_closer]
+            distances[closer_queries] = piece_distances[is_closer]
+            s[closer_queries] = self.path.s_starts[piece] + local_s[is_closer]
+            d[closer_queries] = (dy * np.cos(piece_heading) - dx * np.sin(piece_heading))[is_closer]
+            heading[closer_queries] = piece_heading[is_closer] + self.path.yaws[piece]
+        return s, d, _wrap_angle(heading)
+
+    def project(self, points: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        :param points: Array (n, 2) of world coordinates
+        :return: Arc length s and signed distance d of every point and the heading of the center line at s
+        """
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        return self._project_candidates(points, *self._candidates(points))
+
+    def project_near(self, points: np.ndarray, s: np.ndarray, max_distance: float, closed: bool = False) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Project points onto the pieces of the center line near known arc lengths, e.g. the previous positions of moving
+        points. Unlike project() this keeps points at crossings of the track on their own branch.
+        :param points: Array (n, 2) of world coordinates
+        :param s: Arc lengths the points are expected near
+        :param max_distance: Maximum distance in arc length from s of the pieces to project onto
+        :param closed: Flag whether the track is a closed loop, the pieces near the end are then also near the start
+        :return: Arc length s and signed distance d of every point and the heading of the center line at s
+        """
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        return self._project_candidates(points, *self._window_candidates(np.ravel(s), max_distance, closed))
+
+    def to_frenet(self, points: np.ndarray, headings: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray, Optional[np.ndarray]]:
+        """
+        :param points: Array (n, 2) of world coordinates
+        :param headings: Optional headings (rad) of the points in world coordinates
+        :return: Arrays s, d and the headings relative to the center line (None without headings)
+        """
+        s, d, centerline_heading = self.project(points)
+        if headings is None:
+            return s, d, None
+        return s, d, _wrap_angle(np.ravel(headings) - centerline_heading)
+
+    def to_cartesian(self, s: np.ndarray, d: np.ndarray, relative_headings: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        :param s: Arc lengths, clipped to the track
+        :param d: Signed distances from the center line
+        :param relative_headings: Optional headings (rad) relative to the center line, 0 if not given
+        :return: Array (n, 2) of world coordinates and the headings in world coordinates
+        """
+        x, y, heading, _ = self.path.evaluate(s)
+        d = np.ravel(d)
+        points = np.stack([x - d * np.sin(heading), y + d * np.cos(heading)], axis=-1)
+        if relative_headings is not None:
+            heading = heading + np.ravel(relative_headings)
+        return points, _wrap_angle(heading)
@@ -1,6 +1,9 @@
 # Copyright (C) 2022 twyleg
+import functools
 import jinja2
 from pathlib import Path
+from typing import Dict, Optional
+from track_generator import instrumentation
 from track_generator.track import Track
 
 
@@ -11,70 +14,73 @@ def read(fname):
     return open(FILE_DIRPATH / fname).read()
 
 
+@functools.lru_cache(maxsize=None)
+def get_template_environment() -> jinja2.Environment:
+    return jinja2.Environment(loader=jinja2.FileSystemLoader(FILE_DIRPATH / "gazebo_model_templates/"))
+
+
 class GazeboModelGenerator:
-    def __init__(self, track_name: str, output_directory: Path):
+    def __init__(self, track_name: str, output_directory: Optional[Path] = None):
         self.track_name = track_name
-        self.output_directory = output_directory
+        self.output_directory = output_directory if output_directory else Path()
         self.gazebo_models_directory = self.output_directory / "gazebo_models"
         self.track_directory = self.gazebo_models_directory / track_name
         self.track_materials_scripts_directory = self.track_directory / "materials/scripts"
         self.track_materials_textures_directory = self.track_directory / "materials/textures"
 
-        self.gazebo_models_directory.mkdir(parents=True, exist_ok=True)
-        self.track_directory.mkdir(parents=True, exist_ok=True)
-        self.track_materials_scripts_directory.mkdir(parents=True, exist_ok=True)
-        self.track_materials_textures_directory.mkdir(parents=True, exist_ok=True)
-
-        self.environment = jinja2.Environment(loader=jinja2.FileSystemLoader(FILE_DIRPATH / "gazebo_model_templates/"))
+        self.environment = get_template_environment()
 
-    def generate_track_material(self):
-        assert self.track_materials_scripts_directory
+    def render_track_material(self) -> str:
         template = self.environment.get_template("track.material.jinja")
 
         material = {"name": f"{self.track_name}_material", "texture_file_name": f"{self.track_name}.png"}
 
-        with open(self.track_materials_scripts_directory / "track.material", "w") as output_file:
-            output_file.write(template.render(material=material))
+        return template.render(material=material)
 
-    def generate_track_sdf(self, track: Track):
-        assert self.track_directory
+    def render_track_sdf(self, track: Track) -> str:
         template = self.environment.get_template("model.sdf.jinja")
 
         model = {"name": self.track_name, "width": track.width, "height": track.height}
 
-        with open(self.track_directory / "model.sdf", "w") as output_file:
-            output_file.write(template.render(model=model))
+        return template.render(model=model)
 
-    def generate_track_config(self, track: Track):
-        assert self.track_directory
+    def render_track_config(self, track: Track) -> str:
         template = self.environment.get_template("model.config.jinja")
 
         model = {"name": self.track_name, "version": track.version, "desc": self.track_name}
 
-        with open(self.track_directory / "model.config", "w") as output_file:
-            output_file.write(template.render(model=model))
+        return template.render(model=model)
 
-    def generate_example_world(self, track: Track):
-        assert self.track_directory
+    def render_example_world(self, track: Track) -> str:
         template = self.environment.get_template("example.world.jinja")
 
         example = {"name": self.track_name}
-        output_filename = f"{self.track_name}.world"
 
-        with open(self.gazebo_models_directory / output_filename, "w") as output_file:
-            output_file.write(template.render(example=example))
-
-    def generate_setup_script(self):
-        assert self.gazebo_models_directory
+        return template.render(example=example)
 
+    def render_setup_script(self) -> str:
         template = self.environment.get_template("setup.bash.jinja")
 
-        with open(self.gazebo_models_directory / "setup.bash", "w") as output_file:
-            output_file.write(template.render())
-
+        return template.render()
+
+    @instrumentation.traced("GazeboModelGenerator.render_gazebo_model")
+    def render_gazebo_model(self, track: Track) -> Dict[Path, str]:
+        """
+        Render all files of the gazebo model without writing them.
+        :return: File contents by file path (relative to the output directory if none was given)
+        """
+        return {
+            self.track_materials_scripts_directory / "track.material": self.render_track_material(),
+            self.track_directory / "model.sdf": self.render_track_sdf(track),
+            self.track_directory / "model.config": self.render_track_config(track),
+            self.gazebo_models_directory / f"{self.track_name}.world": self.render_example_world(track),
+            self.gazebo_models_directory / "setup.bash": self.render_setup_script(),
+        }
+
+    @instrumentation.traced("GazeboModelGenerator.generate_gazebo_model")
     def generate_gazebo_model(self, track: Track):
-        self.generate_track_material()
-        self.generate_track_sdf(track)
-        self.generate_track_config(track)
-        self.generate_example_world(track)
-        self.generate_setup_script()
+        self.track_materials_textures_directory.mkdir(parents=True, exist_ok=True)
+        for filepath, content in self.render_gazebo_model(track).items():
+            filepath.parent.mkdir(parents=True, exist_ok=True)
+            with open(filepath, "w") as output_file:
+                output_file.write(content)
@@ -1,21 +1,25 @@
 # Copyright (C) 2022 twyleg
+import itertools
 import os
 import logging
 
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
-from typing import List, Callable
+from typing import TYPE_CHECKING, Deque, Dict, Iterable, Iterator, List, Callable, Optional, Sequence, Tuple
 
-from track_generator import xml_reader
-from track_generator.painter import Painter
-from track_generator.gazebo_model_generator import GazeboModelGenerator
-from track_generator.ground_truth_generator import GroundTruthGenerator
+from track_generator import instrumentation
+from track_generator.artifacts import TrackArtifacts
+from track_generator.profiler import Profiler, profile_stage
+from track_generator.sinks import DirectorySink, OutputSink
 
-
-logm = logging.getLogger(__name__)
+if TYPE_CHECKING:
+    from track_generator.content_store import ContentStore
+    from track_generator.track import Track
+    from track_generator.trajectory import VehicleLimits
 
 
-def _create_output_directory_if_required(output_dirpath: Path):
-    output_dirpath.mkdir(parents=True, exist_ok=True)
+logm = logging.getLogger(__name__)
 
 
 def get_track_name_from_file_path(track_filepath: Path) -> str:
@@ -25,51 +29,428 @@ def get_track_name_from_file_path(track_filepath: Path) -> str:
 
 
 def generate_track(
-    track_filepaths: List[Path],
+    track_filepaths: Iterable[Path],
     root_output_dirpath: Path,
     generate_png=False,
     generate_gazebo_project=False,
     generate_ground_truth=False,
+    profiler: Optional[Profiler] = None,
+    sink: Optional[OutputSink] = None,
+    prefetch: int = 0,
+    render_cache: Optional["ContentStore"] = None,
+    ground_truth_spacing: Optional[float] = None,
+    ground_truth_formats: Optional[Sequence[str]] = None,
+    generate_labels=False,
+    label_rle=False,
+    map_resolution: Optional[float] = None,
+    racing_line: Optional[str] = None,
 ) -> List[Path]:
     """
     Generate tracks (SVG, Gazebo project, etc) from given track files (XML)
+    The generation options (generate_png, ..., racing_line) and the profiler are documented at render_track_artifacts().
     :param track_filepaths: List of track files
     :param root_output_dirpath: The output directory to write results to. Subdirectories for every track will be
     generated.
-    :param generate_png: Flag whether a png image should be created for the track
-    :param generate_gazebo_project:Flag whether gazebo project files should be created for the track
+    :param sink: Optional sink to write the results to instead of the subdirectories of root_output_dirpath. The sink
+    is flushed at the end of the batch but not closed.
+    :param prefetch: Number of track files to read ahead in the background (see iter_generate_track())
+    :param render_cache: Optional content store to look up the artifacts of tracks that were rendered before with the
+    same inputs instead of rendering them again. Newly rendered tracks are added to it.
     :return: List of output directories for the tracks
     """
+    sink = sink if sink else DirectorySink(root_output_dirpath)
     track_output_directories: List[Path] = []
-    for track_filepath in track_filepaths:
-        track = xml_reader.read_track(track_filepath)
-        track.calc()
+    # Render keys of the tracks handed to iter_generate_track(), which yields their artifacts in the same order (track
+    # names aren't unique within a batch)
+    render_keys: Deque[str] = deque()
+
+    def iter_uncached_track_filepaths(render_cache: "ContentStore") -> Iterator[Path]:
+        from track_generator.content_store import render_key
+
+        for track_filepath in track_filepaths:
+            track_name = get_track_name_from_file_path(track_filepath)
+            key = render_key(
+                track_filepath,
+                track_name,
+                generate_png,
+                generate_gazebo_project,
+                generate_ground_truth,
+                ground_truth_spacing,
+                ground_truth_formats,
+                generate_labels,
+                label_rle,
+                map_resolution,
+                racing_line,
+            )
+            manifest = render_cache.get_manifest(key)
+            if manifest is None:
+                render_keys.append(key)
+                yield track_filepath
+                continue
+            reused_artifacts = TrackArtifacts(track_name)
+            reused_artifacts.extra_files = {relative_path: render_cache.read(digest) for relative_path, digest in manifest.items()}
+            with profile_stage(profiler, "write"):
+                sink.write_artifacts(reused_artifacts)
+            track_output_directories.append(root_output_dirpath / track_name)
+            logm.info("Reused track #%d: %s", len(track_output_directories), track_name)
+
+    track_filepaths_to_render = iter_uncached_track_filepaths(render_cache) if render_cache else track_filepaths
+    for artifacts in iter_generate_track(
+        track_filepaths_to_render,
+        generate_png,
+        generate_gazebo_project,
+        generate_ground_truth,
+        profiler,
+        prefetch,
+        ground_truth_spacing=ground_truth_spacing,
+        ground_truth_formats=ground_truth_formats,
+        generate_labels=generate_labels,
+        label_rle=label_rle,
+        map_resolution=map_resolution,
+        racing_line=racing_line,
+    ):
+        with profile_stage(profiler, "write"):
+            sink.write_artifacts(artifacts)
+        if render_cache:
+            render_cache.put_manifest(render_keys.popleft(), _store_render(render_cache, artifacts))
+        track_output_directories.append(root_output_dirpath / artifacts.track_name)
+        logm.info("Generated track #%d: %s", len(track_output_directories), artifacts.track_name)
+    with profile_stage(profiler, "write"):
+        sink.flush()
+    return track_output_directories
+
+
+def generate_track_artifacts(
+    track_filepaths: Iterable[Path],
+    generate_png=False,
+    generate_gazebo_project=False,
+    generate_ground_truth=False,
+    profiler: Optional[Profiler] = None,
+    ground_truth_spacing: Optional[float] = None,
+    ground_truth_formats: Optional[Sequence[str]] = None,
+    generate_labels=False,
+    label_rle=False,
+    map_resolution: Optional[float] = None,
+    racing_line: Optional[str] = None,
+) -> List[TrackArtifacts]:
+    """
+    Generate tracks (SVG, Gazebo project, etc) from given track files (XML) in memory without writing any files
+    The generation options (generate_png, ..., racing_line) and the profiler are documented at render_track_artifacts().
+    :param track_filepaths: List of track files
+    :return: List of the artifacts of the tracks
+    """
+    return list(
+        iter_generate_track(
+            track_filepaths,
+            generate_png,
+            generate_gazebo_project,
+            generate_ground_truth,
+            profiler,
+            ground_truth_spacing=ground_truth_spacing,
+            ground_truth_formats=ground_truth_formats,
+            generate_labels=generate_labels,
+            label_rle=label_rle,
+            map_resolution=map_resolution,
+            racing_line=racing_line,
+        )
+    )
+
 
+def iter_generate_track(
+    track_filepaths: Iterable[Path],
+    generate_png=False,
+    generate_gazebo_project=False,
+    generate_ground_truth=False,
+    profiler: Optional[Profiler] = None,
+    prefetch: int = 0,
+    ground_truth_spacing: Optional[float] = None,
+    ground_truth_formats: Optional[Sequence[str]] = None,
+    generate_labels=False,
+    label_rle=False,
+    map_resolution: Optional[float] = None,
+    racing_line: Optional[str] = None,
+) -> Iterator[TrackArtifacts]:
+    """
+    Generate tracks (SVG, Gazebo project, etc) from given track files (XML) one by one. The artifacts of a track are
+    yielded as soon as it is complete, its geometry and drawing are released before, so the memory consumption does
+    not grow with the number of tracks as long as the caller does not keep the artifacts.
+    The generation options (generate_png, ..., racing_line) and the profiler are documented at render_track_artifacts().
+    :param track_filepaths: Track files, may be a lazy iterable
+    :param prefetch: Number of track files to read ahead in a background thread (bounded). Disabled while profiling
+    because the stages would overlap.
+    :return: Iterator over the artifacts of the tracks
+    """
+    # Heavy dependencies (xmlschema, drawsvg, jinja2) are imported by the stages that need them to keep the CLI startup fast
+    from track_generator import xml_reader
+
+    if profiler and prefetch > 0:
+        logm.warning("Prefetching is disabled while profiling")
+        prefetch = 0
+
+    if prefetch > 0:
+        for track_name, track in _iter_prefetched_tracks(track_filepaths, prefetch):
+            with instrumentation.track_scope(track_name):
+                artifacts = render_track_artifacts(
+                    track,
+                    track_name,
+                    generate_png,
+                    generate_gazebo_project,
+                    generate_ground_truth,
+                    ground_truth_spacing=ground_truth_spacing,
+                    ground_truth_formats=ground_truth_formats,
+                    generate_labels=generate_labels,
+                    label_rle=label_rle,
+                    map_resolution=map_resolution,
+                    racing_line=racing_line,
+                )
+            del track
+            yield artifacts
+            del artifacts
+        return
+
+    for track_filepath in track_filepaths:
         track_name = get_track_name_from_file_path(track_filepath)
-        track_output_directory = root_output_dirpath / track_name
-        _create_output_directory_if_required(track_output_directory)
-        track_output_directories.append(track_output_directory)
+        if profiler:
+            profiler.start_track(track_name)
+
+        with instrumentation.track_scope(track_name):
+            track = xml_reader.read_track(track_filepath, profiler)
+            artifacts = render_track_artifacts(
+                track,
+                track_name,
+                generate_png,
+                generate_gazebo_project,
+                generate_ground_truth,
+                profiler,
+                ground_truth_spacing,
+                ground_truth_formats,
+                generate_labels,
+                label_rle,
+                map_resolution,
+                racing_line,
+            )
+        del track
+        yield artifacts
+        del artifacts
+
 
-        painter = Painter()
+def _store_render(render_cache: "ContentStore", artifacts: TrackArtifacts) -> Dict[str, str]:
+    # A ContentAddressedSink on the same store has stored the artifacts already, only missing objects are added
+    from track_generator.content_store import content_digest
+
+    manifest: Dict[str, str] = {}
+    for relative_path, content in artifacts.files().items():
+        digest = content_digest(content)
+        manifest[relative_path] = digest if render_cache.contains(digest) else render_cache.put(content)
+    return manifest
+
+
+def _read_named_track(track_filepath: Path) -> Tuple[str, "Track"]:
+    from track_generator import xml_reader
+
+    track_name = get_track_name_from_file_path(track_filepath)
+    with instrumentation.track_context(track_name):
+        return track_name, xml_reader.read_track(track_filepath)
+
+
+def _iter_prefetched_tracks(track_filepaths: Iterable[Path], prefetch: int) -> Iterator[Tuple[str, "Track"]]:
+    track_filepath_iterator = iter(track_filepaths)
+    pending: Deque["Future[Tuple[str, Track]]"] = deque()
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="track_prefetch") as executor:
+        try:
+            for track_filepath in itertools.islice(track_filepath_iterator, prefetch):
+                pending.append(executor.submit(_read_named_track, track_filepath))
+            while pending:
+                future = pending.popleft()
+                next_track_filepath = next(track_filepath_iterator, None)
+                if next_track_filepath is not None:
+                    pending.append(executor.submit(_read_named_track, next_track_filepath))
+                yield future.result()
+                del future
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+def render_track(
+    track: "Track",
+    track_name: str,
+    track_output_directory: Path,
+    generate_png=False,
+    generate_gazebo_project=False,
+    generate_ground_truth=False,
+    profiler: Optional[Profiler] = None,
+    ground_truth_spacing: Optional[float] = None,
+    ground_truth_formats: Optional[Sequence[str]] = None,
+    generate_labels=False,
+    label_rle=False,
+    map_resolution: Optional[float] = None,
+    racing_line: Optional[str] = None,
+) -> TrackArtifacts:
+    """
+    Calculate a single track that was already read and write its results (SVG, Gazebo project, etc)
+    The generation options (generate_png, ..., racing_line) and the profiler are documented at render_track_artifacts().
+    :param track: The track to render
+    :param track_name: Name of the track, used for the output file names
+    :param track_output_directory: The output directory to write the results to
+    :return: The artifacts that were written
+    """
+    artifacts = render_track_artifacts(
+        track,
+        track_name,
+        generate_png,
+        generate_gazebo_project,
+        generate_ground_truth,
+        profiler,
+        ground_truth_spacing,
+        ground_truth_formats,
+        generate_labels,
+        label_rle,
+        map_resolution,
+        racing_line,
+    )
+    with profile_stage(profiler, "write"):
+        DirectorySink(track_output_directory, per_track_subdirectory=False).write_artifacts(artifacts)
+    return artifacts
+
+
+def render_track_artifacts(
+    track: "Track",
+    track_name: str,
+    generate_png=False,
+    generate_gazebo_project=False,
+    generate_ground_truth=False,
+    profiler: Optional[Profiler] = None,
+    ground_truth_spacing: Optional[float] = None,
+    ground_truth_formats: Optional[Sequence[str]] = None,
+    generate_labels=False,
+    label_rle=False,
+    map_resolution: Optional[float] = None,
+    racing_line: Optional[str] = None,
+) -> TrackArtifacts:
+    """
+    Calculate a single track that was already read and render its results (SVG, Gazebo project, etc) in memory
+    :param track: The track to render
+    :param track_name: Name of the track, used for the artifact names
+    :param generate_png: Flag whether a png image should be created for the track
+    :param generate_gazebo_project:Flag whether gazebo project files should be created for the track
+    :param generate_ground_truth: Flag whether ground truth data should be created for the track
+    :param profiler: Optional profiler to record the time and memory consumption of the generation stages
+    :param ground_truth_spacing: Optional arc length spacing in m to resample the ground truth densely with
+    :param ground_truth_formats: Formats of the ground truth ("xml", "npz", "raw"). Default: xml
+    :param generate_labels: Flag whether a class map (PNG, one class per pixel) aligned with the track PNG should be
+    created for the track
+    :param label_rle: Flag whether run-length encoded masks of all classes should be created in addition (JSON)
+    :param map_resolution: Optional cell size in m of the planner maps (occupancy grid, signed distance and heading
+    field with map_server YAML) to create for the track
+    :param racing_line: Optional boundaries ("lane" or "road") of a minimum curvature racing line to create for the track
+    :return: The rendered artifacts
+    """
+    from track_generator.painter import Painter
+
+    track.calc(profiler)
+
+    artifacts = TrackArtifacts(track_name)
+
+    painter = Painter(labels=generate_labels)
+    with profile_stage(profiler, "svg_paint"):
         painter.draw_track(track)
-        painter.save_svg(track_name, track_output_directory)
-        if generate_png:
-            painter.save_png(track_name, track_output_directory)
+    with profile_stage(profiler, "svg_save"):
+        artifacts.svg = painter.as_svg()
+
+    if painter.label_raster:
+        with profile_stage(profiler, "labels"):
+            from track_generator.label_raster import encode_label_png, encode_label_rle
 
-        if generate_gazebo_project:
-            gazebo_model_generator = GazeboModelGenerator(track_name, track_output_directory)
-            gazebo_model_generator.generate_gazebo_model(track)
+            artifacts.extra_files[f"{track_name}_labels.png"] = encode_label_png(painter.label_raster.labels)
+            if label_rle:
+                artifacts.extra_files[f"{track_name}_labels_rle.json"] = encode_label_rle(painter.label_raster.labels)
+            painter.label_raster = None
 
-            painter.save_png(track_name, gazebo_model_generator.track_materials_textures_directory)
+    png: Optional[bytes] = None
+    if generate_png or generate_gazebo_project:
+        with profile_stage(profiler, "png_render"):
+            png = painter.as_png()
+    if generate_png:
+        artifacts.png = png
 
+    if generate_gazebo_project:
+        with profile_stage(profiler, "gazebo"):
+            from track_generator.gazebo_model_generator import GazeboModelGenerator
+
+            gazebo_model_generator = GazeboModelGenerator(track_name)
+            artifacts.set_gazebo_files(gazebo_model_generator.render_gazebo_model(track), texture=png)
+
+    with profile_stage(profiler, "svg_paint"):
         painter.draw_track_verbose(track)
-        painter.save_svg(track_name, track_output_directory, file_name_postfix="_verbose")
+    with profile_stage(profiler, "svg_save"):
+        artifacts.svg_verbose = painter.as_svg()
 
-        if generate_ground_truth:
-            ground_truth_generator = GroundTruthGenerator(track_name, track_output_directory)
-            ground_truth_generator.generate_ground_truth(track)
-    return track_output_directories
+    if generate_ground_truth:
+        with profile_stage(profiler, "ground_truth"):
+            from track_generator.ground_truth_generator import GroundTruthGenerator
+
+            ground_truth_generator = GroundTruthGenerator(track_name, spacing=ground_truth_spacing, formats=ground_truth_formats or ("xml",))
+            ground_truth_files = ground_truth_generator.render_ground_truth_files(track)
+            ground_truth = ground_truth_files.pop("ground_truth.xml", None)
+            assert ground_truth is None or isinstance(ground_truth, str)
+            artifacts.ground_truth = ground_truth
+            artifacts.extra_files.update(ground_truth_files)
+
+    if map_resolution is not None:
+        with profile_stage(profiler, "map"):
+            from track_generator.track_map import TrackMap
 
+            artifacts.extra_files.update(TrackMap.from_track(track, map_resolution).render_map_files())
 
-def generate_trajectory():
-    logm.warning("generate_trajectory not implemented yet")
+    if racing_line is not None:
+        with profile_stage(profiler, "racing_line"):
+            from track_generator.ground_truth_generator import encode_npz
+            from track_generator.racing_line import DEFAULT_VEHICLE_WIDTH, calc_racing_line
+
+            line = calc_racing_line(track, racing_line)
+            metadata = {"bounds": racing_line, "vehicle_width": DEFAULT_VEHICLE_WIDTH, "closed": line.closed}
+            artifacts.extra_files["racing_line.npz"] = encode_npz(line.to_columns(), metadata)
+
+    return artifacts
+
+
+def generate_trajectory(
+    track_filepaths: Iterable[Path],
+    root_output_dirpath: Path,
+    vehicle_limits: Optional["VehicleLimits"] = None,
+    time_step: Optional[float] = None,
+    sink: Optional[OutputSink] = None,
+) -> List[Path]:
+    """
+    Generate time-parameterized reference trajectories along the center lines of the given track files (XML). The
+    trajectories are written as columns (t, s, x, y, heading, curvature, speed, acceleration, lateral_acceleration) to
+    an uncompressed NPZ file per track.
+    :param track_filepaths: List of track files
+    :param root_output_dirpath: The output directory to write results to. Subdirectories for every track will be
+    generated.
+    :param vehicle_limits: Speed and acceleration limits of the vehicle. Default: VehicleLimits()
+    :param time_step: Time between the trajectory samples in s. Default: 0.02
+    :param sink: Optional sink to write the results to instead of the subdirectories of root_output_dirpath. The sink
+    is flushed at the end of the batch but not closed.
+    :return: List of output directories for the tracks
+    """
+    from track_generator import xml_reader
+    from track_generator.ground_truth_generator import encode_npz
+    from track_generator.trajectory import DEFAULT_TIME_STEP, VehicleLimits, calc_trajectory
+
+    sink = sink if sink else DirectorySink(root_output_dirpath)
+    vehicle_limits = vehicle_limits or VehicleLimits()
+    time_step = time_step or DEFAULT_TIME_STEP
+    metadata = {"time_step": time_step, **{name: value for name, value in vars(vehicle_limits).items() if value is not None}}
+
+    track_output_directories: List[Path] = []
+    for track_filepath in track_filepaths:
+        track_name = get_track_name_from_file_path(track_filepath)
+        track = xml_reader.read_track(track_filepath)
+        track.calc()
+        sink.write(track_name, "trajectory.npz", encode_npz(calc_trajectory(track, vehicle_limits, time_step), metadata))
+        track_output_directories.append(root_output_dirpath / track_name)
+        logm.info("Generated trajectory #%d: %s", len(track_output_directories), track_name)
+    sink.flush()
+    return track_output_directories
@@ -1,8 +1,14 @@
 # Copyright (C) 2023 Lukas Lange
+import io
+import json
 from pathlib import Path
-from xml.etree import cElementTree as ET
-from xml.dom import minidom
+from typing import IO, Dict, List, Optional, Sequence, Tuple, Union
 
+import numpy as np
+
+from track_generator import instrumentation
+from track_generator.artifacts import Content
+from track_generator.coordinate_system import PIXELS_PER_METER, Polygon, world_to_pixel
 from track_generator.track import (
     Segment,
     Track,
@@ -18,81 +24,271 @@ from track_generator.track import (
 )
 
 
+GROUND_TRUTH_FORMATS = ["xml", "npz", "raw"]
+DEFAULT_BINARY_SPACING = 0.01
+SEGMENT_TYPES = ["Start", "Straight", "Turn", "Crosswalk", "Intersection", "Gap", "ParkingArea", "TrafficIsland", "Clothoid"]
+RAW_COLUMN_ALIGNMENT = 64
+
+POINT_ATTRIBUTES = ("x_1", "y_1", "x_2", "y_2")
+DENSE_POINT_ATTRIBUTES = ("x_1", "y_1", "x_2", "y_2", "x_c", "y_c")
+
+
+class GroundTruthWriter:
+    """
+    Writes ground truth XML incrementally to a text stream. Points are passed as arrays with one column per point
+    attribute (default x_1, y_1, x_2, y_2) and formatted with a single formatting operation per array. Numbers are
+    written with the shortest representation that round-trips (same as str()). With indent=None the XML is written
+    without line breaks and indentation.
+    """
+
+    def __init__(
+        self,
+        f: IO[str],
+        indent: Optional[str] = "\t",
+        point_attributes: Sequence[str] = POINT_ATTRIBUTES,
+        root_attributes: Optional[Dict[str, str]] = None,
+    ):
+        self.f = f
+        newline = "\n" if indent is not None else ""
+        indent = indent if indent is not None else ""
+        self._num_point_attributes = len(point_attributes)
+        self._point_template = indent * 2 + "<Point " + " ".join(f'{name}="%r"' for name in point_attributes) + "/>" + newline
+        self._points_start = f"{indent}<Points>{newline}"
+        self._points_end = f"{indent}</Points>{newline}"
+        self._empty_points = f"{indent}<Points/>{newline}"
+        self._newline = newline
+        self._has_points = False
+
+        attributes = "".join(f' {name}="{value}"' for name, value in {"version": "0.0.1", **(root_attributes or {})}.items())
+        self.f.write(f'<?xml version="1.0" ?>{newline}<GroundTruth{attributes}>{newline}')
+
+    def write_points(self, points: np.ndarray) -> None:
+        if len(points) == 0:
+            return
+        if not self._has_points:
+            self.f.write(self._points_start)
+            self._has_points = True
+        values = np.asarray(points, dtype=np.float64).ravel().tolist()
+        self.f.write((self._point_template * (len(values) // self._num_point_attributes)) % tuple(values))
+
+    def close(self) -> None:
+        self.f.write(self._points_end if self._has_points else self._empty_points)
+        self.f.write(f"</GroundTruth>{self._newline}")
+
+
+def _to_points(polygon_1: Polygon, polygon_2: Polygon) -> np.ndarray:
+    return np.array([[point_1.x_w, point_1.y_w, point_2.x_w, point_2.y_w] for point_1, point_2 in zip(polygon_1, polygon_2)], dtype=np.float64).reshape(-1, 4)
+
+
+def calc_ground_truth_columns(track: Track, spacing: float) -> Dict[str, np.ndarray]:
+    """
+    Calculate the dense ground truth of a track as columns with one entry per sample: arc length, world coordinates,
+    heading and curvature of the center line, world coordinates of the lane boundaries, pixel coordinates of all of
+    them in the rendered images, the index of the segment and its type (index in SEGMENT_TYPES).
+    """
+    from track_generator.centerline import sample_track
+
+    samples = sample_track(track, spacing)
+    columns: Dict[str, np.ndarray] = {
+        "s": samples.s,
+        "x": samples.x,
+        "y": samples.y,
+        "heading": samples.heading,
+        "curvature": samples.curvature,
+        "left_x": samples.left[:, 0],
+        "left_y": samples.left[:, 1],
+        "right_x": samples.right[:, 0],
+        "right_y": samples.right[:, 1],
+    }
+    for prefix in ("", "left_", "right_"):
+        columns[f"{prefix}px"], columns[f"{prefix}py"] = world_to_pixel(columns[f"{prefix}x"], columns[f"{prefix}y"], track.height, track.origin)
+
+    segment_type_codes = np.array([SEGMENT_TYPES.index(type(segment).__name__) for segment in track.segments], dtype=np.uint8)
+    columns["segment_index"] = samples.segment_index
+    columns["segment_type"] = segment_type_codes[samples.segment_index]
+    return {name: np.ascontiguousarray(column) for name, column in columns.items()}
+
+
+def _ground_truth_metadata(track: Track, spacing: float) -> Dict[str, Union[float, int, List[str]]]:
+    return {
+        "spacing": spacing,
+        "pixels_per_meter": PIXELS_PER_METER,
+        "image_width": round(track.width * PIXELS_PER_METER),
+        "image_height": round(track.height * PIXELS_PER_METER),
+        "segment_types": SEGMENT_TYPES,
+    }
+
+
+def encode_npz(columns: Dict[str, np.ndarray], metadata: Dict) -> bytes:
+    """
+    Encode ground truth columns as uncompressed NPZ. Metadata is added as arrays of the same name.
+    """
+    f = io.BytesIO()
+    np.savez(f, **columns, **{name: np.asarray(value) for name, value in metadata.items()})
+    return f.getvalue()
+
+
+def encode_raw(columns: Dict[str, np.ndarray], metadata: Dict, data_filename: str = "ground_truth.bin") -> Tuple[bytes, str]:
+    """
+    Encode ground truth columns as raw binary data, every column stored contiguously at an aligned offset, and a JSON
+    header that describes the dtype and offset of every column.
+    :return: The binary data and the header
+    """
+    chunks: List[bytes] = []
+    header_columns: Dict[str, Dict[str, Union[str, int]]] = {}
+    offset = 0
+    for name, column in columns.items():
+        padding = -offset % RAW_COLUMN_ALIGNMENT
+        chunks.append(b"\0" * padding)
+        offset += padding
+        header_columns[name] = {"dtype": column.dtype.str, "offset": offset}
+        data = column.tobytes()
+        chunks.append(data)
+        offset += len(data)
+
+    num_samples = len(next(iter(columns.values()))) if columns else 0
+    header = {"version": "0.0.1", "data_file": data_filename, "num_samples": num_samples, "columns": header_columns, **metadata}
+    return b"".join(chunks), json.dumps(header, indent=4)
+
+
+def load_ground_truth(filepath: Path) -> Dict[str, np.ndarray]:
+    """
+    Load binary ground truth without parsing: NPZ files are read array by array, raw ground truth (given by its JSON
+    header) is memory-mapped, every column is a read-only view of the mapped data file.
+    """
+    if filepath.suffix == ".npz":
+        with np.load(filepath) as npz:
+            return {name: npz[name] for name in npz.files}
+
+    with open(filepath) as f:
+        header = json.load(f)
+    num_samples = header["num_samples"]
+    columns = header["columns"]
+    if num_samples == 0:
+        return {name: np.empty(0, dtype=column["dtype"]) for name, column in columns.items()}
+
+    data = np.memmap(filepath.parent / header["data_file"], dtype=np.uint8, mode="r")
+    return {name: np.frombuffer(data, dtype=column["dtype"], count=num_samples, offset=column["offset"]) for name, column in columns.items()}
+
+
 class GroundTruthGenerator:
-    def __init__(self, track_name: str, output_directory: Path):
+    """
+    Generates the ground truth of a track. By default, the points of the track definition are written (start and end
+    points of straights, start points of turns, etc). With a spacing, the lane boundaries and the center line are
+    resampled densely at the given arc length spacing instead, every point then contains the right boundary (x_1, y_1),
+    the left boundary (x_2, y_2) and the center line (x_c, y_c) relative to the driving direction.
+
+    Besides XML ("xml"), the dense ground truth can be written as columns (see calc_ground_truth_columns()) to an
+    uncompressed NPZ file ("npz") or a raw memory-mappable file with JSON header ("raw"), which can be loaded with
+    load_ground_truth(). Binary formats are always sampled densely, with DEFAULT_BINARY_SPACING if no spacing is given.
+    """
+
+    def __init__(
+        self,
+        track_name: str,
+        output_directory: Optional[Path] = None,
+        indent: Optional[str] = "\t",
+        spacing: Optional[float] = None,
+        formats: Sequence[str] = ("xml",),
+    ):
+        for ground_truth_format in formats:
+            if ground_truth_format not in GROUND_TRUTH_FORMATS:
+                raise ValueError(f"Unsupported ground truth format: {ground_truth_format}")
         self.track_name = track_name
         self.output_directory = output_directory
-        self.root = ET.Element("GroundTruth", {"version": "0.0.1"})
-        self.points = ET.SubElement(self.root, "Points")
+        self.indent = indent
+        self.spacing = spacing
+        self.formats = formats
 
+    @instrumentation.traced("GroundTruthGenerator.generate_ground_truth")
     def generate_ground_truth(self, track: Track):
-        for segment in track.segments:
-            self.generate_segment(segment)
-        with open(self.output_directory / "ground_truth.xml", "w") as f:
-            f.write(minidom.parseString(ET.tostring(self.root, "utf-8")).toprettyxml(indent="\t"))
+        assert self.output_directory
+        if "xml" in self.formats:
+            with open(self.output_directory / "ground_truth.xml", "w") as f:
+                self.write_ground_truth(track, f)
+        for filename, content in self.render_binary_ground_truth_files(track).items():
+            with open(self.output_directory / filename, "w" if isinstance(content, str) else "wb") as f:
+                f.write(content)
+
+    @instrumentation.traced("GroundTruthGenerator.render_ground_truth_files")
+    def render_ground_truth_files(self, track: Track) -> Dict[str, Content]:
+        files: Dict[str, Content] = {}
+        if "xml" in self.formats:
+            files["ground_truth.xml"] = self.render_ground_truth(track)
+        files.update(self.render_binary_ground_truth_files(track))
+        return files
 
-    def generate_segment(self, segment: Segment):
+    def render_binary_ground_truth_files(self, track: Track) -> Dict[str, Content]:
+        files: Dict[str, Content] = {}
+        binary_formats = [ground_truth_format for ground_truth_format in self.formats if ground_truth_format != "xml"]
+        if binary_formats:
+            spacing = self.spacing if self.spacing is not None else DEFAULT_BINARY_SPACING
+            columns = calc_ground_truth_columns(track, spacing)
+            metadata = _ground_truth_metadata(track, spacing)
+            if "npz" in binary_formats:
+                files["ground_truth.npz"] = encode_npz(columns, metadata)
+            if "raw" in binary_formats:
+                files["ground_truth.bin"], files["ground_truth.json"] = encode_raw(columns, metadata)
+        return files
+
+    @instrumentation.traced("GroundTruthGenerator.render_ground_truth")
+    def render_ground_truth(self, track: Track) -> str:
+        f = io.StringIO()
+        self.write_ground_truth(track, f)
+        return f.getvalue()
+
+    def write_ground_truth(self, track: Track, f: IO[str]) -> None:
+        if self.spacing is not None:
+            self.write_dense_ground_truth(track, f, self.spacing)
+            return
+
+        writer = GroundTruthWriter(f, self.indent)
+        for i, segment in enumerate(track.segments):
+            with instrumentation.segment_span("GroundTruthGenerator.generate_segment", i, segment):
+                for points in self.generate_segment(segment):
+                    writer.write_points(points)
+        writer.close()
+
+    def write_dense_ground_truth(self, track: Track, f: IO[str], spacing: float) -> None:
+        from track_generator.centerline import sample_track
+
+        writer = GroundTruthWriter(f, self.indent, DENSE_POINT_ATTRIBUTES, {"spacing": repr(spacing)})
+        samples = sample_track(track, spacing)
+        writer.write_points(np.column_stack([samples.right, samples.left, samples.center]))
+        writer.close()
+
+    def generate_segment(self, segment: Segment) -> List[np.ndarray]:
         if isinstance(segment, Start):
-            pass
+            return []
         elif isinstance(segment, (Straight, ParkingArea, Gap, Crosswalk)):
-            self.generate_straight(segment)
+            return self.generate_straight(segment)
         elif isinstance(segment, Turn):
-            self.generate_turn(segment)
+            return self.generate_turn(segment)
         elif isinstance(segment, Intersection):
-            self.generate_intersection(segment)
+            return self.generate_intersection(segment)
         elif isinstance(segment, TrafficIsland):
-            self.generate_traffic_island(segment)
+            return self.generate_traffic_island(segment)
         elif isinstance(segment, Clothoid):
-            self.generate_clothoid(segment)
+            return self.generate_clothoid(segment)
         else:
             raise RuntimeError(f"Error in GroundTruthGenerator: {segment} not found")
 
-    def generate_straight(self, segment: Straight):
-        for i, _ in enumerate(segment.center_line_polygon):
-            self.write_points(
-                [segment.left_line_polygon[i].x_w, segment.left_line_polygon[i].y_w],
-                [segment.right_line_polygon[i].x_w, segment.right_line_polygon[i].y_w],
-            )
+    def generate_straight(self, segment: Straight) -> List[np.ndarray]:
+        return [_to_points(segment.left_line_polygon, segment.right_line_polygon)]
 
-    def generate_turn(self, segment: Turn):
+    def generate_turn(self, segment: Turn) -> List[np.ndarray]:
         assert segment.start_point_left
         assert segment.start_point_right
-        self.write_points(
-            [segment.start_point_left.x_w, segment.start_point_left.y_w],
-            [segment.start_point_right.x_w, segment.start_point_right.y_w],
-        )
-
-    def generate_intersection(self, segment: Intersection):
-        for i, _ in enumerate(segment.corner_line_polygons[0]):
-            self.write_points(
-                [segment.corner_line_polygons[0][i].x_w, segment.corner_line_polygons[0][i].y_w],
-                [segment.corner_line_polygons[1][i].x_w, segment.corner_line_polygons[1][i].y_w],
-            )
-        for i, _ in enumerate(segment.corner_line_polygons[0]):
-            self.write_points(
-                [segment.corner_line_polygons[2][i].x_w, segment.corner_line_polygons[2][i].y_w],
-                [segment.corner_line_polygons[3][i].x_w, segment.corner_line_polygons[3][i].y_w],
-            )
-
-    def generate_traffic_island(self, segment: TrafficIsland):
-        for i, _ in enumerate(segment.line_polygons[2]):
-            self.write_points(
-                [segment.line_polygons[2][i].x_w, segment.line_polygons[2][i].y_w],
-                [segment.line_polygons[3][i].x_w, segment.line_polygons[3][i].y_w],
-            )
-
-    def generate_clothoid(self, segment: Clothoid):
-        for i, _ in enumerate(segment.lines[0]):
-            self.write_points([segment.lines[1][i].x_w, segment.lines[1][i].y_w], [segment.lines[2][i].x_w, segment.lines[2][i].y_w])
-
-    def write_points(self, point_1: list, point_2: list):
-        ET.SubElement(
-            self.points,
-            "Point",
-            {
-                "x_1": str(point_1[0]),
-                "y_1": str(point_1[1]),
-                "x_2": str(point_2[0]),
-                "y_2": str(point_2[1]),
-            },
-        )
+        return [_to_points([segment.start_point_left], [segment.start_point_right])]
+
+    def generate_intersection(self, segment: Intersection) -> List[np.ndarray]:
+        return [
+            _to_points(segment.corner_line_polygons[0], segment.corner_line_polygons[1]),
+            _to_points(segment.corner_line_polygons[2], segment.corner_line_polygons[3]),
+        ]
+
+    def generate_traffic_island(self, segment: TrafficIsland) -> List[np.ndarray]:
+        return [_to_points(segment.line_polygons[2], segment.line_polygons[3])]
+
+    def generate_clothoid(self, segment: Clothoid) -> List[np.ndarray]:
+        return [_to_points(segment.lines[1], segment.lines[2])]
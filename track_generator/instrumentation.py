@@ -0,0 +1,177 @@
+# Copyright (C) 2024 twyleg
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Callable, ContextManager, Dict, Iterator, List, Optional, TypeVar
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+_NULL_SPAN: ContextManager[None] = nullcontext()
+_current_track_name: ContextVar[Optional[str]] = ContextVar("current_track_name", default=None)
+_hooks: List["InstrumentationHook"] = []
+
+
+class SpanEvent:
+    def __init__(self, name: str, timestamp_ns: int, attributes: Dict[str, Any]):
+        self.name = name
+        self.timestamp_ns = timestamp_ns
+        self.attributes = attributes
+        self.pid = os.getpid()
+        self.tid = threading.get_ident()
+
+    @property
+    def track_name(self) -> Optional[str]:
+        return self.attributes.get("track")
+
+    @property
+    def segment_index(self) -> Optional[int]:
+        return self.attributes.get("segment_index")
+
+
+class InstrumentationHook:
+    """
+    Base class for instrumentation hooks. Every span of the generation pipeline calls on_start() when it is entered
+    and on_end() with the same attributes when it is left.
+    """
+
+    def on_start(self, event: SpanEvent) -> None:
+        pass
+
+    def on_end(self, event: SpanEvent) -> None:
+        pass
+
+
+class _Span:
+    def __init__(self, name: str, attributes: Dict[str, Any]):
+        self.name = name
+        self.attributes = attributes
+        track_name = _current_track_name.get()
+        if track_name is not None:
+            self.attributes.setdefault("track", track_name)
+
+    def __enter__(self) -> None:
+        event = SpanEvent(self.name, time.perf_counter_ns(), self.attributes)
+        for hook in tuple(_hooks):
+            hook.on_start(event)
+
+    def __exit__(self, *args) -> None:
+        event = SpanEvent(self.name, time.perf_counter_ns(), self.attributes)
+        for hook in tuple(_hooks):
+            hook.on_end(event)
+
+
+def register_hook(hook: InstrumentationHook) -> None:
+    _hooks.append(hook)
+
+
+def unregister_hook(hook: InstrumentationHook) -> None:
+    _hooks.remove(hook)
+
+
+def is_enabled() -> bool:
+    return bool(_hooks)
+
+
+@contextmanager
+def hook_registered(hook: InstrumentationHook) -> Iterator[InstrumentationHook]:
+    register_hook(hook)
+    try:
+        yield hook
+    finally:
+        unregister_hook(hook)
+
+
+def span(name: str, **attributes: Any) -> ContextManager[None]:
+    if not _hooks:
+        return _NULL_SPAN
+    return _Span(name, attributes)
+
+
+def segment_span(name: str, segment_index: int, segment: Any) -> ContextManager[None]:
+    if not _hooks:
+        return _NULL_SPAN
+    return _Span(name, {"segment_index": segment_index, "segment_type": type(segment).__name__})
+
+
+def traced(name: str) -> Callable[[F], F]:
+    def decorator(func: F) -> F:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _hooks:
+                return func(*args, **kwargs)
+            with _Span(name, {}):
+                return func(*args, **kwargs)
+
+        return wrapper  # type: ignore
+
+    return decorator
+
+
+@contextmanager
+def track_context(track_name: str) -> Iterator[None]:
+    token = _current_track_name.set(track_name)
+    try:
+        yield
+    finally:
+        _current_track_name.reset(token)
+
+
+@contextmanager
+def track_scope(track_name: str) -> Iterator[None]:
+    with track_context(track_name), span("generate_track"):
+        yield
+
+
+class ChromeTraceExporter(InstrumentationHook):
+    """
+    Collects spans as Chrome trace events (duration events "B"/"E") that can be loaded in chrome://tracing or Perfetto.
+    Every worker process of a parallel batch is shown as separate process, traces of several workers can be combined
+    with merge_chrome_traces().
+    """
+
+    def __init__(self) -> None:
+        self.trace_events: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def _append(self, event: SpanEvent, phase: str) -> None:
+        trace_event = {
+            "name": event.name,
+            "cat": event.name.split(".")[0],
+            "ph": phase,
+            "ts": event.timestamp_ns / 1000.0,
+            "pid": event.pid,
+            "tid": event.tid,
+            "args": event.attributes,
+        }
+        with self._lock:
+            self.trace_events.append(trace_event)
+
+    def on_start(self, event: SpanEvent) -> None:
+        self._append(event, "B")
+
+    def on_end(self, event: SpanEvent) -> None:
+        self._append(event, "E")
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"traceEvents": list(self.trace_events), "displayTimeUnit": "ms"}
+
+    def write(self, trace_filepath: Path) -> None:
+        trace_filepath.parent.mkdir(parents=True, exist_ok=True)
+        with open(trace_filepath, "w") as f:
+            json.dump(self.to_dict(), f)
+
+
+def merge_chrome_traces(trace_filepaths: List[Path], output_filepath: Path) -> None:
+    trace_events: List[Dict[str, Any]] = []
+    for trace_filepath in trace_filepaths:
+        with open(trace_filepath) as f:
+            trace_events.extend(json.load(f)["traceEvents"])
+    trace_events.sort(key=lambda trace_event: trace_event["ts"])
+    output_filepath.parent.mkdir(parents=True, exist_ok=True)
+    with open(output_filepath, "w") as f:
+        json.dump({"traceEvents": trace_events, "displayTimeUnit": "ms"}, f)
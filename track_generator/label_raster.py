@@ -0,0 +1,307 @@
+# Copyright (C) 2024 twyleg
+import abc
+import json
+import struct
+import zlib
+from enum import IntEnum
+from math import ceil, cos
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from track_generator.coordinate_system import PIXELS_PER_METER, Polygon, world_to_pixel
+
+# Maximum length in m of the pieces that strokes are rasterized in, bounds the pixel window evaluated per piece
+MAX_PIECE_LENGTH = 0.25
+# Number of pixel rows evaluated at once when filling polygons
+FILL_BAND_ROWS = 256
+# Tolerance in pixels for pixel centers on the ends of strokes, so no pixels are lost between adjoining strokes
+EDGE_TOLERANCE = 1e-6
+
+
+class LabelClass(IntEnum):
+    BACKGROUND = 0
+    ROAD = 1
+    LANE_LINE = 2
+    CENTER_LINE = 3
+    STOP_LINE = 4
+    CROSSWALK = 5
+    PARKING_OUTLINE = 6
+    BLOCKED_AREA = 7
+
+
+Dash = Tuple[float, float]
+
+
+class LabelTarget(abc.ABC):
+    """
+    Receiver of the labeled shapes (strokes and areas with their LabelClass) that the Painter draws a track from, in
+    drawing order. Coordinates are world coordinates.
+    """
+
+    def begin_segment(self, segment_index: int) -> None:
+        """
+        Called before the shapes of the segment with the given index in Track.segments are drawn.
+        """
+        pass
+
+    @abc.abstractmethod
+    def stroke_polyline(self, points: np.ndarray, width: float, label: LabelClass, dash: Optional[Dash] = None) -> None:
+        pass
+
+    @abc.abstractmethod
+    def stroke_arc(
+        self, center: Tuple[float, float], radius: float, start_angle: float, sweep: float, width: float, label: LabelClass, dash: Optional[Dash] = None
+    ) -> None:
+        pass
+
+    @abc.abstractmethod
+    def fill_polygon(self, points: np.ndarray, label: LabelClass) -> None:
+        pass
+
+
+class LabelRaster(LabelTarget):
+    """
+    Single-channel class map (one LabelClass value per pixel) with the size and pixel mapping of the PNG of a track.
+    Shapes are rasterized without anti-aliasing: a pixel gets the class of the last shape covering its center, so
+    shapes overwrite each other in the same order as in the SVG. Strokes have butt caps, polylines round joins and
+    dashes follow the SVG semantics (dash pattern in m along the stroke, restarting with every stroke).
+    """
+
+    def __init__(self, width: float, height: float, origin: Tuple[float, float], pixels_per_meter: float = PIXELS_PER_METER):
+        self.height = height
+        self.origin = origin
+        self.pixels_per_meter = pixels_per_meter
+        self.labels = np.zeros((int(round(height * pixels_per_meter)), int(round(width * pixels_per_meter))), dtype=np.uint8)
+
+    def to_pixel(self, points: np.ndarray) -> np.ndarray:
+        px, py = world_to_pixel(points[:, 0], points[:, 1], self.height, self.origin, self.pixels_per_meter)
+        return np.stack([px, py], axis=-1)
+
+    def _window(self, min_corner: np.ndarray, max_corner: np.ndarray) -> Optional[Tuple[slice, slice, np.ndarray, np.ndarray]]:
+        """
+        :return: Row and column slices of the pixels whose centers may lie within the given pixel coordinate bounds and
+        the pixel center coordinates of the rows and columns, or None if the bounds are outside of the image
+        """
+        num_rows, num_cols = self.labels.shape
+        col_start, col_end = max(0, int(np.floor(min_corner[0]))), min(num_cols, int(np.ceil(max_corner[0])) + 1)
+        row_start, row_end = max(0, int(np.floor(min_corner[1]))), min(num_rows, int(np.ceil(max_corner[1])) + 1)
+        if col_start >= col_end or row_start >= row_end:
+            return None
+        return (
+            slice(row_start, row_end),
+            slice(col_start, col_end),
+            np.arange(row_start, row_end)[:, np.newaxis] + 0.5,
+            np.arange(col_start, col_end)[np.newaxis, :] + 0.5,
+        )
+
+    @staticmethod
+    def _is_dash(s: np.ndarray, dash: Optional[Dash]) -> np.ndarray:
+        if dash is None:
+            return np.ones_like(s, dtype=bool)
+        return np.mod(s, dash[0] + dash[1]) < dash[0]
+
+    def _stroke_line(self, p0: np.ndarray, p1: np.ndarray, s0: float, width: float, label: LabelClass, dash: Optional[Dash]) -> None:
+        """
+        Rasterize a straight stroke with butt caps from p0 to p1 (pixel coordinates) that starts at arc length s0 (m).
+        """
+        half_width = width * self.pixels_per_meter / 2
+        window = self._window(np.minimum(p0, p1) - half_width, np.maximum(p0, p1) + half_width)
+        if window is None:
+            return
+        rows, cols, y, x = window
+        direction = p1 - p0
+        length = float(np.hypot(*direction))
+        if length == 0.0:
+            return
+        direction = direction / length
+        along = (x - p0[0]) * direction[0] + (y - p0[1]) * direction[1]
+        across = (x - p0[0]) * -direction[1] + (y - p0[1]) * direction[0]
+        mask = (along >= -EDGE_TOLERANCE) & (along <= length + EDGE_TOLERANCE) & (np.abs(across) <= half_width)
+        mask &= self._is_dash(s0 + along / self.pixels_per_meter, dash)
+        self.labels[rows, cols][mask] = label
+
+    def _stroke_join(self, p: np.ndarray, s: float, width: float, label: LabelClass, dash: Optional[Dash]) -> None:
+        if not self._is_dash(np.array(s), dash):
+            return
+        half_width = width * self.pixels_per_meter / 2
+        window = self._window(p - half_width, p + half_width)
+        if window is None:
+            return
+        rows, cols, y, x = window
+        self.labels[rows, cols][(x - p[0]) ** 2 + (y - p[1]) ** 2 <= half_width**2] = label
+
+    def stroke_polyline(self, points: np.ndarray, width: float, label: LabelClass, dash: Optional[Dash] = None) -> None:
+        """
+        :param points: Points (world coordinates) of the polyline
+        :param width: Stroke width in m
+        :param label: Class of the stroke
+        :param dash: Optional dash pattern (dash length, gap length) in m
+        """
+        pixel_points = self.to_pixel(np.asarray(points, dtype=float))
+        s = 0.0
+        for i in range(len(pixel_points) - 1):
+            p0, p1 = pixel_points[i], pixel_points[i + 1]
+            segment_length = float(np.hypot(*(p1 - p0))) / self.pixels_per_meter
+            num_pieces = max(1, ceil(segment_length / MAX_PIECE_LENGTH))
+            for j in range(num_pieces):
+                self._stroke_line(
+                    p0 + (p1 - p0) * j / num_pieces, p0 + (p1 - p0) * (j + 1) / num_pieces, s + segment_length * j / num_pieces, width, label, dash
+                )
+            s += segment_length
+            if i < len(pixel_points) - 2:
+                self._stroke_join(p1, s, width, label, dash)
+
+    def stroke_arc(
+        self, center: Tuple[float, float], radius: float, start_angle: float, sweep: float, width: float, label: LabelClass, dash: Optional[Dash] = None
+    ) -> None:
+        """
+        :param center: Center of the arc (world coordinates)
+        :param radius: Radius of the arc in m
+        :param start_angle: Angle (rad, counterclockwise from the world x axis) of the start of the arc
+        :param sweep: Angle (rad) of the arc, negative for clockwise arcs
+        :param width: Stroke width in m
+        :param label: Class of the stroke
+        :param dash: Optional dash pattern (dash length, gap length) in m, measured along the arc
+        """
+        pixel_center = self.to_pixel(np.array([center], dtype=float))[0]
+        pixel_radius = radius * self.pixels_per_meter
+        half_width = width * self.pixels_per_meter / 2
+        sign = 1.0 if sweep >= 0.0 else -1.0
+        num_pieces = max(1, ceil(abs(sweep) * (radius + width / 2) / MAX_PIECE_LENGTH))
+        piece_sweep = abs(sweep) / num_pieces
+
+        for j in range(num_pieces):
+            piece_start = j * piece_sweep
+            angles = start_angle + sign * np.array([piece_start, piece_start + piece_sweep / 2, piece_start + piece_sweep])
+            # Image rows point downwards, so world angles are mirrored in pixel coordinates
+            directions = np.stack([np.cos(angles), -np.sin(angles)], axis=-1)
+            corners = np.concatenate([pixel_center + directions * max(0.0, pixel_radius - half_width), pixel_center + directions * (pixel_radius + half_width)])
+            # The outer edge bulges beyond the corners between them by its sagitta
+            padding = (pixel_radius + half_width) * (1.0 - cos(piece_sweep / 4))
+            window = self._window(corners.min(axis=0) - padding, corners.max(axis=0) + padding)
+            if window is None:
+                continue
+            rows, cols, y, x = window
+            dx, dy = x - pixel_center[0], pixel_center[1] - y
+            distance = np.sqrt(dx**2 + dy**2)
+            # Angles slightly before the start are mapped to [-angle_tolerance, 0) instead of close to 2 pi
+            angle_tolerance = EDGE_TOLERANCE / max(distance.max(), 1.0)
+            angle = np.mod(sign * (np.arctan2(dy, dx) - start_angle) + angle_tolerance, 2 * np.pi) - angle_tolerance
+            mask = (
+                (np.abs(distance - pixel_radius) <= half_width)
+                & (angle >= piece_start - angle_tolerance)
+                & (angle <= piece_start + piece_sweep + angle_tolerance)
+            )
+            mask &= self._is_dash(angle * radius, dash)
+            self.labels[rows, cols][mask] = label
+
+    def fill_polygon(self, points: np.ndarray, label: LabelClass) -> None:
+        """
+        Fill the (implicitly closed) polygon with the even-odd rule.
+        :param points: Points (world coordinates) of the polygon
+        :param label: Class of the area
+        """
+        pixel_points = self.to_pixel(np.asarray(points, dtype=float))
+        if len(pixel_points) < 3:
+            return
+        window = self._window(pixel_points.min(axis=0), pixel_points.max(axis=0))
+        if window is None:
+            return
+        rows, cols, _, x = window
+        edges_start, edges_end = pixel_points, np.roll(pixel_points, -1, axis=0)
+        for band_start in range(rows.start, rows.stop, FILL_BAND_ROWS):
+            band_rows = slice(band_start, min(rows.stop, band_start + FILL_BAND_ROWS))
+            y = np.arange(band_rows.start, band_rows.stop)[:, np.newaxis] + 0.5
+            inside = np.zeros((band_rows.stop - band_rows.start, x.shape[1]), dtype=bool)
+            for (x0, y0), (x1, y1) in zip(edges_start, edges_end):
+                if y0 == y1:
+                    continue
+                crosses = (y0 <= y) != (y1 <= y)
+                x_crossing = x0 + (y - y0) * (x1 - x0) / (y1 - y0)
+                inside ^= crosses & (x < x_crossing)
+            self.labels[band_rows, cols][inside] = label
+
+
+def polygon_to_array(polygon: Polygon) -> np.ndarray:
+    return np.array([[point.x_w, point.y_w] for point in polygon], dtype=float).reshape(-1, 2)
+
+
+def arc_start_angle(center: Tuple[float, float], start: Tuple[float, float]) -> float:
+    return float(np.arctan2(start[1] - center[1], start[0] - center[0]))
+
+
+def encode_label_png(labels: np.ndarray, compression_level: int = 6) -> bytes:
+    """
+    Encode a class map as 8 bit grayscale PNG.
+    """
+    num_rows, num_cols = labels.shape
+    scanlines = np.zeros((num_rows, num_cols + 1), dtype=np.uint8)
+    scanlines[:, 1:] = labels
+
+    def chunk(chunk_type: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + chunk_type + data + struct.pack(">I", zlib.crc32(chunk_type + data) & 0xFFFFFFFF)
+
+    return b"".join(
+        [
+            b"\x89PNG\r\n\x1a\n",
+            chunk(b"IHDR", struct.pack(">IIBBBBB", num_cols, num_rows, 8, 0, 0, 0, 0)),
+            chunk(b"IDAT", zlib.compress(scanlines.tobytes(), compression_level)),
+            chunk(b"IEND", b""),
+        ]
+    )
+
+
+def decode_label_png(data: bytes) -> np.ndarray:
+    """
+    Decode a class map encoded by encode_label_png() (8 bit grayscale PNG without scanline filters).
+    :return: Array of the class map with one row per image row (uint8)
+    """
+    if data[:8] != b"\x89PNG\r\n\x1a\n":
+        raise ValueError("Not a PNG image")
+    offset = 8
+    header = b""
+    image_data: List[bytes] = []
+    while offset < len(data):
+        (length,) = struct.unpack_from(">I", data, offset)
+        chunk_type = data[offset + 4 : offset + 8]
+        if chunk_type == b"IHDR":
+            header = data[offset + 8 : offset + 8 + length]
+        elif chunk_type == b"IDAT":
+            image_data.append(data[offset + 8 : offset + 8 + length])
+        offset += length + 12
+    num_cols, num_rows, bit_depth, color_type, _, _, interlace = struct.unpack(">IIBBBBB", header)
+    if (bit_depth, color_type, interlace) != (8, 0, 0):
+        raise ValueError(f"Unsupported PNG image: bit depth {bit_depth}, color type {color_type}, interlace {interlace}")
+    scanlines = np.frombuffer(zlib.decompress(b"".join(image_data)), dtype=np.uint8).reshape(num_rows, num_cols + 1)
+    if np.any(scanlines[:, 0]):
+        raise ValueError("Unsupported PNG image: filtered scanlines")
+    return scanlines[:, 1:]
+
+
+def encode_rle(mask: np.ndarray) -> Dict[str, List[int]]:
+    """
+    Run-length encode a binary mask in the uncompressed COCO format: run lengths of alternating 0 and 1 pixels in
+    column-major order, starting with 0 pixels.
+    """
+    flat = np.asarray(mask, dtype=bool).ravel(order="F")
+    changes = np.flatnonzero(flat[1:] != flat[:-1]) + 1
+    counts = np.diff(np.concatenate([[0], changes, [len(flat)]]))
+    if len(flat) and flat[0]:
+        counts = np.concatenate([[0], counts])
+    return {"size": list(mask.shape), "counts": counts.tolist()}
+
+
+def decode_rle(rle: Dict[str, List[int]]) -> np.ndarray:
+    num_rows, num_cols = rle["size"]
+    values = np.arange(len(rle["counts"])) % 2 == 1
+    return np.repeat(values, rle["counts"]).reshape((num_cols, num_rows)).T
+
+
+def encode_label_rle(labels: np.ndarray) -> str:
+    """
+    :return: JSON document with the class names and a run-length encoded mask (see encode_rle()) for every class
+    """
+    labels_column_major = np.asfortranarray(labels)
+    masks = {label_class.name.lower(): encode_rle(labels_column_major == label_class) for label_class in LabelClass}
+    return json.dumps({"classes": [label_class.name.lower() for label_class in LabelClass], "masks": masks})
@@ -3,7 +3,8 @@ import math
 import drawsvg as draw
 
 from pathlib import Path
-from typing import Optional, Tuple
+from typing import Any, Dict, Optional, Tuple
+from track_generator import instrumentation
 from track_generator.track import (
     Track,
     Start,
@@ -18,7 +19,8 @@ from track_generator.track import (
     BackgroundColor,
     BackgroundImage,
 )
-from track_generator.coordinate_system import Point2d, Polygon
+from track_generator.coordinate_system import PIXELS_PER_METER, Point2d, Polygon
+from track_generator.label_raster import Dash, LabelClass, LabelRaster, LabelTarget, arc_start_angle, polygon_to_array
 
 DEFAULT_LINE_WIDTH = 0.020
 DEFAULT_TRACK_WIDTH = 0.800
@@ -27,6 +29,8 @@ DEFAULT_LANE_WIDTH = 0.380
 DEFAULT_TRACK_COLOR = "#000000"
 DEFAULT_LINE_COLOR = "#ffffff"
 
+CENTER_LINE_DASH: Dash = (0.16, 0.16)
+
 
 class SvgPoint:
     IMAGE_HEIGHT = 0.0
@@ -42,24 +46,34 @@ class SvgPoint:
 
 
 class Painter:
-    def __init__(self) -> None:
+    def __init__(self, labels: bool = False, label_pixels_per_meter: float = PIXELS_PER_METER) -> None:
+        """
+        :param labels: Flag whether a class map of the track (label_raster) should be rasterized from the same shapes
+        while drawing the track
+        :param label_pixels_per_meter: Resolution of the class map. Default: resolution of the PNG
+        """
         self.d: draw.Drawing | None = None
-        self.dash_style = "stroke-miterlimit:4;stroke-dasharray:0.16,0.16;stroke-dashoffset:0"
-
-        self.default_track_background_style = {
+        self.labels = labels
+        self.label_pixels_per_meter = label_pixels_per_meter
+        self.label_raster: Optional[LabelRaster] = None
+        # Receiver of the labeled shapes while a track is drawn
+        self.label_target: Optional[LabelTarget] = None
+        self.dash_style = f"stroke-miterlimit:4;stroke-dasharray:{CENTER_LINE_DASH[0]},{CENTER_LINE_DASH[1]};stroke-dashoffset:0"
+
+        self.default_track_background_style: Dict[str, Any] = {
             "fill": "none",
             "stroke": DEFAULT_TRACK_COLOR,
             "stroke_width": DEFAULT_TRACK_WIDTH,
         }
 
-        self.default_center_line_style = {
+        self.default_center_line_style: Dict[str, Any] = {
             "fill": "none",
             "stroke": DEFAULT_LINE_COLOR,
             "stroke_width": DEFAULT_LINE_WIDTH,
             "style": self.dash_style,
         }
 
-        self.default_outer_line_style = {
+        self.default_outer_line_style: Dict[str, Any] = {
             "fill": "none",
             "stroke": DEFAULT_LINE_COLOR,
             "stroke_width": DEFAULT_LINE_WIDTH,
@@ -70,13 +84,34 @@ class Painter:
         rotation_angle = -90.0 if cw else 90.0
         return -direction_angle + rotation_angle
 
-    def draw_polygon(self, polygon: Polygon, **kwargs) -> None:
+    def draw_polygon(self, polygon: Polygon, label: Optional[LabelClass] = None, fill_label: Optional[LabelClass] = None, **kwargs) -> None:
+        """
+        :param label: Class of the stroke in the label raster
+        :param fill_label: Class of the area in the label raster
+        """
         assert self.d
         points = []
         for point in polygon:
             points.extend([*SvgPoint(point).p])
         self.d.append(draw.Lines(*points, **kwargs))
 
+        if self.label_target:
+            if fill_label is not None:
+                self.label_target.fill_polygon(polygon_to_array(polygon), fill_label)
+            if label is not None:
+                dash = CENTER_LINE_DASH if kwargs.get("style") == self.dash_style else None
+                self.label_target.stroke_polyline(polygon_to_array(polygon), kwargs["stroke_width"], label, dash)
+
+    def label_turn(self, segment: Turn, radius: float, width: float, label: LabelClass, dash: Optional[Dash] = None) -> None:
+        assert segment.center_point
+        assert segment.start_point_center
+        if not self.label_target:
+            return
+        center = (segment.center_point.x_w, segment.center_point.y_w)
+        start_angle = arc_start_angle(center, (segment.start_point_center.x_w, segment.start_point_center.y_w))
+        sweep = -math.radians(segment.radian_angle) if segment.direction_clockwise else math.radians(segment.radian_angle)
+        self.label_target.stroke_arc(center, radius, start_angle, sweep, width, label, dash)
+
     def draw_point(self, p: Point2d):
         assert self.d
         svg_p = SvgPoint(p)
@@ -97,20 +132,24 @@ class Painter:
             )
         )
 
+    @instrumentation.traced("Painter.draw_start_verbose")
     def draw_start_verbose(self, segment: Start):
         self.draw_point(segment.start_point)
 
+    @instrumentation.traced("Painter.draw_straight")
     def draw_straight(self, segment: Straight):
-        self.draw_polygon(segment.center_line_polygon, **self.default_track_background_style)
-        self.draw_polygon(segment.center_line_polygon, **self.default_center_line_style)
-        self.draw_polygon(segment.left_line_polygon, **self.default_outer_line_style)
-        self.draw_polygon(segment.right_line_polygon, **self.default_outer_line_style)
+        self.draw_polygon(segment.center_line_polygon, LabelClass.ROAD, **self.default_track_background_style)
+        self.draw_polygon(segment.center_line_polygon, LabelClass.CENTER_LINE, **self.default_center_line_style)
+        self.draw_polygon(segment.left_line_polygon, LabelClass.LANE_LINE, **self.default_outer_line_style)
+        self.draw_polygon(segment.right_line_polygon, LabelClass.LANE_LINE, **self.default_outer_line_style)
 
+    @instrumentation.traced("Painter.draw_straight_verbose")
     def draw_straight_verbose(self, segment: Straight):
         self.draw_point(segment.center_line_polygon[0])
         self.draw_point(segment.left_line_polygon[0])
         self.draw_point(segment.right_line_polygon[0])
 
+    @instrumentation.traced("Painter.draw_turn")
     def draw_turn(self, segment: Turn):
         assert segment.direction_angle is not None
         assert segment.start_direction_angle is not None
@@ -166,6 +205,13 @@ class Painter:
             )
         )
 
+        radius = math.fabs(segment.radius)
+        self.label_turn(segment, radius, DEFAULT_TRACK_WIDTH, LabelClass.ROAD)
+        self.label_turn(segment, radius - DEFAULT_LANE_WIDTH, DEFAULT_LINE_WIDTH, LabelClass.LANE_LINE)
+        self.label_turn(segment, radius + DEFAULT_LANE_WIDTH, DEFAULT_LINE_WIDTH, LabelClass.LANE_LINE)
+        self.label_turn(segment, radius, DEFAULT_LINE_WIDTH, LabelClass.CENTER_LINE, CENTER_LINE_DASH)
+
+    @instrumentation.traced("Painter.draw_turn_verbose")
     def draw_turn_verbose(self, segment: Turn):
         assert segment.direction_angle is not None
         assert segment.start_direction_angle is not None
@@ -204,57 +250,71 @@ class Painter:
         self.draw_point(segment.start_point_left)
         self.draw_point(segment.start_point_right)
 
+    @instrumentation.traced("Painter.draw_crosswalk")
     def draw_crosswalk(self, segment: Crosswalk):
-        self.draw_polygon(segment.center_line_polygon, **self.default_track_background_style)
-        self.draw_polygon(segment.left_line_polygon, **self.default_outer_line_style)
-        self.draw_polygon(segment.right_line_polygon, **self.default_outer_line_style)
+        self.draw_polygon(segment.center_line_polygon, LabelClass.ROAD, **self.default_track_background_style)
+        self.draw_polygon(segment.left_line_polygon, LabelClass.LANE_LINE, **self.default_outer_line_style)
+        self.draw_polygon(segment.right_line_polygon, LabelClass.LANE_LINE, **self.default_outer_line_style)
 
         for polygon in segment.line_polygons:
-            self.draw_polygon(polygon, stroke=DEFAULT_LINE_COLOR, stroke_width=0.03, fill="none")
+            self.draw_polygon(polygon, LabelClass.CROSSWALK, stroke=DEFAULT_LINE_COLOR, stroke_width=0.03, fill="none")
 
+    @instrumentation.traced("Painter.draw_intersection")
     def draw_intersection(self, segment: Intersection):
         for polygon in segment.base_line_polygons:
-            self.draw_polygon(polygon, **self.default_track_background_style)
+            self.draw_polygon(polygon, LabelClass.ROAD, **self.default_track_background_style)
 
         for polygon in segment.corner_line_polygons:
-            self.draw_polygon(polygon, **self.default_outer_line_style)
+            self.draw_polygon(polygon, LabelClass.LANE_LINE, **self.default_outer_line_style)
 
         for polygon in segment.stop_line_polygons:
-            self.draw_polygon(polygon, stroke=DEFAULT_LINE_COLOR, stroke_width=DEFAULT_LINE_WIDTH * 2, fill="none")
+            self.draw_polygon(polygon, LabelClass.STOP_LINE, stroke=DEFAULT_LINE_COLOR, stroke_width=DEFAULT_LINE_WIDTH * 2, fill="none")
 
         for polygon in segment.center_line_polygons:
-            self.draw_polygon(polygon, **self.default_center_line_style)
+            self.draw_polygon(polygon, LabelClass.CENTER_LINE, **self.default_center_line_style)
 
+    @instrumentation.traced("Painter.draw_traffic_island")
     def draw_traffic_island(self, segment: TrafficIsland):
         assert self.d
-        self.draw_polygon(segment.background_polygon)
+        self.draw_polygon(segment.background_polygon, fill_label=LabelClass.ROAD)
 
         for polygon in segment.line_polygons:
-            self.draw_polygon(polygon, **self.default_outer_line_style)
+            self.draw_polygon(polygon, LabelClass.LANE_LINE, **self.default_outer_line_style)
 
         for polygon in segment.crosswalk_lines_polygons:
-            self.draw_polygon(polygon, stroke=DEFAULT_LINE_COLOR, stroke_width=0.03, fill="none")
+            self.draw_polygon(polygon, LabelClass.CROSSWALK, stroke=DEFAULT_LINE_COLOR, stroke_width=0.03, fill="none")
 
+    @instrumentation.traced("Painter.draw_parking_area")
     def draw_parking_area(self, segment: ParkingArea):
         assert self.d
         self.draw_straight(segment)
 
         for polygon in segment.outline_polygon:
-            self.draw_polygon(polygon, fill=DEFAULT_TRACK_COLOR, stroke=DEFAULT_LINE_COLOR, stroke_width=DEFAULT_LINE_WIDTH)
+            self.draw_polygon(
+                polygon, LabelClass.PARKING_OUTLINE, LabelClass.ROAD, fill=DEFAULT_TRACK_COLOR, stroke=DEFAULT_LINE_COLOR, stroke_width=DEFAULT_LINE_WIDTH
+            )
+
+        if self.label_target:
+            # Blocked spots are marked by two crossing diagonals, their corners span the blocked area
+            for diagonal, other_diagonal in zip(segment.blocker_polygons[::2], segment.blocker_polygons[1::2]):
+                area = [diagonal[0], other_diagonal[0], diagonal[1], other_diagonal[1]]
+                self.label_target.fill_polygon(polygon_to_array(area), LabelClass.BLOCKED_AREA)
 
         for polygon in segment.spot_seperator_polygons:
-            self.draw_polygon(polygon, **self.default_outer_line_style)
+            self.draw_polygon(polygon, LabelClass.PARKING_OUTLINE, **self.default_outer_line_style)
 
         for polygon in segment.blocker_polygons:
-            self.draw_polygon(polygon, **self.default_outer_line_style)
+            self.draw_polygon(polygon, LabelClass.BLOCKED_AREA, **self.default_outer_line_style)
 
+    @instrumentation.traced("Painter.draw_clothoid")
     def draw_clothoid(self, segment: Clothoid):
         assert self.d
-        self.draw_polygon(segment.lines[0], **self.default_track_background_style)
-        self.draw_polygon(segment.lines[0], **self.default_center_line_style)
-        self.draw_polygon(segment.lines[1], **self.default_outer_line_style)
-        self.draw_polygon(segment.lines[2], **self.default_outer_line_style)
+        self.draw_polygon(segment.lines[0], LabelClass.ROAD, **self.default_track_background_style)
+        self.draw_polygon(segment.lines[0], LabelClass.CENTER_LINE, **self.default_center_line_style)
+        self.draw_polygon(segment.lines[1], LabelClass.LANE_LINE, **self.default_outer_line_style)
+        self.draw_polygon(segment.lines[2], LabelClass.LANE_LINE, **self.default_outer_line_style)
 
+    @instrumentation.traced("Painter.draw_template_based_segment")
     def draw_template_based_segment(self, segment, template_file_path: str):
         assert self.d
         svg_start_point_center = SvgPoint(segment.start_point_center)
@@ -300,10 +360,16 @@ class Painter:
         elif isinstance(segment, Turn):
             self.draw_turn_verbose(segment)
 
-    def draw_track(self, track: Track):
+    @instrumentation.traced("Painter.draw_track")
+    def draw_track(self, track: Track, label_target: Optional[LabelTarget] = None):
+        """
+        :param label_target: Optional receiver of the labeled shapes of the track instead of the label raster
+        """
         SvgPoint.IMAGE_HEIGHT = track.height
         self.d = draw.Drawing(track.width, track.height, origin=track.origin, displayInline=False)
-        self.d.set_pixel_scale(1000)
+        self.d.set_pixel_scale(PIXELS_PER_METER)
+        self.label_raster = LabelRaster(track.width, track.height, track.origin, self.label_pixels_per_meter) if self.labels else None
+        self.label_target = label_target if label_target else self.label_raster
 
         if isinstance(track.background, BackgroundColor):
             self.d.append(
@@ -320,20 +386,41 @@ class Painter:
             img = track.background
             self.d.append(draw.Image(img.x, img.y, img.width, img.height, img.filepath, embed=True, preserveAspectRatio="none"))
 
-        for segment in track.segments:
-            self.draw_segment(segment)
+        try:
+            for i, segment in enumerate(track.segments):
+                with instrumentation.segment_span("Painter.draw_segment", i, segment):
+                    if self.label_target:
+                        self.label_target.begin_segment(i)
+                    self.draw_segment(segment)
+        finally:
+            self.label_target = None
 
+    @instrumentation.traced("Painter.draw_track_verbose")
     def draw_track_verbose(self, track: Track):
-        for segment in track.segments:
-            self.draw_segment_verbose(segment)
+        for i, segment in enumerate(track.segments):
+            with instrumentation.segment_span("Painter.draw_segment_verbose", i, segment):
+                self.draw_segment_verbose(segment)
+
+    @instrumentation.traced("Painter.as_svg")
+    def as_svg(self) -> str:
+        assert self.d
+        return self.d.as_svg()
+
+    @instrumentation.traced("Painter.as_png")
+    def as_png(self) -> bytes:
+        assert self.d
+        self.d.set_pixel_scale(PIXELS_PER_METER)
+        return self.d.rasterize().png_data
 
+    @instrumentation.traced("Painter.save_svg")
     def save_svg(self, track_name: str, output_directory: Path, file_name_postfix: str = ""):
         assert self.d
         output_file_path = output_directory / track_name
         self.d.save_svg(f"{output_file_path}{file_name_postfix}.svg")
 
+    @instrumentation.traced("Painter.save_png")
     def save_png(self, track_name: str, output_directory: Path):
         assert self.d
         output_file_path = output_directory / track_name
-        self.d.set_pixel_scale(1000)
+        self.d.set_pixel_scale(PIXELS_PER_METER)
         self.d.save_png(f"{output_file_path}.png")
@@ -0,0 +1,151 @@
+# Copyright (C) 2024 twyleg
+import json
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+from typing import Any, ContextManager, Dict, Iterator, List, Optional
+
+
+class StageProfile:
+    def __init__(self, name: str):
+        self.name = name
+        self.calls = 0
+        self.wall_time = 0.0
+        self.cpu_time = 0.0
+        self.peak_memory = 0
+
+    def add(self, wall_time: float, cpu_time: float, peak_memory: int) -> None:
+        self.calls += 1
+        self.wall_time += wall_time
+        self.cpu_time += cpu_time
+        self.peak_memory = max(self.peak_memory, peak_memory)
+
+    def merge(self, other: "StageProfile") -> None:
+        self.calls += other.calls
+        self.wall_time += other.wall_time
+        self.cpu_time += other.cpu_time
+        self.peak_memory = max(self.peak_memory, other.peak_memory)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "wall_time": self.wall_time,
+            "cpu_time": self.cpu_time,
+            "peak_memory": self.peak_memory,
+        }
+
+
+class TrackProfile:
+    def __init__(self, track_name: str):
+        self.track_name = track_name
+        self.stages: Dict[str, StageProfile] = {}
+
+    def get_stage(self, name: str) -> StageProfile:
+        if name not in self.stages:
+            self.stages[name] = StageProfile(name)
+        return self.stages[name]
+
+    @property
+    def wall_time(self) -> float:
+        return sum(stage.wall_time for stage in self.stages.values())
+
+    @property
+    def cpu_time(self) -> float:
+        return sum(stage.cpu_time for stage in self.stages.values())
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "track_name": self.track_name,
+            "wall_time": self.wall_time,
+            "cpu_time": self.cpu_time,
+            "stages": {name: stage.to_dict() for name, stage in self.stages.items()},
+        }
+
+
+class Profiler:
+    """
+    Records wall time, CPU time and peak memory of the generation stages for every track.
+
+    Stages must not be nested, the peak memory of a stage is measured with tracemalloc relative to the memory that was
+    already allocated when the stage was entered.
+    """
+
+    def __init__(self, trace_memory: bool = True) -> None:
+        self.trace_memory = trace_memory
+        self.track_profiles: List[TrackProfile] = []
+        self._started_tracemalloc = False
+
+    def __enter__(self) -> "Profiler":
+        self.start()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.stop()
+
+    def start(self) -> None:
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+
+    def stop(self) -> None:
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+
+    def start_track(self, track_name: str) -> TrackProfile:
+        track_profile = TrackProfile(track_name)
+        self.track_profiles.append(track_profile)
+        return track_profile
+
+    @property
+    def current_track_profile(self) -> TrackProfile:
+        if not self.track_profiles:
+            self.start_track("")
+        return self.track_profiles[-1]
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        stage_profile = self.current_track_profile.get_stage(name)
+        tracing = tracemalloc.is_tracing()
+        memory_at_start = 0
+        if tracing:
+            memory_at_start, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+        wall_time_start = time.perf_counter()
+        cpu_time_start = time.process_time()
+        try:
+            yield
+        finally:
+            wall_time = time.perf_counter() - wall_time_start
+            cpu_time = time.process_time() - cpu_time_start
+            peak_memory = max(0, tracemalloc.get_traced_memory()[1] - memory_at_start) if tracing else 0
+            stage_profile.add(wall_time, cpu_time, peak_memory)
+
+    def summary(self) -> Dict[str, Any]:
+        stages: Dict[str, StageProfile] = {}
+        for track_profile in self.track_profiles:
+            for name, stage_profile in track_profile.stages.items():
+                stages.setdefault(name, StageProfile(name)).merge(stage_profile)
+
+        return {
+            "num_tracks": len(self.track_profiles),
+            "wall_time": sum(track_profile.wall_time for track_profile in self.track_profiles),
+            "cpu_time": sum(track_profile.cpu_time for track_profile in self.track_profiles),
+            "stages": {name: stage.to_dict() for name, stage in sorted(stages.items(), key=lambda item: -item[1].wall_time)},
+        }
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            "tracks": [track_profile.to_dict() for track_profile in self.track_profiles],
+            "summary": self.summary(),
+        }
+
+    def write_report(self, report_filepath: Path) -> None:
+        report_filepath.parent.mkdir(parents=True, exist_ok=True)
+        with open(report_filepath, "w") as f:
+            json.dump(self.report(), f, indent=4)
+
+
+def profile_stage(profiler: Optional[Profiler], name: str) -> ContextManager[None]:
+    return profiler.stage(name) if profiler else nullcontext()
@@ -0,0 +1,198 @@
+# Copyright (C) 2024 twyleg
+import logging
+from math import ceil
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from track_generator.track import LINE_OFFSET, LINE_WIDTH, Track
+
+logm = logging.getLogger(__name__)
+
+RACING_LINE_BOUNDS = ["lane", "road"]
+
+DEFAULT_SPACING = 0.1
+DEFAULT_VEHICLE_WIDTH = 0.2
+# Weight of the squared tangent length (shorter lines) relative to the squared curvature
+DEFAULT_LENGTH_WEIGHT = 0.0
+# Weight of the squared offsets, keeps the problem strictly convex on straights where every offset has no curvature
+OFFSET_WEIGHT = 1e-6
+MAX_ITERATIONS = 100
+
+
+class RacingLine:
+    """
+    Line within the boundaries of a track, given by its lateral offsets (positive to the left) from the center line at
+    equidistant stations along it.
+    """
+
+    def __init__(
+        self,
+        s: np.ndarray,
+        offsets: np.ndarray,
+        positions: np.ndarray,
+        lower_bounds: np.ndarray,
+        upper_bounds: np.ndarray,
+        active: np.ndarray,
+        closed: bool,
+        iterations: int,
+    ):
+        """
+        :param s: Arc lengths of the stations on the center line
+        :param positions: Array (n, 2) of the world coordinates of the line
+        :param active: Active bound of every station: -1 lower, 1 upper, 0 none
+        :param closed: Flag whether the line is a closed loop (the last station is followed by the first one)
+        :param iterations: Number of iterations the solver took
+        """
+        self.s = s
+        self.offsets = offsets
+        self.positions = positions
+        self.lower_bounds = lower_bounds
+        self.upper_bounds = upper_bounds
+        self.active = active
+        self.closed = closed
+        self.iterations = iterations
+
+    def headings_and_curvatures(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        :return: Headings (rad) and curvatures (1/m) of the line from central differences of the positions
+        """
+        if self.closed:
+            first = (np.roll(self.positions, -1, axis=0) - np.roll(self.positions, 1, axis=0)) / 2
+            second = np.roll(self.positions, -1, axis=0) - 2 * self.positions + np.roll(self.positions, 1, axis=0)
+        else:
+            first = np.gradient(self.positions, axis=0)
+            second = np.gradient(first, axis=0)
+        cross = first[:, 0] * second[:, 1] - first[:, 1] * second[:, 0]
+        return np.arctan2(first[:, 1], first[:, 0]), cross / np.hypot(first[:, 0], first[:, 1]) ** 3
+
+    def to_columns(self) -> Dict[str, np.ndarray]:
+        headings, curvatures = self.headings_and_curvatures()
+        return {
+            "s": self.s,
+            "offset": self.offsets,
+            "x": self.positions[:, 0],
+            "y": self.positions[:, 1],
+            "heading": headings,
+            "curvature": curvatures,
+        }
+
+
+def _difference_operator(n: int, order: int, closed: bool):
+    """
+    :return: Sparse matrix of the forward differences (order 1) or central second differences (order 2) of n values,
+    with wrap around for closed lines
+    """
+    from scipy import sparse
+
+    coefficients = [-1.0, 1.0] if order == 1 else [1.0, -2.0, 1.0]
+    if closed:
+        # Entries (i, (i + k) mod n) lie on the diagonals k and k - n
+        diagonals = [c for k, c in enumerate(coefficients) for _ in range(1 if k == 0 else 2)]
+        offsets = [offset for k in range(order + 1) for offset in ([0] if k == 0 else [k, k - n])]
+        return sparse.diags(diagonals, offsets, shape=(n, n), format="csr")
+    return sparse.diags(coefficients, list(range(order + 1)), shape=(n - order, n), format="csr")
+
+
+def _solve_box_qp(
+    hessian, gradient: np.ndarray, lower: np.ndarray, upper: np.ndarray, active: np.ndarray, max_iterations: int
+) -> Tuple[np.ndarray, np.ndarray, int]:
+    """
+    Minimize 1/2 x^T H x + g^T x subject to lower <= x <= upper with the primal-dual active set method. Every iteration
+    fixes the active variables at their bounds and solves a sparse system for the free ones, the method stops once the
+    active set repeats. A good initial active set (warm start) needs few iterations.
+    :param active: Initial active set: -1 at the lower bound, 1 at the upper bound, 0 free
+    :return: Solution, final active set and number of iterations
+    """
+    from scipy.sparse.linalg import spsolve
+
+    hessian = hessian.tocsr()
+    # Scales the bound violations against the multipliers, the active set does not depend on it at the solution
+    c = float(hessian.diagonal().mean())
+    for iteration in range(1, max_iterations + 1):
+        x = np.where(active < 0, lower, np.where(active > 0, upper, 0.0))
+        free = np.flatnonzero(active == 0)
+        if len(free):
+            hessian_free = hessian[free]
+            rhs = -(gradient[free] + hessian_free @ x - hessian_free[:, free] @ x[free])
+            x[free] = spsolve(hessian_free[:, free].tocsc(), rhs)
+        multipliers = hessian @ x + gradient
+        next_active = np.where(multipliers + c * (lower - x) > 0.0, -1, np.where(multipliers + c * (upper - x) < 0.0, 1, 0)).astype(np.int8)
+        if np.array_equal(next_active, active):
+            return x, active, iteration
+        active = next_active
+    logm.warning("Racing line did not converge in %d iterations", max_iterations)
+    return np.clip(x, lower, upper), active, max_iterations
+
+
+def calc_racing_line(
+    track: Track,
+    bounds: str = "road",
+    spacing: float = DEFAULT_SPACING,
+    vehicle_width: float = DEFAULT_VEHICLE_WIDTH,
+    length_weight: float = DEFAULT_LENGTH_WEIGHT,
+    warm_start: Optional[RacingLine] = None,
+) -> RacingLine:
+    """
+    Calculate a minimum curvature line within the boundaries of a calculated track. The line is given by lateral offsets
+    from the center line at equidistant stations, the integral of the squared curvature (second differences) is
+    minimized as sparse quadratic program with the offsets limited to the boundaries.
+    :param bounds: "road" for both lanes (the right lane only beside traffic islands) or "lane" for the right lane
+    :param spacing: Maximum arc length in m between the stations
+    :param vehicle_width: Width of the vehicle in m, the line keeps half of it away from the boundaries
+    :param length_weight: Weight of the squared tangent length, values above 0 trade curvature for shorter lines (a
+    common approximation of minimum time lines)
+    :param warm_start: Optional racing line of a similar track (e.g. before a small edit), its active bounds are the
+    initial guess of the solver
+    """
+    from scipy import sparse
+
+    if bounds not in RACING_LINE_BOUNDS:
+        raise ValueError(f"Invalid racing line bounds: {bounds}")
+    if spacing <= 0.0:
+        raise ValueError(f"Invalid spacing: {spacing}")
+
+    path = track.get_centerline_path()
+    closed = path.is_closed()
+
+    num_steps = max(2, ceil(path.length / spacing - 1e-9))
+    s = np.arange(num_steps) * path.length / num_steps if closed else np.linspace(0.0, path.length, num_steps + 1)
+    h = path.length / num_steps
+    x, y, heading, _ = path.evaluate(s)
+    normal_x, normal_y = -np.sin(heading), np.cos(heading)
+
+    # Lane lines are centered at the lateral offset, the lanes beside traffic islands are moved outwards
+    lateral_offset = path.lateral_offset(s)
+    island_offset = lateral_offset - LINE_OFFSET
+    outer = lateral_offset - LINE_WIDTH / 2 - vehicle_width / 2
+    inner = island_offset + LINE_WIDTH / 2 + vehicle_width / 2
+    lower = -outer
+    upper = -inner if bounds == "lane" else np.where(island_offset > 0.0, -inner, outer)
+    if np.any(lower > upper):
+        raise ValueError(f"Vehicle of width {vehicle_width} does not fit between the {bounds} boundaries")
+
+    # Residuals of the weighted sums: curvature (second differences / h^2) and tangents (first differences / h) in x and
+    # y, integrated over the arc length, plus the offsets
+    n = len(s)
+    second_differences = _difference_operator(n, 2, closed) * h**-1.5
+    first_differences = _difference_operator(n, 1, closed) * np.sqrt(length_weight / h)
+    blocks, constants = [], []
+    for difference in (second_differences, first_differences):
+        for position, normal in ((x, normal_x), (y, normal_y)):
+            blocks.append(difference @ sparse.diags(normal))
+            constants.append(difference @ position)
+    blocks.append(sparse.identity(n) * np.sqrt(OFFSET_WEIGHT * h))
+    constants.append(np.zeros(n))
+    residuals = sparse.vstack(blocks).tocsr()
+    hessian = residuals.T @ residuals
+    gradient = residuals.T @ np.concatenate(constants)
+
+    active = np.zeros(n, dtype=np.int8)
+    if warm_start is not None and len(warm_start.s):
+        # Active bounds of the nearest station of the previous line, stations are matched by relative arc length
+        previous_stations = np.rint(s / max(path.length, 1e-12) * (len(warm_start.s) - (0 if warm_start.closed else 1))).astype(np.int64)
+        active = warm_start.active[np.clip(previous_stations, 0, len(warm_start.s) - 1)].copy()
+
+    offsets, active, iterations = _solve_box_qp(hessian, gradient, lower, upper, active, MAX_ITERATIONS)
+    positions = np.stack([x + offsets * normal_x, y + offsets * normal_y], axis=-1)
+    return RacingLine(s, offsets, positions, lower, upper, active, closed, iterations)
@@ -0,0 +1,415 @@
+# Copyright (C) 2024 twyleg
+from math import ceil, degrees, hypot, radians
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from track_generator.centerline import CenterlinePrimitive, Line, get_centerline_primitive
+from track_generator.track import (
+    LINE_OFFSET,
+    TRACK_WIDTH,
+    BackgroundColor,
+    Clothoid,
+    ClothoidDirection,
+    ClothoidType,
+    Crosswalk,
+    Intersection,
+    IntersectionDirection,
+    ParkingArea,
+    Start,
+    Straight,
+    Track,
+    TrafficIsland,
+    Turn,
+)
+
+SEGMENT_TYPES = ["Straight", "Turn", "Clothoid", "Crosswalk", "Intersection", "ParkingArea", "TrafficIsland"]
+DEFAULT_WEIGHTS = {"Straight": 3.0, "Turn": 4.0, "Clothoid": 1.0, "Crosswalk": 0.5, "Intersection": 0.5, "ParkingArea": 0.5, "TrafficIsland": 0.5}
+# Arc length in m around a joint of two segments within which their footprints may share grid cells
+JOINT_LENGTH = TRACK_WIDTH
+# Maximum angle in degrees of the turns that close a loop
+MAX_CLOSING_ANGLE = 270.0
+# Distance in m (and angle in rad) up to which the closing turns and straight have to end at the start of the track
+CLOSING_TOLERANCE = 1e-6
+# Distance in m between the samples of the center line of a segment that are checked before its footprint
+CENTERLINE_SAMPLE_DISTANCE = 0.1
+# Number of segments in a row that do not fit after which the last segment is removed
+MAX_FAILURES = 10
+
+SPOT_TYPES = ["free", "blocked", "occupied"]
+
+Pose = Tuple[float, float, float]
+Range = Tuple[float, float]
+
+
+class SegmentGrammar:
+    """
+    Weights of the segment types that are appended to random tracks and the ranges of their parameters (lengths in m,
+    angles in degrees). The parameters are drawn uniformly and rounded to mm and tenths of a degree.
+    """
+
+    def __init__(self, weights: Optional[Dict[str, float]] = None):
+        """
+        :param weights: Relative frequency of every segment type in SEGMENT_TYPES, missing types are not used
+        """
+        weights = DEFAULT_WEIGHTS if weights is None else weights
+        unknown = set(weights) - set(SEGMENT_TYPES)
+        if unknown or any(weight < 0.0 for weight in weights.values()) or sum(weights.values()) <= 0.0:
+            raise ValueError(f"Invalid segment weights: {weights}")
+        self.segment_types = [segment_type for segment_type in SEGMENT_TYPES if weights.get(segment_type, 0.0) > 0.0]
+        self.cumulative_weights = np.cumsum([weights[segment_type] for segment_type in self.segment_types]) / sum(weights.values())
+
+        self.straight_length: Range = (0.5, 2.0)
+        self.turn_radius: Range = (0.8, 2.0)
+        self.turn_angle: Range = (30.0, 180.0)
+        self.clothoid_a: Range = (1.0, 2.0)
+        self.clothoid_angle: Range = (20.0, 90.0)
+        self.crosswalk_length: Range = (0.4, 0.8)
+        self.intersection_length: Range = (1.4, 2.0)
+        self.parking_spots: Tuple[int, int] = (2, 5)
+        self.parking_spot_length: Range = (0.3, 0.5)
+        self.parking_depth = 0.3
+        self.island_width: Range = (0.2, 0.5)
+        self.island_crosswalk_length: Range = (0.4, 0.6)
+        self.island_curve_segment_length: Range = (0.6, 1.0)
+
+    @staticmethod
+    def _uniform(rng: np.random.Generator, value_range: Range, decimals: int = 3) -> float:
+        return round(float(rng.uniform(*value_range)), decimals)
+
+    def _sample_parking_area(self, rng: np.random.Generator) -> ParkingArea:
+        spots = [
+            ParkingArea.ParkingLot.Spot(SPOT_TYPES[int(rng.integers(len(SPOT_TYPES)))], self._uniform(rng, self.parking_spot_length))
+            for _ in range(int(rng.integers(self.parking_spots[0], self.parking_spots[1] + 1)))
+        ]
+        opening_ending_angle = 45.0 if rng.random() < 0.5 else 60.0
+        lot_length = sum(spot.length for spot in spots) + 2 * self.parking_depth / np.tan(radians(opening_ending_angle))
+        margin = self._uniform(rng, (0.0, 1.0))
+        start = round(float(rng.uniform(0.0, margin)), 3)
+        lots = [ParkingArea.ParkingLot(start, self.parking_depth, opening_ending_angle, spots)]
+        length = round(lot_length + margin, 3)
+        return ParkingArea(length, lots, []) if rng.random() < 0.5 else ParkingArea(length, [], lots)
+
+    def sample(self, rng: np.random.Generator):
+        """
+        :return: A new segment of a random type with random parameters
+        """
+        segment_type = self.segment_types[min(int(np.searchsorted(self.cumulative_weights, rng.random(), side="right")), len(self.segment_types) - 1)]
+        if segment_type == "Straight":
+            return Straight(self._uniform(rng, self.straight_length))
+        elif segment_type == "Turn":
+            return Turn(self._uniform(rng, self.turn_radius), self._uniform(rng, self.turn_angle, 1), bool(rng.random() < 0.5))
+        elif segment_type == "Clothoid":
+            clothoid_direction = ClothoidDirection.LEFT if rng.random() < 0.5 else ClothoidDirection.RIGHT
+            clothoid_type = ClothoidType.CLOSING if rng.random() < 0.5 else ClothoidType.OPEND
+            return Clothoid(self._uniform(rng, self.clothoid_a), self._uniform(rng, self.clothoid_angle, 1), 0.0, clothoid_direction, clothoid_type)
+        elif segment_type == "Crosswalk":
+            return Crosswalk(self._uniform(rng, self.crosswalk_length))
+        elif segment_type == "Intersection":
+            intersection_direction = [IntersectionDirection.STRAIGHT, IntersectionDirection.LEFT, IntersectionDirection.RIGHT][int(rng.integers(3))]
+            return Intersection(self._uniform(rng, self.intersection_length), intersection_direction)
+        elif segment_type == "ParkingArea":
+            return self._sample_parking_area(rng)
+        else:
+            island_width = self._uniform(rng, self.island_width)
+            crosswalk_length = self._uniform(rng, self.island_crosswalk_length)
+            return TrafficIsland(island_width, crosswalk_length, self._uniform(rng, self.island_curve_segment_length), 1.0)
+
+
+def _corridor(primitive: CenterlinePrimitive, right: float, left: float, step: float) -> np.ndarray:
+    """
+    :return: Points (n, 2) in the start coordinate system of the primitive that cover the area between the given
+    distances to the right and to the left of its center line with a spacing of at most step
+    """
+    s = np.linspace(0.0, primitive.length, max(2, ceil(primitive.length / step) + 1))
+    offsets = np.linspace(-right, left, max(2, ceil((left + right) / step) + 1))
+    x, y, heading, _ = primitive.evaluate(s)
+    points_x = x[:, np.newaxis] - np.sin(heading)[:, np.newaxis] * offsets
+    points_y = y[:, np.newaxis] + np.cos(heading)[:, np.newaxis] * offsets
+    return np.stack([points_x.ravel(), points_y.ravel()], axis=-1)
+
+
+class _Piece:
+    def __init__(self, segment, start_pose: Pose, end_pose: Pose, s_start: float, s_end: float):
+        self.segment = segment
+        self.start_pose = start_pose
+        self.end_pose = end_pose
+        self.s_start = s_start
+        self.s_end = s_end
+        self.cells = np.empty(0, dtype=np.int64)
+
+
+class _Layout:
+    """
+    Segments of a track under construction with an occupancy grid of their footprints. Every grid cell holds the index
+    of the first piece that covers it or -1.
+    """
+
+    def __init__(self, generator: "RandomTrackGenerator", start_pose: Pose):
+        self.generator = generator
+        self.start_pose = start_pose
+        self.grid_shape = (ceil(generator.height / generator.cell_size), ceil(generator.width / generator.cell_size))
+        self.grid = np.full(self.grid_shape[0] * self.grid_shape[1], -1, dtype=np.int32)
+        self.pieces: List[_Piece] = []
+        self.s_starts = np.empty(0)
+        self.s_ends = np.empty(0)
+
+    @property
+    def end_pose(self) -> Pose:
+        return self.pieces[-1].end_pose if self.pieces else self.start_pose
+
+    @property
+    def length(self) -> float:
+        return self.pieces[-1].s_end if self.pieces else 0.0
+
+    def _extents(self, segment) -> Tuple[float, float]:
+        """
+        :return: Distances in m of the footprint of the segment to the right and to the left of its center line
+        """
+        right = left = TRACK_WIDTH / 2 + self.generator.clearance
+        if isinstance(segment, ParkingArea):
+            depth = max([lot.depth for lot in segment.right_lots + segment.left_lots], default=0.0)
+            right += (LINE_OFFSET + depth - TRACK_WIDTH / 2) if segment.right_lots else 0.0
+            left += (LINE_OFFSET + depth - TRACK_WIDTH / 2) if segment.left_lots else 0.0
+        elif isinstance(segment, TrafficIsland):
+            right += segment.island_width / 2
+            left += segment.island_width / 2
+        return right, left
+
+    @staticmethod
+    def _to_world(points: np.ndarray, pose: Pose) -> np.ndarray:
+        x, y, heading = pose
+        c, s = np.cos(heading), np.sin(heading)
+        return np.stack([x + c * points[:, 0] - s * points[:, 1], y + s * points[:, 0] + c * points[:, 1]], axis=-1)
+
+    def centerline(self, segment, primitive: CenterlinePrimitive, pose: Pose) -> np.ndarray:
+        """
+        :return: Samples (n, 2) of the center line of the segment at the pose in world coordinates, of both roads of
+        intersections
+        """
+        if isinstance(segment, Intersection):
+            line = Line(segment.length)
+            x, y, _, _ = line.evaluate(np.linspace(0.0, line.length, max(2, ceil(line.length / CENTERLINE_SAMPLE_DISTANCE) + 1)))
+            points = np.concatenate([np.stack([x, y], axis=-1), np.stack([np.full_like(x, line.length / 2), x - line.length / 2], axis=-1)])
+        else:
+            x, y, _, _ = primitive.evaluate(np.linspace(0.0, primitive.length, max(2, ceil(primitive.length / CENTERLINE_SAMPLE_DISTANCE) + 1)))
+            points = np.stack([x, y], axis=-1)
+        return self._to_world(points, pose)
+
+    def footprint(self, segment, primitive: CenterlinePrimitive, pose: Pose) -> np.ndarray:
+        """
+        :return: Points (n, 2) in world coordinates that cover the segment at the pose with the clearance around it
+        """
+        right, left = self._extents(segment)
+        step = self.generator.cell_size / 2
+        if isinstance(segment, Intersection):
+            # Both roads of the crossing, whatever the direction
+            cross = _corridor(Line(segment.length), right, left, step)
+            points = np.concatenate([cross, np.stack([segment.length / 2 - cross[:, 1], cross[:, 0] - segment.length / 2], axis=-1)])
+        else:
+            points = _corridor(primitive, right, left, step)
+        return self._to_world(points, pose)
+
+    def _cells(self, points: np.ndarray) -> np.ndarray:
+        cell_size = self.generator.cell_size
+        rows = np.clip(((self.generator.height - points[:, 1]) / cell_size).astype(np.int64), 0, self.grid_shape[0] - 1)
+        cols = np.clip((points[:, 0] / cell_size).astype(np.int64), 0, self.grid_shape[1] - 1)
+        return rows * self.grid_shape[1] + cols
+
+    def _overlaps(self, points: np.ndarray, owners: np.ndarray, radius: float, closing_joint: bool) -> bool:
+        """
+        :param owners: Pieces that own the grid cells of the points or -1
+        :param radius: Distance from the joints within which the points may be in the cells of neighbouring pieces
+        :return: Flag whether any point is in the cell of a piece that is not a neighbour around a joint
+        """
+        conflicts = np.flatnonzero(owners >= 0)
+        if len(conflicts) == 0:
+            return False
+        joints = [(self.end_pose[0], self.end_pose[1], self.length)]
+        if closing_joint:
+            joints.append((self.start_pose[0], self.start_pose[1], 0.0))
+        conflict_owners = owners[conflicts]
+        is_allowed = np.zeros(len(conflicts), dtype=bool)
+        for x, y, s in joints:
+            is_near = np.hypot(points[conflicts, 0] - x, points[conflicts, 1] - y) < radius
+            is_adjacent = (self.s_ends[conflict_owners] >= s - JOINT_LENGTH) & (self.s_starts[conflict_owners] <= s + JOINT_LENGTH)
+            is_allowed |= is_near & is_adjacent
+        return not np.all(is_allowed)
+
+    def append(self, segment, closing_joint: bool = False) -> bool:
+        """
+        Append the segment if its footprint is inside the track area and does not overlap the footprints of the
+        previous segments, except around the joints with its neighbours. The center line is checked first, the
+        footprint is only sampled for segments that pass.
+        :param closing_joint: Flag whether the segment ends at the start of the track
+        :return: Flag whether the segment was appended
+        """
+        start_pose = self.end_pose
+        primitive = get_centerline_primitive(segment)
+        assert primitive is not None
+        extent = max(self._extents(segment))
+        radius = extent + 2 * self.generator.cell_size
+
+        # The footprint is within the extent of the center line
+        center = self.centerline(segment, primitive, start_pose)
+        if np.any(center < extent) or np.any(center[:, 0] > self.generator.width - extent) or np.any(center[:, 1] > self.generator.height - extent):
+            return False
+        if self._overlaps(center, self.grid[self._cells(center)], radius, closing_joint):
+            return False
+
+        points = self.footprint(segment, primitive, start_pose)
+        cells = self._cells(points)
+        owners = self.grid[cells]
+        if self._overlaps(points, owners, radius, closing_joint):
+            return False
+
+        x, y, heading, _ = primitive.evaluate(np.array([primitive.length]))
+        end_x, end_y = self._to_world(np.array([[x[0], y[0]]]), start_pose)[0]
+        piece = _Piece(segment, start_pose, (float(end_x), float(end_y), start_pose[2] + float(heading[0])), self.length, self.length + primitive.length)
+        piece.cells = np.unique(cells[owners < 0])
+        self.grid[piece.cells] = len(self.pieces)
+        self.pieces.append(piece)
+        self.s_starts = np.append(self.s_starts, piece.s_start)
+        self.s_ends = np.append(self.s_ends, piece.s_end)
+        return True
+
+    def pop(self) -> None:
+        piece = self.pieces.pop()
+        self.grid[piece.cells] = -1
+        self.s_starts = self.s_starts[:-1]
+        self.s_ends = self.s_ends[:-1]
+
+
+def _closing_paths(pose: Pose, target: Pose, radius: float) -> List[Tuple[float, List]]:
+    """
+    Paths of a turn, a straight and a turn with the given radius from the pose to the target pose (Dubins paths with
+    two turns).
+    :return: Pairs of the length and the segments of every path that exists, zero length segments are left out
+    """
+    x, y, heading = pose
+    target_x, target_y, target_heading = target
+    paths = []
+    for first_left in [True, False]:
+        for second_left in [True, False]:
+            first_sign = 1.0 if first_left else -1.0
+            second_sign = 1.0 if second_left else -1.0
+            center = np.array([x - first_sign * radius * np.sin(heading), y + first_sign * radius * np.cos(heading)])
+            target_center = np.array([target_x - second_sign * radius * np.sin(target_heading), target_y + second_sign * radius * np.cos(target_heading)])
+            difference = target_center - center
+            distance = hypot(*difference)
+            if first_left == second_left:
+                straight_length = distance
+                straight_heading = np.arctan2(difference[1], difference[0])
+            else:
+                if distance < 2 * radius:
+                    continue
+                straight_length = np.sqrt(distance**2 - 4 * radius**2)
+                straight_heading = np.arctan2(difference[1], difference[0]) + first_sign * np.arctan2(2 * radius, straight_length)
+            first_angle = (first_sign * (straight_heading - heading)) % (2 * np.pi)
+            second_angle = (second_sign * (target_heading - straight_heading)) % (2 * np.pi)
+            if degrees(max(first_angle, second_angle)) > MAX_CLOSING_ANGLE:
+                continue
+            segments: List = []
+            if degrees(first_angle) > CLOSING_TOLERANCE:
+                segments.append(Turn(radius, degrees(first_angle), not first_left))
+            if straight_length > CLOSING_TOLERANCE:
+                segments.append(Straight(float(straight_length)))
+            if degrees(second_angle) > CLOSING_TOLERANCE:
+                segments.append(Turn(radius, degrees(second_angle), not second_left))
+            paths.append((radius * (first_angle + second_angle) + straight_length, segments))
+    return sorted(paths, key=lambda path: path[0])
+
+
+class RandomTrackGenerator:
+    """
+    Generates random tracks that fit into an area of the given size from the segments of a SegmentGrammar. Segments are
+    appended one after the other; every segment is checked against the area and an occupancy grid of the segments
+    before, so overlapping layouts are rejected as soon as they arise instead of after calculating the whole track.
+    When no segment fits, the last segment is removed again. Closed tracks are closed with two turns and a straight
+    back to the start. A track only depends on the seed, so a data set is reproduced from its seeds.
+    """
+
+    def __init__(
+        self,
+        width: float,
+        height: float,
+        grammar: Optional[SegmentGrammar] = None,
+        num_segments: Tuple[int, int] = (6, 16),
+        closed: bool = True,
+        clearance: float = 0.1,
+        cell_size: float = 0.1,
+        max_attempts: int = 100,
+        max_restarts: int = 200,
+    ):
+        """
+        :param width: Width of the track area in m (Size of the track)
+        :param height: Height of the track area in m
+        :param grammar: Segment types and parameter ranges, the defaults of SegmentGrammar if None
+        :param num_segments: Minimum and maximum number of random segments, closed tracks get up to three more
+        :param closed: Flag whether the tracks are closed loops
+        :param clearance: Minimum distance in m between the footprints of segments and to the border of the area
+        :param cell_size: Size of the cells of the occupancy grid in m, at most the clearance
+        :param max_attempts: Maximum number of segments that are tried from a start pose
+        :param max_restarts: Maximum number of start poses that are tried for a track before giving up
+        """
+        if width <= 2 * TRACK_WIDTH or height <= 2 * TRACK_WIDTH:
+            raise ValueError(f"Track area too small: {width} x {height}")
+        if not 0 < num_segments[0] <= num_segments[1]:
+            raise ValueError(f"Invalid number of segments: {num_segments}")
+        if not 0.0 < cell_size <= clearance:
+            raise ValueError(f"Invalid cell size or clearance: {cell_size}, {clearance}")
+        self.width = width
+        self.height = height
+        self.grammar = SegmentGrammar() if grammar is None else grammar
+        self.num_segments = num_segments
+        self.closed = closed
+        self.clearance = clearance
+        self.cell_size = cell_size
+        self.max_attempts = max_attempts
+        self.max_restarts = max_restarts
+
+    def _close(self, layout: _Layout) -> bool:
+        radii = np.linspace(self.grammar.turn_radius[1], self.grammar.turn_radius[0], 4)
+        paths = [path for radius in radii for path in _closing_paths(layout.end_pose, layout.start_pose, float(radius))]
+        for _, segments in sorted(paths, key=lambda path: path[0]):
+            num_pieces = len(layout.pieces)
+            if all(layout.append(segment, closing_joint=i == len(segments) - 1) for i, segment in enumerate(segments)):
+                return True
+            while len(layout.pieces) > num_pieces:
+                layout.pop()
+        return False
+
+    def _grow(self, layout: _Layout, rng: np.random.Generator) -> bool:
+        num_segments = int(rng.integers(self.num_segments[0], self.num_segments[1] + 1))
+        failures = 0
+        for _ in range(self.max_attempts):
+            if len(layout.pieces) >= self.num_segments[1] or failures >= MAX_FAILURES:
+                # Dead end, replace the last segment or try another start pose
+                if not layout.pieces:
+                    return False
+                layout.pop()
+                failures = 0
+            if layout.append(self.grammar.sample(rng)):
+                failures = 0
+                if len(layout.pieces) >= num_segments and (not self.closed or self._close(layout)):
+                    return True
+            else:
+                failures += 1
+        return False
+
+    def generate(self, seed: int) -> Track:
+        """
+        :param seed: Seed of the random numbers, the same seed gives the same track
+        :return: New track that is not calculated yet, with the origin at the lower left corner of the area
+        """
+        rng = np.random.default_rng(seed)
+        margin = TRACK_WIDTH / 2 + self.clearance
+        for _ in range(self.max_restarts):
+            start_pose = (float(rng.uniform(margin, self.width - margin)), float(rng.uniform(margin, self.height - margin)), float(rng.uniform(-np.pi, np.pi)))
+            start_pose = (round(start_pose[0], 3), round(start_pose[1], 3), radians(round(degrees(start_pose[2]), 1)))
+            layout = _Layout(self, start_pose)
+            if self._grow(layout, rng):
+                start = Start(start_pose[0], start_pose[1], degrees(start_pose[2]))
+                segments = [start] + [piece.segment for piece in layout.pieces]
+                return Track("0.0.1", self.width, self.height, (0.0, 0.0), BackgroundColor("#545454", 1.0), segments)
+        raise RuntimeError(f"No track found for seed {seed}")
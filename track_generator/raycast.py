@@ -0,0 +1,240 @@
+# Copyright (C) 2024 twyleg
+from typing import Tuple, Union
+
+import numpy as np
+
+from track_generator.label_raster import LabelClass
+from track_generator.spatial_index import SpatialIndex, UniformGrid
+from track_generator.track import Track
+
+DEFAULT_CELL_SIZE = 0.1
+DEFAULT_MAX_RANGE = 5.0
+# Number of rays traced at once, limits the memory of the candidate pairs
+CHUNK_SIZE = 65536
+# Classes of the strokes that rays hit
+MARKING_CLASSES = [
+    LabelClass.LANE_LINE,
+    LabelClass.CENTER_LINE,
+    LabelClass.STOP_LINE,
+    LabelClass.CROSSWALK,
+    LabelClass.PARKING_OUTLINE,
+    LabelClass.BLOCKED_AREA,
+]
+
+ArrayLike = Union[float, np.ndarray]
+
+
+class Raycaster:
+    """
+    Sensor models on the markings of a calculated track, with the shapes of its spatial index, so sensor data and the
+    track images agree:
+        2D lidar: rays in the ground plane hit the strokes of the markings (lines, stop lines, crosswalk stripes,
+        parking outlines and blocker crosses) with their widths and dashes
+        downward camera: classes of a grid of ground points below the vehicle, like the label raster
+    Rays are traced in lockstep through a uniform grid over the marking strokes, every step tests the strokes in the
+    current cell of every ray that has not hit a marking yet.
+    """
+
+    def __init__(self, spatial_index: SpatialIndex, cell_size: float = DEFAULT_CELL_SIZE):
+        """
+        :param cell_size: Size of the grid cells in m
+        """
+        if cell_size <= 0.0:
+            raise ValueError(f"Invalid cell size: {cell_size}")
+        self.spatial_index = spatial_index
+        self.strokes = np.flatnonzero(np.isin(spatial_index.shape_label[spatial_index.stroke_shape], MARKING_CLASSES))
+
+        stroke_min = spatial_index.stroke_min[self.strokes]
+        stroke_max = spatial_index.stroke_max[self.strokes]
+        self.origin = stroke_min.min(axis=0) if len(self.strokes) else np.zeros(2)
+        extent = stroke_max.max(axis=0) - self.origin if len(self.strokes) else np.zeros(2)
+        self.shape = (int(extent[0] // cell_size) + 1, int(extent[1] // cell_size) + 1)
+        self.cell_size = cell_size
+        self.grid = UniformGrid(stroke_min, stroke_max, self.origin, cell_size, self.shape)
+
+        # Geometry of the marking strokes, round joins have no direction
+        self.p0 = spatial_index.stroke_p0[self.strokes]
+        direction = spatial_index.stroke_p1[self.strokes] - self.p0
+        self.length = np.hypot(direction[:, 0], direction[:, 1])
+        self.unit = direction / np.where(self.length > 0.0, self.length, 1.0)[:, np.newaxis]
+        self.half_width = spatial_index.stroke_half_width[self.strokes]
+        self.s0 = spatial_index.stroke_s0[self.strokes]
+        self.dash_length = spatial_index.stroke_dash_length[self.strokes]
+        self.dash_period = spatial_index.stroke_dash_period[self.strokes]
+        self.is_round = spatial_index.stroke_round[self.strokes]
+
+    @classmethod
+    def from_track(cls, track: Track, cell_size: float = DEFAULT_CELL_SIZE) -> "Raycaster":
+        """
+        :param track: The calculated track
+        :param cell_size: Size of the grid cells in m
+        """
+        return cls(track.get_spatial_index(), cell_size)
+
+    def _intersect(self, origins: np.ndarray, directions: np.ndarray, strokes: np.ndarray) -> np.ndarray:
+        """
+        :param strokes: Indices into the marking strokes
+        :return: Distance along the rays to the first point on a dash of the strokes, inf if the rays miss them
+        """
+        relative = origins - self.p0[strokes]
+        unit, length, half_width = self.unit[strokes], self.length[strokes], self.half_width[strokes]
+        along = relative[:, 0] * unit[:, 0] + relative[:, 1] * unit[:, 1]
+        across = relative[:, 1] * unit[:, 0] - relative[:, 0] * unit[:, 1]
+        along_direction = directions[:, 0] * unit[:, 0] + directions[:, 1] * unit[:, 1]
+        across_direction = directions[:, 1] * unit[:, 0] - directions[:, 0] * unit[:, 1]
+
+        # Butt capped strokes: rectangles in the coordinate system of the stroke (slab method)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            along_0, along_1 = -along / along_direction, (length - along) / along_direction
+            across_0, across_1 = (-half_width - across) / across_direction, (half_width - across) / across_direction
+        along_enter = np.where(along_direction == 0.0, np.where((along >= 0.0) & (along <= length), -np.inf, np.inf), np.minimum(along_0, along_1))
+        along_exit = np.where(along_direction == 0.0, np.where((along >= 0.0) & (along <= length), np.inf, -np.inf), np.maximum(along_0, along_1))
+        across_enter = np.where(across_direction == 0.0, np.where(np.abs(across) <= half_width, -np.inf, np.inf), np.minimum(across_0, across_1))
+        across_exit = np.where(across_direction == 0.0, np.where(np.abs(across) <= half_width, np.inf, -np.inf), np.maximum(across_0, across_1))
+        t_enter = np.maximum(np.maximum(along_enter, across_enter), 0.0)
+        t_exit = np.minimum(along_exit, across_exit)
+
+        # Round joins: discs around their point
+        b = relative[:, 0] * directions[:, 0] + relative[:, 1] * directions[:, 1]
+        c = relative[:, 0] ** 2 + relative[:, 1] ** 2 - half_width**2
+        root = np.sqrt(np.maximum(b**2 - c, 0.0))
+        is_round = self.is_round[strokes]
+        t_enter = np.where(is_round, np.maximum(-b - root, 0.0), t_enter)
+        t_exit = np.where(is_round, np.where(b**2 >= c, -b + root, -np.inf), t_exit)
+
+        # The first point on a dash: the entry point or the start (end) of the next dash in the direction of the ray
+        period = self.dash_period[strokes]
+        dash_length = self.dash_length[strokes]
+        safe_period = np.where(period > 0.0, period, 1.0)
+        s_enter = self.s0[strokes] + np.where(is_round, 0.0, along + t_enter * along_direction)
+        phase = np.mod(s_enter, safe_period)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            t_dash = t_enter + np.where(along_direction > 0.0, safe_period - phase, dash_length - phase) / along_direction
+        is_on_dash = (period == 0.0) | (phase < dash_length)
+        t_hit = np.where(is_on_dash, t_enter, np.where(is_round | (along_direction == 0.0), np.inf, t_dash))
+        return np.where((t_enter <= t_exit) & (t_hit <= t_exit), t_hit, np.inf)
+
+    def _cast_chunk(self, origins: np.ndarray, directions: np.ndarray, max_range: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        distances = np.full(len(origins), np.inf)
+        strokes = np.full(len(origins), -1, dtype=np.int64)
+        if not len(self.strokes):
+            return distances, strokes
+
+        # Start of the rays within the grid
+        grid_min, grid_max = self.origin, self.origin + np.array(self.shape) * self.cell_size
+        with np.errstate(divide="ignore", invalid="ignore"):
+            t_0, t_1 = (grid_min - origins) / directions, (grid_max - origins) / directions
+        is_parallel = directions == 0.0
+        is_within = (origins >= grid_min) & (origins <= grid_max)
+        t_enter = np.where(is_parallel, np.where(is_within, -np.inf, np.inf), np.minimum(t_0, t_1)).max(axis=1)
+        t_exit = np.where(is_parallel, np.where(is_within, np.inf, -np.inf), np.maximum(t_0, t_1)).min(axis=1)
+        t_start = np.maximum(t_enter, 0.0)
+        t_end = np.minimum(t_exit, max_range)
+
+        # Cells along the rays (Amanatides and Woo): distance to the next cell boundary in x and y and between them
+        start_points = origins + t_start[:, np.newaxis] * directions
+        cells = np.clip(np.floor((start_points - self.origin) / self.cell_size).astype(np.int64), 0, np.array(self.shape) - 1)
+        steps = np.where(directions > 0.0, 1, -1)
+        with np.errstate(divide="ignore"):
+            t_delta = self.cell_size / np.abs(directions)
+            next_boundaries = self.origin + (cells + (steps > 0)) * self.cell_size
+            t_next = np.where(is_parallel, np.inf, (next_boundaries - origins) / np.where(is_parallel, 1.0, directions))
+
+        # State of the rays that did not hit a marking yet, compacted after every step
+        rays = np.flatnonzero(t_start <= t_end)
+        cells_x, cells_y = cells[rays, 0], cells[rays, 1]
+        steps_x, steps_y = steps[rays, 0], steps[rays, 1]
+        t_next_x, t_next_y = t_next[rays, 0], t_next[rays, 1]
+        t_delta_x, t_delta_y = t_delta[rays, 0], t_delta[rays, 1]
+        ray_t_end = t_end[rays]
+        while len(rays):
+            queries, candidates = self.grid.candidates(cells_y * self.shape[0] + cells_x)
+            if len(queries):
+                query_rays = rays[queries]
+                t_hit = self._intersect(origins[query_rays], directions[query_rays], candidates)
+                np.minimum.at(distances, query_rays, t_hit)
+                is_closest = np.isfinite(t_hit) & (t_hit == distances[query_rays])
+                strokes[query_rays[is_closest]] = self.strokes[candidates[is_closest]]
+
+            # Hits within the current cell are final, strokes that reach into later cells are tested there again
+            is_step_x = t_next_x < t_next_y
+            t_cell_exit = np.where(is_step_x, t_next_x, t_next_y)
+            cells_x = cells_x + np.where(is_step_x, steps_x, 0)
+            cells_y = cells_y + np.where(is_step_x, 0, steps_y)
+            t_next_x = t_next_x + np.where(is_step_x, t_delta_x, 0.0)
+            t_next_y = t_next_y + np.where(is_step_x, 0.0, t_delta_y)
+            is_active = (
+                (distances[rays] > t_cell_exit)
+                & (t_cell_exit <= ray_t_end)
+                & (cells_x >= 0)
+                & (cells_x < self.shape[0])
+                & (cells_y >= 0)
+                & (cells_y < self.shape[1])
+            )
+            rays, cells_x, cells_y, steps_x, steps_y = rays[is_active], cells_x[is_active], cells_y[is_active], steps_x[is_active], steps_y[is_active]
+            t_next_x, t_next_y, t_delta_x, t_delta_y, ray_t_end = (
+                t_next_x[is_active],
+                t_next_y[is_active],
+                t_delta_x[is_active],
+                t_delta_y[is_active],
+                ray_t_end[is_active],
+            )
+
+        is_hit = distances <= max_range
+        return np.where(is_hit, distances, np.inf), np.where(is_hit, strokes, -1)
+
+    def cast(self, origins: np.ndarray, angles: np.ndarray, max_range: ArrayLike = DEFAULT_MAX_RANGE) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        :param origins: Array (n, 2) of the ray origins in world coordinates
+        :param angles: Directions of the rays (rad) in world coordinates
+        :param max_range: Maximum distance of the hits in m
+        :return: Distance to the first marking (inf for none), its LabelClass (BACKGROUND for none) and shape index in the
+        spatial index (-1 for none) for every ray
+        """
+        origins = np.asarray(origins, dtype=float).reshape(-1, 2)
+        angles = np.ravel(angles)
+        directions = np.stack([np.cos(angles), np.sin(angles)], axis=-1)
+        max_range = np.broadcast_to(np.asarray(max_range, dtype=float), len(origins))
+        distances = np.empty(len(origins))
+        strokes = np.empty(len(origins), dtype=np.int64)
+        for start in range(0, len(origins), CHUNK_SIZE):
+            chunk = slice(start, start + CHUNK_SIZE)
+            distances[chunk], strokes[chunk] = self._cast_chunk(origins[chunk], directions[chunk], max_range[chunk])
+
+        shapes = np.where(strokes >= 0, self.spatial_index.stroke_shape[np.maximum(strokes, 0)], -1)
+        labels = np.where(shapes >= 0, self.spatial_index.shape_label[np.maximum(shapes, 0)], LabelClass.BACKGROUND).astype(np.uint8)
+        return distances, labels, shapes
+
+    def scan(self, poses: np.ndarray, angles: np.ndarray, max_range: float = DEFAULT_MAX_RANGE) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Simulate a 2D lidar at every pose.
+        :param poses: Array (n, 3) of sensor poses: x, y and heading (rad) in world coordinates
+        :param angles: Array (m,) of the ray directions (rad) relative to the heading
+        :param max_range: Maximum distance of the hits in m
+        :return: Arrays (n, m) of the distances (inf for no hit) and LabelClass of the hit markings
+        """
+        poses = np.asarray(poses, dtype=float).reshape(-1, 3)
+        angles = np.ravel(angles)
+        origins = np.repeat(poses[:, :2], len(angles), axis=0)
+        distances, labels, _ = self.cast(origins, (poses[:, 2:3] + angles).ravel(), max_range)
+        return distances.reshape(len(poses), len(angles)), labels.reshape(len(poses), len(angles))
+
+    def downward_camera(self, poses: np.ndarray, size: Tuple[float, float], resolution: float, offset: Tuple[float, float] = (0.0, 0.0)) -> np.ndarray:
+        """
+        Simulate a camera looking straight down at every pose, its pixels show the class of the ground below them.
+        :param poses: Array (n, 3) of vehicle poses: x, y and heading (rad) in world coordinates
+        :param size: Length (along the heading) and width in m of the ground area that the camera sees
+        :param resolution: Size of a pixel on the ground in m
+        :param offset: Center of the ground area in the vehicle coordinate system (forward, left) in m
+        :return: Array (n, rows, columns) of LabelClass, row 0 is the far end, column 0 is the left side
+        """
+        poses = np.asarray(poses, dtype=float).reshape(-1, 3)
+        rows, columns = max(1, round(size[0] / resolution)), max(1, round(size[1] / resolution))
+        forward = offset[0] + (rows / 2 - 0.5 - np.arange(rows)) * resolution
+        left = offset[1] + (columns / 2 - 0.5 - np.arange(columns)) * resolution
+        forward_grid, left_grid = np.meshgrid(forward, left, indexing="ij")
+        cos, sin = np.cos(poses[:, 2])[:, np.newaxis], np.sin(poses[:, 2])[:, np.newaxis]
+        x = poses[:, 0:1] + forward_grid.ravel() * cos - left_grid.ravel() * sin
+        y = poses[:, 1:2] + forward_grid.ravel() * sin + left_grid.ravel() * cos
+        _, labels = self.spatial_index.query_labels(np.stack([x.ravel(), y.ravel()], axis=-1))
+        return labels.reshape(len(poses), rows, columns)
@@ -0,0 +1,343 @@
+# Copyright (C) 2024 twyleg
+import base64
+import json
+import logging
+import os
+import socket
+import socketserver
+import threading
+import urllib.error
+import urllib.request
+from concurrent.futures import Future, ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from track_generator.artifacts import to_bytes
+
+
+logm = logging.getLogger(__name__)
+
+
+class JobError(Exception):
+    pass
+
+
+class RenderJob:
+    """
+    A generation job. The track is either given by the path of a track file or by the track definition (XML) itself.
+
+    Jobs are exchanged as JSON objects with the following keys:
+        track_file: Path of the track file (XML)
+        track_xml: Track definition (XML) as string, alternative to track_file
+        track_name: Name of the track, required with track_xml. Default: track file name
+        base_dir: Directory to resolve relative references of track_xml against. Default: working dir of the service
+        output: Output directory for the track. Default: <service output directory>/<track_name>
+        png, gazebo, ground_truth: Same as the generate_track flags. Default: false
+        ground_truth_spacing: Arc length spacing in m to resample the ground truth densely with. Default: none
+        ground_truth_formats: List of ground truth formats ("xml", "npz", "raw"). Default: ["xml"]
+        labels: Generate a class map (PNG) aligned with the track PNG. Default: false
+        labels_rle: Generate run-length encoded masks of all classes in addition (JSON). Default: false
+        map_resolution: Cell size in m of the planner maps (occupancy grid, distance and heading field). Default: none
+        racing_line: Boundaries ("lane" or "road") of a minimum curvature racing line (NPZ). Default: none
+        return_bytes: Return the content of the artifacts (base64) in addition to their paths. Default: false
+        write_files: Write the artifacts to the output directory. Disable to only return them. Default: true
+    """
+
+    def __init__(
+        self,
+        track_file: Optional[str] = None,
+        track_xml: Optional[str] = None,
+        track_name: Optional[str] = None,
+        base_dir: Optional[str] = None,
+        output: Optional[str] = None,
+        png: bool = False,
+        gazebo: bool = False,
+        ground_truth: bool = False,
+        ground_truth_spacing: Optional[float] = None,
+        ground_truth_formats: Optional[List[str]] = None,
+        labels: bool = False,
+        labels_rle: bool = False,
+        map_resolution: Optional[float] = None,
+        racing_line: Optional[str] = None,
+        return_bytes: bool = False,
+        write_files: bool = True,
+    ):
+        if (track_file is None) == (track_xml is None):
+            raise JobError("Exactly one of 'track_file' and 'track_xml' is required")
+        if track_xml is not None and track_name is None:
+            raise JobError("'track_name' is required for 'track_xml' jobs")
+        if not write_files and not return_bytes:
+            raise JobError("Jobs without 'write_files' require 'return_bytes'")
+
+        self.track_file = track_file
+        self.track_xml = track_xml
+        self.track_name = track_name
+        self.base_dir = base_dir
+        self.output = output
+        self.png = png
+        self.gazebo = gazebo
+        self.ground_truth = ground_truth
+        self.ground_truth_spacing = ground_truth_spacing
+        self.ground_truth_formats = ground_truth_formats
+        self.labels = labels
+        self.labels_rle = labels_rle
+        self.map_resolution = map_resolution
+        self.racing_line = racing_line
+        self.return_bytes = return_bytes
+        self.write_files = write_files
+
+    @classmethod
+    def from_dict(cls, job_dict: Dict[str, Any]) -> "RenderJob":
+        if not isinstance(job_dict, dict):
+            raise JobError("Job must be a JSON object")
+        try:
+            return cls(**job_dict)
+        except TypeError as e:
+            raise JobError(str(e))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(self.__dict__)
+
+
+def _warm_up_worker() -> None:
+    from track_generator import xml_reader
+    from track_generator import painter  # noqa: F401
+    from track_generator import gazebo_model_generator
+    from track_generator import ground_truth_generator  # noqa: F401
+
+    xml_reader.load_schema()
+    environment = gazebo_model_generator.get_template_environment()
+    for template_name in environment.list_templates():
+        environment.get_template(template_name)
+
+
+def _noop() -> None:
+    pass
+
+
+def _run_job(job_dict: Dict[str, Any], root_output_dirpath: str) -> Dict[str, Any]:
+    from track_generator import generator
+    from track_generator import instrumentation
+    from track_generator import xml_reader
+    from track_generator.sinks import DirectorySink
+
+    job = RenderJob.from_dict(job_dict)
+    if job.track_file is not None:
+        track_name = job.track_name or generator.get_track_name_from_file_path(Path(job.track_file))
+    else:
+        assert job.track_name
+        track_name = job.track_name
+    track_output_directory = Path(job.output) if job.output else Path(root_output_dirpath) / track_name
+
+    with instrumentation.track_scope(track_name):
+        if job.track_file is not None:
+            track = xml_reader.read_track(Path(job.track_file))
+        else:
+            assert job.track_xml is not None
+            track = xml_reader.read_track_from_string(job.track_xml, Path(job.base_dir) if job.base_dir else None)
+        artifacts = generator.render_track_artifacts(
+            track,
+            track_name,
+            job.png,
+            job.gazebo,
+            job.ground_truth,
+            ground_truth_spacing=job.ground_truth_spacing,
+            ground_truth_formats=job.ground_truth_formats,
+            generate_labels=job.labels,
+            label_rle=job.labels_rle,
+            map_resolution=job.map_resolution,
+            racing_line=job.racing_line,
+        )
+
+    files = artifacts.files()
+    result: Dict[str, Any] = {"status": "ok", "track_name": track_name}
+    if job.write_files:
+        DirectorySink(track_output_directory, per_track_subdirectory=False).write_artifacts(artifacts)
+        result["output_directory"] = str(track_output_directory)
+        result["artifacts"] = [str(track_output_directory / relative_path) for relative_path in files]
+    if job.return_bytes:
+        result["artifact_data"] = {relative_path: base64.b64encode(to_bytes(content)).decode("ascii") for relative_path, content in files.items()}
+    return result
+
+
+class RenderService:
+    """
+    Pool of warm worker processes that have the track schema and the templates loaded. Jobs are queued up to
+    max_queue_size, further jobs are rejected (QueueFullError) until a slot gets available again.
+    """
+
+    class QueueFullError(Exception):
+        pass
+
+    def __init__(self, root_output_dirpath: Path, num_workers: Optional[int] = None, max_queue_size: int = 64):
+        self.root_output_dirpath = root_output_dirpath
+        self.num_workers = num_workers if num_workers else (os.cpu_count() or 1)
+        self.max_queue_size = max_queue_size
+        self._slots = threading.BoundedSemaphore(self.num_workers + max_queue_size)
+        self._executor = ProcessPoolExecutor(max_workers=self.num_workers, initializer=_warm_up_worker)
+
+    def submit(self, job: RenderJob) -> "Future[Dict[str, Any]]":
+        if not self._slots.acquire(blocking=False):
+            raise RenderService.QueueFullError(f"Job queue is full ({self.max_queue_size} jobs pending)")
+        try:
+            future = self._executor.submit(_run_job, job.to_dict(), str(self.root_output_dirpath))
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def run(self, job_dict: Dict[str, Any]) -> Dict[str, Any]:
+        try:
+            job = RenderJob.from_dict(job_dict)
+            return self.submit(job).result()
+        except RenderService.QueueFullError as e:
+            return {"status": "busy", "error": str(e)}
+        except Exception as e:
+            logm.debug("Job failed: %s", e, exc_info=True)
+            return {"status": "error", "error": f"{e.__class__.__name__}: {e}"}
+
+    def warm_up(self) -> None:
+        # The workers warm up in the pool initializer, no-op tasks only force all of them to start.
+        for future in [self._executor.submit(_noop) for _ in range(self.num_workers)]:
+            future.result()
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+
+STATUS_TO_HTTP_CODE = {"ok": 200, "busy": 503, "error": 400}
+
+
+class _HttpRequestHandler(BaseHTTPRequestHandler):
+    server: "RenderHttpServer"
+
+    def _send_json(self, code: int, payload: Dict[str, Any]) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self) -> None:
+        if self.path == "/health":
+            self._send_json(200, {"status": "ok"})
+        else:
+            self._send_json(404, {"status": "error", "error": "Not found"})
+
+    def do_POST(self) -> None:
+        if self.path != "/jobs":
+            self._send_json(404, {"status": "error", "error": "Not found"})
+            return
+        try:
+            content_length = int(self.headers.get("Content-Length", 0))
+            job_dict = json.loads(self.rfile.read(content_length))
+        except ValueError as e:
+            self._send_json(400, {"status": "error", "error": f"Invalid request: {e}"})
+            return
+        result = self.server.render_service.run(job_dict)
+        self._send_json(STATUS_TO_HTTP_CODE[result["status"]], result)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        logm.debug(format, *args)
+
+
+class RenderHttpServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: tuple, render_service: RenderService):
+        super().__init__(address, _HttpRequestHandler)
+        self.render_service = render_service
+
+
+UNIX_SOCKETS_SUPPORTED = hasattr(socket, "AF_UNIX")
+
+
+if UNIX_SOCKETS_SUPPORTED:
+
+    class _UnixSocketRequestHandler(socketserver.StreamRequestHandler):
+        server: "RenderUnixSocketServer"
+
+        def handle(self) -> None:
+            for line in self.rfile:
+                if not line.strip():
+                    continue
+                try:
+                    result = self.server.render_service.run(json.loads(line))
+                except ValueError as e:
+                    result = {"status": "error", "error": f"Invalid request: {e}"}
+                self.wfile.write(json.dumps(result).encode("utf-8") + b"\n")
+                self.wfile.flush()
+
+    class RenderUnixSocketServer(socketserver.ThreadingUnixStreamServer):
+        daemon_threads = True
+
+        def __init__(self, socket_path: Path, render_service: RenderService):
+            if socket_path.exists():
+                socket_path.unlink()
+            super().__init__(str(socket_path), _UnixSocketRequestHandler)
+            self.render_service = render_service
+
+
+def serve(
+    root_output_dirpath: Path,
+    host: str = "127.0.0.1",
+    port: int = 8765,
+    unix_socket_path: Optional[Path] = None,
+    num_workers: Optional[int] = None,
+    max_queue_size: int = 64,
+) -> None:
+    """
+    Serve generation jobs with a pool of warm workers until interrupted. Jobs are accepted as JSON lines on the given
+    unix socket or, if no socket is given, via HTTP POST on http://<host>:<port>/jobs. Unix sockets are only available
+    on platforms with AF_UNIX support (see UNIX_SOCKETS_SUPPORTED).
+    """
+    if unix_socket_path and not UNIX_SOCKETS_SUPPORTED:
+        raise OSError("Unix sockets are not supported on this platform")
+
+    render_service = RenderService(root_output_dirpath, num_workers, max_queue_size)
+    render_service.warm_up()
+
+    server: socketserver.BaseServer
+    if unix_socket_path:
+        server = RenderUnixSocketServer(unix_socket_path, render_service)
+        logm.info("Serving on unix socket %s with %d workers", unix_socket_path, render_service.num_workers)
+    else:
+        server = RenderHttpServer((host, port), render_service)
+        logm.info("Serving on http://%s:%d/jobs with %d workers", host, port, render_service.num_workers)
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logm.info("Shutting down...")
+    finally:
+        server.server_close()
+        render_service.shutdown()
+        if unix_socket_path and unix_socket_path.exists():
+            unix_socket_path.unlink()
+
+
+def request_http(job: Dict[str, Any], host: str = "127.0.0.1", port: int = 8765, timeout: Optional[float] = None) -> Dict[str, Any]:
+    request = urllib.request.Request(f"http://{host}:{port}/jobs", data=json.dumps(job).encode("utf-8"), headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return json.loads(e.read())
+
+
+if UNIX_SOCKETS_SUPPORTED:
+
+    def request_unix_socket(jobs: List[Dict[str, Any]], unix_socket_path: Path, timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+            s.settimeout(timeout)
+            s.connect(str(unix_socket_path))
+            with s.makefile("rwb") as f:
+                results: List[Dict[str, Any]] = []
+                for job in jobs:
+                    f.write(json.dumps(job).encode("utf-8") + b"\n")
+                    f.flush()
+                    results.append(json.loads(f.readline()))
+                return results
@@ -0,0 +1,209 @@
+# Copyright (C) 2024 twyleg
+from typing import Dict, Optional, Tuple, Union
+
+import numpy as np
+
+from track_generator.track import LINE_OFFSET, LINE_WIDTH, Track
+from track_generator.trajectory import VehicleLimits
+
+DEFAULT_WHEELBASE = 0.26
+DEFAULT_VEHICLE_WIDTH = 0.2
+DEFAULT_MAX_STEERING_ANGLE = 0.5
+DEFAULT_TIME_STEP = 0.02
+# Arc length in m beyond the distance a vehicle can travel in a step that the Frenet projection searches around the
+# previous arc length of the vehicle
+PROJECTION_MARGIN = 0.5
+# Speed in m/s added to the speed in the offset feedback of the lane keeping controller, keeps it finite at standstill
+CONTROLLER_SOFTENING = 0.1
+
+SIMULATION_COLUMNS = ["x", "y", "heading", "speed", "steering_angle", "s", "d", "relative_heading", "progress", "lane_departure", "off_road", "finished"]
+
+ArrayLike = Union[float, np.ndarray]
+
+
+def _wrap_angle(angle: np.ndarray) -> np.ndarray:
+    return (angle + np.pi) % (2 * np.pi) - np.pi
+
+
+class VehicleSimulator:
+    """
+    Headless simulation of many independent vehicles (kinematic bicycle model, position of the rear axle) on a calculated
+    track. The states of all vehicles are arrays that are advanced in lockstep by vectorized steps, every step reports
+    the Frenet state of the vehicles along the center line, lane departures and the progress along the track. Vehicles
+    do not interact, so every vehicle can serve as a separate environment.
+    """
+
+    def __init__(
+        self,
+        track: Track,
+        num_vehicles: int,
+        vehicle_limits: Optional[VehicleLimits] = None,
+        wheelbase: float = DEFAULT_WHEELBASE,
+        vehicle_width: float = DEFAULT_VEHICLE_WIDTH,
+        max_steering_angle: float = DEFAULT_MAX_STEERING_ANGLE,
+        time_step: float = DEFAULT_TIME_STEP,
+    ):
+        """
+        :param track: The calculated track
+        :param num_vehicles: Number of vehicles
+        :param vehicle_limits: Limits of the speed and the longitudinal acceleration, start and end speed are not used
+        :param wheelbase: Distance between the axles in m
+        :param vehicle_width: Width of the vehicles in m, for the lane departure
+        :param max_steering_angle: Maximum steering angle in rad
+        :param time_step: Simulated time per step in s
+        """
+        if num_vehicles <= 0:
+            raise ValueError(f"Invalid number of vehicles: {num_vehicles}")
+        if min(wheelbase, max_steering_angle, time_step) <= 0.0:
+            raise ValueError(f"Invalid wheelbase, steering angle or time step: {wheelbase}, {max_steering_angle}, {time_step}")
+        self.path = track.get_centerline_path()
+        self.frenet_frame = track.get_frenet_frame()
+        self.closed = self.path.is_closed()
+        self.num_vehicles = num_vehicles
+        self.vehicle_limits = vehicle_limits or VehicleLimits()
+        self.wheelbase = wheelbase
+        self.vehicle_width = vehicle_width
+        self.max_steering_angle = max_steering_angle
+        self.time_step = time_step
+
+        self.time = np.zeros(num_vehicles)
+        self.x, self.y, self.heading, self.speed, self.steering_angle = (np.zeros(num_vehicles) for _ in range(5))
+        self.s, self.d, self.relative_heading, self.progress = (np.zeros(num_vehicles) for _ in range(4))
+        self.reset()
+
+    def lane_bounds(self, s: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        :return: Lower and upper lateral offset of the right lane (inner edges of the lane line and the center line) at every
+        arc length, beside traffic islands the lane is moved outwards
+        """
+        lateral_offset = self.path.lateral_offset(s)
+        return -(lateral_offset - LINE_WIDTH / 2), -(lateral_offset - LINE_OFFSET + LINE_WIDTH / 2)
+
+    def reset(
+        self,
+        indices: Optional[np.ndarray] = None,
+        s: ArrayLike = 0.0,
+        d: Optional[ArrayLike] = None,
+        relative_heading: ArrayLike = 0.0,
+        speed: ArrayLike = 0.0,
+    ) -> Dict[str, np.ndarray]:
+        """
+        Place vehicles on the track in Frenet coordinates, their progress starts at 0.
+        :param indices: Indices of the vehicles to reset, all vehicles if not given
+        :param s: Arc lengths of the vehicles
+        :param d: Lateral offsets of the vehicles, the center of the right lane if not given
+        :param relative_heading: Headings relative to the center line in rad
+        :return: The observation of all vehicles
+        """
+        indices = np.arange(self.num_vehicles) if indices is None else np.asarray(indices, dtype=np.int64)
+        s = np.clip(np.broadcast_to(np.asarray(s, dtype=float), indices.shape), 0.0, self.path.length)
+        if d is None:
+            d = np.mean(self.lane_bounds(s), axis=0)
+        d = np.broadcast_to(np.asarray(d, dtype=float), indices.shape)
+        points, heading = self.frenet_frame.to_cartesian(s, d, np.broadcast_to(relative_heading, indices.shape))
+
+        self.x[indices], self.y[indices], self.heading[indices] = points[:, 0], points[:, 1], heading
+        self.speed[indices] = np.broadcast_to(speed, indices.shape)
+        self.steering_angle[indices] = 0.0
+        self.time[indices] = 0.0
+        self.progress[indices] = 0.0
+        self.s[indices], self.d[indices], centerline_heading = self.frenet_frame.project_near(points, s, PROJECTION_MARGIN, self.closed)
+        self.relative_heading[indices] = _wrap_angle(heading - centerline_heading)
+        return self.observation()
+
+    def step(self, acceleration: ArrayLike, steering_angle: ArrayLike) -> Dict[str, np.ndarray]:
+        """
+        Advance all vehicles by one time step. The actions are held constant during the step and limited to the vehicle
+        limits, the vehicles move on circular arcs (exact for a constant steering angle).
+        :param acceleration: Longitudinal accelerations in m/s^2, negative to brake
+        :param steering_angle: Steering angles in rad, positive to the left
+        :return: The observation of all vehicles
+        """
+        limits = self.vehicle_limits
+        acceleration = np.clip(np.broadcast_to(acceleration, self.num_vehicles), -limits.max_deceleration, limits.max_acceleration)
+        self.steering_angle = np.clip(np.broadcast_to(steering_angle, self.num_vehicles).astype(float), -self.max_steering_angle, self.max_steering_angle)
+
+        speed = np.clip(self.speed + acceleration * self.time_step, 0.0, limits.max_speed)
+        distance = (self.speed + speed) / 2 * self.time_step
+        turn = np.tan(self.steering_angle) / self.wheelbase * distance
+        # Chord of the arc, np.sinc(x) is sin(pi * x) / (pi * x)
+        chord = distance * np.sinc(turn / (2 * np.pi))
+        self.x = self.x + chord * np.cos(self.heading + turn / 2)
+        self.y = self.y + chord * np.sin(self.heading + turn / 2)
+        self.heading = _wrap_angle(self.heading + turn)
+        self.speed = speed
+        self.time = self.time + self.time_step
+
+        # The previous arc lengths keep vehicles at crossings of the track on their branch
+        max_distance = limits.max_speed * self.time_step + PROJECTION_MARGIN
+        s, self.d, centerline_heading = self.frenet_frame.project_near(np.stack([self.x, self.y], axis=-1), self.s, max_distance, self.closed)
+        progress = s - self.s
+        if self.closed:
+            progress = (progress + self.path.length / 2) % self.path.length - self.path.length / 2
+        self.progress = self.progress + progress
+        self.s = s
+        self.relative_heading = _wrap_angle(self.heading - centerline_heading)
+        return self.observation()
+
+    def observation(self) -> Dict[str, np.ndarray]:
+        """
+        :return: Columns SIMULATION_COLUMNS of all vehicles:
+            lane_departure: the vehicle is not entirely within the right lane
+            off_road: the rear axle of the vehicle is beyond the outer lines of the road
+            finished: the vehicle reached the end of an open track or completed a lap of a closed one
+        """
+        lower, upper = self.lane_bounds(self.s)
+        if self.closed:
+            finished = self.progress >= self.path.length
+        else:
+            finished = self.s >= self.path.length
+        columns = {
+            "x": self.x,
+            "y": self.y,
+            "heading": self.heading,
+            "speed": self.speed,
+            "steering_angle": self.steering_angle,
+            "s": self.s,
+            "d": self.d,
+            "relative_heading": self.relative_heading,
+            "progress": self.progress,
+            "lane_departure": (self.d - self.vehicle_width / 2 < lower) | (self.d + self.vehicle_width / 2 > upper),
+            "off_road": np.abs(self.d) > self.path.lateral_offset(self.s) + LINE_WIDTH / 2,
+            "finished": finished,
+        }
+        return {name: columns[name].copy() for name in SIMULATION_COLUMNS}
+
+
+class LaneKeepingController:
+    """
+    Simple controller that follows the right lane: a Stanley steering controller on the Frenet state (feed forward of
+    the center line curvature, feedback of the relative heading and the lateral offset) and a proportional speed
+    controller.
+    """
+
+    def __init__(self, target_speed: ArrayLike = 1.0, offset_gain: float = 2.0, speed_gain: float = 2.0, target_offset: Optional[ArrayLike] = None):
+        """
+        :param target_speed: Target speeds in m/s, a scalar or one per vehicle
+        :param offset_gain: Gain of the lateral offset feedback in 1/s
+        :param speed_gain: Gain of the speed controller in 1/s
+        :param target_offset: Target lateral offsets in m, the center of the right lane if not given
+        """
+        self.target_speed = target_speed
+        self.offset_gain = offset_gain
+        self.speed_gain = speed_gain
+        self.target_offset = target_offset
+
+    def __call__(self, simulator: VehicleSimulator) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        :return: Accelerations and steering angles of all vehicles
+        """
+        _, _, _, curvature = simulator.path.evaluate(simulator.s)
+        target_offset = np.mean(simulator.lane_bounds(simulator.s), axis=0) if self.target_offset is None else self.target_offset
+        offset_error = simulator.d - target_offset
+        steering_angle = (
+            np.arctan(simulator.wheelbase * curvature / (1.0 - curvature * simulator.d))
+            - simulator.relative_heading
+            - np.arctan(self.offset_gain * offset_error / (simulator.speed + CONTROLLER_SOFTENING))
+        )
+        acceleration = self.speed_gain * (np.asarray(self.target_speed) - simulator.speed)
+        return acceleration, steering_angle
@@ -0,0 +1,204 @@
+# Copyright (C) 2024 twyleg
+import abc
+import functools
+import os
+import threading
+import zipfile
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Iterable, List, Set
+
+from track_generator import instrumentation
+from track_generator.artifacts import Content, TrackArtifacts, to_bytes
+
+
+def sync_directories(dirpaths: Iterable[Path]) -> None:
+    """
+    Sync the entries of directories (new or replaced files) to disk.
+    """
+    # Directories can't be opened for syncing on all platforms (e.g. Windows)
+    if not hasattr(os, "O_DIRECTORY"):
+        return
+    for dirpath in dirpaths:
+        fd = os.open(dirpath, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+class OutputSink(abc.ABC):
+    """
+    Destination for the artifacts of generated tracks. Artifacts are addressed by the track name and their path relative
+    to the output directory of the track (POSIX style, e.g. "gazebo_models/setup.bash").
+    """
+
+    @abc.abstractmethod
+    def write(self, track_name: str, relative_path: str, content: Content) -> None:
+        pass
+
+    def write_artifacts(self, artifacts: TrackArtifacts) -> None:
+        with instrumentation.span("OutputSink.write_artifacts", track=artifacts.track_name):
+            for relative_path, content in artifacts.files().items():
+                self.write(artifacts.track_name, relative_path, content)
+
+    def flush(self) -> None:
+        """
+        Block until everything that was written is persisted.
+        """
+        pass
+
+    def close(self) -> None:
+        self.flush()
+
+    def __enter__(self) -> "OutputSink":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+class DirectorySink(OutputSink):
+    """
+    Writes the artifacts to <root_dirpath>/<track_name>/<relative_path> or, with per_track_subdirectory disabled,
+    to <root_dirpath>/<relative_path>. With fsync enabled every file is synced after writing and flush() syncs the
+    directories that received files.
+    """
+
+    def __init__(self, root_dirpath: Path, per_track_subdirectory: bool = True, fsync: bool = False):
+        self.root_dirpath = root_dirpath
+        self.per_track_subdirectory = per_track_subdirectory
+        self.fsync = fsync
+        self._unsynced_dirpaths: Set[Path] = set()
+        self._lock = threading.Lock()
+
+    def get_filepath(self, track_name: str, relative_path: str) -> Path:
+        if self.per_track_subdirectory:
+            return self.root_dirpath / track_name / relative_path
+        return self.root_dirpath / relative_path
+
+    def write(self, track_name: str, relative_path: str, content: Content) -> None:
+        filepath = self.get_filepath(track_name, relative_path)
+        filepath.parent.mkdir(parents=True, exist_ok=True)
+        # Replace links (e.g. into a content store) instead of writing through them into the linked file
+        if filepath.is_symlink() or filepath.exists():
+            filepath.unlink()
+        with open(filepath, "wb") as f:
+            f.write(to_bytes(content))
+            if self.fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        if self.fsync:
+            with self._lock:
+                self._unsynced_dirpaths.add(filepath.parent)
+
+    def flush(self) -> None:
+        with self._lock:
+            dirpaths, self._unsynced_dirpaths = self._unsynced_dirpaths, set()
+        sync_directories(dirpaths)
+
+
+class ZipSink(OutputSink):
+    """
+    Writes the artifacts of all tracks into a single zip archive as <track_name>/<relative_path>.
+    """
+
+    def __init__(self, zip_filepath: Path, compression: int = zipfile.ZIP_STORED):
+        zip_filepath.parent.mkdir(parents=True, exist_ok=True)
+        self.zip_file = zipfile.ZipFile(zip_filepath, "w", compression=compression)
+        self._lock = threading.Lock()
+
+    def write(self, track_name: str, relative_path: str, content: Content) -> None:
+        with self._lock:
+            self.zip_file.writestr(f"{track_name}/{relative_path}", to_bytes(content))
+
+    def flush(self) -> None:
+        with self._lock:
+            if self.zip_file.fp:
+                self.zip_file.fp.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            self.zip_file.close()
+
+
+class CallbackSink(OutputSink):
+    """
+    Passes every artifact to a caller-provided callback(track_name, relative_path, content).
+    """
+
+    def __init__(self, callback: Callable[[str, str, Content], None]):
+        self.callback = callback
+
+    def write(self, track_name: str, relative_path: str, content: Content) -> None:
+        self.callback(track_name, relative_path, content)
+
+
+class WriteBehindSink(OutputSink):
+    """
+    Hands the artifacts to another sink in background threads, so rendering of the next track overlaps with writing.
+    At most max_inflight_bytes are buffered, write() blocks until enough in-flight data was persisted (a single artifact
+    larger than the budget is accepted once nothing else is in flight). Errors of background writes are raised by the
+    next call of write() or flush(), flush() waits for all pending writes and flushes the wrapped sink.
+    """
+
+    def __init__(self, sink: OutputSink, max_workers: int = 4, max_inflight_bytes: int = 64 * 1024 * 1024):
+        self.sink = sink
+        self.max_inflight_bytes = max_inflight_bytes
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="write_behind")
+        self._condition = threading.Condition()
+        self._inflight_bytes = 0
+        self._pending: Set[Future] = set()
+        self._errors: List[BaseException] = []
+
+    @property
+    def inflight_bytes(self) -> int:
+        return self._inflight_bytes
+
+    def _raise_errors(self) -> None:
+        with self._condition:
+            errors, self._errors = self._errors, []
+        if errors:
+            raise errors[0]
+
+    def _on_write_done(self, size: int, future: Future) -> None:
+        with self._condition:
+            self._inflight_bytes -= size
+            self._pending.discard(future)
+            if not future.cancelled() and future.exception() is not None:
+                self._errors.append(future.exception())  # type: ignore
+            self._condition.notify_all()
+
+    def _submit(self, size: int, fn: Callable, *args) -> None:
+        self._raise_errors()
+        with self._condition:
+            self._condition.wait_for(lambda: self._inflight_bytes == 0 or self._inflight_bytes + size <= self.max_inflight_bytes)
+            self._inflight_bytes += size
+            future = self._executor.submit(fn, *args)
+            self._pending.add(future)
+        future.add_done_callback(functools.partial(self._on_write_done, size))
+
+    def write(self, track_name: str, relative_path: str, content: Content) -> None:
+        data = to_bytes(content)
+        self._submit(len(data), self.sink.write, track_name, relative_path, data)
+
+    def write_artifacts(self, artifacts: TrackArtifacts) -> None:
+        # One background job per track, so the wrapped sink receives the track as a whole (see ArchiveSink). The
+        # artifacts are encoded once here, the encoded track is counted against the budget and handed to the sink.
+        encoded_artifacts = TrackArtifacts(artifacts.track_name)
+        encoded_artifacts.extra_files = {relative_path: to_bytes(content) for relative_path, content in artifacts.files().items()}
+        size = sum(len(data) for data in encoded_artifacts.extra_files.values())
+        self._submit(size, self.sink.write_artifacts, encoded_artifacts)
+
+    def flush(self) -> None:
+        with self._condition:
+            self._condition.wait_for(lambda: not self._pending)
+        self._raise_errors()
+        self.sink.flush()
+
+    def close(self) -> None:
+        try:
+            self.flush()
+        finally:
+            self._executor.shutdown(wait=True)
+            self.sink.close()
@@ -0,0 +1,326 @@
+# Copyright (C) 2024 twyleg
+from math import acos, ceil
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from track_generator.label_raster import Dash, LabelClass, LabelTarget
+from track_generator.track import Track
+
+DEFAULT_CELL_SIZE = 0.25
+# Maximum deviation in m of the polylines that arcs are approximated with
+ARC_TOLERANCE = 1e-4
+# Tolerance in m for points on the ends of strokes, so no points are lost between adjoining strokes
+EDGE_TOLERANCE = 1e-9
+# Classes of the strokes that nearest_boundary() searches
+BOUNDARY_CLASSES = [LabelClass.LANE_LINE]
+
+
+class _ShapeRecorder(LabelTarget):
+    """
+    Records the shapes of a track as the Painter draws them: strokes are split into straight pieces with butt caps and
+    round joins (arcs are approximated by polylines), areas are kept as polygons.
+    """
+
+    def __init__(self) -> None:
+        self.segment_index = -1
+        self.shape_segment_index: List[int] = []
+        self.shape_label: List[int] = []
+        # p0_x, p0_y, p1_x, p1_y, half width, arc length at p0, dash length, dash period (0 for solid), round, shape
+        self.strokes: List[Tuple[float, float, float, float, float, float, float, float, bool, int]] = []
+        self.polygons: List[np.ndarray] = []
+        self.polygon_shapes: List[int] = []
+
+    def begin_segment(self, segment_index: int) -> None:
+        self.segment_index = segment_index
+
+    def _add_shape(self, label: LabelClass) -> int:
+        self.shape_segment_index.append(self.segment_index)
+        self.shape_label.append(int(label))
+        return len(self.shape_label) - 1
+
+    def _add_polyline(self, points: np.ndarray, width: float, dash: Optional[Dash], shape: int) -> None:
+        dash_length, dash_period = (dash[0], dash[0] + dash[1]) if dash else (0.0, 0.0)
+        s = 0.0
+        for i in range(len(points) - 1):
+            (x0, y0), (x1, y1) = points[i], points[i + 1]
+            self.strokes.append((x0, y0, x1, y1, width / 2, s, dash_length, dash_period, False, shape))
+            s += float(np.hypot(x1 - x0, y1 - y0))
+            if i < len(points) - 2:
+                self.strokes.append((x1, y1, x1, y1, width / 2, s, dash_length, dash_period, True, shape))
+
+    def stroke_polyline(self, points: np.ndarray, width: float, label: LabelClass, dash: Optional[Dash] = None) -> None:
+        self._add_polyline(np.asarray(points, dtype=float), width, dash, self._add_shape(label))
+
+    def stroke_arc(
+        self, center: Tuple[float, float], radius: float, start_angle: float, sweep: float, width: float, label: LabelClass, dash: Optional[Dash] = None
+    ) -> None:
+        max_step = 2 * acos(max(-1.0, 1.0 - ARC_TOLERANCE / radius)) if radius > 0.0 else np.pi
+        angles = np.linspace(start_angle, start_angle + sweep, max(1, ceil(abs(sweep) / max_step)) + 1)
+        points = np.stack([center[0] + radius * np.cos(angles), center[1] + radius * np.sin(angles)], axis=-1)
+        self._add_polyline(points, width, dash, self._add_shape(label))
+
+    def fill_polygon(self, points: np.ndarray, label: LabelClass) -> None:
+        points = np.asarray(points, dtype=float)
+        if len(points) >= 3:
+            self.polygons.append(points)
+            self.polygon_shapes.append(self._add_shape(label))
+
+
+class UniformGrid:
+    """
+    Uniform grid over the bounding boxes of items. The items of every cell are stored contiguously (CSR layout), so
+    the candidates of arrays of cells are gathered without Python loops.
+    """
+
+    def __init__(self, min_corners: np.ndarray, max_corners: np.ndarray, origin: np.ndarray, cell_size: float, shape: Tuple[int, int]):
+        """
+        :param shape: Number of cells in x and y direction
+        """
+        self.origin = origin
+        self.cell_size = cell_size
+        self.shape = shape
+
+        first_cells = np.clip(np.floor((min_corners - origin) / cell_size).astype(np.int64), 0, np.array(shape) - 1)
+        last_cells = np.clip(np.floor((max_corners - origin) / cell_size).astype(np.int64), 0, np.array(shape) - 1)
+        extents = last_cells - first_cells + 1
+        counts = extents[:, 0] * extents[:, 1]
+        items = np.repeat(np.arange(len(counts)), counts)
+        local_indices = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        cells_x = first_cells[items, 0] + local_indices % extents[items, 0]
+        cells_y = first_cells[items, 1] + local_indices // extents[items, 0]
+        cells = cells_y * shape[0] + cells_x
+
+        order = np.argsort(cells, kind="stable")
+        self.items = items[order]
+        self.cell_starts = np.concatenate([[0], np.cumsum(np.bincount(cells, minlength=shape[0] * shape[1]))])
+
+    def cell_of(self, points: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        :return: Cell coordinates (x, y) of the points, not limited to the grid
+        """
+        cells = np.floor((points - self.origin) / self.cell_size).astype(np.int64)
+        return cells[:, 0], cells[:, 1]
+
+    def flat_cells(self, cells_x: np.ndarray, cells_y: np.ndarray) -> np.ndarray:
+        """
+        :return: Indices of the cells, -1 for cells outside of the grid
+        """
+        is_inside = (cells_x >= 0) & (cells_x < self.shape[0]) & (cells_y >= 0) & (cells_y < self.shape[1])
+        return np.where(is_inside, cells_y * self.shape[0] + cells_x, -1)
+
+    def candidates(self, flat_cells: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        :param flat_cells: Cell indices, -1 for cells outside of the grid
+        :return: Pairs of the index into flat_cells and the items registered in that cell
+        """
+        valid_cells = np.maximum(flat_cells, 0)
+        starts = self.cell_starts[valid_cells]
+        counts = np.where(flat_cells >= 0, self.cell_starts[valid_cells + 1] - starts, 0)
+        queries = np.repeat(np.arange(len(flat_cells)), counts)
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        return queries, self.items[np.repeat(starts, counts) + offsets]
+
+
+class SpatialIndex:
+    """
+    Spatial index over the shapes (strokes and areas) of a calculated track, the same shapes with the same classes that
+    the track images and label rasters are drawn from. Shapes are numbered in drawing order, so a point is assigned to
+    the last drawn shape covering it, like a pixel of the images. All queries take numpy arrays of world coordinates.
+
+    shape_segment_index and shape_label map a shape index to the index of its segment in Track.segments and its
+    LabelClass.
+    """
+
+    def __init__(self, recorder: _ShapeRecorder, cell_size: float = DEFAULT_CELL_SIZE):
+        if cell_size <= 0.0:
+            raise ValueError(f"Invalid cell size: {cell_size}")
+
+        self.shape_segment_index = np.array(recorder.shape_segment_index, dtype=np.int32)
+        self.shape_label = np.array(recorder.shape_label, dtype=np.uint8)
+
+        strokes = np.array([stroke[:8] for stroke in recorder.strokes], dtype=float).reshape(-1, 8)
+        self.stroke_p0 = strokes[:, 0:2]
+        self.stroke_p1 = strokes[:, 2:4]
+        self.stroke_half_width = strokes[:, 4]
+        self.stroke_s0 = strokes[:, 5]
+        self.stroke_dash_length = strokes[:, 6]
+        self.stroke_dash_period = strokes[:, 7]
+        self.stroke_round = np.array([stroke[8] for stroke in recorder.strokes], dtype=bool)
+        self.stroke_shape = np.array([stroke[9] for stroke in recorder.strokes], dtype=np.int64)
+
+        # Polygons are closed and padded with their first vertex to the same number of vertices, padding edges have no
+        # length and never cross a ray
+        max_vertices = max([len(polygon) for polygon in recorder.polygons], default=0) + 1
+        self.polygon_vertices = np.empty((len(recorder.polygons), max_vertices, 2))
+        for i, polygon in enumerate(recorder.polygons):
+            self.polygon_vertices[i] = np.concatenate([polygon, np.repeat(polygon[:1], max_vertices - len(polygon), axis=0)])
+        self.polygon_shape = np.array(recorder.polygon_shapes, dtype=np.int64)
+
+        stroke_min = np.minimum(self.stroke_p0, self.stroke_p1) - self.stroke_half_width[:, np.newaxis]
+        stroke_max = np.maximum(self.stroke_p0, self.stroke_p1) + self.stroke_half_width[:, np.newaxis]
+        polygon_min = self.polygon_vertices.min(axis=1) if len(self.polygon_vertices) else np.empty((0, 2))
+        polygon_max = self.polygon_vertices.max(axis=1) if len(self.polygon_vertices) else np.empty((0, 2))
+        all_min = np.concatenate([stroke_min, polygon_min])
+        all_max = np.concatenate([stroke_max, polygon_max])
+        origin = all_min.min(axis=0) if len(all_min) else np.zeros(2)
+        extent = all_max.max(axis=0) - origin if len(all_max) else np.zeros(2)
+        shape = (int(extent[0] // cell_size) + 1, int(extent[1] // cell_size) + 1)
+
+        self.cell_size = cell_size
+        self.stroke_min, self.stroke_max = stroke_min, stroke_max
+        self.polygon_min, self.polygon_max = polygon_min, polygon_max
+        self.stroke_grid = UniformGrid(stroke_min, stroke_max, origin, cell_size, shape)
+        self.polygon_grid = UniformGrid(polygon_min, polygon_max, origin, cell_size, shape)
+        self.boundary_strokes = np.flatnonzero(~self.stroke_round & np.isin(self.shape_label[self.stroke_shape], BOUNDARY_CLASSES))
+        self.boundary_grid = UniformGrid(stroke_min[self.boundary_strokes], stroke_max[self.boundary_strokes], origin, cell_size, shape)
+
+    @classmethod
+    def from_track(cls, track: Track, cell_size: float = DEFAULT_CELL_SIZE) -> "SpatialIndex":
+        """
+        :param track: The calculated track
+        :param cell_size: Size of the grid cells in m
+        """
+        from track_generator.painter import Painter
+
+        recorder = _ShapeRecorder()
+        Painter().draw_track(track, label_target=recorder)
+        return cls(recorder, cell_size)
+
+    def __len__(self) -> int:
+        return len(self.shape_label)
+
+    def _stroke_projection(self, points: np.ndarray, strokes: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        :return: Distance along and across the strokes, their lengths and unit directions
+        """
+        direction = self.stroke_p1[strokes] - self.stroke_p0[strokes]
+        length = np.hypot(direction[:, 0], direction[:, 1])
+        unit = direction / np.where(length > 0.0, length, 1.0)[:, np.newaxis]
+        relative = points - self.stroke_p0[strokes]
+        along = relative[:, 0] * unit[:, 0] + relative[:, 1] * unit[:, 1]
+        across = relative[:, 1] * unit[:, 0] - relative[:, 0] * unit[:, 1]
+        return along, across, length, unit
+
+    def _hits_strokes(self, points: np.ndarray, strokes: np.ndarray) -> np.ndarray:
+        along, across, length, _ = self._stroke_projection(points, strokes)
+        half_width = self.stroke_half_width[strokes]
+        butt_hit = (along >= -EDGE_TOLERANCE) & (along <= length + EDGE_TOLERANCE) & (np.abs(across) <= half_width)
+        relative = points - self.stroke_p0[strokes]
+        round_hit = np.hypot(relative[:, 0], relative[:, 1]) <= half_width
+        hit = np.where(self.stroke_round[strokes], round_hit, butt_hit)
+
+        period = self.stroke_dash_period[strokes]
+        s = self.stroke_s0[strokes] + np.clip(along, 0.0, length)
+        is_dash = (period == 0.0) | (np.mod(s, np.where(period > 0.0, period, 1.0)) < self.stroke_dash_length[strokes])
+        return hit & is_dash
+
+    def _inside_polygons(self, points: np.ndarray, polygons: np.ndarray) -> np.ndarray:
+        vertices = self.polygon_vertices[polygons]
+        x0, y0 = vertices[:, :-1, 0], vertices[:, :-1, 1]
+        x1, y1 = vertices[:, 1:, 0], vertices[:, 1:, 1]
+        x, y = points[:, 0:1], points[:, 1:2]
+        crosses = (y0 <= y) != (y1 <= y)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            x_crossing = x0 + (y - y0) * (x1 - x0) / (y1 - y0)
+        return np.logical_xor.reduce(crosses & (x < x_crossing), axis=1)
+
+    def query_points(self, points: np.ndarray) -> np.ndarray:
+        """
+        :param points: Array (n, 2) of world coordinates
+        :return: Index of the last drawn shape covering each point, -1 for points that are not covered
+        """
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        shapes = np.full(len(points), -1, dtype=np.int64)
+        cells = self.stroke_grid.flat_cells(*self.stroke_grid.cell_of(points))
+
+        queries, strokes = self.stroke_grid.candidates(cells)
+        hits = self._hits_strokes(points[queries], strokes)
+        np.maximum.at(shapes, queries[hits], self.stroke_shape[strokes[hits]])
+
+        queries, polygons = self.polygon_grid.candidates(cells)
+        if len(queries):
+            inside = self._inside_polygons(points[queries], polygons)
+            np.maximum.at(shapes, queries[inside], self.polygon_shape[polygons[inside]])
+        return shapes
+
+    def query_labels(self, points: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        :param points: Array (n, 2) of world coordinates
+        :return: Segment index (-1 for none) and LabelClass (BACKGROUND for none) of each point
+        """
+        shapes = self.query_points(points)
+        is_covered = shapes >= 0
+        segment_indices = np.where(is_covered, self.shape_segment_index[np.maximum(shapes, 0)], -1)
+        labels = np.where(is_covered, self.shape_label[np.maximum(shapes, 0)], LabelClass.BACKGROUND).astype(np.uint8)
+        return segment_indices, labels
+
+    def query_box(self, min_corner: Sequence[float], max_corner: Sequence[float]) -> np.ndarray:
+        """
+        :param min_corner: World coordinates of the lower left corner of the box
+        :param max_corner: World coordinates of the upper right corner of the box
+        :return: Sorted indices of the shapes with parts whose bounding boxes intersect the box
+        """
+        box_min, box_max = np.asarray(min_corner, dtype=float), np.asarray(max_corner, dtype=float)
+        grid = self.stroke_grid
+        first_x, first_y = grid.cell_of(box_min[np.newaxis])
+        last_x, last_y = grid.cell_of(box_max[np.newaxis])
+        cells_x, cells_y = np.meshgrid(
+            np.arange(max(first_x[0], 0), min(last_x[0], grid.shape[0] - 1) + 1), np.arange(max(first_y[0], 0), min(last_y[0], grid.shape[1] - 1) + 1)
+        )
+        cells = grid.flat_cells(cells_x.ravel(), cells_y.ravel())
+
+        _, strokes = self.stroke_grid.candidates(cells)
+        _, polygons = self.polygon_grid.candidates(cells)
+        strokes = strokes[np.all((self.stroke_min[strokes] <= box_max) & (self.stroke_max[strokes] >= box_min), axis=1)]
+        polygons = polygons[np.all((self.polygon_min[polygons] <= box_max) & (self.polygon_max[polygons] >= box_min), axis=1)]
+        return np.unique(np.concatenate([self.stroke_shape[strokes], self.polygon_shape[polygons]]))
+
+    def nearest_boundary(self, points: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Find the nearest point on the center of the lane boundary lines (BOUNDARY_CLASSES) for every point. The grid
+        is searched in rings of cells around the points until no closer boundary is possible.
+        :param points: Array (n, 2) of world coordinates
+        :return: Distances, nearest boundary points (n, 2) and the shape indices of the boundaries (inf, nan and -1 if
+        the track has no boundaries)
+        """
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        distances = np.full(len(points), np.inf)
+        nearest_points = np.full((len(points), 2), np.nan)
+        shapes = np.full(len(points), -1, dtype=np.int64)
+        if not len(self.boundary_strokes):
+            return distances, nearest_points, shapes
+
+        grid = self.boundary_grid
+        cells_x, cells_y = grid.cell_of(points)
+        # Rings beyond the farthest corner of the grid are empty
+        max_rings = np.maximum.reduce([np.abs(cells_x), np.abs(cells_x - grid.shape[0] + 1), np.abs(cells_y), np.abs(cells_y - grid.shape[1] + 1)])
+
+        active = np.arange(len(points))
+        ring = 0
+        while len(active):
+            offsets = np.array([(dx, dy) for dx in range(-ring, ring + 1) for dy in range(-ring, ring + 1) if max(abs(dx), abs(dy)) == ring])
+            ring_cells = grid.flat_cells((cells_x[active, np.newaxis] + offsets[:, 0]).ravel(), (cells_y[active, np.newaxis] + offsets[:, 1]).ravel())
+            queries, candidates = grid.candidates(ring_cells)
+            if len(queries):
+                query_points = active[queries // len(offsets)]
+                strokes = self.boundary_strokes[candidates]
+                along, _, length, unit = self._stroke_projection(points[query_points], strokes)
+                candidate_points = self.stroke_p0[strokes] + np.clip(along, 0.0, length)[:, np.newaxis] * unit
+                candidate_distances = np.hypot(*(points[query_points] - candidate_points).T)
+
+                # Closest candidate of every point
+                order = np.lexsort((candidate_distances, query_points))
+                is_first = np.concatenate([[True], query_points[order][1:] != query_points[order][:-1]])
+                closest = order[is_first]
+                is_closer = candidate_distances[closest] < distances[query_points[closest]]
+                closest = closest[is_closer]
+                distances[query_points[closest]] = candidate_distances[closest]
+                nearest_points[query_points[closest]] = candidate_points[closest]
+                shapes[query_points[closest]] = self.stroke_shape[strokes[closest]]
+
+            # Boundaries outside of the searched rings are farther away than the ring distance
+            is_done = (distances[active] <= ring * grid.cell_size) | (ring >= max_rings[active])
+            active = active[~is_done]
+            ring += 1
+        return distances, nearest_points, shapes
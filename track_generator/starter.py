@@ -1,11 +1,13 @@
 # Copyright (C) 2024 twyleg
 import argparse
+import sys
 from pathlib import Path
 
 from simple_python_app.subcommand_application import SubcommandApplication
 
 from track_generator import __version__
-from track_generator import generator
+from track_generator import instrumentation
+from track_generator.profiler import Profiler
 
 
 FILE_DIR = Path(__file__).parent
@@ -62,21 +64,378 @@ class CliApplication(SubcommandApplication):
             action="store_true",
             help="Generate ground truth data for track."
         )
+        generate_track_command.parser.add_argument(
+            "--ground_truth_spacing",
+            dest="ground_truth_spacing",
+            type=float,
+            default=None,
+            help="Resample the ground truth densely along the lane boundaries and the center line with the given arc length spacing in m (--ground_truth only).",
+        )
+        generate_track_command.parser.add_argument(
+            "--ground_truth_format",
+            dest="ground_truth_formats",
+            choices=["xml", "npz", "raw"],
+            action="append",
+            default=None,
+            help="Format of the ground truth, can be given multiple times: xml, npz or raw (memory-mappable columns with JSON header). Binary formats are sampled densely (default spacing 0.01m). Default=xml",
+        )
+        generate_track_command.parser.add_argument(
+            "--labels",
+            action="store_true",
+            help="Generate a class map for the track (8 bit grayscale PNG aligned with the track PNG, one class per pixel)."
+        )
+        generate_track_command.parser.add_argument(
+            "--labels_rle",
+            action="store_true",
+            help="Generate run-length encoded masks of all classes in addition to the class map (--labels only)."
+        )
+        generate_track_command.parser.add_argument(
+            "--map_resolution",
+            dest="map_resolution",
+            type=float,
+            default=None,
+            help="Generate planner maps with the given cell size in m: occupancy grid (PGM), signed distance and heading field (NPY) with a map_server YAML descriptor.",
+        )
+        generate_track_command.parser.add_argument(
+            "--racing_line",
+            dest="racing_line",
+            choices=["lane", "road"],
+            default=None,
+            help="Generate a minimum curvature racing line within the boundaries of the right lane or the whole road (NPZ).",
+        )
+        generate_track_command.parser.add_argument(
+            "--prefetch",
+            dest="prefetch",
+            type=int,
+            default=0,
+            help="Number of track files to read ahead in the background. Default=0",
+        )
+        generate_track_command.parser.add_argument(
+            "--write_behind",
+            dest="write_behind",
+            type=int,
+            nargs="?",
+            const=64,
+            default=None,
+            help="Write results in background threads while the next tracks are generated, buffering at most the given amount of MiB (64 if given without a value). Disabled by default",
+        )
+        generate_track_command.parser.add_argument(
+            "--fsync",
+            action="store_true",
+            help="Sync written files and directories to disk before finishing."
+        )
+        generate_track_command.parser.add_argument(
+            "--archive",
+            dest="archive",
+            choices=["tar", "zip"],
+            default=None,
+            help="Write all results into sharded, uncompressed archives with an index instead of a directory per track.",
+        )
+        generate_track_command.parser.add_argument(
+            "--shard_size",
+            dest="shard_size",
+            type=int,
+            default=1024,
+            help="Maximum size of an archive shard in MiB (--archive only). Default=1024",
+        )
+        generate_track_command.parser.add_argument(
+            "--content_store",
+            dest="content_store",
+            default=None,
+            help="Store the results deduplicated by content in the given directory and link them into the output directory.",
+        )
+        generate_track_command.parser.add_argument(
+            "--link",
+            dest="link",
+            choices=["hardlink", "symlink", "copy"],
+            default="hardlink",
+            help="How results are linked from the content store into the output directory (--content_store only). Default=hardlink",
+        )
+        generate_track_command.parser.add_argument(
+            "--reuse_renders",
+            action="store_true",
+            help="Skip rendering of tracks that were already rendered with the same inputs and reuse their results from the content store (--content_store only).",
+        )
+        generate_track_command.parser.add_argument(
+            "--profile",
+            dest="profile",
+            nargs="?",
+            const="profile.json",
+            default=None,
+            help='Record time and memory consumption of the generation stages and write a JSON report. Relative paths are relative to the output directory. Default="profile.json"',
+        )
+        generate_track_command.parser.add_argument(
+            "--trace",
+            dest="trace",
+            nargs="?",
+            const="trace.json",
+            default=None,
+            help='Write a Chrome trace-event JSON file of the generation pipeline. Relative paths are relative to the output directory. Default="trace.json"',
+        )
+
+        serve_command = self.add_subcommand(
+            command="serve",
+            help="Serve generation jobs with warm workers.",
+            description="Serve generation jobs with a pool of warm workers via HTTP (POST /jobs) or a unix socket (JSON lines).",
+            handler=self._handle_serve
+        )
+        serve_command.parser.add_argument(
+            "-o",
+            "--output",
+            dest="output",
+            default=Path.cwd() / "output",
+            help='Default output directory for jobs without explicit output directory. Default="./output"',
+        )
+        serve_command.parser.add_argument(
+            "--host",
+            dest="host",
+            default="127.0.0.1",
+            help='Host to listen on for HTTP jobs. Default="127.0.0.1"',
+        )
+        serve_command.parser.add_argument(
+            "--port",
+            dest="port",
+            type=int,
+            default=8765,
+            help="Port to listen on for HTTP jobs. Default=8765",
+        )
+        serve_command.parser.add_argument(
+            "--unix_socket",
+            dest="unix_socket",
+            default=None,
+            help="Listen on the given unix socket instead of HTTP.",
+        )
+        serve_command.parser.add_argument(
+            "--workers",
+            dest="workers",
+            type=int,
+            default=None,
+            help="Number of worker processes. Default=number of CPUs",
+        )
+        serve_command.parser.add_argument(
+            "--max_queue",
+            dest="max_queue",
+            type=int,
+            default=64,
+            help="Maximum number of pending jobs, further jobs are rejected as busy. Default=64",
+        )
+
+        read_artifact_command = self.add_subcommand(
+            command="read_artifact",
+            help="Read a single artifact from an archive.",
+            description="Read a single artifact of a track from archives written with generate_track --archive.",
+            handler=self._handle_read_artifact
+        )
+        read_artifact_command.parser.add_argument(
+            "archive_dir",
+            type=str,
+            help="output directory of generate_track --archive (containing the index)"
+        )
+        read_artifact_command.parser.add_argument(
+            "track_name",
+            nargs="?",
+            default=None,
+            help="name of the track. Lists the tracks if omitted"
+        )
+        read_artifact_command.parser.add_argument(
+            "artifact",
+            nargs="?",
+            default=None,
+            help='path of the artifact relative to the track (e.g. "ground_truth.xml"). Lists the artifacts if omitted'
+        )
+        read_artifact_command.parser.add_argument(
+            "-o",
+            "--output",
+            dest="output",
+            default=None,
+            help="Write the artifact to the given file instead of stdout.",
+        )
 
         generate_trajectory_command = self.add_subcommand(
             command="generate_trajectory",
             help="Generate trajectory.",
-            description="Generate trajectory.",
+            description="Generate time-parameterized reference trajectories along the center lines of tracks (NPZ).",
             handler=self._handle_generate_trajectory
         )
+        generate_trajectory_command.parser.add_argument(
+            "track_files",
+            metavar="track_file",
+            type=str,
+            nargs="+",
+            help="a track file (XML) to generate the trajectory for"
+        )
+        generate_trajectory_command.parser.add_argument(
+            "-o",
+            "--output",
+            dest="output",
+            default=Path.cwd() / "output",
+            help='Output directory for generated trajectories. Default="./"',
+        )
+        generate_trajectory_command.parser.add_argument(
+            "--time_step",
+            dest="time_step",
+            type=float,
+            default=0.02,
+            help="Time between the trajectory samples in s. Default=0.02",
+        )
+        generate_trajectory_command.parser.add_argument(
+            "--max_speed",
+            dest="max_speed",
+            type=float,
+            default=2.0,
+            help="Maximum speed in m/s. Default=2.0",
+        )
+        generate_trajectory_command.parser.add_argument(
+            "--max_lateral_acceleration",
+            dest="max_lateral_acceleration",
+            type=float,
+            default=2.0,
+            help="Maximum lateral acceleration in m/s^2. Default=2.0",
+        )
+        generate_trajectory_command.parser.add_argument(
+            "--max_acceleration",
+            dest="max_acceleration",
+            type=float,
+            default=1.0,
+            help="Maximum longitudinal acceleration in m/s^2. Default=1.0",
+        )
+        generate_trajectory_command.parser.add_argument(
+            "--max_deceleration",
+            dest="max_deceleration",
+            type=float,
+            default=1.5,
+            help="Maximum longitudinal deceleration in m/s^2. Default=1.5",
+        )
         # fmt: on
 
     def _handle_generate_track(self, args: argparse.Namespace) -> int:
-        generator.generate_track(args.track_files, args.output, args.png, args.gazebo, args.ground_truth)
+        from track_generator import generator
+        from track_generator.sinks import DirectorySink, OutputSink, WriteBehindSink
+
+        if args.archive is not None and args.content_store is not None:
+            self.logm.error("--archive and --content_store can't be combined")
+            return 1
+        if args.reuse_renders and args.content_store is None:
+            self.logm.error("--reuse_renders requires --content_store")
+            return 1
+
+        sink: OutputSink
+        content_store = None
+        if args.archive is not None:
+            from track_generator.archive import ArchiveSink
+
+            sink = ArchiveSink(Path(args.output), args.archive, args.shard_size * 1024 * 1024, fsync=args.fsync)
+        elif args.content_store is not None:
+            from track_generator.content_store import ContentAddressedSink, ContentStore
+
+            content_store = ContentStore(Path(args.content_store), fsync=args.fsync)
+            sink = ContentAddressedSink(Path(args.output), content_store, args.link)
+        else:
+            sink = DirectorySink(Path(args.output), fsync=args.fsync)
+        if args.write_behind is not None:
+            sink = WriteBehindSink(sink, max_inflight_bytes=args.write_behind * 1024 * 1024)
+
+        trace_exporter = instrumentation.ChromeTraceExporter() if args.trace is not None else None
+        if trace_exporter:
+            instrumentation.register_hook(trace_exporter)
+
+        try:
+            if args.profile is not None and args.prefetch > 0:
+                self.logm.warning("--prefetch is ignored with --profile, the profiled stages would overlap")
+            generate_track_kwargs = dict(
+                sink=sink,
+                prefetch=args.prefetch if args.profile is None else 0,
+                render_cache=content_store if args.reuse_renders else None,
+                ground_truth_spacing=args.ground_truth_spacing,
+                ground_truth_formats=args.ground_truth_formats,
+                generate_labels=args.labels,
+                label_rle=args.labels_rle,
+                map_resolution=args.map_resolution,
+                racing_line=args.racing_line,
+            )
+            if args.profile is None:
+                generator.generate_track(args.track_files, Path(args.output), args.png, args.gazebo, args.ground_truth, **generate_track_kwargs)
+            else:
+                with Profiler() as profiler:
+                    generator.generate_track(
+                        args.track_files, Path(args.output), args.png, args.gazebo, args.ground_truth, profiler=profiler, **generate_track_kwargs
+                    )
+                self._write_profile_report(profiler, Path(args.output) / args.profile)
+        finally:
+            sink.close()
+            if content_store:
+                statistics = content_store.statistics()
+                self.logm.info(
+                    "Content store: %d object(s) written (%d bytes), %d reused (%d bytes)",
+                    statistics["objects_written"],
+                    statistics["bytes_written"],
+                    statistics["objects_reused"],
+                    statistics["bytes_reused"],
+                )
+            if trace_exporter:
+                instrumentation.unregister_hook(trace_exporter)
+                trace_filepath = Path(args.output) / args.trace
+                trace_exporter.write(trace_filepath)
+                self.logm.info("Trace written to: %s", trace_filepath)
+        return 0
+
+    def _write_profile_report(self, profiler: Profiler, report_filepath: Path) -> None:
+        profiler.write_report(report_filepath)
+
+        summary = profiler.summary()
+        self.logm.info("Profiled %d track(s): wall=%.3fs, cpu=%.3fs", summary["num_tracks"], summary["wall_time"], summary["cpu_time"])
+        for name, stage in summary["stages"].items():
+            self.logm.info(
+                "  %-24s calls=%-5d wall=%.3fs cpu=%.3fs peak_mem=%.1fKiB",
+                name,
+                stage["calls"],
+                stage["wall_time"],
+                stage["cpu_time"],
+                stage["peak_memory"] / 1024,
+            )
+        self.logm.info("Profile report written to: %s", report_filepath)
+
+    def _handle_serve(self, args: argparse.Namespace) -> int:
+        from track_generator import service
+
+        if args.unix_socket and not service.UNIX_SOCKETS_SUPPORTED:
+            self.logm.error("--unix_socket is not supported on this platform, use HTTP instead")
+            return 1
+
+        unix_socket_path = Path(args.unix_socket) if args.unix_socket else None
+        service.serve(Path(args.output), args.host, args.port, unix_socket_path, args.workers, args.max_queue)
+        return 0
+
+    def _handle_read_artifact(self, args: argparse.Namespace) -> int:
+        from track_generator.archive import ArchiveReader
+
+        with ArchiveReader(Path(args.archive_dir)) as archive_reader:
+            if args.track_name is None:
+                print("\n".join(archive_reader.track_names()))
+            elif args.artifact is None:
+                print("\n".join(archive_reader.list_artifacts(args.track_name)))
+            else:
+                try:
+                    data = archive_reader.read(args.track_name, args.artifact)
+                except ArchiveReader.ArtifactNotFoundError as e:
+                    self.logm.error("Artifact not found: %s", e)
+                    return 1
+                if args.output:
+                    Path(args.output).write_bytes(data)
+                else:
+                    sys.stdout.buffer.write(data)
         return 0
 
     def _handle_generate_trajectory(self, args: argparse.Namespace) -> int:
-        self.logm.warning("Subcommand not yet implemented!")
+        from track_generator import generator
+        from track_generator.trajectory import VehicleLimits
+
+        try:
+            vehicle_limits = VehicleLimits(args.max_speed, args.max_lateral_acceleration, args.max_acceleration, args.max_deceleration)
+        except ValueError as e:
+            self.logm.error("Invalid vehicle limits: %s", e)
+            return 1
+        generator.generate_trajectory(args.track_files, Path(args.output), vehicle_limits, args.time_step)
         return 0
 
 
@@ -4,8 +4,15 @@ from pathlib import Path
 import numpy
 from enum import Enum
 from math import tan, factorial, sqrt, sin, cos, radians, pi
-from typing import Any, List, Tuple, Optional, Union
+from typing import TYPE_CHECKING, Any, List, Tuple, Optional, Union
+from track_generator import instrumentation
 from track_generator.coordinate_system import Polygon, Point2d, CartesianSystem2d
+from track_generator.profiler import Profiler, profile_stage
+
+if TYPE_CHECKING:
+    from track_generator.centerline import CenterlinePath
+    from track_generator.frenet import FrenetFrame
+    from track_generator.spatial_index import SpatialIndex
 
 LINE_WIDTH = 0.020
 TRACK_WIDTH = 0.800
@@ -86,14 +93,65 @@ class Track:
         self.origin = origin
         self.background = background
         self.segments = segments
-
-    def calc(self) -> None:
+        self.centerline_path: Optional["CenterlinePath"] = None
+        self.spatial_index: Optional["SpatialIndex"] = None
+        self.frenet_frame: Optional["FrenetFrame"] = None
+
+    @instrumentation.traced("Track.calc")
+    def calc(self, profiler: Optional[Profiler] = None) -> None:
+        self.centerline_path = None
+        self.spatial_index = None
+        self.frenet_frame = None
         for i in range(len(self.segments)):
-            if i == 0:
-                self.segments[i].calc()
-            else:
-                prev_segment = self.segments[i - 1]
-                self.segments[i].calc(prev_segment)
+            segment_type_name = type(self.segments[i]).__name__
+            with profile_stage(profiler, f"calc.{segment_type_name}"), instrumentation.segment_span("Segment.calc", i, self.segments[i]):
+                if i == 0:
+                    self.segments[i].calc()
+                else:
+                    prev_segment = self.segments[i - 1]
+                    self.segments[i].calc(prev_segment)
+
+    def get_centerline_path(self) -> "CenterlinePath":
+        """
+        :return: Center line of the calculated track as function of the arc length. It is built on first use and kept
+        until the track is calculated again.
+        """
+        if self.centerline_path is None:
+            from track_generator.centerline import CenterlinePath
+
+            self.centerline_path = CenterlinePath(self)
+        return self.centerline_path
+
+    def evaluate_centerline(self, s: numpy.ndarray) -> Tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]:
+        """
+        Evaluate the center line (driving line) of the calculated track at arbitrary arc lengths.
+        :param s: Arc lengths in m from the start of the track, clipped to the track
+        :return: Positions (n, 2) in world coordinates, headings (rad) and curvatures (1/m, positive to the left)
+        """
+        x, y, heading, curvature = self.get_centerline_path().evaluate(s)
+        return numpy.stack([x, y], axis=-1), heading, curvature
+
+    def get_spatial_index(self) -> "SpatialIndex":
+        """
+        :return: Spatial index over the shapes of the calculated track for point, box and nearest boundary queries. It
+        is built on first use and kept until the track is calculated again.
+        """
+        if self.spatial_index is None:
+            from track_generator.spatial_index import SpatialIndex
+
+            self.spatial_index = SpatialIndex.from_track(self)
+        return self.spatial_index
+
+    def get_frenet_frame(self) -> "FrenetFrame":
+        """
+        :return: Conversion between world and Frenet coordinates along the center line of the calculated track. It is
+        built on first use and kept until the track is calculated again.
+        """
+        if self.frenet_frame is None:
+            from track_generator.frenet import FrenetFrame
+
+            self.frenet_frame = FrenetFrame.from_track(self)
+        return self.frenet_frame
 
 
 class Segment:
@@ -0,0 +1,247 @@
+# Copyright (C) 2024 twyleg
+import io
+import json
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from track_generator.artifacts import Content
+from track_generator.centerline import sample_track
+from track_generator.coordinate_system import world_to_pixel
+from track_generator.label_raster import LabelClass
+from track_generator.track import Track
+
+# Cell values of the occupancy grid, as in the trinary images of the ROS map_server
+FREE = 254
+OCCUPIED = 0
+
+OCCUPIED_THRESHOLD = 0.65
+FREE_THRESHOLD = 0.196
+
+MAP_FILENAME = "map.yaml"
+OCCUPANCY_FILENAME = "map.pgm"
+DISTANCE_FILENAME = "map_distance.npy"
+HEADING_FILENAME = "map_heading.npy"
+
+NOT_DRIVABLE_CLASSES = [LabelClass.BACKGROUND, LabelClass.BLOCKED_AREA]
+
+# Squared distance of cells without any feature, large enough to dominate every real squared distance while keeping
+# the envelope calculations exact in float64
+_NO_FEATURE = 1e12
+
+
+def _squared_distance_transform_1d(f: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Exact 1D squared distance transform (lower envelope of parabolas, Felzenszwalb and Huttenlocher) along the last
+    axis, evaluated for all lines at once.
+    :param f: Array (lines, n) of squared distances sampled at 0..n-1
+    :return: Squared distances and the index of the nearest sample along the last axis
+    """
+    num_lines, n = f.shape
+    lines = np.arange(num_lines)
+    v = np.zeros((num_lines, n), dtype=np.int64)
+    z = np.full((num_lines, n + 1), np.inf)
+    z[:, 0] = -np.inf
+    k = np.zeros(num_lines, dtype=np.int64)
+
+    for q in range(1, n):
+        # Intersection of the parabola of q with the last parabola of the envelope, parabolas hidden by the one of q are
+        # removed from the envelope (only the lines with hidden parabolas are evaluated again)
+        f_q = f[:, q] + q * q
+        v_k = v[lines, k]
+        s = (f_q - (f[lines, v_k] + v_k * v_k)) / (2.0 * (q - v_k))
+        hidden_lines = lines[s <= z[lines, k]]
+        while hidden_lines.size:
+            k[hidden_lines] -= 1
+            v_k = v[hidden_lines, k[hidden_lines]]
+            s[hidden_lines] = (f_q[hidden_lines] - (f[hidden_lines, v_k] + v_k * v_k)) / (2.0 * (q - v_k))
+            hidden_lines = hidden_lines[s[hidden_lines] <= z[hidden_lines, k[hidden_lines]]]
+        k += 1
+        v[lines, k] = q
+        z[lines, k] = s
+        z[lines, k + 1] = np.inf
+
+    distances = np.empty_like(f)
+    nearest = np.empty((num_lines, n), dtype=np.int64)
+    k[:] = 0
+    for q in range(n):
+        passed_lines = lines[z[lines, k + 1] < q]
+        while passed_lines.size:
+            k[passed_lines] += 1
+            passed_lines = passed_lines[z[passed_lines, k[passed_lines] + 1] < q]
+        v_k = v[lines, k]
+        distances[:, q] = (q - v_k) ** 2 + f[lines, v_k]
+        nearest[:, q] = v_k
+    return distances, nearest
+
+
+def distance_transform(features: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Exact Euclidean distance transform of a 2D grid, separable into vectorized passes over the columns and the rows.
+    :param features: Boolean grid of the feature cells
+    :return: Distance of every cell to the nearest feature cell (in cells) and the row and column of that feature cell
+    """
+    f = np.where(features, 0.0, _NO_FEATURE)
+    column_distances, nearest_rows = _squared_distance_transform_1d(f.T)
+    distances, nearest_cols = _squared_distance_transform_1d(column_distances.T)
+    nearest_rows = nearest_rows.T[np.arange(features.shape[0])[:, np.newaxis], nearest_cols]
+    return np.sqrt(distances), nearest_rows, nearest_cols
+
+
+def _encode_npy(array: np.ndarray) -> bytes:
+    f = io.BytesIO()
+    np.save(f, array)
+    return f.getvalue()
+
+
+def _encode_pgm(image: np.ndarray) -> bytes:
+    return f"P5\n{image.shape[1]} {image.shape[0]}\n255\n".encode("ascii") + image.tobytes()
+
+
+def decode_pgm(data: bytes) -> np.ndarray:
+    """
+    Decode a binary 8 bit PGM image, e.g. the occupancy grid of a TrackMap.
+    """
+    fields: List[bytes] = []
+    offset = 0
+    while len(fields) < 4:
+        end = data.index(b"\n", offset) + 1
+        fields.extend(data[offset:end].split(b"#", 1)[0].split())
+        offset = end
+    if fields[0] != b"P5" or int(fields[3]) != 255:
+        raise ValueError("Unsupported PGM image")
+    return np.frombuffer(data, dtype=np.uint8, count=int(fields[1]) * int(fields[2]), offset=offset).reshape(int(fields[2]), int(fields[1]))
+
+
+def _load_pgm(filepath: Path) -> np.ndarray:
+    with open(filepath, "rb") as f:
+        fields: List[bytes] = []
+        while len(fields) < 4:
+            line = f.readline()
+            fields.extend(line.split(b"#", 1)[0].split())
+        offset = f.tell()
+    if fields[0] != b"P5" or int(fields[3]) != 255:
+        raise ValueError(f"Unsupported PGM file: {filepath}")
+    return np.memmap(filepath, dtype=np.uint8, mode="r", offset=offset, shape=(int(fields[2]), int(fields[1])))
+
+
+class TrackMap:
+    """
+    Grid maps of a track for planners, with the cell layout of the images rendered from the track (first row at the
+    top) at a given resolution:
+        occupancy: uint8 grid, FREE for the drivable area (road surface and its markings) and OCCUPIED elsewhere
+        distance: float32 signed distance in m from the cell center to the boundary of the drivable area, positive
+        inside of it
+        heading: float32 driving direction (rad) at the nearest point of the center line, NaN outside of the drivable
+        area
+    """
+
+    def __init__(self, occupancy: np.ndarray, distance: np.ndarray, heading: np.ndarray, resolution: float, origin: Tuple[float, float]):
+        """
+        :param resolution: Size of a cell in m
+        :param origin: World coordinates of the lower left corner of the grid
+        """
+        self.occupancy = occupancy
+        self.distance = distance
+        self.heading = heading
+        self.resolution = resolution
+        self.origin = origin
+
+    @classmethod
+    def from_track(cls, track: Track, resolution: float) -> "TrackMap":
+        """
+        Rasterize the drivable area with the same shapes as the track images and derive the distance and heading
+        fields with distance transforms.
+        :param track: The calculated track
+        :param resolution: Size of a cell in m
+        """
+        from track_generator.painter import Painter
+
+        if resolution <= 0.0:
+            raise ValueError(f"Invalid map resolution: {resolution}")
+
+        painter = Painter(labels=True, label_pixels_per_meter=1.0 / resolution)
+        painter.draw_track(track)
+        assert painter.label_raster
+        drivable = ~np.isin(painter.label_raster.labels, NOT_DRIVABLE_CLASSES)
+
+        # Cells outside of the grid are not drivable
+        distance_to_occupied = distance_transform(np.pad(~drivable, 1, constant_values=True))[0][1:-1, 1:-1]
+        distance_to_drivable, _, _ = distance_transform(drivable)
+        # Cell centers are half a cell away from the boundary between free and occupied cells
+        distance = np.where(drivable, distance_to_occupied - 0.5, 0.5 - distance_to_drivable) * resolution
+
+        samples = sample_track(track, resolution / 2)
+        cols, rows = world_to_pixel(samples.x, samples.y, track.height, track.origin, 1.0 / resolution)
+        rows, cols = np.floor(rows).astype(np.int64), np.floor(cols).astype(np.int64)
+        is_inside = (rows >= 0) & (rows < drivable.shape[0]) & (cols >= 0) & (cols < drivable.shape[1])
+        sample_indices = np.full(drivable.shape, -1, dtype=np.int64)
+        sample_indices[rows[is_inside], cols[is_inside]] = np.flatnonzero(is_inside)
+        heading = np.full(drivable.shape, np.nan, dtype=np.float32)
+        if np.any(is_inside):
+            _, nearest_rows, nearest_cols = distance_transform(sample_indices >= 0)
+            nearest_heading = samples.heading[sample_indices[nearest_rows, nearest_cols]]
+            heading[drivable] = np.arctan2(np.sin(nearest_heading), np.cos(nearest_heading))[drivable]
+
+        occupancy = np.where(drivable, FREE, OCCUPIED).astype(np.uint8)
+        # map_server origin: world position of the lower left corner of the grid, the rows are rounded to whole cells
+        origin = (float(track.origin[0]), float(track.height - track.origin[1] - occupancy.shape[0] * resolution))
+        return cls(occupancy, distance.astype(np.float32), heading, resolution, origin)
+
+    def render_map_files(self) -> Dict[str, Content]:
+        """
+        :return: The map descriptor (map_server YAML with additional keys for the fields), the occupancy grid (PGM) and
+        the fields (NPY), all of them can be memory-mapped (see load_track_map())
+        """
+        descriptor = "\n".join(
+            [
+                f"image: {OCCUPANCY_FILENAME}",
+                "mode: trinary",
+                f"resolution: {self.resolution!r}",
+                f"origin: [{float(self.origin[0])!r}, {float(self.origin[1])!r}, 0.0]",
+                "negate: 0",
+                f"occupied_thresh: {OCCUPIED_THRESHOLD}",
+                f"free_thresh: {FREE_THRESHOLD}",
+                f"distance_field: {DISTANCE_FILENAME}",
+                f"heading_field: {HEADING_FILENAME}",
+                "",
+            ]
+        )
+        return {
+            MAP_FILENAME: descriptor,
+            OCCUPANCY_FILENAME: _encode_pgm(self.occupancy),
+            DISTANCE_FILENAME: _encode_npy(self.distance),
+            HEADING_FILENAME: _encode_npy(self.heading),
+        }
+
+
+def _parse_map_descriptor(text: str) -> Dict[str, object]:
+    descriptor: Dict[str, object] = {}
+    for line in text.splitlines():
+        key, separator, value = line.split("#", 1)[0].partition(":")
+        if not separator:
+            continue
+        try:
+            descriptor[key.strip()] = json.loads(value)
+        except json.JSONDecodeError:
+            descriptor[key.strip()] = value.strip()
+    return descriptor
+
+
+def load_track_map(map_filepath: Path) -> TrackMap:
+    """
+    Load a map written by TrackMap.render_map_files(). The grids are memory-mapped read-only.
+    :param map_filepath: Path of the map descriptor (YAML)
+    """
+    map_filepath = Path(map_filepath)
+    descriptor = _parse_map_descriptor(map_filepath.read_text())
+    origin = descriptor["origin"]
+    assert isinstance(origin, list)
+    return TrackMap(
+        _load_pgm(map_filepath.parent / str(descriptor["image"])),
+        np.load(map_filepath.parent / str(descriptor["distance_field"]), mmap_mode="r"),
+        np.load(map_filepath.parent / str(descriptor["heading_field"]), mmap_mode="r"),
+        float(str(descriptor["resolution"])),
+        (origin[0], origin[1]),
+    )
@@ -0,0 +1,165 @@
+# Copyright (C) 2024 twyleg
+from math import ceil
+from typing import Dict, List, Optional, Sequence, Union
+
+import numpy as np
+
+from track_generator.track import Track
+
+# Arc length spacing in m of the grid the speed profile is solved on
+DEFAULT_SPACING = 0.01
+DEFAULT_TIME_STEP = 0.02
+
+TRAJECTORY_COLUMNS = ["t", "s", "x", "y", "heading", "curvature", "speed", "acceleration", "lateral_acceleration"]
+
+
+class VehicleLimits:
+    def __init__(
+        self,
+        max_speed: float = 2.0,
+        max_lateral_acceleration: float = 2.0,
+        max_acceleration: float = 1.0,
+        max_deceleration: float = 1.5,
+        start_speed: float = 0.0,
+        end_speed: Optional[float] = 0.0,
+    ):
+        """
+        :param max_speed: Maximum speed in m/s
+        :param max_lateral_acceleration: Maximum lateral acceleration in m/s^2, limits the speed in curves
+        :param max_acceleration: Maximum longitudinal acceleration in m/s^2
+        :param max_deceleration: Maximum longitudinal deceleration in m/s^2 (positive)
+        :param start_speed: Speed at the start of the track in m/s
+        :param end_speed: Speed at the end of the track in m/s, None for no constraint
+        """
+        if min(max_speed, max_lateral_acceleration, max_acceleration, max_deceleration) <= 0.0:
+            raise ValueError("Vehicle limits must be positive")
+        self.max_speed = max_speed
+        self.max_lateral_acceleration = max_lateral_acceleration
+        self.max_acceleration = max_acceleration
+        self.max_deceleration = max_deceleration
+        self.start_speed = start_speed
+        self.end_speed = end_speed
+
+
+def _limited_rise(limits: np.ndarray, start: np.ndarray, step: np.ndarray) -> np.ndarray:
+    """
+    Solve w[0] = min(limits[0], start), w[i] = min(limits[i], w[i-1] + step) along the last axis. Subtracting i * step
+    turns the recurrence into a cumulative minimum.
+    """
+    ramp = np.arange(limits.shape[-1]) * step
+    shifted = limits - ramp
+    shifted[..., 0] = np.minimum(shifted[..., 0], start[..., 0])
+    return np.minimum.accumulate(shifted, axis=-1) + ramp
+
+
+def speed_profile(
+    curvature: np.ndarray,
+    spacing: float,
+    max_speed: Union[float, np.ndarray],
+    max_lateral_acceleration: Union[float, np.ndarray],
+    max_acceleration: Union[float, np.ndarray],
+    max_deceleration: Union[float, np.ndarray],
+    start_speed: Union[float, np.ndarray] = 0.0,
+    end_speed: Union[float, np.ndarray] = np.inf,
+) -> np.ndarray:
+    """
+    Fastest speed profile along equidistant arc lengths: the speed is limited by the lateral acceleration in curves,
+    a forward pass limits the acceleration and a backward pass the deceleration. All profiles of a batch are solved at
+    once, the limits are scalars or arrays with the batch shape.
+    :param curvature: Array (..., n) of curvatures at arc lengths with the given spacing
+    :param spacing: Arc length between the samples in m
+    :return: Array (..., n) of speeds in m/s
+    """
+
+    def batch(value: Union[float, np.ndarray]) -> np.ndarray:
+        return np.asarray(value, dtype=float)[..., np.newaxis]
+
+    curvature = np.asarray(curvature, dtype=float)
+    with np.errstate(divide="ignore"):
+        squared_speed_limits = np.minimum(batch(max_speed) ** 2, batch(max_lateral_acceleration) / np.abs(curvature))
+
+    # v[i]^2 <= v[i-1]^2 + 2 * a * ds for constant accelerations between the samples
+    squared_speeds = _limited_rise(squared_speed_limits, batch(start_speed) ** 2, 2 * batch(max_acceleration) * spacing)
+    squared_speeds = _limited_rise(squared_speeds[..., ::-1], batch(end_speed) ** 2, 2 * batch(max_deceleration) * spacing)[..., ::-1]
+    return np.sqrt(squared_speeds)
+
+
+def _resample_in_time(s: np.ndarray, speed: np.ndarray, time_step: float) -> Dict[str, np.ndarray]:
+    """
+    Resample a speed profile at a fixed time step. Between the arc length samples the acceleration is constant, so
+    arc length and speed are exact at every time.
+    """
+    standstill = (speed[:-1] <= 0.0) & (speed[1:] <= 0.0)
+    if np.any(standstill):
+        raise ValueError(f"Speed profile stands still between s={s[np.argmax(standstill)]}m and the next sample, the end is never reached")
+    spacing = np.diff(s)
+    acceleration = (speed[1:] ** 2 - speed[:-1] ** 2) / (2 * spacing)
+    t = np.concatenate([[0.0], np.cumsum(2 * spacing / (speed[:-1] + speed[1:]))])
+
+    t_resampled = np.arange(int(t[-1] / time_step + 1e-9) + 1) * time_step
+    interval = np.clip(np.searchsorted(t, t_resampled, side="right") - 1, 0, len(spacing) - 1)
+    tau = t_resampled - t[interval]
+    return {
+        "t": t_resampled,
+        "s": np.minimum(s[interval] + speed[interval] * tau + acceleration[interval] * tau**2 / 2, s[-1]),
+        "speed": np.maximum(speed[interval] + acceleration[interval] * tau, 0.0),
+        "acceleration": acceleration[interval],
+    }
+
+
+def calc_trajectories(
+    track: Track, vehicle_limits: Sequence[VehicleLimits], time_step: float = DEFAULT_TIME_STEP, spacing: float = DEFAULT_SPACING
+) -> List[Dict[str, np.ndarray]]:
+    """
+    Calculate time-parameterized reference trajectories along the center line of a calculated track, one for every set
+    of vehicle limits. The speed profiles of all sets are solved in one vectorized pass.
+    :param vehicle_limits: Sets of vehicle limits
+    :param time_step: Time between the trajectory samples in s
+    :param spacing: Maximum arc length spacing in m of the grid the speed profiles are solved on
+    :return: Columns TRAJECTORY_COLUMNS of every trajectory
+    """
+    if time_step <= 0.0 or spacing <= 0.0:
+        raise ValueError(f"Invalid time step or spacing: {time_step}, {spacing}")
+
+    path = track.get_centerline_path()
+    # At least two intervals, so a vehicle that starts and ends at standstill can accelerate and brake in between
+    s = np.linspace(0.0, path.length, max(2, ceil(path.length / spacing - 1e-9)) + 1)
+    _, _, _, curvature = path.evaluate(s)
+    # The speed changes monotonically between two samples, so both have to respect the curvature on either side to
+    # keep the lateral acceleration within its limit at joints between segments
+    curvature = np.abs(curvature)
+    curvature[1:] = np.maximum(curvature[1:], curvature[:-1])
+    curvature[:-1] = np.maximum(curvature[:-1], curvature[1:])
+
+    def limits_array(name: str) -> np.ndarray:
+        return np.array([getattr(limits, name) for limits in vehicle_limits], dtype=float)
+
+    end_speed = np.array([np.inf if limits.end_speed is None else limits.end_speed for limits in vehicle_limits])
+    speeds = speed_profile(
+        curvature,
+        s[1] - s[0],
+        limits_array("max_speed"),
+        limits_array("max_lateral_acceleration"),
+        limits_array("max_acceleration"),
+        limits_array("max_deceleration"),
+        limits_array("start_speed"),
+        end_speed,
+    )
+
+    trajectories: List[Dict[str, np.ndarray]] = []
+    for speed in speeds:
+        columns = _resample_in_time(s, speed, time_step)
+        columns["x"], columns["y"], columns["heading"], columns["curvature"] = path.evaluate(columns["s"])
+        columns["lateral_acceleration"] = columns["speed"] ** 2 * columns["curvature"]
+        trajectories.append({name: np.ascontiguousarray(columns[name]) for name in TRAJECTORY_COLUMNS})
+    return trajectories
+
+
+def calc_trajectory(
+    track: Track, vehicle_limits: Optional[VehicleLimits] = None, time_step: float = DEFAULT_TIME_STEP, spacing: float = DEFAULT_SPACING
+) -> Dict[str, np.ndarray]:
+    """
+    Calculate a time-parameterized reference trajectory along the center line of a calculated track.
+    :return: Columns TRAJECTORY_COLUMNS of the trajectory
+    """
+    return calc_trajectories(track, [vehicle_limits or VehicleLimits()], time_step, spacing)[0]
@@ -1,11 +1,16 @@
 # Copyright (C) 2022 twyleg
+import functools
 import os
 import xml.etree.ElementTree as ET
 from pathlib import Path
-from typing import Union
+from typing import TYPE_CHECKING, Optional, Union
 
-from xmlschema import XMLSchema
+from track_generator import instrumentation
 from track_generator.track import *
+from track_generator.profiler import Profiler, profile_stage
+
+if TYPE_CHECKING:
+    from xmlschema import XMLSchema
 
 # mypy: disable-error-code="union-attr"
 
@@ -13,19 +18,52 @@ from track_generator.track import *
 FILE_DIR = Path(__file__).parent
 
 
-def read_track(xml_input_filepath: Path) -> Track:
+@functools.lru_cache(maxsize=None)
+def load_schema() -> "XMLSchema":
+    from xmlschema import XMLSchema
+
+    return XMLSchema(FILE_DIR / "xsd/track.xsd")
+
+
+@instrumentation.traced("read_track")
+def read_track(xml_input_filepath: Path, profiler: Optional[Profiler] = None) -> Track:
     print(f"Reading track: {xml_input_filepath}")
-    schema = XMLSchema(FILE_DIR / "xsd/track.xsd")
-    schema.validate(xml_input_filepath)
+    with profile_stage(profiler, "schema_load"):
+        schema = load_schema()
+
+    with profile_stage(profiler, "parse"):
+        schema.validate(xml_input_filepath)
+
+        tree = ET.parse(xml_input_filepath)
+        root = tree.getroot()
+
+        version = _read_root(root)
+        width, height = _read_size(root)
+        x, y = _read_origin(root)
+        background = _read_background(root, Path(xml_input_filepath).parent)
+        segments = _read_segments(root)
+
+    return Track(version, width, height, (x, y), background, segments)
+
+
+@instrumentation.traced("read_track")
+def read_track_from_string(xml_string: str, base_dirpath: Optional[Path] = None, profiler: Optional[Profiler] = None) -> Track:
+    """
+    Read a track from a track definition (XML) given as string. Relative file references (e.g. background images) are
+    resolved relative to base_dirpath or the current working directory.
+    """
+    with profile_stage(profiler, "schema_load"):
+        schema = load_schema()
 
-    tree = ET.parse(xml_input_filepath)
-    root = tree.getroot()
+    with profile_stage(profiler, "parse"):
+        root = ET.fromstring(xml_string)
+        schema.validate(root)
 
-    version = _read_root(root)
-    width, height = _read_size(root)
-    x, y = _read_origin(root)
-    background = _read_background(root, xml_input_filepath)
-    segments = _read_segments(root)
+        version = _read_root(root)
+        width, height = _read_size(root)
+        x, y = _read_origin(root)
+        background = _read_background(root, base_dirpath if base_dirpath else Path.cwd())
+        segments = _read_segments(root)
 
     return Track(version, width, height, (x, y), background, segments)
 
@@ -49,7 +87,7 @@ def _read_origin(root: ET.Element) -> Tuple[float, float]:
     return float(x), float(y)
 
 
-def _read_background(root: ET.Element, xml_filepath: Path) -> Union[BackgroundColor, BackgroundImage]:
+def _read_background(root: ET.Element, xml_file_basedir: Path) -> Union[BackgroundColor, BackgroundImage]:
     background_element = root.find("Background")
     background_image_element = root.find("BackgroundImage")
     if background_element is not None:
@@ -64,7 +102,6 @@ def _read_background(root: ET.Element, xml_filepath: Path) -> Union[BackgroundCo
         height = float(background_image_element.attrib["height"])
 
         if not file.is_absolute():
-            xml_file_basedir = Path(xml_filepath).parent
             file = xml_file_basedir / file
 
         return BackgroundImage(file, x, y, width, height)
@@ -0,0 +1,113 @@
+# Copyright (C) 2024 twyleg
+import xml.etree.ElementTree as ET
+from pathlib import Path
+from typing import List
+
+from track_generator.track import (
+    BackgroundColor,
+    BackgroundImage,
+    Clothoid,
+    Crosswalk,
+    Gap,
+    Intersection,
+    ParkingArea,
+    Start,
+    Straight,
+    Track,
+    TrafficIsland,
+    Turn,
+)
+
+
+def _format(value: float) -> str:
+    # The shortest representation that reads back to the same float
+    return repr(float(value))
+
+
+def _write_lots(parent: ET.Element, tag: str, lots: List[ParkingArea.ParkingLot]) -> None:
+    lots_element = ET.SubElement(parent, tag)
+    for lot in lots:
+        lot_element = ET.SubElement(
+            lots_element, "ParkingLot", start=_format(lot.start), depth=_format(lot.depth), opening_ending_angle=_format(lot.opening_ending_angle)
+        )
+        for spot in lot.spots:
+            ET.SubElement(lot_element, "Spot", type=spot.type, length=_format(spot.length))
+
+
+def _write_segment(segments_element: ET.Element, segment) -> None:
+    # Subclasses before their base classes (Crosswalk, Gap and ParkingArea are Straights)
+    if isinstance(segment, Start):
+        start_point = segment.start_point
+        ET.SubElement(segments_element, "Start", x=_format(start_point.x_w), y=_format(start_point.y_w), direction_angle=_format(segment.direction_angle))
+    elif isinstance(segment, Crosswalk):
+        ET.SubElement(segments_element, "Crosswalk", length=_format(segment.length))
+    elif isinstance(segment, Gap):
+        ET.SubElement(segments_element, "Gap", length=_format(segment.length), direction=segment.direction.value)
+    elif isinstance(segment, ParkingArea):
+        parking_area_element = ET.SubElement(segments_element, "ParkingArea", length=_format(segment.length))
+        _write_lots(parking_area_element, "RightLots", segment.right_lots)
+        _write_lots(parking_area_element, "LeftLots", segment.left_lots)
+    elif isinstance(segment, Straight):
+        ET.SubElement(segments_element, "Straight", length=_format(segment.length))
+    elif isinstance(segment, Turn):
+        direction = "right" if segment.direction_clockwise else "left"
+        ET.SubElement(segments_element, "Turn", direction=direction, radius=_format(segment.radius), radian=_format(segment.radian_angle))
+    elif isinstance(segment, Intersection):
+        ET.SubElement(segments_element, "Intersection", length=_format(segment.length), direction=segment.direction.value)
+    elif isinstance(segment, TrafficIsland):
+        ET.SubElement(
+            segments_element,
+            "TrafficIsland",
+            island_width=_format(segment.island_width),
+            crosswalk_length=_format(segment.crosswalk_length),
+            curve_segment_length=_format(segment.curve_segment_length),
+            curvature=_format(segment.curvature),
+        )
+    elif isinstance(segment, Clothoid):
+        ET.SubElement(
+            segments_element,
+            "Clothoid",
+            a=_format(segment.a),
+            angle=_format(segment.angle),
+            angle_offset=_format(segment.angle_offset),
+            direction=segment.direction.value,
+            type=segment.type.value,
+        )
+    else:
+        raise RuntimeError(f"Error in xml_writer: {segment} not supported")
+
+
+def write_track_to_string(track: Track) -> str:
+    """
+    Serialize a track to a track definition that xml_reader reads back to the same track.
+    :param track: The track, it does not need to be calculated
+    :return: XML of the track definition
+    """
+    root = ET.Element("TrackDefinition", version=track.version)
+    ET.SubElement(root, "Size", width=_format(track.width), height=_format(track.height))
+    ET.SubElement(root, "Origin", x=_format(track.origin[0]), y=_format(track.origin[1]))
+    if isinstance(track.background, BackgroundColor):
+        ET.SubElement(root, "Background", color=track.background.color, opacity=_format(track.background.opacity))
+    elif isinstance(track.background, BackgroundImage):
+        background = track.background
+        ET.SubElement(
+            root,
+            "BackgroundImage",
+            file=str(background.filepath),
+            x=_format(background.x),
+            y=_format(background.y),
+            width=_format(background.width),
+            height=_format(background.height),
+        )
+    segments_element = ET.SubElement(root, "Segments")
+    for segment in track.segments:
+        _write_segment(segments_element, segment)
+    ET.indent(root, space="    ")
+    return ET.tostring(root, encoding="unicode") + "\n"
+
+
+def write_track(track: Track, xml_output_filepath: Path) -> None:
+    """
+    Write a track to a track definition file, see write_track_to_string()
+    """
+    Path(xml_output_filepath).write_text(write_track_to_string(track))